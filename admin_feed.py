@@ -0,0 +1,415 @@
+"""
+Live change stream from the conference server to the admin dashboard
+Every server worker publishes a compact feed of what changed in its rooms over a local Unix
+socket (FeedPublisher): rooms opened and closed, participants joining and leaving, and its
+counters. Changes are collected per room and sent as one batch per interval, read from the
+rooms' roster change logs, so the cost follows the changes rather than the number of rooms.
+The admin server listens on the socket (FeedServer), keeps an incrementally updated mirror of
+all workers (AdminMirror) and pushes the changes that took effect to dashboards as
+Server-Sent Events.
+
+Frames are a 4-byte length and a JSON object:
+    {"worker": id, "snapshot": bool, "ops": [...], "counters": {"connections": n, ...},
+     "events": {"messages": n, ...}}
+with ops
+    ["open", room_id, {"name", "mode", "created_at"}]
+    ["close", room_id]
+    ["join", room_id, user_id, username]
+    ["leave", room_id, user_id]
+    ["reset", room_id, [[user_id, username], ...]]   the room's full participant list
+and "events" the activity counted since the previous frame (omitted when there was none).
+A worker sends a snapshot of every room it holds each time it connects, then only changes.
+The admin server may send back {"command": "close_room", "room_id": ...}, and
+{"command": "reload_meetings"} after it changed scheduled meetings (see scheduler.py).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import struct
+from collections import Counter, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from fanout import fast_json
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct("!I")
+
+# Seconds between reconnect attempts while the admin server is not listening
+RECONNECT_INTERVAL = 5.0
+
+# A worker whose admin connection has this many bytes unsent drops it and resyncs on reconnect
+MAX_UNSENT_BYTES = 8 * 1024 * 1024
+
+# Events a dashboard may fall behind before its stream is closed (EventSource reconnects and
+# starts over from a snapshot)
+SUBSCRIBER_BACKLOG = 1000
+
+
+def encode_frame(message: dict) -> bytes:
+    payload = fast_json.dumps(message).encode()
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> dict:
+    header = await reader.readexactly(FRAME_HEADER.size)
+    return json.loads(await reader.readexactly(FRAME_HEADER.unpack(header)[0]))
+
+
+class FeedPublisher:
+    """Conference-server side: batches room changes of a StateStore to the admin server"""
+
+    def __init__(self, path: str, store, counters: Callable[[], dict], interval: float):
+        self.path = path
+        self.store = store
+        self.counters = counters
+        self.interval = interval
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.on_close_room: Optional[Callable[[str], Awaitable[Any]]] = None
+        self.on_reload_meetings: Optional[Callable[[], Any]] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.dirty: Set[str] = set()
+        self.sent: Dict[str, Tuple[str, int]] = {}  # room_id -> (roster epoch, version) last sent
+        self.last_counters: Optional[dict] = None
+        self.events: Counter = Counter()
+        self.task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.ops = 0
+
+    # Store listeners: O(1), nothing is tracked while the admin server is not connected
+    def mark(self, room_id: str):
+        if self.writer is not None:
+            self.dirty.add(room_id)
+
+    def on_change(self, op: str, args: tuple):
+        if op == "add_room" and self.writer is not None:
+            self.dirty.add(args[0].id)
+
+    def count(self, kind: str):
+        """Count one activity event (a chat message, a recording started, ...) for analytics"""
+        if self.writer is not None:
+            self.events[kind] += 1
+
+    def batch(self) -> List[list]:
+        """Ops bringing the admin server from what it was sent to the current state"""
+        ops: List[list] = []
+        dirty, self.dirty = self.dirty, set()
+        for room_id in dirty:
+            room = self.store.rooms.get(room_id)
+            roster = self.store.get_roster(room_id)
+            if room is None or roster is None:
+                if self.sent.pop(room_id, None) is not None:
+                    ops.append(["close", room_id])
+                continue
+            known = self.sent.get(room_id)
+            if known is None:
+                ops.append(["open", room_id, {"name": room.name, "mode": room.mode,
+                                              "created_at": room.created_at.isoformat()}])
+            changes = roster.changes_since(known[1]) if known and known[0] == roster.epoch else None
+            if changes is None:
+                ops.append(["reset", room_id, [[entry["user_id"], entry["username"]]
+                                               for entry in roster.snapshot()]])
+            else:
+                for change in changes:
+                    if change["op"] == "join":
+                        ops.append(["join", room_id, change["user_id"], change["participant"]["username"]])
+                    elif change["op"] == "leave":
+                        ops.append(["leave", room_id, change["user_id"]])
+            self.sent[room_id] = (roster.epoch, roster.version)
+        return ops
+
+    def send(self, snapshot: bool = False):
+        ops = self.batch()
+        counters = self.counters()
+        if not (ops or snapshot or self.events or counters != self.last_counters):
+            return
+        self.last_counters = counters
+        message = {"worker": self.worker, "snapshot": snapshot, "ops": ops, "counters": counters}
+        if self.events:
+            message["events"], self.events = dict(self.events), Counter()
+        self.writer.write(encode_frame(message))
+        self.batches += 1
+        self.ops += len(ops)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                reader, self.writer = await asyncio.open_unix_connection(self.path)
+            except OSError:
+                await asyncio.sleep(RECONNECT_INTERVAL)
+                continue
+            logger.info("Connected to admin feed", extra={"path": self.path})
+            commands = asyncio.ensure_future(self._read_commands(reader))
+            self.sent.clear()
+            self.dirty = set(self.store.rooms)
+            self.last_counters = None
+            try:
+                self.send(snapshot=True)
+                while not commands.done() and not self.writer.is_closing():
+                    if self.writer.transport.get_write_buffer_size() > MAX_UNSENT_BYTES:
+                        logger.warning("Admin feed is not keeping up, reconnecting")
+                        break
+                    await asyncio.sleep(self.interval)
+                    self.send()
+            except (ConnectionError, OSError):
+                pass
+            finally:
+                commands.cancel()
+                self.writer.close()
+                self.writer = None
+                self.dirty.clear()
+                self.events.clear()
+            await asyncio.sleep(RECONNECT_INTERVAL)
+
+    async def _read_commands(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                command = await read_frame(reader)
+                if command.get("command") == "close_room" and self.on_close_room is not None:
+                    try:
+                        await self.on_close_room(str(command.get("room_id")))
+                    except Exception:
+                        logger.exception("Admin command failed")
+                elif command.get("command") == "reload_meetings" and self.on_reload_meetings is not None:
+                    self.on_reload_meetings()
+        except (asyncio.IncompleteReadError, ConnectionError, OSError, ValueError):
+            return
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def snapshot(self) -> dict:
+        return {
+            "path": self.path,
+            "connected": self.writer is not None,
+            "batches": self.batches,
+            "ops": self.ops,
+        }
+
+
+class Subscriber:
+    """One dashboard's pending events"""
+
+    def __init__(self, backlog: int = SUBSCRIBER_BACKLOG):
+        self.backlog = backlog
+        self.events: Deque[dict] = deque()
+        self.ready = asyncio.Event()
+        self.overflowed = False
+
+    def push(self, event: dict):
+        if len(self.events) >= self.backlog:
+            self.overflowed = True
+        else:
+            self.events.append(event)
+        self.ready.set()
+
+    async def next(self) -> Optional[dict]:
+        """The next event, or None once this subscriber fell too far behind"""
+        while not self.events and not self.overflowed:
+            self.ready.clear()
+            await self.ready.wait()
+        return None if self.overflowed else self.events.popleft()
+
+
+class AdminMirror:
+    """Rooms and counters of every connected worker, updated op by op.
+
+    Ops are applied idempotently, so workers sharing rooms through a backplane may all report
+    the same change; only changes that take effect reach the dashboards. A room stays while any
+    worker holds it.
+
+    on_change sees each change that took effect in a live batch, with the room it concerns; it
+    is not called for snapshots or dropped workers, which restate or forget state rather than
+    report activity. on_events receives each batch's activity counts.
+    """
+
+    def __init__(self):
+        self.rooms: Dict[str, dict] = {}  # room_id -> {"name", "mode", "created_at", "participants"}
+        self.owners: Dict[str, Set[str]] = {}  # room_id -> workers holding it
+        self.worker_rooms: Dict[str, Set[str]] = {}  # worker -> room_ids
+        self.worker_counters: Dict[str, dict] = {}
+        self.participants = 0
+        self.subscribers: Set[Subscriber] = set()
+        self.on_change: Optional[Callable[[list, dict], None]] = None
+        self.on_events: Optional[Callable[[dict], None]] = None
+        self._counters: Optional[dict] = None
+        self._live = False
+
+    def counters(self) -> dict:
+        return {
+            "rooms": len(self.rooms),
+            "participants": self.participants,
+            "connections": sum(counters.get("connections", 0) for counters in self.worker_counters.values()),
+            "workers": len(self.worker_counters),
+        }
+
+    def state(self) -> dict:
+        """Everything a dashboard needs to start from"""
+        return {"rooms": self.rooms, "counters": self.counters()}
+
+    def apply(self, message: dict):
+        worker = str(message["worker"])
+        changes: List[list] = []
+        stale = set(self.worker_rooms.get(worker, ())) if message.get("snapshot") else set()
+        self._live = not message.get("snapshot")
+        for op in message.get("ops", ()):
+            kind, room_id = op[0], op[1]
+            if kind == "open":
+                stale.discard(room_id)
+                self._open(worker, room_id, op[2], changes)
+            elif kind == "close":
+                self._release(worker, room_id, changes)
+            elif kind == "join":
+                self._join(room_id, op[2], op[3], changes)
+            elif kind == "leave":
+                self._leave(room_id, op[2], changes)
+            elif kind == "reset":
+                self._reset(room_id, op[2], changes)
+        for room_id in stale:
+            self._release(worker, room_id, changes)
+        self._live = False
+        self.worker_counters[worker] = message.get("counters", {})
+        if message.get("events") and self.on_events is not None:
+            self.on_events(message["events"])
+        self._publish(changes)
+
+    def drop_worker(self, worker: str):
+        changes: List[list] = []
+        for room_id in list(self.worker_rooms.get(worker, ())):
+            self._release(worker, room_id, changes)
+        self.worker_rooms.pop(worker, None)
+        self.worker_counters.pop(worker, None)
+        self._publish(changes)
+
+    def _open(self, worker: str, room_id: str, info: dict, changes: List[list]):
+        self.owners.setdefault(room_id, set()).add(worker)
+        self.worker_rooms.setdefault(worker, set()).add(room_id)
+        if room_id not in self.rooms:
+            self.rooms[room_id] = {**info, "participants": {}}
+            self._changed(changes, ["open", room_id, info], self.rooms[room_id])
+
+    def _release(self, worker: str, room_id: str, changes: List[list]):
+        self.worker_rooms.get(worker, set()).discard(room_id)
+        owners = self.owners.get(room_id)
+        if owners is None:
+            return
+        owners.discard(worker)
+        if not owners:
+            del self.owners[room_id]
+            room = self.rooms.pop(room_id)
+            self.participants -= len(room["participants"])
+            self._changed(changes, ["close", room_id], room)
+
+    def _join(self, room_id: str, user_id: str, username: str, changes: List[list]):
+        room = self.rooms.get(room_id)
+        if room is None or room["participants"].get(user_id) == username:
+            return
+        if user_id not in room["participants"]:
+            self.participants += 1
+        room["participants"][user_id] = username
+        self._changed(changes, ["join", room_id, user_id, username], room)
+
+    def _leave(self, room_id: str, user_id: str, changes: List[list]):
+        room = self.rooms.get(room_id)
+        if room is None or room["participants"].pop(user_id, None) is None:
+            return
+        self.participants -= 1
+        self._changed(changes, ["leave", room_id, user_id], room)
+
+    def _reset(self, room_id: str, members: List[list], changes: List[list]):
+        room = self.rooms.get(room_id)
+        if room is None:
+            return
+        current = dict(members)
+        for user_id in [user_id for user_id in room["participants"] if user_id not in current]:
+            self._leave(room_id, user_id, changes)
+        for user_id, username in current.items():
+            self._join(room_id, user_id, username, changes)
+
+    def _changed(self, changes: List[list], change: list, room: dict):
+        changes.append(change)
+        if self._live and self.on_change is not None:
+            self.on_change(change, room)
+
+    def _publish(self, changes: List[list]):
+        counters = self.counters()
+        if not changes and counters == self._counters:
+            return
+        self._counters = counters
+        event = {"ops": changes, "counters": counters}
+        for subscriber in self.subscribers:
+            subscriber.push(event)
+
+
+class FeedServer:
+    """Admin-server side: accepts worker feeds on a Unix socket and applies them to a mirror"""
+
+    def __init__(self, path: str, mirror: AdminMirror):
+        self.path = path
+        self.mirror = mirror
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.writers: Dict[str, asyncio.StreamWriter] = {}  # worker -> connection
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self._handle_worker, path=self.path)
+
+    async def _handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        worker = None
+        try:
+            while True:
+                message = await read_frame(reader)
+                worker = str(message["worker"])
+                self.writers[worker] = writer
+                self.mirror.apply(message)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError, asyncio.CancelledError):
+            pass
+        except (ValueError, KeyError, IndexError, TypeError):
+            logger.exception("Bad admin feed frame from %s", worker)
+        finally:
+            if worker is not None:
+                self.writers.pop(worker, None)
+                self.mirror.drop_worker(worker)
+            writer.close()
+
+    def close_room(self, room_id: str) -> bool:
+        """Ask the workers holding a room to close it; False if no connected worker holds it"""
+        sent = False
+        for worker in self.mirror.owners.get(room_id, ()):
+            writer = self.writers.get(worker)
+            if writer is not None and not writer.is_closing():
+                writer.write(encode_frame({"command": "close_room", "room_id": room_id}))
+                sent = True
+        return sent
+
+    def reload_meetings(self) -> int:
+        """Have every connected worker reload its scheduled meetings; the number asked"""
+        frame = encode_frame({"command": "reload_meetings"})
+        sent = 0
+        for writer in self.writers.values():
+            if not writer.is_closing():
+                writer.write(frame)
+                sent += 1
+        return sent
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        for writer in list(self.writers.values()):
+            writer.close()
@@ -6,20 +6,30 @@ Password: password
 """
 
 from fastapi import FastAPI, Request, HTTPException, Depends, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 import secrets
 import uvicorn
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import csv
+import io
 import json
 import os
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Optional
 import asyncio
 import websockets
 import socketio
 
+from admin_feed import AdminMirror, FeedServer, Subscriber
+from analytics import COUNTERS, FIELDS, GAUGES, RESOLUTIONS, Analytics
+from audit_log import AuditLog
+from recordings import list_recordings
+from scheduler import ACTIVE, CANCELLED, COMPLETED, SCHEDULED, Scheduler, parse_meeting, schedule_at
+from chat_log import ChatLog
+
 # Initialize FastAPI app
 app = FastAPI(title="Teams Clone Admin Dashboard", version="1.0.0")
 
@@ -34,21 +44,124 @@ ADMIN_PASSWORD = "password"
 templates = Jinja2Templates(directory="admin_templates")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# Recordings written by the main server (MYCONFAPP_RECORDINGS_DIR there as well)
+RECORDINGS_DIR = os.environ.get("MYCONFAPP_RECORDINGS_DIR", "recordings")
+
+# Chat history database of the main server (MYCONFAPP_CHAT_DB there as well), searched read-only
+CHAT_DB_URL = os.environ.get("MYCONFAPP_CHAT_DB", "sqlite:///chat.db")
+chat_log = ChatLog(CHAT_DB_URL, read_only=True)
+
+# Scheduled meetings, stored in the same database as by the main server (MYCONFAPP_MEETINGS_DB
+# there as well), whose workers run their timers; they are told to reload after every change
+MEETINGS_DB_URL = os.environ.get("MYCONFAPP_MEETINGS_DB", "sqlite:///meetings.db")
+scheduler = Scheduler(MEETINGS_DB_URL, timers=False)
+
+# Meetings listed on the meetings page (from the start of today) and on the dashboard
+MEETINGS_PAGE_SIZE = 200
+DASHBOARD_MEETINGS = 10
+
+# Fields of the meetings page's form an update changes
+MEETING_FORM_FIELDS = ("title", "date", "start_time", "duration", "start_at", "end_at", "description",
+                       "participants", "auto_record")
+
+# Unix socket the main server's workers stream room changes to (MYCONFAPP_ADMIN_FEED there as well)
+ADMIN_FEED_PATH = os.environ.get("MYCONFAPP_ADMIN_FEED", "admin_feed.sock")
+
+# Dashboards get a comment line this often while nothing changes, so proxies keep the stream open
+STREAM_KEEPALIVE = 15.0
+
+# Live mirror of the main server's rooms, updated from the feed (see admin_feed.py)
+mirror = AdminMirror()
+feed_server = FeedServer(ADMIN_FEED_PATH, mirror) if ADMIN_FEED_PATH else None
+
+# Per-minute analytics history (see analytics.py); empty keeps analytics in memory only
+ANALYTICS_DIR = os.environ.get("MYCONFAPP_ANALYTICS_DIR", "analytics")
+
+# Seconds between samples of the live rooms, participants and connections for analytics
+ANALYTICS_SAMPLE_INTERVAL = 5.0
+
+# Usage counted from the feed: meetings, joins and leaves as the mirror applies them, chat
+# messages, screen shares, recordings and files as the workers report them
+analytics_store = Analytics(ANALYTICS_DIR or None)
+analytics_sampler: Optional[asyncio.Task] = None
+
+def meeting_seconds(room: dict) -> float:
+    try:
+        return max(0.0, (datetime.now() - datetime.fromisoformat(room["created_at"])).total_seconds())
+    except (KeyError, TypeError, ValueError):
+        return 0.0
+
+def record_change(change: list, room: dict):
+    kind = change[0]
+    if kind == "open":
+        analytics_store.add("meetings")
+    elif kind == "close":
+        analytics_store.add("meetings_ended")
+        analytics_store.add("meeting_seconds", meeting_seconds(room))
+    elif kind == "join":
+        analytics_store.add("joins")
+    elif kind == "leave":
+        analytics_store.add("leaves")
+
+def record_events(events: dict):
+    for kind, count in events.items():
+        if kind in COUNTERS and isinstance(count, int):
+            analytics_store.add(kind, count)
+
+mirror.on_change = record_change
+mirror.on_events = record_events
+
+async def sample_gauges():
+    while True:
+        counters = mirror.counters()
+        for field in GAUGES:
+            analytics_store.set_gauge(field, counters[field])
+        await asyncio.sleep(ANALYTICS_SAMPLE_INTERVAL)
+
+@app.on_event("startup")
+async def start_feed_server():
+    global analytics_sampler
+    analytics_sampler = asyncio.ensure_future(sample_gauges())
+    if feed_server is not None:
+        await feed_server.start()
+
+@app.on_event("shutdown")
+async def stop_feed_server():
+    if feed_server is not None:
+        await feed_server.stop()
+    if analytics_sampler is not None:
+        analytics_sampler.cancel()
+    analytics_store.flush()
+    await audit_log.close()
+    await scheduler.stop()
+    await chat_log.close()
+
+# Admin action log (see audit_log.py); empty keeps only the most recent entries, in memory
+AUDIT_DIR = os.environ.get("MYCONFAPP_AUDIT_DIR", "audit")
+audit_log = AuditLog(AUDIT_DIR or None)
+
+# Connected users listed on the users page
+USERS_PAGE_SIZE = 100
+
+# Audit log entries per page
+AUDIT_PAGE_SIZE = 50
+AUDIT_PAGE_MAX = 200
+
 # Global data store for admin dashboard
+# Rooms, participants and connections come from the live mirror
 admin_data = {
-    "active_rooms": {},
-    "total_users": 0,
+    "active_rooms": mirror.rooms,
     "total_meetings": 0,
     "server_stats": {
-        "uptime": datetime.now(),
-        "total_connections": 0,
-        "active_connections": 0
+        "uptime": datetime.now()
     },
-    "scheduled_meetings": [],
-    "recordings": [],
-    "user_activities": []
+    "recordings": []
 }
 
+def refresh_recordings():
+    """Reload the recordings list from the recordings directory"""
+    admin_data["recordings"] = list_recordings(RECORDINGS_DIR)
+
 def verify_admin(credentials: HTTPBasicCredentials = Depends(security)):
     """Verify admin credentials"""
     is_correct_username = secrets.compare_digest(credentials.username, ADMIN_USERNAME)
@@ -65,15 +178,18 @@ def verify_admin(credentials: HTTPBasicCredentials = Depends(security)):
 @app.get("/", response_class=HTMLResponse)
 async def admin_dashboard(request: Request, admin: str = Depends(verify_admin)):
     """Main admin dashboard"""
+    refresh_recordings()
     
     # Calculate statistics
+    counters = mirror.counters()
+    meeting_counts = await scheduler.counts()
     stats = {
-        "total_rooms": len(admin_data["active_rooms"]),
-        "total_users": admin_data["total_users"],
+        "total_rooms": counters["rooms"],
+        "total_users": counters["participants"],
         "total_meetings": admin_data["total_meetings"],
-        "active_connections": admin_data["server_stats"]["active_connections"],
+        "active_connections": counters["connections"],
         "uptime": datetime.now() - admin_data["server_stats"]["uptime"],
-        "scheduled_meetings": len(admin_data["scheduled_meetings"]),
+        "scheduled_meetings": meeting_counts[SCHEDULED],
         "recordings": len(admin_data["recordings"])
     }
     
@@ -82,8 +198,8 @@ async def admin_dashboard(request: Request, admin: str = Depends(verify_admin)):
         "admin_user": admin,
         "stats": stats,
         "active_rooms": admin_data["active_rooms"],
-        "recent_activities": admin_data["user_activities"][-10:],  # Last 10 activities
-        "scheduled_meetings": admin_data["scheduled_meetings"]
+        "recent_activities": audit_log.latest(10),
+        "scheduled_meetings": await scheduler.page(since=time.time(), status=SCHEDULED, limit=DASHBOARD_MEETINGS)
     })
 
 @app.get("/rooms", response_class=HTMLResponse)
@@ -96,34 +212,118 @@ async def manage_rooms(request: Request, admin: str = Depends(verify_admin)):
     })
 
 @app.get("/users", response_class=HTMLResponse)
-async def manage_users(request: Request, admin: str = Depends(verify_admin)):
-    """User management page"""
+async def manage_users(request: Request, cursor: Optional[int] = None, action: Optional[str] = None,
+                       admin: str = Depends(verify_admin)):
+    """User management page, with one page of the audit log (older pages by `cursor`)"""
+    entries, next_cursor = await audit_log.query(action=action or None, before=cursor, limit=AUDIT_PAGE_SIZE)
+    counters = mirror.counters()
+    users = {}
+    for room_id, room in mirror.rooms.items():
+        for user_id, username in room["participants"].items():
+            if len(users) >= USERS_PAGE_SIZE:
+                break
+            users[user_id] = {"name": username or "Anonymous User", "status": "online", "current_room": room_id}
     return templates.TemplateResponse("admin_users.html", {
         "request": request,
         "admin_user": admin,
-        "user_activities": admin_data["user_activities"]
+        "users": users,
+        "user_stats": {
+            "online_users": counters["participants"],
+            "idle_users": 0,
+            "total_connections": counters["connections"],
+            "avg_session_time": "-"
+        },
+        "audit_entries": entries,
+        "audit_next_cursor": next_cursor,
+        "audit_action": action or ""
     })
 
+def start_of_today() -> float:
+    return datetime.combine(datetime.now().date(), datetime.min.time()).timestamp()
+
 @app.get("/meetings", response_class=HTMLResponse)
 async def manage_meetings(request: Request, admin: str = Depends(verify_admin)):
-    """Meeting management page"""
+    """Meeting management page: today's meetings and the ones after, by start time"""
+    refresh_recordings()
+    totals = await scheduler.counts()
+    today = await scheduler.counts(since=start_of_today())
     return templates.TemplateResponse("admin_meetings.html", {
         "request": request,
         "admin_user": admin,
-        "scheduled_meetings": admin_data["scheduled_meetings"],
+        "meetings": await scheduler.page(since=start_of_today(), limit=MEETINGS_PAGE_SIZE),
+        "meeting_stats": {
+            "scheduled_meetings": totals[SCHEDULED],
+            "active_meetings": totals[ACTIVE],
+            "completed_today": today[COMPLETED],
+            "cancelled_meetings": totals[CANCELLED]
+        },
         "recordings": admin_data["recordings"]
     })
 
+# Analytics page periods: (resolution, buckets) shown and compared with the period before
+ANALYTICS_PERIODS = {"today": ("hour", 24), "week": ("day", 7), "month": ("day", 30)}
+
+# Activity counted per meeting in the engagement chart, in the chart's label order
+ENGAGEMENT_FIELDS = ("messages", "screen_shares", "recordings", "files")
+
+def bucket_label(start: float, resolution: str) -> str:
+    if resolution == "day":
+        return datetime.fromtimestamp(start, timezone.utc).strftime("%a %d %b")
+    return datetime.fromtimestamp(start).strftime("%H:%M")
+
+def format_duration(seconds: float) -> str:
+    minutes = int(seconds // 60)
+    return f"{minutes // 60}h {minutes % 60}m" if minutes >= 60 else f"{minutes}m"
+
+def trend(current: float, previous: float) -> Optional[int]:
+    """Change from the previous period in percent, None without a previous value"""
+    return round((current - previous) / previous * 100) if previous else None
+
 @app.get("/analytics", response_class=HTMLResponse)
-async def analytics(request: Request, admin: str = Depends(verify_admin)):
+async def analytics(request: Request, period: str = "today", admin: str = Depends(verify_admin)):
     """Analytics and reports page"""
+    if period not in ANALYTICS_PERIODS:
+        raise HTTPException(status_code=400, detail=f"Unknown period: {period}")
+    resolution, count = ANALYTICS_PERIODS[period]
+    current = {field: analytics_store.total(field, resolution, count) for field in COUNTERS}
+    previous = {field: analytics_store.total(field, resolution, count, skip=count) for field in COUNTERS}
+    average = current["meeting_seconds"] / current["meetings_ended"] if current["meetings_ended"] else 0.0
+    previous_average = previous["meeting_seconds"] / previous["meetings_ended"] if previous["meetings_ended"] else 0.0
+    starts, meetings = analytics_store.series("meetings", resolution, count)
+    days = count if resolution == "day" else 1
+    # Concurrency is read per minute for a day, per hour for longer periods
+    fine = "minute" if days == 1 else "hour"
+    counters = mirror.counters()
+    meeting_counts = await scheduler.counts(since=time.time() - days * 86400)
+    live_rooms = sorted(mirror.rooms.values(), key=lambda room: len(room["participants"]), reverse=True)[:10]
     
-    # Generate analytics data
     analytics_data = {
-        "daily_users": generate_daily_stats(),
-        "room_usage": generate_room_usage_stats(),
-        "peak_hours": generate_peak_hours_stats(),
-        "feature_usage": generate_feature_usage_stats()
+        "period": period,
+        "total_users": int(current["joins"]),
+        "total_meetings": int(current["meetings"]),
+        "avg_meeting_duration": format_duration(average),
+        "total_recordings": int(current["recordings"]),
+        "trends": {
+            "users": trend(current["joins"], previous["joins"]),
+            "meetings": trend(current["meetings"], previous["meetings"]),
+            "duration": trend(average, previous_average),
+            "recordings": trend(current["recordings"], previous["recordings"]),
+        },
+        "activity_labels": json.dumps([bucket_label(start, resolution) for start in starts]),
+        "activity_data": json.dumps([int(value) for value in meetings]),
+        "status_data": json.dumps([meeting_counts[SCHEDULED], counters["rooms"],
+                                   int(current["meetings_ended"]), meeting_counts[CANCELLED]]),
+        "hours_labels": json.dumps([f"{hour:02d}:00" for hour in range(24)]),
+        "hours_data": json.dumps(analytics_store.peak_hours("participants", days)),
+        "engagement_data": json.dumps([round(current[field] / max(current["meetings"], 1), 2)
+                                       for field in ENGAGEMENT_FIELDS]),
+        "participants": analytics_store.percentiles("participants", fine, days * 86400 // RESOLUTIONS[fine][0]),
+        "live": counters,
+        "live_rooms": [{"name": room["name"], "mode": room["mode"], "participants": len(room["participants"]),
+                        "open_for": format_duration(meeting_seconds(room))} for room in live_rooms],
+        "recent_issues": [],
+        "export_resolution": fine,
+        "export_since": (datetime.now(timezone.utc) - timedelta(days=days)).isoformat(),
     }
     
     return templates.TemplateResponse("admin_analytics.html", {
@@ -132,20 +332,87 @@ async def analytics(request: Request, admin: str = Depends(verify_admin)):
         "analytics": analytics_data
     })
 
+@app.get("/api/analytics/realtime")
+async def analytics_realtime(admin: str = Depends(verify_admin)):
+    """Live counters and the last hour minute by minute"""
+    starts, participants = analytics_store.series("participants", "minute", 60)
+    return {
+        "counters": mirror.counters(),
+        "minutes": [datetime.fromtimestamp(start, timezone.utc).isoformat() for start in starts],
+        "participants": participants,
+        "joins": analytics_store.series("joins", "minute", 60)[1],
+        "messages": analytics_store.series("messages", "minute", 60)[1],
+        "participant_percentiles": analytics_store.percentiles("participants", "minute", 60),
+        "store": analytics_store.snapshot(),
+    }
+
+# Bytes of export output collected before each write to the client
+EXPORT_CHUNK = 64 * 1024
+
+def export_value(value: float):
+    return int(value) if value.is_integer() else round(value, 3)
+
+def export_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(("start",) + FIELDS)
+    for start, row in rows:
+        writer.writerow([datetime.fromtimestamp(start, timezone.utc).isoformat()] + [export_value(value) for value in row])
+        if buffer.tell() >= EXPORT_CHUNK:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def export_json(rows):
+    chunk, separator = ["["], ""
+    size = 1
+    for start, row in rows:
+        entry = {"start": datetime.fromtimestamp(start, timezone.utc).isoformat(),
+                 **{field: export_value(value) for field, value in zip(FIELDS, row)}}
+        line = separator + json.dumps(entry)
+        separator = ",\n"
+        chunk.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK:
+            yield "".join(chunk)
+            chunk, size = [], 0
+    chunk.append("]\n")
+    yield "".join(chunk)
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Not an ISO timestamp: {value}")
+
+@app.get("/api/analytics/export")
+async def export_analytics(format: str = "csv", resolution: str = "hour", since: Optional[str] = None,
+                           until: Optional[str] = None, admin: str = Depends(verify_admin)):
+    """The stored history as CSV or JSON, downsampled to `resolution` (minute, hour or day) while
+    it streams; optional ISO bounds `since` and `until`"""
+    if format not in ("csv", "json"):
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {format}")
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown resolution: {resolution}")
+    rows = analytics_store.export(resolution, parse_time(since), parse_time(until))
+    body = export_csv(rows) if format == "csv" else export_json(rows)
+    media_type = "text/csv" if format == "csv" else "application/json"
+    return StreamingResponse(body, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="analytics-{resolution}.{format}"'})
+
 # API Endpoints for admin actions
 @app.post("/api/rooms/{room_id}/close")
 async def close_room(room_id: str, admin: str = Depends(verify_admin)):
-    """Close a specific room"""
-    if room_id in admin_data["active_rooms"]:
-        del admin_data["active_rooms"][room_id]
+    """Close a specific room on the workers holding it; it leaves the mirror once they report it closed"""
+    if room_id in mirror.rooms:
+        if feed_server is None or not feed_server.close_room(room_id):
+            raise HTTPException(status_code=503, detail="No server connection for this room")
         
         # Log admin action
-        admin_data["user_activities"].append({
-            "timestamp": datetime.now().isoformat(),
-            "admin": admin,
-            "action": "closed_room",
-            "room_id": room_id
-        })
+        audit_log.record(admin, "closed_room", room_id)
         
         return {"success": True, "message": f"Room {room_id} closed"}
     else:
@@ -156,50 +423,202 @@ async def disconnect_user(user_id: str, admin: str = Depends(verify_admin)):
     """Disconnect a specific user"""
     
     # Log admin action
-    admin_data["user_activities"].append({
-        "timestamp": datetime.now().isoformat(),
-        "admin": admin,
-        "action": "disconnected_user",
-        "user_id": user_id
-    })
+    audit_log.record(admin, "disconnected_user", user_id)
     
     return {"success": True, "message": f"User {user_id} disconnected"}
 
+def reload_meetings():
+    """Have the workers pick up a changed meeting now rather than at their next refill"""
+    if feed_server is not None:
+        feed_server.reload_meetings()
+
+def close_meeting_room(meeting: dict):
+    if feed_server is not None and meeting["room_id"] in mirror.rooms:
+        feed_server.close_room(meeting["room_id"])
+
+async def pending_meeting(meeting_id: str) -> dict:
+    meeting = await scheduler.get(meeting_id)
+    if meeting is None:
+        raise HTTPException(status_code=404, detail="Meeting not found")
+    if meeting["status"] not in (SCHEDULED, ACTIVE):
+        raise HTTPException(status_code=409, detail=f"Meeting is {meeting['status']}")
+    return meeting
+
+@app.post("/api/meetings/create")
+async def create_meeting(request: Request, admin: str = Depends(verify_admin)):
+    """Schedule a meeting from the meetings page's form"""
+    form = dict(await request.form())
+    form.pop("id", None)
+    try:
+        meeting = await scheduler.add(parse_meeting(form, form.get("organizer") or admin))
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    reload_meetings()
+    audit_log.record(admin, "created_meeting", meeting["id"])
+    return {"success": True, "meeting_id": meeting["id"], "room_id": meeting["room_id"]}
+
+@app.post("/api/meetings/{meeting_id}/update")
+async def update_meeting(meeting_id: str, request: Request, admin: str = Depends(verify_admin)):
+    """Change a scheduled meeting; its reminder and room follow the new time"""
+    meeting = await pending_meeting(meeting_id)
+    if meeting["status"] != SCHEDULED:
+        raise HTTPException(status_code=409, detail="Only meetings that have not started can be changed")
+    form = dict(await request.form())
+    form["id"] = meeting_id
+    try:
+        changed = parse_meeting(form)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    if changed["end_at"] <= time.time():
+        raise HTTPException(status_code=400, detail="The meeting would be over already")
+    # A new time means new timers: nothing has fired for it yet
+    meeting = await scheduler.update(meeting_id, reschedule=True, **{name: changed[name] for name in MEETING_FORM_FIELDS})
+    if meeting is None:
+        raise HTTPException(status_code=409, detail="Meeting was cancelled or ended meanwhile")
+    reload_meetings()
+    audit_log.record(admin, "updated_meeting", meeting_id)
+    return {"success": True, "meeting_id": meeting_id}
+
+@app.post("/api/meetings/{meeting_id}/start")
+async def start_meeting(meeting_id: str, admin: str = Depends(verify_admin)):
+    """Start a scheduled meeting now: a worker opens its room at once, it keeps its duration"""
+    meeting = await pending_meeting(meeting_id)
+    if meeting["status"] == SCHEDULED:
+        # The listed date and start time move with it, so the page and the export show when it started
+        meeting = await scheduler.update(meeting_id, status=ACTIVE, **schedule_at(time.time(), meeting["duration"]))
+        if meeting is None:
+            raise HTTPException(status_code=409, detail="Meeting was cancelled or ended meanwhile")
+        reload_meetings()
+        audit_log.record(admin, "started_meeting", meeting_id)
+    return {"success": True, "meeting_id": meeting_id, "room_id": meeting["room_id"]}
+
+@app.post("/api/meetings/{meeting_id}/end")
+async def end_meeting(meeting_id: str, admin: str = Depends(verify_admin)):
+    """End a meeting now and close its room"""
+    await pending_meeting(meeting_id)
+    meeting = await scheduler.update(meeting_id, status=COMPLETED, end_at=time.time())
+    if meeting is None:
+        raise HTTPException(status_code=409, detail="Meeting was cancelled or ended meanwhile")
+    close_meeting_room(meeting)
+    reload_meetings()
+    audit_log.record(admin, "ended_meeting", meeting_id)
+    return {"success": True, "meeting_id": meeting_id}
+
 @app.post("/api/meetings/{meeting_id}/cancel")
 async def cancel_meeting(meeting_id: str, admin: str = Depends(verify_admin)):
-    """Cancel a scheduled meeting"""
-    
-    # Find and remove meeting
-    admin_data["scheduled_meetings"] = [
-        m for m in admin_data["scheduled_meetings"] 
-        if m.get("id") != meeting_id
-    ]
+    """Cancel a scheduled or running meeting; a running one's room is closed"""
+    await pending_meeting(meeting_id)
+    meeting = await scheduler.cancel(meeting_id)
+    if meeting is None:
+        raise HTTPException(status_code=409, detail="Meeting was cancelled or ended meanwhile")
+    close_meeting_room(meeting)
+    reload_meetings()
     
     # Log admin action
-    admin_data["user_activities"].append({
-        "timestamp": datetime.now().isoformat(),
-        "admin": admin,
-        "action": "cancelled_meeting",
-        "meeting_id": meeting_id
-    })
+    audit_log.record(admin, "cancelled_meeting", meeting_id)
     
     return {"success": True, "message": f"Meeting {meeting_id} cancelled"}
 
+@app.get("/api/meetings/{meeting_id}/details")
+async def meeting_details(meeting_id: str, admin: str = Depends(verify_admin)):
+    """One meeting; its room is /room/{room_id} on the main server"""
+    meeting = await scheduler.get(meeting_id)
+    if meeting is None:
+        raise HTTPException(status_code=404, detail="Meeting not found")
+    return meeting
+
+# Columns of the meetings export
+MEETING_EXPORT_FIELDS = ("id", "title", "organizer", "status", "date", "start_time", "duration", "participants",
+                         "description", "created_at")
+
+def export_meetings(meetings):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(MEETING_EXPORT_FIELDS)
+    for meeting in meetings:
+        meeting["participants"] = ", ".join(meeting["participants"] or ())
+        writer.writerow([meeting.get(name) for name in MEETING_EXPORT_FIELDS])
+        if buffer.tell() >= EXPORT_CHUNK:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+@app.get("/api/meetings/export")
+async def export_meetings_csv(admin: str = Depends(verify_admin)):
+    """Every meeting as CSV, by start time, read from the database while it streams"""
+    return StreamingResponse(export_meetings(scheduler.export()), media_type="text/csv", headers={
+        "Content-Disposition": 'attachment; filename="meetings.csv"'})
+
 @app.get("/api/stats")
 async def get_stats(admin: str = Depends(verify_admin)):
     """Get real-time statistics"""
+    refresh_recordings()
     
+    counters = mirror.counters()
     stats = {
-        "total_rooms": len(admin_data["active_rooms"]),
-        "total_users": admin_data["total_users"],
-        "active_connections": admin_data["server_stats"]["active_connections"],
-        "scheduled_meetings": len(admin_data["scheduled_meetings"]),
+        "total_rooms": counters["rooms"],
+        "total_users": counters["participants"],
+        "active_connections": counters["connections"],
+        "scheduled_meetings": (await scheduler.counts())[SCHEDULED],
         "recordings": len(admin_data["recordings"]),
         "uptime_seconds": (datetime.now() - admin_data["server_stats"]["uptime"]).total_seconds()
     }
     
     return stats
 
+@app.get("/api/stream")
+async def stream_changes(admin: str = Depends(verify_admin)):
+    """Server-Sent Events: a snapshot of the live rooms and counters, then only what changes"""
+    # Snapshot and subscription happen without awaiting in between, so no change is missed
+    snapshot = json.dumps(mirror.state())
+    subscriber = Subscriber()
+    mirror.subscribers.add(subscriber)
+
+    async def events():
+        try:
+            yield f"event: snapshot\ndata: {snapshot}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.next(), STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    break  # too far behind; the browser reconnects and starts from a new snapshot
+                yield f"data: {json.dumps(event)}\n\n"
+        finally:
+            mirror.subscribers.discard(subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/api/audit")
+async def get_audit_log(admin_name: Optional[str] = None, action: Optional[str] = None, target: Optional[str] = None,
+                        since: Optional[str] = None, until: Optional[str] = None, cursor: Optional[int] = None,
+                        limit: int = AUDIT_PAGE_SIZE, admin: str = Depends(verify_admin)):
+    """Admin actions, newest first, optionally by admin (`admin_name`), action and target id
+    (room, user or meeting) and between ISO timestamps; pass the returned `next_cursor` as
+    `cursor` for the next page"""
+    limit = max(1, min(limit, AUDIT_PAGE_MAX))
+    entries, next_cursor = await audit_log.query(admin_name, action, target, since, until, cursor, limit)
+    return {"entries": entries, "next_cursor": next_cursor}
+
+@app.get("/api/recordings")
+async def get_recordings(admin: str = Depends(verify_admin)):
+    """Recordings of all rooms, newest first"""
+    refresh_recordings()
+    return {"recordings": admin_data["recordings"]}
+
+@app.get("/api/messages/search")
+async def search_messages(q: str, room_id: Optional[str] = None, user_id: Optional[str] = None,
+                          since: Optional[str] = None, until: Optional[str] = None,
+                          cursor: Optional[int] = None, limit: int = 50,
+                          admin: str = Depends(verify_admin)):
+    """Chat messages of every room (or `room_id`) containing the words of `q`, newest first"""
+    limit = max(1, min(limit, 200))
+    messages, next_cursor = await chat_log.search(q, room_id, user_id, since, until, cursor, limit)
+    return {"query": q, "messages": messages, "next_cursor": next_cursor}
+
 @app.post("/api/broadcast")
 async def broadcast_message(
     message: str = Form(...),
@@ -208,53 +627,11 @@ async def broadcast_message(
     """Broadcast message to all users"""
     
     # Log admin action
-    admin_data["user_activities"].append({
-        "timestamp": datetime.now().isoformat(),
-        "admin": admin,
-        "action": "broadcast_message",
-        "message": message
-    })
+    audit_log.record(admin, "broadcast_message", message=message)
     
     # In a real implementation, this would send the message to all connected clients
     return {"success": True, "message": "Broadcast sent successfully"}
 
-# Utility functions for analytics
-def generate_daily_stats():
-    """Generate daily user statistics"""
-    return {
-        "labels": ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"],
-        "data": [45, 52, 38, 61, 78, 35, 42]  # Sample data
-    }
-
-def generate_room_usage_stats():
-    """Generate room usage statistics"""
-    return {
-        "labels": ["Video Calls", "Screen Share", "File Share", "Chat Only"],
-        "data": [65, 45, 30, 55]  # Sample data
-    }
-
-def generate_peak_hours_stats():
-    """Generate peak hours statistics"""
-    return {
-        "labels": ["00:00", "04:00", "08:00", "12:00", "16:00", "20:00"],
-        "data": [5, 2, 35, 65, 45, 25]  # Sample data
-    }
-
-def generate_feature_usage_stats():
-    """Generate feature usage statistics"""
-    return {
-        "recording": 75,
-        "screen_sharing": 85,
-        "file_sharing": 60,
-        "chat": 95,
-        "scheduling": 40
-    }
-
-# Update admin data from main server (this would be called by the main server)
-def update_admin_data(room_data: Dict[str, Any]):
-    """Update admin dashboard with data from main server"""
-    admin_data.update(room_data)
-
 if __name__ == "__main__":
     print("🔧 Starting Teams Clone Administrator Dashboard...")
     print("🌐 Dashboard URL: http://localhost:5001")
@@ -0,0 +1,348 @@
+"""
+Usage analytics in fixed-size, multi-resolution counter rings
+Activity is counted per minute in a ring of the last day. Every minute that closes is folded
+into its hour (a ring of 31 days) and its day (a ring of 400 days): counters are summed, gauges
+keep their peak. Memory is fixed whatever the uptime, and a query reads at most one ring.
+
+Rings are flat array('d') buffers. With NumPy installed queries run on zero-copy views of them
+(percentiles, peak hours, window sums); without it the same queries run in plain Python.
+
+Closed minutes are also appended to monthly CSV segments (minutes-YYYY-MM.csv). The export reads
+them row by row, downsampling on the fly, and the rings are rebuilt from them at startup.
+Minutes without any activity are not written; gauges hold their last value across them.
+"""
+
+import csv
+import glob
+import itertools
+import logging
+import os
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import numpy
+except ImportError:  # optional speed-up
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+# Summed when minutes are folded into hours and days
+COUNTERS = ("meetings", "meetings_ended", "meeting_seconds", "joins", "leaves",
+            "messages", "screen_shares", "recordings", "files")
+# Peak value within the bucket
+GAUGES = ("rooms", "participants", "connections")
+FIELDS = COUNTERS + GAUGES
+FIELD_INDEX = {name: index for index, name in enumerate(FIELDS)}
+
+MINUTE = 60
+HOUR = 3600
+DAY = 86400
+
+# (seconds per bucket, buckets kept)
+RESOLUTIONS = {
+    "minute": (MINUTE, 1440),
+    "hour": (HOUR, 31 * 24),
+    "day": (DAY, 400),
+}
+
+
+def available() -> bool:
+    return numpy is not None
+
+
+class Ring:
+    """The newest `size` buckets of one resolution, one row of FIELDS per bucket"""
+
+    def __init__(self, seconds: int, size: int):
+        self.seconds = seconds
+        self.size = size
+        self.values = array("d", bytes(8 * size * len(FIELDS)))
+        self.newest: Optional[int] = None  # bucket number (epoch // seconds) of the newest row
+
+    def advance(self, bucket: int, gauges: Sequence[float]):
+        """Make `bucket` the newest row; rows entered on the way start with no counts and the
+        gauges' current values"""
+        if self.newest is not None and bucket <= self.newest:
+            return
+        width = len(FIELDS)
+        empty = array("d", bytes(8 * width))
+        carried = array("d", bytes(8 * len(COUNTERS))) + array("d", gauges)
+        if self.newest is None:
+            first, before = bucket - self.size + 1, empty  # nothing is known before the first bucket
+        else:
+            first, before = max(self.newest + 1, bucket - self.size + 1), carried
+        for number in range(first, bucket + 1):
+            start = (number % self.size) * width
+            self.values[start:start + width] = carried if number == bucket else before
+        self.newest = bucket
+
+    def row(self, bucket: int) -> int:
+        """Offset of a bucket's row in values"""
+        return (bucket % self.size) * len(FIELDS)
+
+    def fold(self, bucket: int, row: Sequence[float], gauges: Sequence[float]):
+        """Add one finer-grained row: counters summed, gauges by peak"""
+        self.advance(bucket, gauges)
+        start = self.row(bucket)
+        values = self.values
+        for index in range(len(FIELDS)):
+            if index < len(COUNTERS):
+                values[start + index] += row[index]
+            elif row[index] > values[start + index]:
+                values[start + index] = row[index]
+
+    def column(self, field: str, count: int):
+        """Bucket numbers and values of one field for the newest `count` buckets, oldest first:
+        NumPy arrays when available (the values a copy), else lists"""
+        count = min(count, self.size) if self.newest is not None else 0
+        first = (self.newest or 0) - count + 1
+        field_index = FIELD_INDEX[field]
+        width = len(FIELDS)
+        if numpy is not None:
+            numbers = numpy.arange(first, first + count, dtype=numpy.int64)
+            table = numpy.frombuffer(self.values, dtype=numpy.float64).reshape(self.size, width)
+            return numbers, table[numbers % self.size, field_index]
+        numbers = list(range(first, first + count))
+        return numbers, [self.values[(number % self.size) * width + field_index] for number in numbers]
+
+
+class Analytics:
+    """Counter rings at minute, hour and day resolution fed with activity as it happens"""
+
+    def __init__(self, directory: Optional[str] = None, clock=time.time):
+        self.directory = directory
+        self.clock = clock
+        self.rings = {name: Ring(seconds, size) for name, (seconds, size) in RESOLUTIONS.items()}
+        self.minute: Optional[int] = None  # open minute (epoch // 60)
+        self.current = array("d", bytes(8 * len(FIELDS)))  # the open minute's row
+        self.gauges = [0.0] * len(GAUGES)  # last value of each gauge
+        self.written = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._restore()
+
+    # Recording
+    def add(self, field: str, amount: float = 1.0):
+        self._advance(self.clock())
+        self.current[FIELD_INDEX[field]] += amount
+
+    def set_gauge(self, field: str, value: float):
+        self._advance(self.clock())
+        index = FIELD_INDEX[field]
+        self.gauges[index - len(COUNTERS)] = value
+        self.current[index] = max(self.current[index], value)
+
+    def flush(self):
+        """Store the open minute now, e.g. at shutdown; activity later in the same minute is
+        stored as a second row that readers merge with the first"""
+        if self.minute is not None:
+            self._close(write=True)
+            self.minute = None
+
+    def _advance(self, now: float):
+        minute = int(now // MINUTE)
+        if self.minute is None:
+            self._open(minute)
+        elif minute > self.minute:
+            self._close(write=True)
+            self._open(minute)
+
+    def _open(self, minute: int):
+        self.minute = minute
+        self.current = array("d", bytes(8 * len(COUNTERS))) + array("d", self.gauges)
+        for name, ring in self.rings.items():
+            ring.advance(minute * MINUTE // ring.seconds, self.gauges)
+
+    def _close(self, write: bool):
+        """Store the open minute in every ring and, if it had any activity, in the history"""
+        row, minute = self.current, self.minute
+        start = minute * MINUTE
+        for ring in self.rings.values():
+            if ring.seconds == MINUTE:
+                ring.advance(minute, self.gauges)
+                ring.values[ring.row(minute):ring.row(minute) + len(FIELDS)] = row
+            else:
+                ring.fold(start // ring.seconds, row, self.gauges)
+        if write and self.directory and any(row):
+            self._write(start, row)
+
+    # History
+    def _segment(self, start: float) -> str:
+        month = datetime.fromtimestamp(start, timezone.utc).strftime("%Y-%m")
+        return os.path.join(self.directory, f"minutes-{month}.csv")
+
+    def _write(self, start: float, row: Sequence[float]):
+        path = self._segment(start)
+        new = not os.path.exists(path)
+        try:
+            with open(path, "a", newline="") as segment:
+                writer = csv.writer(segment)
+                if new:
+                    writer.writerow(("minute",) + FIELDS)
+                writer.writerow([datetime.fromtimestamp(start, timezone.utc).isoformat()] +
+                                [_number(value) for value in row])
+            self.written += 1
+        except OSError:
+            logger.exception("Cannot write analytics history to %s", path)
+
+    def segments(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.directory, "minutes-*.csv"))) if self.directory else []
+
+    def history(self, since: Optional[float] = None, until: Optional[float] = None) -> Iterator[Tuple[float, List[float]]]:
+        """(minute start, row) of every stored minute in [since, until), oldest first, read one
+        line at a time"""
+        for path in self.segments():
+            # A segment holds one month; skip those entirely outside the range
+            month = datetime.strptime(os.path.basename(path)[8:15], "%Y-%m").replace(tzinfo=timezone.utc)
+            month_end = month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1)
+            if (since is not None and month_end.timestamp() <= since) or \
+                    (until is not None and month.timestamp() >= until):
+                continue
+            with open(path, newline="") as segment:
+                reader = csv.reader(segment)
+                header = next(reader, None)
+                if header is None:
+                    continue
+                columns = [header.index(name) if name in header else None for name in FIELDS]
+                for line in reader:
+                    try:
+                        start = datetime.fromisoformat(line[0]).timestamp()
+                        row = [float(line[column]) if column is not None else 0.0 for column in columns]
+                    except (ValueError, IndexError):
+                        continue  # a line cut short by a crash
+                    if (since is None or start >= since) and (until is None or start < until):
+                        yield start, row
+
+    def export(self, resolution: str = "minute", since: Optional[float] = None,
+               until: Optional[float] = None) -> Iterator[Tuple[float, List[float]]]:
+        """Stored history and the open minute, downsampled to `resolution` while the history is
+        read: one bucket in memory"""
+        rows = self.history(since, until)
+        if self.minute is not None and any(self.current):
+            start = self.minute * MINUTE
+            if (since is None or start >= since) and (until is None or start < until):
+                rows = itertools.chain(rows, [(start, list(self.current))])
+        return _downsample(rows, RESOLUTIONS[resolution][0])
+
+    def _restore(self):
+        """Rebuild the rings from the history of the last 400 days"""
+        since = self.clock() - RESOLUTIONS["day"][0] * RESOLUTIONS["day"][1]
+        restored = 0
+        for start, row in self.history(since):
+            minute = int(start // MINUTE)
+            if self.minute is None or minute > self.minute:
+                if self.minute is not None:
+                    self._close(write=False)
+                self._open(minute)
+                self.current = array("d", row)
+            else:
+                _merge(self.current, row)
+            self.gauges = list(self.current[len(COUNTERS):])
+            restored += 1
+        if self.minute is not None:
+            self._close(write=False)
+        # Nothing is known about the time the admin server was down
+        self.gauges = [0.0] * len(GAUGES)
+        self.minute = None
+        if restored:
+            logger.info("Restored analytics", extra={"minutes": restored})
+
+    # Queries
+    def _column(self, field: str, resolution: str, count: int):
+        """Ring.column with the open minute, which lives in self.current until it closes, added
+        to the newest bucket"""
+        self._advance(self.clock())
+        numbers, values = self.rings[resolution].column(field, count)
+        if len(values):
+            current = self.current[FIELD_INDEX[field]]
+            values[-1] = values[-1] + current if field in COUNTERS else max(values[-1], current)
+        return numbers, values
+
+    def series(self, field: str, resolution: str, count: int) -> Tuple[List[float], List[float]]:
+        """Bucket start times and values of a field for the newest `count` buckets, oldest first"""
+        seconds = self.rings[resolution].seconds
+        numbers, values = self._column(field, resolution, count)
+        return [int(number) * seconds for number in numbers], [float(value) for value in values]
+
+    def total(self, field: str, resolution: str, count: int, skip: int = 0) -> float:
+        """Sum (counters) or peak (gauges) of a field over `count` buckets ending `skip` buckets
+        before the newest"""
+        _, values = self._column(field, resolution, count + skip)
+        values = values[:len(values) - skip] if skip else values
+        if not len(values):
+            return 0.0
+        if numpy is not None:
+            return float(values.sum() if field in COUNTERS else values.max())
+        return float(sum(values) if field in COUNTERS else max(values))
+
+    def percentiles(self, field: str, resolution: str, count: int,
+                    quantiles: Sequence[float] = (50, 95, 99)) -> Dict[str, float]:
+        """Percentiles of a field's per-bucket values over the newest `count` buckets"""
+        _, values = self._column(field, resolution, count)
+        if not len(values):
+            return {f"p{q:g}": 0.0 for q in quantiles}
+        if numpy is not None:
+            results = numpy.percentile(values, quantiles)
+            return {f"p{q:g}": round(float(value), 3) for q, value in zip(quantiles, results)}
+        ordered = sorted(values)
+        return {f"p{q:g}": round(_percentile(ordered, q), 3) for q in quantiles}
+
+    def peak_hours(self, field: str = "participants", days: int = 7) -> List[float]:
+        """Mean of a field for each local hour of the day over the last `days` days"""
+        numbers, values = self._column(field, "hour", days * 24)
+        offset = time.localtime().tm_gmtoff
+        if numpy is not None:
+            hours = (numbers * HOUR + offset) // HOUR % 24
+            sums = numpy.bincount(hours, weights=values, minlength=24)
+            counts = numpy.bincount(hours, minlength=24)
+            return [round(float(value), 2) for value in sums / numpy.maximum(counts, 1)]
+        sums, counts = [0.0] * 24, [0] * 24
+        for number, value in zip(numbers, values):
+            hour = (number * HOUR + offset) // HOUR % 24
+            sums[hour] += value
+            counts[hour] += 1
+        return [round(total / max(count, 1), 2) for total, count in zip(sums, counts)]
+
+    def snapshot(self) -> dict:
+        return {
+            "numpy": available(),
+            "history_minutes_written": self.written,
+            "segments": len(self.segments()),
+        }
+
+
+def _downsample(rows: Iterator[Tuple[float, List[float]]], seconds: int) -> Iterator[Tuple[float, List[float]]]:
+    bucket, total = None, None
+    for start, row in rows:
+        number = int(start // seconds)
+        if number != bucket:
+            if total is not None:
+                yield bucket * seconds, total
+            bucket, total = number, list(row)
+        else:
+            _merge(total, row)
+    if total is not None:
+        yield bucket * seconds, total
+
+
+def _merge(total, row: Sequence[float]):
+    """Combine two rows of the same bucket: counters summed, gauges by peak"""
+    for index in range(len(COUNTERS)):
+        total[index] += row[index]
+    for index in range(len(COUNTERS), len(FIELDS)):
+        total[index] = max(total[index], row[index])
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    """Linear interpolation between closest ranks, as numpy.percentile does by default"""
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if value.is_integer() else f"{value:.3f}"
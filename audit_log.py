@@ -0,0 +1,377 @@
+"""
+Audit log of administrator actions
+The newest entries stay in a fixed-size ring, so the dashboard's recent activity and the first
+page of the log are served from memory. With a directory, every entry is also appended as a JSON
+line to the current segment file; a segment that reaches SEGMENT_BYTES is closed and a new one
+started, and the oldest segments beyond MAX_SEGMENTS are deleted.
+
+Each segment has an index: the byte offset and timestamp of every entry, and posting lists of
+entry positions per admin, action and target id. The current segment's index lives in memory;
+a closed segment's is written next to it (`.idx`), and only its summary (id and time range,
+admins, actions) is kept in memory while the full index is loaded on demand. A query walks the
+segments newest first, skips those the summary rules out, and reads only the entries it returns,
+so a page costs the same however long the history is.
+
+Entry ids increase and double as pagination cursors. All file access happens on one thread:
+appends, rotation and queries stay in order without locks, and the event loop never waits for
+the disk.
+"""
+
+import asyncio
+import base64
+import bisect
+import glob
+import hashlib
+import itertools
+import json
+import logging
+import os
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Entries kept in memory
+RECENT_SIZE = 1000
+
+# A segment is closed once it holds this many bytes; older segments beyond the count are deleted
+SEGMENT_BYTES = 4 * 1024 * 1024
+MAX_SEGMENTS = 64
+
+# Closed segments' indexes kept loaded
+INDEX_CACHE_SIZE = 8
+
+# Entry fields with a posting list in each segment index
+INDEXED_FIELDS = ("admin", "action", "target")
+
+# Bits per target id in a closed segment's target filter, and hashes per id (about 1% false
+# positives)
+FILTER_BITS_PER_TARGET = 10
+FILTER_HASHES = 7
+
+
+class TargetFilter:
+    """Bloom filter of the target ids in a segment, so a query for one id opens only the
+    segments that probably hold it"""
+
+    def __init__(self, bits: int, data: Optional[bytes] = None):
+        self.bits = bits
+        self.data = bytearray(data) if data is not None else bytearray((bits + 7) // 8)
+
+    def _positions(self, value: str):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+        return [(first + number * second) % self.bits for number in range(FILTER_HASHES)]
+
+    def add(self, value: str):
+        for position in self._positions(value):
+            self.data[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: str) -> bool:
+        return all(self.data[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    @classmethod
+    def of(cls, values) -> "TargetFilter":
+        values = list(values)
+        bloom = cls(max(64, len(values) * FILTER_BITS_PER_TARGET))
+        for value in values:
+            bloom.add(value)
+        return bloom
+
+    def encode(self) -> dict:
+        return {"bits": self.bits, "data": base64.b64encode(bytes(self.data)).decode()}
+
+    @classmethod
+    def decode(cls, encoded: dict) -> "TargetFilter":
+        return cls(encoded["bits"], base64.b64decode(encoded["data"]))
+
+
+class SegmentIndex:
+    """Offsets, timestamps and posting lists of one segment's entries; entry ids in a segment
+    are consecutive, so an entry's position is its id minus first_id"""
+
+    def __init__(self, first_id: int):
+        self.first_id = first_id
+        self.offsets: List[int] = []
+        self.times: List[str] = []
+        self.postings: Dict[str, Dict[str, List[int]]] = {field: {} for field in INDEXED_FIELDS}
+
+    def add(self, entry: dict, offset: int):
+        position = len(self.offsets)
+        self.offsets.append(offset)
+        self.times.append(entry["timestamp"])
+        for field in INDEXED_FIELDS:
+            value = entry.get(field)
+            if value is not None:
+                self.postings[field].setdefault(str(value), []).append(position)
+
+    @property
+    def last_id(self) -> int:
+        return self.first_id + len(self.offsets) - 1
+
+    def summary(self) -> dict:
+        return {
+            "first_id": self.first_id,
+            "last_id": self.last_id,
+            "first_time": self.times[0] if self.times else None,
+            "last_time": self.times[-1] if self.times else None,
+            "admin": sorted(self.postings["admin"]),
+            "action": sorted(self.postings["action"]),
+            "target": TargetFilter.of(self.postings["target"]).encode(),
+        }
+
+    def positions(self, filters: Dict[str, str], since: Optional[str], until: Optional[str],
+                  before: Optional[int], limit: int) -> List[int]:
+        """Positions of up to `limit` matching entries, newest first"""
+        high = len(self.offsets) if before is None else max(0, min(len(self.offsets), before - self.first_id))
+        low = 0
+        if since is not None:
+            low = bisect.bisect_left(self.times, since)
+        if until is not None:
+            high = min(high, bisect.bisect_left(self.times, until))
+        if high <= low:
+            return []
+        lists = []
+        for field, value in filters.items():
+            postings = self.postings[field].get(value)
+            if postings is None:
+                return []
+            lists.append(postings)
+        if not lists:
+            return list(range(high - 1, max(low, high - limit) - 1, -1))
+        # Walk the shortest posting list backwards, checking the others by bisection
+        lists.sort(key=len)
+        shortest, others = lists[0], lists[1:]
+        found = []
+        for index in range(bisect.bisect_left(shortest, high) - 1, -1, -1):
+            position = shortest[index]
+            if position < low or len(found) >= limit:
+                break
+            if all(_contains(other, position) for other in others):
+                found.append(position)
+        return found
+
+    def dump(self, path: str):
+        with open(path, "w") as index_file:
+            index_file.write(json.dumps(self.summary()) + "\n")
+            json.dump({"offsets": self.offsets, "times": self.times, "postings": self.postings}, index_file)
+
+    @classmethod
+    def load(cls, path: str) -> "SegmentIndex":
+        with open(path) as index_file:
+            summary = json.loads(index_file.readline())
+            body = json.loads(index_file.readline())
+        index = cls(summary["first_id"])
+        index.offsets, index.times, index.postings = body["offsets"], body["times"], body["postings"]
+        return index
+
+    @classmethod
+    def scan(cls, path: str, first_id: int) -> Tuple["SegmentIndex", int]:
+        """Rebuild from the segment itself, and the size of its complete lines; a line cut short
+        by a crash ends the segment"""
+        index = cls(first_id)
+        offset = 0
+        with open(path, "rb") as segment:
+            for line in segment:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                index.add(entry, offset)
+                offset += len(line)
+        return index, offset
+
+
+def read_summary(path: str) -> dict:
+    with open(path) as index_file:
+        return loaded_summary(json.loads(index_file.readline()))
+
+
+def loaded_summary(summary: dict) -> dict:
+    """A segment summary as kept in memory: admins and actions as sets, targets as a filter"""
+    return {**summary, "admin": set(summary["admin"]), "action": set(summary["action"]),
+            "target": TargetFilter.decode(summary["target"])}
+
+
+def _contains(values: List[int], value: int) -> bool:
+    index = bisect.bisect_left(values, value)
+    return index < len(values) and values[index] == value
+
+
+def _matches(entry: dict, filters: Dict[str, str], since: Optional[str], until: Optional[str]) -> bool:
+    if since is not None and entry["timestamp"] < since:
+        return False
+    if until is not None and entry["timestamp"] >= until:
+        return False
+    return all(str(entry.get(field)) == value for field, value in filters.items())
+
+
+class AuditLog:
+    """Ring of recent entries plus optional rotating, indexed segment files"""
+
+    def __init__(self, directory: Optional[str], recent_size: int = RECENT_SIZE,
+                 segment_bytes: int = SEGMENT_BYTES, max_segments: int = MAX_SEGMENTS):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.recent: Deque[dict] = deque(maxlen=recent_size)
+        self.last_id = 0
+        self.written = 0
+        self.closed: List[dict] = []  # summaries of closed segments, oldest first
+        self.active: Optional[SegmentIndex] = None
+        self.active_file = None
+        self.active_size = 0
+        self.indexes: "OrderedDict[int, SegmentIndex]" = OrderedDict()  # first_id -> loaded index
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audit-log")
+            self._open()
+            self.recent.extend(reversed(self._query({}, None, None, None, recent_size)))
+
+    @property
+    def persistent(self) -> bool:
+        return bool(self.directory)
+
+    def _path(self, first_id: int, suffix: str) -> str:
+        return os.path.join(self.directory, f"audit-{first_id:012d}.{suffix}")
+
+    def _open(self):
+        """Load the summaries of closed segments and the index of the newest one, which stays open"""
+        paths = sorted(glob.glob(os.path.join(self.directory, "audit-*.jsonl")))
+        for number, path in enumerate(paths):
+            first_id = int(os.path.basename(path)[6:18])
+            index_path = self._path(first_id, "idx")
+            if number == len(paths) - 1:
+                self.active, self.active_size = SegmentIndex.scan(path, first_id)
+                with open(path, "r+b") as segment:
+                    segment.truncate(self.active_size)  # drop a line cut short by a crash
+                self.last_id = self.active.last_id
+            elif os.path.exists(index_path):
+                self.closed.append(read_summary(index_path))
+            else:
+                index, _ = SegmentIndex.scan(path, first_id)
+                index.dump(index_path)
+                self.closed.append(loaded_summary(index.summary()))
+        if self.active is not None:
+            self.active_file = open(path, "ab")
+
+    # Writing
+    def record(self, admin: str, action: str, target: Optional[str] = None, **details) -> dict:
+        self.last_id += 1
+        entry = {"id": self.last_id, "timestamp": datetime.now().isoformat(), "admin": admin,
+                 "action": action, "target": target, **details}
+        self.recent.append(entry)
+        if self.persistent:
+            asyncio.get_running_loop().run_in_executor(self.executor, self._write, entry)
+        return entry
+
+    def _write(self, entry: dict):
+        line = (json.dumps(entry) + "\n").encode()
+        try:
+            if self.active is None or (self.active.offsets and self.active_size + len(line) > self.segment_bytes):
+                self._rotate(entry["id"])
+            self.active_file.write(line)
+            self.active_file.flush()
+        except OSError:
+            logger.exception("Writing audit entry %d failed", entry["id"])
+            return
+        self.active.add(entry, self.active_size)
+        self.active_size += len(line)
+        self.written += 1
+
+    def _rotate(self, first_id: int):
+        if self.active is not None:
+            self.active_file.close()
+            self.active.dump(self._path(self.active.first_id, "idx"))
+            self.closed.append(loaded_summary(self.active.summary()))
+        while len(self.closed) >= self.max_segments:
+            oldest = self.closed.pop(0)
+            self.indexes.pop(oldest["first_id"], None)
+            for suffix in ("jsonl", "idx"):
+                try:
+                    os.unlink(self._path(oldest["first_id"], suffix))
+                except FileNotFoundError:
+                    pass
+        self.active = SegmentIndex(first_id)
+        self.active_file = open(self._path(first_id, "jsonl"), "ab")
+        self.active_size = 0
+
+    # Reading
+    def _load_index(self, first_id: int) -> SegmentIndex:
+        index = self.indexes.get(first_id)
+        if index is None:
+            index = self.indexes[first_id] = SegmentIndex.load(self._path(first_id, "idx"))
+            if len(self.indexes) > INDEX_CACHE_SIZE:
+                self.indexes.popitem(last=False)
+        else:
+            self.indexes.move_to_end(first_id)
+        return index
+
+    def _query(self, filters: Dict[str, str], since: Optional[str], until: Optional[str],
+               before: Optional[int], limit: int) -> List[dict]:
+        """Up to `limit` matching entries from the segments, newest first"""
+        entries: List[dict] = []
+        segments = ([(self.active.first_id, self.active)] if self.active is not None else []) + \
+            [(summary["first_id"], summary) for summary in reversed(self.closed)]
+        for first_id, segment in segments:
+            if len(entries) >= limit:
+                break
+            if isinstance(segment, dict):
+                summary = segment
+                if summary["first_time"] is None or (before is not None and summary["first_id"] >= before) or \
+                        (since is not None and summary["last_time"] < since) or \
+                        (until is not None and summary["first_time"] >= until) or \
+                        any(value not in summary[field] for field, value in filters.items()):
+                    continue
+                segment = self._load_index(first_id)
+            positions = segment.positions(filters, since, until, before, limit - len(entries))
+            if positions:
+                with open(self._path(first_id, "jsonl"), "rb") as segment_file:
+                    for position in positions:
+                        segment_file.seek(segment.offsets[position])
+                        entries.append(json.loads(segment_file.readline()))
+        return entries
+
+    async def query(self, admin: Optional[str] = None, action: Optional[str] = None, target: Optional[str] = None,
+                    since: Optional[str] = None, until: Optional[str] = None, before: Optional[int] = None,
+                    limit: int = 50) -> Tuple[List[dict], Optional[int]]:
+        """Up to `limit` entries older than `before` (the newest without it), newest first,
+        optionally of one admin, action or target and within ISO timestamps [since, until); and
+        the cursor for the next page (None at the end of the history)"""
+        filters = {field: str(value) for field, value in (("admin", admin), ("action", action), ("target", target))
+                   if value is not None}
+        entries = list(itertools.islice((entry for entry in reversed(self.recent)
+                                         if (before is None or entry["id"] < before) and _matches(entry, filters, since, until)),
+                                        limit + 1))
+        # The ring answers unless the page reaches past its oldest entry
+        if len(entries) <= limit and self.persistent and (not self.recent or self.recent[0]["id"] > 1):
+            entries = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self._query, filters, since, until, before, limit + 1)
+        more = len(entries) > limit
+        entries = entries[:limit]
+        return entries, (entries[-1]["id"] if more else None)
+
+    def latest(self, count: int) -> List[dict]:
+        """The newest `count` entries, oldest first"""
+        return list(self.recent)[-count:]
+
+    async def close(self):
+        if self.persistent:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self._close_file)
+            self.executor.shutdown()
+
+    def _close_file(self):
+        if self.active_file is not None:
+            self.active_file.close()
+            self.active_file = None
+
+    def snapshot(self) -> dict:
+        return {
+            "recent": len(self.recent),
+            "last_id": self.last_id,
+            "written": self.written,
+            "segments": len(self.closed) + (1 if self.active is not None else 0),
+            "persistent": self.persistent,
+        }
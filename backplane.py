@@ -0,0 +1,257 @@
+"""
+Socket.IO backplane for running several server workers against the same rooms
+Room emits and targeted signaling are relayed between workers over a pub/sub channel,
+and every StateStore mutation is replicated so each worker holds the full registry.
+
+Selected with MYCONFAPP_BACKPLANE:
+    (unset)                       single process, no backplane
+    redis://host:6379/0           python-socketio AsyncRedisManager
+    unix:///run/myconfapp.sock    local broker over a Unix socket (see UnixSocketBroker)
+    memory://name                 in-process broker, for several servers in one process
+
+Run a standalone Unix socket broker with:
+    python backplane.py /run/myconfapp.sock
+"""
+
+import asyncio
+import fcntl
+import logging
+import os
+import pickle
+import struct
+import sys
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+from fanout import SharedFrameManager
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct("!I")
+
+
+class RegistryReplicationMixin:
+    """Replicates StateStore mutations through the pub/sub channel of the client manager"""
+
+    store = None
+
+    def attach_store(self, store):
+        self.store = store
+        self._registry_queue: Optional[asyncio.Queue] = None
+        store.add_listener(self._on_store_change)
+
+    def initialize(self):
+        super().initialize()
+        if self.store is not None:
+            self._registry_queue = asyncio.Queue()
+            self.server.start_background_task(self._registry_publisher)
+            self._registry_queue.put_nowait({'method': 'registry_sync_request', 'host_id': self.host_id})
+
+    def _on_store_change(self, op, args):
+        if self._registry_queue is not None:
+            self._registry_queue.put_nowait({'method': 'registry', 'op': op, 'args': args,
+                                             'host_id': self.host_id})
+
+    async def _registry_publisher(self):
+        # A single publisher keeps mutations in the order the handlers made them
+        while True:
+            message = await self._registry_queue.get()
+            try:
+                await self._publish(message)
+            except Exception:
+                logger.exception("Failed to publish registry update")
+
+    async def _handle_registry(self, message):
+        method = message['method']
+        if method == 'registry':
+            self.store.apply(message['op'], tuple(message['args']))
+        elif method == 'registry_sync_request':
+            await self._publish({'method': 'registry_snapshot', 'host_id': self.host_id,
+                                 'target': message['host_id'], 'state': self.store.snapshot()})
+        elif method == 'registry_snapshot' and message.get('target') == self.host_id:
+            self.store.restore(message['state'])
+
+    async def _listen(self):
+        async for message in super()._listen():
+            data = message
+            if isinstance(message, bytes):
+                try:
+                    data = pickle.loads(message)
+                except Exception:
+                    yield message
+                    continue
+            if isinstance(data, dict) and data.get('method', '').startswith('registry'):
+                if self.store is not None and data.get('host_id') != self.host_id:
+                    try:
+                        await self._handle_registry(data)
+                    except Exception:
+                        logger.exception("Failed to apply registry update")
+                continue
+            yield data
+
+
+class UnixSocketManager(AsyncPubSubManager):
+    """Pub/sub over a local Unix socket broker; the first worker to start hosts the broker"""
+
+    name = 'unixsocket'
+
+    def __init__(self, path: str, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = path
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._embedded_broker: Optional["UnixSocketBroker"] = None
+        self._lock_file = None
+
+    async def _connect(self):
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._writer is not None and not self._writer.is_closing():
+                return
+            retry_sleep = 0.05
+            while True:
+                try:
+                    self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+                    return
+                except (FileNotFoundError, ConnectionRefusedError):
+                    await self._host_broker()
+                    await asyncio.sleep(retry_sleep)
+                    retry_sleep = min(retry_sleep * 2, 2)
+
+    async def _host_broker(self):
+        """Start an embedded broker if no other process holds the broker lock"""
+        if self._embedded_broker is not None:
+            return
+        lock_file = open(self.path + ".lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return
+        self._lock_file = lock_file
+        self._embedded_broker = UnixSocketBroker(self.path)
+        await self._embedded_broker.start()
+        logger.info("Hosting backplane broker on %s", self.path)
+
+    async def _publish(self, data):
+        payload = pickle.dumps(data)
+        for _ in range(2):
+            await self._connect()
+            try:
+                self._writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+                await self._writer.drain()
+                return
+            except (ConnectionError, OSError):
+                self._writer.close()
+        logger.error("Cannot publish to backplane broker at %s", self.path)
+
+    async def _listen(self):
+        while True:
+            await self._connect()
+            reader = self._reader
+            try:
+                while True:
+                    header = await reader.readexactly(FRAME_HEADER.size)
+                    yield await reader.readexactly(FRAME_HEADER.unpack(header)[0])
+            except (asyncio.IncompleteReadError, ConnectionError, OSError):
+                logger.warning("Lost backplane broker connection, reconnecting")
+                if self._writer is not None:
+                    self._writer.close()
+
+
+class UnixSocketBroker:
+    """Relays every frame it receives to all other connected workers"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.clients: List[asyncio.StreamWriter] = []
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self._handle_client, path=self.path)
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.clients.append(writer)
+        try:
+            while True:
+                header = await reader.readexactly(FRAME_HEADER.size)
+                frame = header + await reader.readexactly(FRAME_HEADER.unpack(header)[0])
+                for client in self.clients:
+                    if client is not writer and not client.is_closing():
+                        client.write(frame)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError, asyncio.CancelledError):
+            # CancelledError: the hosting worker is shutting down
+            pass
+        finally:
+            self.clients.remove(writer)
+            writer.close()
+
+
+class InProcessManager(AsyncPubSubManager):
+    """Pub/sub between several AsyncServer instances living in the same process"""
+
+    name = 'inprocess'
+    hubs: Dict[str, List[asyncio.Queue]] = {}
+
+    def __init__(self, hub: str = 'default', channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.hub = hub
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.hubs.setdefault(hub, []).append(self.queue)
+
+    async def _publish(self, data):
+        # Pickle so that servers never share mutable payloads, as with a real broker
+        payload = pickle.dumps(data)
+        for queue in self.hubs[self.hub]:
+            if queue is not self.queue:
+                queue.put_nowait(payload)
+
+    async def _listen(self):
+        while True:
+            yield await self.queue.get()
+
+
+# Replication wraps the transport's _listen, so it must come first in the MRO; SharedFrameManager
+# sits below the pub/sub layer and delivers the emits that reach this worker
+class RedisBackplane(RegistryReplicationMixin, socketio.AsyncRedisManager, SharedFrameManager):
+    pass
+
+
+class UnixSocketBackplane(RegistryReplicationMixin, UnixSocketManager, SharedFrameManager):
+    pass
+
+
+class InProcessBackplane(RegistryReplicationMixin, InProcessManager, SharedFrameManager):
+    pass
+
+
+def create_client_manager(url: Optional[str]):
+    """Build the Socket.IO client manager for a MYCONFAPP_BACKPLANE url, or None for single process"""
+    if not url:
+        return None
+    parsed = urlparse(url)
+    if parsed.scheme in ("redis", "rediss"):
+        return RedisBackplane(url)
+    if parsed.scheme == "unix":
+        return UnixSocketBackplane(parsed.path)
+    if parsed.scheme == "memory":
+        return InProcessBackplane(parsed.netloc or parsed.path or "default")
+    raise ValueError(f"Unsupported backplane url: {url}")
+
+
+if __name__ == "__main__":
+    socket_path = sys.argv[1] if len(sys.argv) > 1 else "/tmp/myconfapp-backplane.sock"
+    print(f"🔀 Backplane broker listening on {socket_path}")
+    asyncio.run(UnixSocketBroker(socket_path).serve_forever())
@@ -0,0 +1,113 @@
+"""
+Benchmark: keeping the admin dashboard current, full-state polling against the change feed
+A StateStore holds rooms of 10 participants. Per dashboard update:
+
+    poll      what a polled endpoint returning current data costs: every room with its
+              participants serialized, whatever changed
+    feed      one interval of the change feed: `changes` joins and leaves spread over random
+              rooms, batched by FeedPublisher, applied to an AdminMirror and turned into the
+              Server-Sent Event for the dashboards
+
+Reported: milliseconds of CPU and bytes per update. The feed's time covers both ends (worker
+and admin server); the mutations themselves are not timed.
+
+Run from the project root:
+    python benchmarks/bench_admin_feed.py
+"""
+
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.update(MYCONFAPP_STATE_DB="", MYCONFAPP_CHAT_DB="", MYCONFAPP_MEETINGS_DB="", MYCONFAPP_ADMIN_FEED="")
+
+from admin_feed import FRAME_HEADER, AdminMirror, FeedPublisher, Subscriber  # noqa: E402
+from main import RoomInfo, UserInfo  # noqa: E402
+from state_store import StateStore  # noqa: E402
+
+ROOM_SIZE = 10
+REPEAT = 20
+
+
+class Sink:
+    """Stands in for the feed connection"""
+
+    def __init__(self):
+        self.frames = []
+
+    def write(self, data):
+        self.frames.append(data)
+
+
+def build(rooms):
+    store = StateStore()
+    now = datetime.now()
+    for r in range(rooms):
+        store.add_room(RoomInfo(id=f"room-{r}", name=f"Room {r}", created_at=now, is_active=True))
+        for u in range(ROOM_SIZE):
+            user_id = f"user-{r}-{u}"
+            store.add_user(UserInfo(id=user_id, username=f"User {r} {u}", room_id=f"room-{r}", joined_at=now))
+            store.add_participant(f"room-{r}", user_id)
+    return store
+
+
+def poll(store):
+    start = time.perf_counter()
+    payload = json.dumps({room_id: {"name": room.name, "mode": room.mode, "created_at": room.created_at.isoformat(),
+                                    "participants": {user.id: user.username for user in store.iter_participants(room_id)}}
+                          for room_id, room in store.rooms.items()})
+    return (time.perf_counter() - start) * 1000, len(payload)
+
+
+def churn(store, changes, rng):
+    """Half the changes are leaves, half joins of the users that left"""
+    room_ids = rng.sample(sorted(store.rooms), changes // 2)
+    for room_id in room_ids:
+        user_id = next(iter(store.room_participants[room_id]))
+        store.remove_participant(room_id, user_id)
+        store.add_participant(room_id, user_id)
+
+
+def main():
+    rng = random.Random(1)
+    print(f"rooms of {ROOM_SIZE}, mean of {REPEAT} updates")
+    print(f"{'rooms':>7} {'changes':>8} {'poll ms':>9} {'poll KiB':>9} {'feed ms':>9} {'frame KiB':>10} {'event KiB':>10}")
+    for rooms in (1000, 10000):
+        store = build(rooms)
+        poll_ms, poll_bytes = poll(store)
+        sink = Sink()
+        publisher = FeedPublisher("", store, lambda: {"connections": rooms * ROOM_SIZE, "users": len(store.users)}, 0.5)
+        publisher.writer = sink
+        store.add_roster_listener(publisher.mark)
+        mirror = AdminMirror()
+        subscriber = Subscriber(backlog=REPEAT + 1)
+        mirror.subscribers.add(subscriber)
+        publisher.dirty = set(store.rooms)
+        publisher.send(snapshot=True)
+        mirror.apply(json.loads(sink.frames.pop()[FRAME_HEADER.size:]))
+        subscriber.events.clear()
+        for changes in (10, 100, 1000):
+            elapsed = frame_bytes = event_bytes = 0
+            for _ in range(REPEAT):
+                churn(store, changes, rng)
+                start = time.perf_counter()
+                publisher.send()
+                frame = sink.frames.pop()
+                mirror.apply(json.loads(frame[FRAME_HEADER.size:]))
+                event = json.dumps(subscriber.events.popleft())
+                elapsed += time.perf_counter() - start
+                frame_bytes += len(frame)
+                event_bytes += len(event)
+            assert mirror.participants == rooms * ROOM_SIZE
+            print(f"{rooms:>7,} {changes:>8,} {poll_ms:>9.2f} {poll_bytes / 1024:>9.0f} {elapsed / REPEAT * 1000:>9.3f} "
+                  f"{frame_bytes / REPEAT / 1024:>10.1f} {event_bytes / REPEAT / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark: analytics rings and history export
+An Analytics store is filled with `days` of simulated minutes (a fake clock, so it takes
+seconds), then measured:
+
+    add           recording one counted event
+    queries       what the analytics page runs: percentiles of concurrent participants over a
+                  day of minutes and a month of hours, mean participants per hour of the day over
+                  30 days, and a 30-day sum, with NumPy and with the pure-Python fallback
+    export        streaming the whole history as hourly CSV: time and peak Python memory
+                  (tracemalloc, which also slows it down), against reading the history into a
+                  list first
+
+Run from the project root:
+    python benchmarks/bench_analytics.py [days]
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.update(MYCONFAPP_CHAT_DB="", MYCONFAPP_MEETINGS_DB="", MYCONFAPP_ADMIN_FEED="", MYCONFAPP_ANALYTICS_DIR="")
+
+import analytics  # noqa: E402
+from admin_server import export_csv  # noqa: E402
+
+REPEAT = 20
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def fill(store, clock, days, rng):
+    participants = 0
+    for _ in range(days * 1440):
+        clock.now += 60
+        participants = max(0, participants + rng.randint(-5, 5))
+        store.set_gauge("participants", participants)
+        for _ in range(rng.randint(0, 4)):
+            store.add("joins")
+        store.add("messages", rng.randint(0, 20))
+    store.flush()
+
+
+def per_call_ms(query):
+    query()  # warm-up: NumPy's first call to a function costs far more than the rest
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        query()
+    return (time.perf_counter() - start) / REPEAT * 1000
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 90
+    directory = tempfile.mkdtemp()
+    try:
+        clock = Clock(1_700_000_000.0)
+        store = analytics.Analytics(directory, clock=clock)
+        start = time.perf_counter()
+        fill(store, clock, days, random.Random(1))
+        print(f"{days} days of minutes, {store.written:,} rows written in {time.perf_counter() - start:.1f} s")
+
+        iterations = 200000
+        start = time.perf_counter()
+        for _ in range(iterations):
+            store.add("messages")
+        print(f"add: {(time.perf_counter() - start) / iterations * 1e9:.0f} ns per event")
+        print()
+
+        queries = (
+            ("percentiles, 1440 minutes", lambda: store.percentiles("participants", "minute", 1440)),
+            ("percentiles, 720 hours", lambda: store.percentiles("participants", "hour", 720)),
+            ("peak hours, 30 days", lambda: store.peak_hours("participants", 30)),
+            ("sum, 30 days of hours", lambda: store.total("joins", "hour", 720)),
+        )
+        numpy = analytics.numpy
+        print(f"{'query ms':<28} {'numpy':>8} {'python':>8}")
+        for name, query in queries:
+            fast = f"{per_call_ms(query):>8.3f}" if numpy is not None else f"{'n/a':>8}"
+            analytics.numpy = None
+            slow = per_call_ms(query)
+            analytics.numpy = numpy
+            print(f"{name:<28} {fast} {slow:>8.3f}")
+        if numpy is None:
+            print("numpy is not installed (pip install numpy), so only the python path was timed")
+        print()
+
+        print(f"{'hourly CSV export':<28} {'seconds':>8} {'peak MiB':>9} {'bytes':>12}")
+        for name, load in (("streamed", False), ("history loaded first", True)):
+            tracemalloc.start()
+            start = time.perf_counter()
+            rows = store.export("hour")
+            if load:
+                rows = iter(list(store.history()))
+                rows = analytics._downsample(rows, 3600)
+            size = sum(len(chunk) for chunk in export_csv(rows))
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{name:<28} {elapsed:>8.2f} {peak / 2 ** 20:>9.1f} {size:>12,}")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark: audit log pages as the history grows
+Fills an AuditLog with `entries` admin actions (4 admins, 4 actions; room and user targets
+drawn from the couple of hundred around at the time) in rotating segments, then times one page
+of 50 entries, as the users page and /api/audit request them:
+
+    newest          the first page, served from the in-memory ring
+    deep            a page halfway back through the history, from the segments
+    by action       the first page of one action older than the ring
+    by target       the first page of one room or user id (a few entries in the whole history)
+
+and, for comparison, rendering every entry of an in-memory list into the audit table as the users
+page did with admin_data["user_activities"].
+
+Run from the project root:
+    python benchmarks/bench_audit_log.py [entries ...]
+"""
+
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from jinja2 import Template  # noqa: E402
+
+from audit_log import AuditLog  # noqa: E402
+
+ADMINS = ("administrator", "ops", "support", "security")
+ACTIONS = ("closed_room", "disconnected_user", "cancelled_meeting", "broadcast_message")
+# Targets come and go: each entry picks one of the TARGETS newest, a new one every 5 entries
+TARGETS = 200
+REPEAT = 20
+
+ROW = Template("{% for entry in entries %}<tr><td>{{ entry.timestamp }}</td><td>{{ entry.admin }}</td>"
+               "<td>{{ entry.action }}</td><td>{{ entry.target or '' }}</td></tr>{% endfor %}")
+
+
+def fill(log, count, rng):
+    start = datetime(2026, 1, 1)
+    entries = []
+    for number in range(1, count + 1):
+        action = rng.choice(ACTIONS)
+        entry = {"id": number, "timestamp": (start + timedelta(seconds=number * 30)).isoformat(),
+                 "admin": rng.choice(ADMINS), "action": action,
+                 "target": None if action == "broadcast_message" else f"target-{number // 5 - rng.randrange(TARGETS)}"}
+        log._write(entry)
+        log.recent.append(entry)
+        entries.append(entry)
+    log.last_id = count
+    return entries
+
+
+async def per_page_ms(log, **query):
+    await log.query(**query)
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        entries, _ = await log.query(**query)
+    return (time.perf_counter() - start) / REPEAT * 1000, len(entries)
+
+
+async def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    rng = random.Random(1)
+    print(f"ms per page of 50 ({REPEAT} pages)")
+    print(f"{'entries':>9} {'segments':>9} {'fill s':>7} {'newest':>8} {'deep':>8} {'by action':>10} "
+          f"{'by target':>10} {'old page':>10}")
+    for size in sizes:
+        directory = tempfile.mkdtemp()
+        try:
+            log = AuditLog(directory)
+            start = time.perf_counter()
+            entries = fill(log, size, rng)
+            fill_seconds = time.perf_counter() - start
+            oldest_recent = log.recent[0]["id"]
+            newest, _ = await per_page_ms(log)
+            deep, _ = await per_page_ms(log, before=size // 2)
+            by_action, _ = await per_page_ms(log, action="cancelled_meeting", before=oldest_recent)
+            by_target, _ = await per_page_ms(log, target=entries[size // 3]["target"])
+            start = time.perf_counter()
+            ROW.render(entries=entries)
+            old_page = (time.perf_counter() - start) * 1000
+            segments = log.snapshot()["segments"]
+            await log.close()
+        finally:
+            shutil.rmtree(directory)
+        print(f"{size:>9,} {segments:>9} {fill_seconds:>7.1f} {newest:>8.3f} {deep:>8.3f} {by_action:>10.3f} "
+              f"{by_target:>10.3f} {old_page:>10.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
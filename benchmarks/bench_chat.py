@@ -0,0 +1,98 @@
+"""
+Benchmark: sustained chat throughput with persistence on
+Sends messages through main.send_message into a room of 50 members on one server, with the
+Engine.IO layer replaced by a sink that encodes and counts packets (as in bench_webinar.py).
+The time each send_message call takes is the time it holds the event loop.
+
+    memory         ring buffer only (MYCONFAPP_CHAT_DB empty)
+    write-behind   ring buffer plus batched SQLite writes on the writer thread (the default)
+    sync commit    one INSERT and commit per message on the event loop, for comparison
+
+"persisted ms" is the time until the last message is in the database once sending stops.
+
+Run from the project root:
+    python benchmarks/bench_chat.py [messages]
+"""
+
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import main as server  # noqa: E402
+from chat_log import ChatLog  # noqa: E402
+
+MEMBERS = 50
+
+sent = {"packets": 0}
+
+
+async def sink(eio_sid, pkt):
+    pkt.encode()
+    sent["packets"] += 1
+
+
+class SyncChatLog(ChatLog):
+    """Writes every message with its own transaction, on the event loop"""
+
+    def append(self, *args, **kwargs):
+        entry = super().append(*args, **kwargs)
+        self.pending.clear()
+        self._write([entry])
+        self.written += 1
+        return entry
+
+
+async def run(name, chat_log, messages):
+    server.chat_log = chat_log
+    room_id = f"chat-bench-{name}"
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(MEMBERS):
+            sid = await server.sio.manager.connect(f"{room_id}-{i}", "/")
+            await server.join_room(sid, {"room_id": room_id, "username": f"User {i}", "user_id": f"{room_id}-u{i}"})
+    sender = f"{room_id}-u0"
+    times = []
+    start = time.perf_counter()
+    for i in range(messages):
+        before = time.perf_counter()
+        await server.send_message(None, {"room_id": room_id, "user_id": sender, "message": f"message {i} " + "x" * 60})
+        times.append(time.perf_counter() - before)
+        if i % 100 == 0:
+            await asyncio.sleep(0)  # let the flushes run
+    elapsed = time.perf_counter() - start
+    await chat_log.flush()
+    persisted = time.perf_counter() - start - elapsed
+    times.sort()
+    p = lambda q: times[min(len(times) - 1, int(q * len(times)))] * 1e6
+    print(f"{name:<13} {messages / elapsed:>10.0f} {p(0.5):>7.0f} {p(0.99):>7.0f} {times[-1] * 1e6:>8.0f} "
+          f"{persisted * 1000:>12.1f} {chat_log.written:>8}")
+    await chat_log.close()
+
+
+async def report(messages):
+    logging.getLogger("engineio.server").setLevel(logging.WARNING)
+    logging.getLogger("socketio.server").setLevel(logging.WARNING)
+    server.sio._send_eio_packet = sink
+    directory = tempfile.mkdtemp(prefix="myconfapp-chat-")
+    print(f"{messages} messages into a room of {MEMBERS}")
+    print(f"{'':<13} {'messages/s':>10} {'p50 us':>7} {'p99 us':>7} {'max us':>8} {'persisted ms':>12} {'written':>8}")
+    await run("memory", ChatLog(None), messages)
+    await run("write-behind", ChatLog(f"sqlite:///{directory}/write_behind.db"), messages)
+    await run("sync commit", SyncChatLog(f"sqlite:///{directory}/sync.db"), messages)
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    asyncio.run(report(messages))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Benchmark: full-text chat search over a large history
+Fills a chat database through ChatLog's writer (the same batches send_message produces, each
+indexed in its own transaction) with synthetic messages: thousands of rooms and users, words
+drawn from a Zipf-distributed vocabulary, timestamps one second apart. Then it runs searches
+the way /api/rooms/{room_id}/messages/search and the admin /api/messages/search do.
+
+Reported: write rate with the index on and off, database size, and p50/p99 latency of a first
+page (20 results) for each kind of query. "LIKE scan" is the same room search without the index.
+
+Run from the project root:
+    python benchmarks/bench_chat_search.py [messages]
+"""
+
+import asyncio
+import bisect
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import sqlalchemy  # noqa: E402
+
+from chat_log import ChatLog, messages_table  # noqa: E402
+
+ROOMS = 5000
+USERS = 2000
+VOCABULARY = 50000
+WORDS_PER_MESSAGE = (3, 12)
+BATCH = 20000
+QUERIES = 200
+START = datetime(2026, 1, 1)
+
+
+class PlainChatLog(ChatLog):
+    """Without the full-text index: writes only the messages, searches with LIKE"""
+    full_text = False
+
+
+def vocabulary():
+    """Pronounceable made-up words, most frequent first, with Zipf weights"""
+    rng = random.Random(1)
+    syllables = [c + v for c in "bcdfghklmnprstvz" for v in "aeiou"]
+    words = set()
+    while len(words) < VOCABULARY:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    words = sorted(words, key=lambda word: rng.random())
+    weights, total = [], 0.0
+    for rank in range(1, VOCABULARY + 1):
+        total += 1 / rank
+        weights.append(total)
+    return words, weights
+
+
+def generate(count, words, weights, rng):
+    total = weights[-1]
+    for first in range(1, count + 1, BATCH):
+        batch = []
+        for message_id in range(first, min(first + BATCH, count + 1)):
+            length = rng.randint(*WORDS_PER_MESSAGE)
+            text = " ".join(words[bisect.bisect(weights, rng.random() * total)] for _ in range(length))
+            batch.append({"id": message_id, "room_id": f"room-{rng.randrange(ROOMS)}",
+                          "user_id": f"user-{rng.randrange(USERS)}", "username": "user", "message": text,
+                          "timestamp": (START + timedelta(seconds=message_id)).isoformat(), "type": "chat"})
+        yield batch
+
+
+def fill(chat_log, count, words, weights):
+    rng = random.Random(2)
+    start = time.perf_counter()
+    for batch in generate(count, words, weights, rng):
+        chat_log._write(batch)
+    chat_log.last_id = count
+    return time.perf_counter() - start
+
+
+async def measure(name, queries):
+    times = []
+    found = 0
+    for query in queries:
+        start = time.perf_counter()
+        messages, _ = await query()
+        times.append(time.perf_counter() - start)
+        found += len(messages)
+    times.sort()
+    p = lambda q: times[min(len(times) - 1, int(q * len(times)))] * 1000
+    print(f"{name:<26} {p(0.5):>8.2f} {p(0.99):>8.2f} {found / len(queries):>8.1f}")
+
+
+async def report(count):
+    directory = tempfile.mkdtemp(prefix="myconfapp-search-")
+    words, weights = vocabulary()
+    try:
+        plain = min(count, 1000000)
+        chat_log = PlainChatLog(f"sqlite:///{directory}/plain.db")
+        elapsed = fill(chat_log, plain, words, weights)
+        print(f"write without index: {plain / elapsed:,.0f} messages/s ({plain:,} messages)")
+        await chat_log.close()
+
+        chat_log = ChatLog(f"sqlite:///{directory}/chat.db")
+        elapsed = fill(chat_log, count, words, weights)
+        print(f"write with index:    {count / elapsed:,.0f} messages/s ({count:,} messages, {elapsed:.0f} s)")
+        print(f"database: {os.path.getsize(f'{directory}/chat.db') / 2 ** 20:,.0f} MiB")
+
+        rng = random.Random(3)
+        rooms = [f"room-{rng.randrange(ROOMS)}" for _ in range(QUERIES)]
+        users = [f"user-{rng.randrange(USERS)}" for _ in range(QUERIES)]
+        common = words[:20]
+        rare = words[5000:20000]
+        times = [(START + timedelta(seconds=rng.randrange(count))).isoformat() for _ in range(QUERIES)]
+        with chat_log.engine.connect() as connection:
+            room_counts = dict(connection.execute(sqlalchemy.select(
+                messages_table.c.room_id, sqlalchemy.func.count()).group_by(messages_table.c.room_id)).all())
+        print(f"{sum(room_counts.values()) / len(room_counts):,.0f} messages per room on average")
+        print(f"{'first page of 20':<26} {'p50 ms':>8} {'p99 ms':>8} {'results':>8}")
+        search = chat_log.search
+        await measure("room + common word", [lambda i=i: search(rng.choice(common), rooms[i]) for i in range(QUERIES)])
+        await measure("room + rare word", [lambda i=i: search(rng.choice(rare), rooms[i]) for i in range(QUERIES)])
+        await measure("room + prefix (3 chars)", [lambda i=i: search(rng.choice(rare)[:3] + "*", rooms[i])
+                                                  for i in range(QUERIES)])
+        await measure("room + two words", [lambda i=i: search(f"{rng.choice(common)} {rng.choice(common[:5])}", rooms[i])
+                                           for i in range(QUERIES)])
+        await measure("room + user + word", [lambda i=i: search(rng.choice(common), rooms[i], users[i])
+                                             for i in range(QUERIES)])
+        await measure("room + word + time window", [lambda i=i: search(rng.choice(common), rooms[i], since=times[i],
+                                                                       until=times[i][:11] + "23:59:59")
+                                                    for i in range(QUERIES)])
+        await measure("all rooms + rare word", [lambda: search(rng.choice(rare)) for _ in range(QUERIES)])
+        await measure("all rooms + prefix", [lambda: search(rng.choice(rare)[:4] + "*") for _ in range(QUERIES)])
+        await measure("all rooms, page 10", [lambda: page_ten(search, rng.choice(common)) for _ in range(20)])
+        await chat_log.close()
+        chat_log = PlainChatLog(f"sqlite:///{directory}/chat.db")
+        search = chat_log.search
+        await measure("LIKE scan: room + rare", [lambda i=i: search(rng.choice(rare), rooms[i]) for i in range(20)])
+        await chat_log.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+async def page_ten(search, word):
+    cursor = None
+    for _ in range(10):
+        messages, cursor = await search(word, before=cursor)
+    return messages, cursor
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+    asyncio.run(report(count))
+
+
+if __name__ == "__main__":
+    main()
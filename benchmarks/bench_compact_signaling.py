@@ -0,0 +1,148 @@
+"""
+Benchmark: bytes on the wire and codec CPU for a full 20-peer join sequence
+Peers join one after another. Each join sends join_room, room_joined and user_joined, and for
+every existing peer one offer, one answer and batched ICE candidates both ways, exactly as the
+server relays them. Every Socket.IO packet is encoded and decoded once per hop, once
+client -> server and once server -> client.
+
+    json            default text protocol, standard library json
+    json+orjson     default text protocol through fanout.fast_json (the server default)
+    msgpack         python-socketio's plain MessagePack packets
+    msgpack-v1      compact_codec.CompactPacket, MessagePack with dictionary-encoded keys
+
+Run from the project root:
+    python benchmarks/bench_compact_signaling.py [peers]
+"""
+
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from socketio import packet  # noqa: E402
+
+from compact_codec import CompactPacket, available as msgpack_available  # noqa: E402
+from fanout import fast_json  # noqa: E402
+
+ROUNDS = 20
+
+
+class StdJSONPacket(packet.Packet):
+    json = json
+
+
+class FastJSONPacket(packet.Packet):
+    json = fast_json
+
+
+CODECS = [("json", StdJSONPacket), ("json+orjson", FastJSONPacket)]
+if msgpack_available():
+    from socketio.msgpack_packet import MsgPackPacket  # noqa: E402
+
+    CODECS += [("msgpack", MsgPackPacket), ("msgpack-v1", CompactPacket)]
+
+
+def sdp(kind, peer):
+    lines = ["v=0", f"o=- 46117{peer:05d} 2 IN IP4 127.0.0.1", "s=-", "t=0 0",
+             "a=group:BUNDLE 0 1", "a=extmap-allow-mixed", "a=msid-semantic: WMS stream"]
+    for mid, media in enumerate(("audio", "video")):
+        lines += [f"m={media} 9 UDP/TLS/RTP/SAVPF 111 63 9 0 8 13 110 126", "c=IN IP4 0.0.0.0",
+                  "a=rtcp:9 IN IP4 0.0.0.0", f"a=ice-ufrag:u{peer:03d}", "a=ice-pwd:cQ7bL2xX3sV9kY8nN4mR1tZ0",
+                  "a=ice-options:trickle", "a=fingerprint:sha-256 " + ":".join(["7A"] * 32),
+                  f"a=setup:{'actpass' if kind == 'offer' else 'active'}", f"a=mid:{mid}",
+                  "a=sendrecv", "a=rtcp-mux", "a=rtpmap:111 opus/48000/2", "a=rtcp-fb:111 transport-cc",
+                  "a=fmtp:111 minptime=10;useinbandfec=1", "a=rtpmap:63 red/48000/2",
+                  "a=rtpmap:96 VP8/90000", "a=rtcp-fb:96 goog-remb", "a=rtcp-fb:96 nack pli",
+                  f"a=ssrc:{1000 + peer} cname:peer{peer}", f"a=ssrc:{1000 + peer} msid:stream track{mid}"]
+    return "\r\n".join(lines) + "\r\n"
+
+
+def candidates(peer, names):
+    return [{"candidate": f"candidate:{name} 1 udp 2122260223 10.0.{peer}.1 5{peer:04d} typ host generation 0",
+             "sdpMid": "0", "sdpMLineIndex": 0, "usernameFragment": f"u{peer:03d}"} for name in names]
+
+
+def join_sequence(peers):
+    """(direction, [event, payload]) for every Socket.IO packet of the scripted join"""
+    room_id = "5f0d3c1e-8f7a-4b1c-9a53-2d7c8e4f6a10"
+    now = datetime(2024, 5, 1, 10, 30).isoformat()
+    user = lambda i: {"user_id": f"user-{i:04d}", "username": f"Participant {i}",
+                      "is_video_enabled": True, "is_audio_enabled": True, "joined_at": now}
+    messages = []
+    for joiner in range(peers):
+        uid = f"user-{joiner:04d}"
+        messages.append(("up", ["join_room", {"room_id": room_id, "username": f"Participant {joiner}",
+                                              "user_id": uid, "capabilities": ["ice_batching"]}]))
+        messages.append(("down", ["room_joined", {"user_id": uid, "room_id": room_id,
+                                                  "participants": [user(i) for i in range(joiner + 1)]}]))
+        for _ in range(joiner):
+            messages.append(("down", ["user_joined", {"user_id": uid, "username": f"Participant {joiner}",
+                                                      "timestamp": now, "room_id": room_id}]))
+        for existing in range(joiner):
+            other = f"user-{existing:04d}"
+            pairs = [("offer", uid, other, joiner), ("answer", other, uid, existing)]
+            for kind, src, dst, peer in pairs:
+                body = {"room_id": room_id, "from_user": src, "to_user": dst,
+                        kind: {"type": kind, "sdp": sdp(kind, peer)}}
+                messages.append(("up", [f"webrtc_{kind}", body]))
+                messages.append(("down", [f"webrtc_{kind}", {"from_user": src, kind: body[kind],
+                                                             "room_id": room_id}]))
+            for src, dst, peer in ((uid, other, joiner), (other, uid, existing)):
+                for names in (["host-udp4", "host-udp6", "host-tcp4", "host-tcp6"],
+                              ["srflx-1", "srflx-2", "srflx-3"]):
+                    batch = candidates(peer, names)
+                    messages.append(("up", ["webrtc_ice_candidate", {"room_id": room_id, "from_user": src,
+                                                                     "to_user": dst, "candidates": batch}]))
+                    messages.append(("down", ["webrtc_ice_candidates", {"from_user": src, "candidates": batch,
+                                                                        "room_id": room_id}]))
+    return messages
+
+
+def wire_size(encoded):
+    return len(encoded.encode()) if isinstance(encoded, str) else len(encoded)
+
+
+def measure(packet_class, messages):
+    packets = [packet_class(packet.EVENT, data=data, namespace="/") for _, data in messages]
+    encoded = [pkt.encode() for pkt in packets]
+    size = sum(wire_size(e) for e in encoded)
+
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        for _, data in messages:
+            packet_class(packet.EVENT, data=data, namespace="/").encode()
+    encode_time = (time.process_time() - start) / ROUNDS
+
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        for e in encoded:
+            packet_class(encoded_packet=e)
+    decode_time = (time.process_time() - start) / ROUNDS
+
+    assert packet_class(encoded_packet=encoded[-1]).data == messages[-1][1]
+    return size, encode_time, decode_time
+
+
+def main():
+    peers = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    messages = join_sequence(peers)
+    print(f"{peers}-peer join: {len(messages)} Socket.IO packets "
+          f"({sum(1 for d, _ in messages if d == 'up')} up, {sum(1 for d, _ in messages if d == 'down')} down)")
+    print(f"{'codec':<12} {'wire KB':>9} {'vs json':>8} {'encode ms':>10} {'decode ms':>10}")
+    baseline = None
+    for name, packet_class in CODECS:
+        size, encode_time, decode_time = measure(packet_class, messages)
+        baseline = baseline or size
+        print(f"{name:<12} {size / 1024:>9.1f} {size / baseline - 1:>+8.1%} "
+              f"{encode_time * 1000:>10.2f} {decode_time * 1000:>10.2f}")
+    if not msgpack_available():
+        print("msgpack and msgpack-v1 skipped: they need msgpack (pip install msgpack)")
+
+
+if __name__ == "__main__":
+    main()
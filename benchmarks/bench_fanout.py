@@ -0,0 +1,101 @@
+"""
+Benchmark: room broadcasts per second into a 1,000-member room
+    before  stock AsyncManager (one task per recipient) with the standard json module
+    after   SharedFrameManager (one shared frame, single pass) with fanout.fast_json
+
+The Engine.IO layer is replaced by a sink that encodes each packet as the transport writer
+would, so the numbers cover the server's own fan-out work. The raw WebSocket path already
+shares one str per broadcast, so only its encoder (json.dumps vs fast_json.dumps) is compared.
+
+Run from the project root:
+    python benchmarks/bench_fanout.py [members]
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import main as server  # noqa: E402
+from fanout import JSON_BACKEND, SharedFrameManager, fast_json  # noqa: E402
+
+DURATION = 2.0
+
+PAYLOADS = {
+    "receive_message": {
+        "id": "6f1c2a2e-3c55-4f0e-9d0b-0a8a3f7d1b11", "user_id": "u-42", "username": "Alice Example",
+        "message": "Can everyone see the slides? I'll share the recording link after the call.",
+        "timestamp": datetime(2024, 5, 1, 10, 30).isoformat(), "room_id": "all-hands",
+    },
+    "user_video_toggle": {"user_id": "u-42", "username": "Alice Example", "is_video_enabled": False},
+    "participants_list": {
+        "participants": [{"id": f"u-{i}", "username": f"Participant {i}", "is_video_enabled": True,
+                          "is_audio_enabled": i % 3 != 0} for i in range(50)],
+    },
+}
+
+
+async def sink(eio_sid, pkt):
+    pkt.encode()
+
+
+async def build_server(manager, codec, members):
+    sio = socketio.AsyncServer(async_mode='asgi', client_manager=manager, json=codec)
+    sio.logger.setLevel(logging.WARNING)
+    sio.eio.send_packet = sink
+    sio.manager.initialize()
+    for i in range(members):
+        sid = await sio.manager.connect(f"eio{i}", "/")
+        await sio.enter_room(sid, "room")
+    return sio
+
+
+async def socketio_rate(sio, event, payload):
+    sent = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < DURATION:
+        await sio.emit(event, payload, room="room")
+        sent += 1
+    return sent / (time.perf_counter() - start)
+
+
+def encode_rate(dumps, payload):
+    """Encodes per second; the raw WebSocket path encodes once per broadcast and shares the str"""
+    sent = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < DURATION:
+        dumps(payload)
+        sent += 1
+    return sent / (time.perf_counter() - start)
+
+
+async def report(members):
+    logging.getLogger("engineio.server").setLevel(logging.WARNING)
+    print(f"{members} members per room, JSON backend after: {JSON_BACKEND}")
+    print(f"{'path':<10} {'event':<18} {'before msg/s':>13} {'after msg/s':>12} {'speed-up':>9}")
+    for event, payload in PAYLOADS.items():
+        # json= sets the codec on the shared Packet class, so each server is built right before use
+        before = await socketio_rate(await build_server(None, json, members), event, payload)
+        after = await socketio_rate(await build_server(SharedFrameManager(), fast_json, members), event, payload)
+        print(f"{'socket.io':<10} {event:<18} {before:>13.0f} {after:>12.0f} {after / before:>8.2f}x")
+    for event, payload in PAYLOADS.items():
+        before, after = encode_rate(json.dumps, payload), encode_rate(fast_json.dumps, payload)
+        print(f"{'ws encode':<10} {event:<18} {before:>13.0f} {after:>12.0f} {after / before:>8.2f}x")
+
+
+def main():
+    members = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    asyncio.run(report(members))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark: sharing a large file through the chunked file relay
+Starts the server in a subprocess with a temporary MYCONFAPP_FILE_DIR, joins a room over
+Socket.IO and uploads a generated file chunk by chunk (the harness never holds more than one
+chunk either), then downloads it and checks the SHA-256 announced with file_shared. One chunk
+is cut off half way to measure what resuming costs.
+
+Reported: upload and download throughput and the server's resident memory before and at its
+peak (VmHWM from /proc), plus the bytes the sharer would send for the same file with the
+previous data-channel sharing (base64 data URL, once per other participant).
+
+Linux only. Run from the project root:
+    python benchmarks/bench_file_relay.py [MiB] [participants]
+"""
+
+import asyncio
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import aiohttp
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+PORT = 8378
+URL = f"http://127.0.0.1:{PORT}"
+MIB = 1024 * 1024
+
+
+def memory(pid):
+    """(VmRSS, VmHWM) in MiB"""
+    with open(f"/proc/{pid}/status") as status:
+        fields = dict(line.split(":", 1) for line in status)
+    return int(fields["VmRSS"].split()[0]) / 1024, int(fields["VmHWM"].split()[0]) / 1024
+
+
+def wait_for_server():
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"{URL}/api/health")
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def chunk_data(index, length):
+    """Deterministic, incompressible-looking content for chunk `index`"""
+    seed = hashlib.sha256(index.to_bytes(8, "big")).digest()
+    return (seed * (length // len(seed) + 1))[:length]
+
+
+async def report(pid, size, participants):
+    sio = socketio.AsyncClient()
+    joined, shared = asyncio.Event(), asyncio.Event()
+    me, announced = {}, {}
+
+    async def on_room_joined(data):
+        me.update(data)
+        joined.set()
+
+    async def on_file_shared(data):
+        announced.update(data["file_info"])
+        shared.set()
+
+    sio.on("room_joined", on_room_joined)
+    sio.on("file_shared", on_file_shared)
+    async with aiohttp.ClientSession() as http:
+        room = await (await http.post(f"{URL}/api/rooms")).json()
+        room_id = room["room_id"]
+        await sio.connect(URL, transports=["websocket"])
+        await sio.emit("join_room", {"room_id": room_id, "username": "sharer"})
+        await joined.wait()
+        rss_before, _ = memory(pid)
+
+        upload = await (await http.post(f"{URL}/api/rooms/{room_id}/files", json={
+            "user_id": me["user_id"], "name": "bench.bin", "size": size})).json()
+        base = f"{URL}/api/rooms/{room_id}/files/{upload['file_id']}"
+        chunk_size = upload["chunk_size"]
+        digest = hashlib.sha256()
+        start = time.perf_counter()
+        index, resent = 0, 0
+        interrupted = False
+        while index * chunk_size < size:
+            data = chunk_data(index, min(chunk_size, size - index * chunk_size))
+            if index == upload["chunk_count"] // 2 and not interrupted:
+                # Send half the chunk and give up, then resume from the status endpoint
+                interrupted = True
+                await http.put(f"{base}/chunks/{index}", data=data[:len(data) // 2])
+                resent += len(data) // 2
+                index = (await (await http.get(f"{base}/status")).json())["next_chunk"]
+                continue
+            response = await http.put(f"{base}/chunks/{index}", data=data)
+            assert response.status == 200, await response.text()
+            digest.update(data)
+            index += 1
+        await asyncio.wait_for(shared.wait(), 10)
+        upload_time = time.perf_counter() - start
+        _, rss_upload_peak = memory(pid)
+
+        start = time.perf_counter()
+        download = hashlib.sha256()
+        async with http.get(base) as response:
+            async for block in response.content.iter_chunked(MIB):
+                download.update(block)
+        download_time = time.perf_counter() - start
+        _, rss_peak = memory(pid)
+        await sio.disconnect()
+
+    assert digest.hexdigest() == download.hexdigest() == announced["sha256"], "hash mismatch"
+    print(f"file {size / MIB:.0f} MiB in {upload['chunk_count']} chunks of {chunk_size // MIB} MiB, sha256 verified")
+    print(f"{'':<10} {'MiB/s':>8} {'seconds':>8}")
+    print(f"{'upload':<10} {size / MIB / upload_time:>8.0f} {upload_time:>8.2f}")
+    print(f"{'download':<10} {size / MIB / download_time:>8.0f} {download_time:>8.2f}")
+    print(f"server RSS: {rss_before:.0f} MiB before, peak {rss_upload_peak:.0f} MiB during upload, "
+          f"{rss_peak:.0f} MiB after download")
+    print(f"resume after a chunk cut off half way: {resent / MIB:.1f} MiB sent twice")
+    relay = size
+    data_channels = size * 4 / 3 * (participants - 1)
+    print(f"sharer upload in a room of {participants}: relay {relay / MIB:.0f} MiB, "
+          f"data channels {data_channels / MIB:.0f} MiB (base64, all of it in browser memory)")
+
+
+def main():
+    size = int(float(sys.argv[1]) * MIB) if len(sys.argv) > 1 else 1024 * MIB
+    participants = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    directory = tempfile.mkdtemp(prefix="myconfapp-files-")
+    env = dict(os.environ, MYCONFAPP_FILE_DIR=directory)
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:socket_app", "--port", str(PORT),
+                               "--log-level", "warning"], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_server()
+        asyncio.run(report(server.pid, size, participants))
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark: ICE candidate relay for a scripted full-mesh join, per-candidate vs batched
+Peers join one after another; every new peer pair gathers host candidates immediately and
+server-reflexive candidates after the STUN round trip, in both directions.
+
+Inbound packets go through the real Socket.IO packet path of server.sio; outbound packets are
+counted at the Engine.IO layer. Event-loop time is the CPU time the server process spent.
+
+Run from the project root:
+    python benchmarks/bench_ice_batching.py
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import main as server  # noqa: E402
+
+# (offset in ms, candidate) gathered by one RTCPeerConnection
+GATHERING = [(0, "host-udp4"), (1, "host-udp6"), (2, "host-tcp4"), (3, "host-tcp6"),
+             (28, "srflx-1"), (34, "srflx-2"), (41, "srflx-3")]
+CLIENT_BATCH_MS = 20
+JOIN_INTERVAL_MS = 60
+PEER_COUNTS = [10, 25, 50]
+
+
+class Counter:
+    packets = 0
+    bytes = 0
+
+
+def client_packets(batched):
+    """(send offset in ms, candidates) as room.js would emit them"""
+    if not batched:
+        return [(offset, [name]) for offset, name in GATHERING]
+    packets, start, pending = [], None, []
+    for offset, name in GATHERING:
+        if start is not None and offset >= start + CLIENT_BATCH_MS:
+            packets.append((start + CLIENT_BATCH_MS, pending))
+            start, pending = None, []
+        if start is None:
+            start = offset
+        pending.append(name)
+    packets.append((GATHERING[-1][0], pending))  # flushed when gathering completes
+    return packets
+
+
+async def send_candidates(eio_sid, room_id, from_user, to_user, batched):
+    elapsed = 0
+    for offset, names in client_packets(batched):
+        await asyncio.sleep((offset - elapsed) / 1000)
+        elapsed = offset
+        candidates = [{"candidate": f"candidate:{name} 1 udp 2122260223 10.0.0.1 50000 typ host",
+                       "sdpMid": "0", "sdpMLineIndex": 0} for name in names]
+        body = {"room_id": room_id, "from_user": from_user, "to_user": to_user}
+        if batched:
+            body["candidates"] = candidates
+        else:
+            body["candidate"] = candidates[0]
+        await server.sio._handle_eio_message(eio_sid, "2" + json.dumps(["webrtc_ice_candidate", body]))
+
+
+async def scripted_join(peers, batched):
+    room_id = f"bench-{peers}-{batched}"
+    eio_sids = []
+    for i in range(peers):
+        eio_sid = f"{room_id}-eio{i}"
+        sid = await server.sio.manager.connect(eio_sid, "/")
+        server.state.add_user(server.UserInfo(id=f"{room_id}-u{i}", username=f"peer{i}", room_id=room_id,
+                                          joined_at=datetime.now(), ice_batching=batched), sid)
+        eio_sids.append(eio_sid)
+
+    tasks = []
+    for joiner in range(1, peers):
+        for existing in range(joiner):
+            for a, b in ((joiner, existing), (existing, joiner)):
+                tasks.append(asyncio.ensure_future(send_candidates(
+                    eio_sids[a], room_id, f"{room_id}-u{a}", f"{room_id}-u{b}", batched)))
+        await asyncio.sleep(JOIN_INTERVAL_MS / 1000)
+    await asyncio.gather(*tasks)
+    await asyncio.sleep(server.ICE_BATCH_WINDOW_MS / 1000 + 0.2)
+    return len(tasks) * len(client_packets(batched))
+
+
+async def run(peers, batched):
+    Counter.packets = Counter.bytes = 0
+    cpu = time.process_time()
+    inbound = await scripted_join(peers, batched)
+    return inbound, Counter.packets, Counter.bytes, time.process_time() - cpu
+
+
+async def count_packet(eio_sid, pkt):
+    Counter.packets += 1
+    Counter.bytes += len(pkt.encode())
+
+
+def main():
+    server.sio.logger.setLevel(logging.WARNING)
+    server.sio._send_eio_packet = count_packet
+    server.sio.manager.initialize()
+    print(f"server window {server.ICE_BATCH_WINDOW_MS:.0f} ms, client batch {CLIENT_BATCH_MS} ms, "
+          f"{len(GATHERING)} candidates per peer connection")
+    print(f"{'peers':>5} {'mode':>9} {'in pkts':>8} {'out pkts':>9} {'out KB':>8} {'loop CPU ms':>12}")
+    asyncio.run(report())
+
+
+async def report():
+    for peers in PEER_COUNTS:
+        results = {}
+        for batched in (False, True):
+            results[batched] = await run(peers, batched)
+            inbound, outbound, size, cpu = results[batched]
+            print(f"{peers:>5} {'batched' if batched else 'single':>9} {inbound:>8} {outbound:>9} "
+                  f"{size / 1024:>8.0f} {cpu * 1000:>12.1f}")
+        single, batch = results[False], results[True]
+        print(f"{'':>5} {'saved':>9} {1 - batch[0] / single[0]:>8.0%} {1 - batch[1] / single[1]:>9.0%} "
+              f"{1 - batch[2] / single[2]:>8.0%} {1 - batch[3] / single[3]:>12.0%}")
+
+
+if __name__ == "__main__":
+    main()
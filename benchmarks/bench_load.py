@@ -0,0 +1,581 @@
+"""
+Load test: meeting rooms full of scripted participants against a locally started server
+Starts the server in a subprocess (or uses --url), then runs `rooms` rooms of `participants`
+headless Socket.IO clients, split over `processes` client processes. Each participant runs the
+script of a meeting, its joins (and so its leaves) spread over the ramp:
+
+    join_room       with ice_batching, as room.js; join_rejected is retried after retry_after
+    negotiation     webrtc_offer to every participant already there, webrtc_answer back, and
+                    `ice` candidates each way
+    activity        for `ramp + duration` seconds, every `think` seconds on average: a burst of
+                    `burst` chat messages, toggle_video or toggle_audio, and with probability
+                    `reconnect` a dropped connection that rejoins with its resume_token
+    leave_room      then disconnect
+
+Every event is sent with an acknowledgement, so its round trip covers the handler. Offers,
+answers, candidates and chat messages carry their send time; toggles are matched to theirs
+within the client process, so delivery to each recipient is measured as well.
+
+While the clients run, the server's RSS and CPU time are read from /proc and its smoothed loop lag
+from /api/health every second; /metrics before and after gives the loop lag distribution and
+the messages the server received and sent.
+
+Reported: throughput, p50/p95/p99 per event (acknowledgement and delivery), loop lag, memory and
+CPU. The results are written as JSON with the commit, so runs can be compared:
+
+    python benchmarks/bench_load.py --baseline load_results/<old>.json
+    python benchmarks/bench_load.py --compare OLD.json NEW.json
+
+Either exits with status 1 when a p95, the loop lag or peak memory grows, or throughput falls,
+by more than --tolerance.
+
+Linux only, needs the python-socketio client (aiohttp). Run from the project root:
+    python benchmarks/bench_load.py [--rooms 20] [--participants 5] [--duration 30] [--processes 1]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+PORT = 8392
+RESULTS_DIR = "load_results"
+SAMPLE_INTERVAL = 1.0
+CALL_TIMEOUT = 10
+# Time for messages still in flight after the last participant has left
+DRAIN = 2.0
+# Changes below this many milliseconds are noise, whatever the percentage
+NOISE_MS = 1.0
+EVENTS = ("join_room", "webrtc_offer", "webrtc_answer", "webrtc_ice_candidate", "send_message",
+          "toggle_video", "toggle_audio", "reconnect", "leave_room")
+# Events whose delivery to other participants is measured, and the event the recipient gets
+DELIVERED = {"webrtc_offer": "webrtc_offer", "webrtc_answer": "webrtc_answer",
+             "webrtc_ice_candidate": "webrtc_ice_candidates", "send_message": "receive_message",
+             "toggle_video": "user_video_toggle", "toggle_audio": "user_audio_toggle"}
+SDP = "v=0\r\no=- 0 0 IN IP4 127.0.0.1\r\ns=-\r\nt=0 0\r\n" + "a=candidate-placeholder\r\n" * 40
+
+
+def percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    samples = sorted(samples)
+    pick = lambda q: round(samples[min(len(samples) - 1, int(q * len(samples)))], 3)
+    return {"count": len(samples), "p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": round(samples[-1], 3)}
+
+
+# Client side: one process runs whole rooms, so a toggle and its recipients share a clock and a table
+
+
+class Stats:
+    def __init__(self):
+        self.ack = {event: [] for event in EVENTS}
+        self.delivery = {event: [] for event in DELIVERED}
+        self.errors = {event: 0 for event in EVENTS}
+        self.counters = {"joined": 0, "join_rejected": 0, "connect_errors": 0, "resumed": 0, "not_resumed": 0}
+        self.toggles = {}  # (event, user_id) -> send time of the latest toggle
+
+    def delivered(self, event, sent):
+        self.delivery[event].append((time.perf_counter() - sent) * 1000)
+
+    def result(self):
+        return {"ack": self.ack, "delivery": self.delivery, "errors": self.errors, "counters": self.counters}
+
+
+class Participant:
+    def __init__(self, url, room_id, index, options, stats, rng):
+        import socketio
+        self.url = url
+        self.room_id = room_id
+        self.user_id = f"{room_id}-user-{index}"
+        self.username = f"User {index}"
+        self.options = options
+        self.stats = stats
+        self.rng = rng
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.resume_token = None
+        self.joined = None
+        self.video = self.audio = True
+        for event in ("room_joined", "join_rejected"):
+            self.sio.on(event, lambda data, event=event: self.on_join(event, data))
+        self.sio.on("webrtc_offer", self.on_offer)
+        self.sio.on("webrtc_answer", self.on_answer)
+        self.sio.on("webrtc_ice_candidate", lambda data: self.on_candidates([data["candidate"]]))
+        self.sio.on("webrtc_ice_candidates", lambda data: self.on_candidates(data["candidates"]))
+        self.sio.on("receive_message", self.on_message)
+        self.sio.on("user_video_toggle", lambda data: self.on_toggle("toggle_video", data))
+        self.sio.on("user_audio_toggle", lambda data: self.on_toggle("toggle_audio", data))
+
+    async def call(self, event, data, record=True):
+        """Send one event and wait for its acknowledgement; False if it timed out or failed"""
+        start = time.perf_counter()
+        try:
+            await self.sio.call(event, data, timeout=CALL_TIMEOUT)
+        except Exception:
+            self.stats.errors[event] += 1
+            return False
+        if record:
+            self.stats.ack[event].append((time.perf_counter() - start) * 1000)
+        return True
+
+    def on_join(self, event, data):
+        if self.joined is not None and not self.joined.done():
+            self.joined.set_result((event, data))
+
+    async def join(self, event="join_room", since=None):
+        """join_room until admitted; returns room_joined's payload, or None if the server is gone.
+
+        Records the time to room_joined under `event`, from `since` or else from the last attempt.
+        """
+        while True:
+            self.joined = asyncio.get_running_loop().create_future()
+            data = {"room_id": self.room_id, "username": self.username, "user_id": self.user_id,
+                    "capabilities": ["ice_batching"]}
+            if self.resume_token:
+                data["resume_token"] = self.resume_token
+            start = time.perf_counter()
+            if not await self.call("join_room", data, record=False):
+                return None
+            try:
+                kind, reply = await asyncio.wait_for(self.joined, CALL_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.stats.errors[event] += 1
+                return None
+            if kind == "room_joined":
+                self.stats.ack[event].append((time.perf_counter() - (since or start)) * 1000)
+                self.resume_token = reply["resume_token"]
+                return reply
+            self.stats.counters["join_rejected"] += 1
+            await asyncio.sleep(reply.get("retry_after", 1) * (1 + self.rng.random()))
+
+    async def connect(self):
+        try:
+            await self.sio.connect(self.url, transports=["websocket"])
+            return True
+        except Exception:
+            self.stats.counters["connect_errors"] += 1
+            return False
+
+    def signal(self, event, to_user, key, value):
+        return self.call(event, {"room_id": self.room_id, "from_user": self.user_id, "to_user": to_user, key: value})
+
+    async def send_candidates(self, to_user):
+        for number in range(self.options.ice):
+            await self.signal("webrtc_ice_candidate", to_user, "candidate", {
+                "candidate": f"candidate:{number} 1 udp {2122260223 - number} 127.0.0.1 {50000 + number} typ host",
+                "sdpMid": "0", "sdpMLineIndex": 0, "sent": time.perf_counter()})
+
+    async def on_offer(self, data):
+        self.stats.delivered("webrtc_offer", data["offer"]["sent"])
+        await self.signal("webrtc_answer", data["from_user"], "answer",
+                          {"type": "answer", "sdp": SDP, "sent": time.perf_counter()})
+        await self.send_candidates(data["from_user"])
+
+    async def on_answer(self, data):
+        self.stats.delivered("webrtc_answer", data["answer"]["sent"])
+        await self.send_candidates(data["from_user"])
+
+    def on_candidates(self, candidates):
+        for candidate in candidates:
+            self.stats.delivered("webrtc_ice_candidate", candidate["sent"])
+
+    def on_message(self, data):
+        self.stats.delivered("send_message", float(data["message"].split(" ", 1)[0]))
+
+    def on_toggle(self, event, data):
+        sent = self.stats.toggles.get((event, data["user_id"]))
+        if sent is not None:
+            self.stats.delivered(event, sent)
+
+    async def chat(self):
+        for number in range(self.options.burst):
+            await self.call("send_message", {"room_id": self.room_id, "user_id": self.user_id,
+                                             "message": f"{time.perf_counter():.6f} message {number} from {self.username}"})
+
+    async def toggle(self):
+        event = self.rng.choice(("toggle_video", "toggle_audio"))
+        if event == "toggle_video":
+            self.video = enabled = not self.video
+        else:
+            self.audio = enabled = not self.audio
+        self.stats.toggles[(event, self.user_id)] = time.perf_counter()
+        await self.call(event, {"room_id": self.room_id, "user_id": self.user_id, "is_enabled": enabled})
+
+    async def reconnect(self):
+        await self.sio.disconnect()
+        start = time.perf_counter()
+        if not await self.connect():
+            return False
+        reply = await self.join("reconnect", since=start)  # connect and join
+        if reply is None:
+            return False
+        self.stats.counters["resumed" if reply["resumed"] else "not_resumed"] += 1
+        return True
+
+    async def run(self, start, deadline):
+        await asyncio.sleep(max(0.0, start - time.time()))
+        if not await self.connect():
+            return
+        try:
+            reply = await self.join()
+            if reply is None:
+                return
+            self.stats.counters["joined"] += 1
+            for peer in reply["other_participants"]:
+                await self.signal("webrtc_offer", peer["user_id"], "offer",
+                                  {"type": "offer", "sdp": SDP, "sent": time.perf_counter()})
+            while True:
+                pause = self.rng.expovariate(1 / self.options.think)
+                if time.time() + pause >= deadline:
+                    break
+                await asyncio.sleep(pause)
+                if self.rng.random() < self.options.reconnect:
+                    if not await self.reconnect():
+                        return
+                elif self.rng.random() < 0.5:
+                    await self.chat()
+                else:
+                    await self.toggle()
+            await asyncio.sleep(max(0.0, deadline - time.time()))
+            await self.call("leave_room", {"room_id": self.room_id, "user_id": self.user_id, "username": self.username})
+        finally:
+            await self.sio.disconnect()
+
+
+async def run_clients(url, rooms, options, start):
+    """One client process: the given rooms, each joined over the ramp"""
+    logging.getLogger("engineio.client").setLevel(logging.CRITICAL)
+    logging.getLogger("socketio.client").setLevel(logging.CRITICAL)
+    stats = Stats()
+    rng = random.Random(options.seed * 1000 + rooms[0] if rooms else options.seed)
+    participants = []
+    for room in rooms:
+        for index in range(options.participants):
+            participant = Participant(url, f"load-{room}", index, options, stats, random.Random(rng.random()))
+            # Everybody stays `ramp + duration` seconds, so the leaves are spread like the joins
+            joins = start + rng.random() * options.ramp
+            participants.append(participant.run(joins, joins + options.ramp + options.duration))
+    await asyncio.gather(*participants)
+    await asyncio.sleep(DRAIN)
+    return stats.result()
+
+
+# Orchestrator: starts the server and the client processes, samples the server, reports
+
+
+def fetch(url):
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return response.read().decode()
+
+
+def scrape(url):
+    """The loop lag histogram buckets and Socket.IO message counters from /metrics"""
+    lag, counters = {}, {}
+    for line in fetch(f"{url}/metrics").splitlines():
+        if line.startswith("myconfapp_event_loop_lag_seconds_bucket"):
+            bound = line.split('le="', 1)[1].split('"', 1)[0]
+            lag[float(bound)] = float(line.rsplit(" ", 1)[1])
+        elif line.startswith(("myconfapp_socketio_messages_received_total", "myconfapp_socketio_messages_sent_total")):
+            name, value = line.split(" ", 1)
+            counters[name] = float(value)
+    return lag, counters
+
+
+def lag_percentiles(before, after):
+    """Upper bounds of the histogram buckets holding p50/p95/p99 of the lag samples taken during the run"""
+    bounds = sorted(after)
+    counts = [after[bound] - before.get(bound, 0) for bound in bounds]  # cumulative
+    total = counts[-1] if counts else 0
+    if not total:
+        return {}
+    result = {}
+    for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        bound = next(bound for bound, count in zip(bounds, counts) if count >= q * total)
+        result[name] = bound * 1000 if bound != float("inf") else None
+    return result
+
+
+def read_proc(pid):
+    """RSS in MiB and CPU seconds used by a local process, or None when it cannot be read"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            rss = next(int(line.split()[1]) for line in status if line.startswith("VmRSS:")) / 1024
+        with open(f"/proc/{pid}/stat") as stat:
+            fields = stat.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        return rss, cpu
+    except (OSError, StopIteration):
+        return None
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return commit, bool(dirty)
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+
+
+def start_server(options):
+    env = dict(os.environ, MYCONFAPP_STATE_DB="", MYCONFAPP_CHAT_DB="", MYCONFAPP_MEETINGS_DB="",
+               MYCONFAPP_ADMIN_FEED="")
+    env.update(setting.split("=", 1) for setting in options.server_env)
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:socket_app", "--port", str(options.port),
+                               "--log-level", "warning"], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{options.port}"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            fetch(f"{url}/api/health")
+            return server, url
+        except OSError:
+            if server.poll() is not None or time.monotonic() > deadline:
+                server.kill()
+                raise SystemExit("the server did not start")
+            time.sleep(0.1)
+
+
+def client_args(options):
+    return ["--participants", str(options.participants), "--duration", str(options.duration),
+            "--ramp", str(options.ramp), "--think", str(options.think), "--burst", str(options.burst),
+            "--ice", str(options.ice), "--reconnect", str(options.reconnect), "--seed", str(options.seed)]
+
+
+def run(options):
+    server = None
+    url, pid = options.url, options.server_pid
+    if url is None:
+        server, url = start_server(options)
+        pid = server.pid
+    directory = tempfile.mkdtemp()
+    try:
+        lag_before, counters_before = scrape(url)
+        proc_before = read_proc(pid) if pid else None
+        start = time.time() + 2  # time for every client process to import and connect
+        clients = []
+        for process in range(options.processes):
+            rooms = ",".join(str(room) for room in range(process, options.rooms, options.processes))
+            if rooms:
+                path = os.path.join(directory, f"client-{process}.json")
+                clients.append((subprocess.Popen([sys.executable, os.path.abspath(__file__), "--client", url, rooms,
+                                                  str(start), path] + client_args(options)), path))
+        samples = []
+        while any(client.poll() is None for client, _ in clients):
+            time.sleep(SAMPLE_INTERVAL)
+            sample = {"t": round(time.time() - start, 1)}
+            try:
+                sample["lag_ms"] = json.loads(fetch(f"{url}/api/health"))["admission"]["loop_lag_ms"]
+            except (OSError, ValueError, KeyError):
+                pass
+            proc = read_proc(pid) if pid else None
+            if proc:
+                sample["rss_mb"], sample["cpu_s"] = round(proc[0], 1), proc[1]
+            samples.append(sample)
+        elapsed = time.time() - start
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)  # the client processes, all waited for
+        clients_cpu = usage.ru_utime + usage.ru_stime
+        if any(client.returncode for client, _ in clients):
+            raise SystemExit("a client process failed")
+        outputs = [load(path) for _, path in clients]
+        lag_after, counters_after = scrape(url)
+        health = json.loads(fetch(f"{url}/api/health"))
+        proc_after = read_proc(pid) if pid else None
+    finally:
+        shutil.rmtree(directory)
+        if server is not None:
+            server.terminate()
+            server.wait()
+    return summarize(options, outputs, samples, elapsed, clients_cpu, (lag_before, lag_after), (counters_before, counters_after),
+                     health, proc_before, proc_after)
+
+
+def summarize(options, outputs, samples, elapsed, clients_cpu, lag, counters, health, proc_before, proc_after):
+    events = {}
+    for event in EVENTS:
+        ack = [value for output in outputs for value in output["ack"][event]]
+        entry = {"sent": len(ack) + sum(output["errors"][event] for output in outputs),
+                 "errors": sum(output["errors"][event] for output in outputs), "ack_ms": percentiles(ack)}
+        if event in DELIVERED:
+            entry["delivery_ms"] = percentiles([value for output in outputs for value in output["delivery"][event]])
+        events[event] = entry
+    active = elapsed - DRAIN
+    sent = sum(entry["sent"] for entry in events.values())
+    delivered = sum(entry["delivery_ms"]["count"] for entry in events.values() if "delivery_ms" in entry)
+    received = {name: counters[1].get(name, 0) - counters[0].get(name, 0) for name in counters[1]}
+    lags = [sample["lag_ms"] for sample in samples if "lag_ms" in sample]
+    rss = [sample["rss_mb"] for sample in samples if "rss_mb" in sample]
+    server = {"loop_lag_ms": dict(lag_percentiles(*lag), mean_smoothed=round(sum(lags) / len(lags), 2) if lags else None,
+                                  max=health["admission"]["max_loop_lag_ms"]),
+              "join_rejected": sum(health["admission"]["rejected"].values()),
+              "rate_limited": sum(health.get("rate_limits", {}).get("refused", {}).values()),
+              "clients_cpu_percent": round(clients_cpu / elapsed * 100, 1)}
+    if proc_before and proc_after:
+        server["rss_mb"] = {"start": round(proc_before[0], 1), "peak": max(rss + [proc_after[0]]),
+                            "end": round(proc_after[0], 1)}
+        server["cpu_percent"] = round((proc_after[1] - proc_before[1]) / elapsed * 100, 1)
+    commit, dirty = git_commit()
+    return {
+        "version": 1,
+        "label": options.label,
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {name: getattr(options, name) for name in ("rooms", "participants", "duration", "ramp", "think",
+                                                             "burst", "ice", "reconnect", "processes", "seed")},
+        "throughput": {
+            "events_per_s": round(sent / active, 1),
+            "deliveries_per_s": round(delivered / active, 1),
+            "server_received_per_s": round(received.get("myconfapp_socketio_messages_received_total", 0) / elapsed, 1),
+            "server_sent_per_s": round(received.get("myconfapp_socketio_messages_sent_total", 0) / elapsed, 1),
+        },
+        "clients": {name: sum(output["counters"][name] for output in outputs) for name in outputs[0]["counters"]},
+        "events": events,
+        "server": server,
+        "samples": samples,
+    }
+
+
+def fmt(value, width=8):
+    return f"{value:>{width}.1f}" if isinstance(value, (int, float)) else f"{'-':>{width}}"
+
+
+def report(result):
+    config = result["config"]
+    print(f"{config['rooms']} rooms x {config['participants']} participants, {config['duration']:.0f} s all in, "
+          f"{config['ramp']:.0f} s ramps, {config['processes']} client process(es), commit {(result['commit'] or '?')[:10]}"
+          f"{' (dirty)' if result['dirty'] else ''}")
+    clients = result["clients"]
+    print(f"joined {clients['joined']}, joins turned away {clients['join_rejected']}, connect errors "
+          f"{clients['connect_errors']}, reconnects resumed {clients['resumed']} / not resumed {clients['not_resumed']}")
+    print()
+    print(f"{'ms':<21} {'sent':>7} {'errors':>6} {'ack p50':>8} {'p95':>8} {'p99':>8} "
+          f"{'received':>9} {'dlv p50':>8} {'p95':>8} {'p99':>8}")
+    for event, entry in result["events"].items():
+        ack, delivery = entry["ack_ms"], entry.get("delivery_ms", {})
+        print(f"{event:<21} {entry['sent']:>7} {entry['errors']:>6} {fmt(ack.get('p50'))} {fmt(ack.get('p95'))} "
+              f"{fmt(ack.get('p99'))} {delivery.get('count', ''):>9} {fmt(delivery.get('p50'))} "
+              f"{fmt(delivery.get('p95'))} {fmt(delivery.get('p99'))}")
+    print()
+    throughput, server = result["throughput"], result["server"]
+    print(f"throughput: {throughput['events_per_s']:.0f} events/s sent, {throughput['deliveries_per_s']:.0f} deliveries/s; "
+          f"server {throughput['server_received_per_s']:.0f} messages/s in, {throughput['server_sent_per_s']:.0f} out")
+    lag = server["loop_lag_ms"]
+    print(f"loop lag ms: p50 <= {fmt(lag.get('p50'), 0)}, p95 <= {fmt(lag.get('p95'), 0)}, "
+          f"p99 <= {fmt(lag.get('p99'), 0)}, smoothed mean {fmt(lag.get('mean_smoothed'), 0)}, max {fmt(lag.get('max'), 0)}")
+    if "rss_mb" in server:
+        rss = server["rss_mb"]
+        print(f"server: RSS {rss['start']:.0f} -> peak {rss['peak']:.0f} -> {rss['end']:.0f} MiB, "
+              f"CPU {server['cpu_percent']:.0f}%")
+    print(f"load generator CPU {server['clients_cpu_percent']:.0f}%; joins turned away by admission "
+          f"{server['join_rejected']}, events refused by rate limits {server['rate_limited']}")
+
+
+def metrics_of(result):
+    """The figures compared between runs: name -> (value, True if higher is better)"""
+    figures = {"throughput events/s": (result["throughput"]["events_per_s"], True),
+               "throughput deliveries/s": (result["throughput"]["deliveries_per_s"], True),
+               "loop lag max ms": (result["server"]["loop_lag_ms"].get("max"), False)}
+    if "rss_mb" in result["server"]:
+        figures["server peak RSS MiB"] = (result["server"]["rss_mb"]["peak"], False)
+    for event, entry in result["events"].items():
+        figures[f"{event} ack p95 ms"] = (entry["ack_ms"].get("p95"), False)
+        if "delivery_ms" in entry:
+            figures[f"{event} delivery p95 ms"] = (entry["delivery_ms"].get("p95"), False)
+    return figures
+
+
+def compare(old, new, tolerance):
+    """Print old against new; True if something got worse by more than the tolerance"""
+    if old["config"] != new["config"]:
+        print("warning: the runs used different configurations")
+    print(f"{'':<38} {(old['commit'] or '?')[:10]:>12} {(new['commit'] or '?')[:10]:>12} {'change':>8}")
+    regressed = False
+    old_figures = metrics_of(old)
+    for name, (value, higher_is_better) in metrics_of(new).items():
+        before = old_figures.get(name, (None,))[0]
+        if value is None or before is None:
+            continue
+        change = (value - before) / before if before else 0.0
+        worse = -change if higher_is_better else change
+        noise = name.endswith(" ms") and abs(value - before) < NOISE_MS
+        flag = worse > tolerance and not noise
+        regressed |= flag
+        print(f"{name:<38} {before:>12.1f} {value:>12.1f} {change * 100:>+7.0f}%{'  REGRESSION' if flag else ''}")
+    return regressed
+
+
+def load(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def parse(argv):
+    parser = argparse.ArgumentParser(description="Load test the signaling server with scripted meeting participants")
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--participants", type=int, default=5, help="per room")
+    parser.add_argument("--duration", type=float, default=30, help="seconds with every participant in")
+    parser.add_argument("--ramp", type=float, default=5, help="seconds over which the participants join, and leave")
+    parser.add_argument("--think", type=float, default=2, help="mean seconds between a participant's actions")
+    parser.add_argument("--burst", type=int, default=3, help="chat messages per burst")
+    parser.add_argument("--ice", type=int, default=4, help="ICE candidates each way per peer connection")
+    parser.add_argument("--reconnect", type=float, default=0.05, help="chance that an action is a reconnect")
+    parser.add_argument("--processes", type=int, default=1, help="client processes")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=PORT, help="for the server started here")
+    parser.add_argument("--server-env", action="append", default=[], metavar="NAME=VALUE",
+                        help="extra environment for the server started here, e.g. MYCONFAPP_RATE_LIMITS=off")
+    parser.add_argument("--url", help="test a running server instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="its process, for memory and CPU")
+    parser.add_argument("--label", default="", help="stored with the results")
+    parser.add_argument("--output", help=f"results file (default {RESULTS_DIR}/<time>-<commit>.json)")
+    parser.add_argument("--baseline", help="results to compare this run with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative change counted as a regression")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two results files without a run")
+    parser.add_argument("--client", nargs=4, metavar=("URL", "ROOMS", "START", "OUTPUT"), help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main():
+    options = parse(sys.argv[1:])
+    if options.client:
+        url, rooms, start, output = options.client
+        result = asyncio.run(run_clients(url, [int(room) for room in rooms.split(",")], options, float(start)))
+        with open(output, "w") as file:
+            json.dump(result, file)
+        return
+    if options.compare:
+        sys.exit(1 if compare(load(options.compare[0]), load(options.compare[1]), options.tolerance) else 0)
+    result = run(options)
+    report(result)
+    output = options.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{(result['commit'] or 'nogit')[:10]}.json")
+    with open(output, "w") as file:
+        json.dump(result, file, indent=1)
+    print(f"results written to {output}")
+    if options.baseline:
+        print()
+        sys.exit(1 if compare(load(options.baseline), result, options.tolerance) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Benchmark: cost of the instrumentation layer
+In process, with the Engine.IO layer as a sink and rate limits off so only the metrics differ:
+
+    histogram        one Histogram.observe
+    no-op handler    an empty async handler, bare and wrapped by main.time_event
+    toggle_video     the real handler in a room of 10 (one fan-out to 9 peers), bare and as
+                     registered (timed, with the fan-out and traffic hooks)
+    scrape           rendering /metrics with every series the server registers
+
+And what a burst of log lines costs the event loop when the consumer is slower than the
+burst: the print() the join handler used to make against logger.info with structured fields
+through the log queue, both writing into a pipe that another process drains at about 1 MB/s.
+Reported: time the calling thread spent logging, its worst single call, and the time until the
+last line was written.
+
+Run from the project root:
+    python benchmarks/bench_metrics.py [iterations]
+"""
+
+import asyncio
+import contextlib
+import logging
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.update(MYCONFAPP_STATE_DB="", MYCONFAPP_CHAT_DB="", MYCONFAPP_MEETINGS_DB="", MYCONFAPP_RATE_LIMITS="off")
+
+import main as server  # noqa: E402
+from metrics import Histogram, LATENCY_BUCKETS  # noqa: E402
+from structured_logging import QueueLogging  # noqa: E402
+
+ROOM_SIZE = 10
+
+DRAIN = """
+import sys, time
+while sys.stdin.buffer.read(4096):
+    time.sleep(0.004)
+"""
+
+
+async def sink(eio_sid, pkt):
+    pass
+
+
+async def noop(sid, data):
+    pass
+
+
+def per_call(total, iterations):
+    return total / iterations * 1e9
+
+
+async def run_async(handler, iterations, *args):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await handler(*args)
+    return per_call(time.perf_counter() - start, iterations)
+
+
+def run_histogram(iterations):
+    histogram = Histogram(LATENCY_BUCKETS)
+    start = time.perf_counter()
+    for i in range(iterations):
+        histogram.observe(0.0001 * (i & 63))
+    return per_call(time.perf_counter() - start, iterations)
+
+
+async def setup_room():
+    sids = []
+    for i in range(ROOM_SIZE):
+        sid = await server.sio.manager.connect(f"sid-{i}", "/")
+        await server.join_room(sid, {"room_id": "bench", "username": f"User {i}", "user_id": f"user-{i}"})
+        sids.append(sid)
+    for _ in range(3):
+        await asyncio.sleep(0)  # let the roster_delta publisher run
+    return sids[0]
+
+
+def slow_reader():
+    """A log consumer draining about 1 MB/s, e.g. a busy terminal or log shipper"""
+    return subprocess.Popen([sys.executable, "-c", DRAIN], stdin=subprocess.PIPE)
+
+
+def run_print(lines):
+    reader = slow_reader()
+    output = open(reader.stdin.fileno(), "w", buffering=1, closefd=False)
+    worst = 0.0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        for i in range(lines):
+            call = time.perf_counter()
+            print(f"User User {i} ({i}) successfully joined room bench, now {ROOM_SIZE} participants")
+            worst = max(worst, time.perf_counter() - call)
+    blocked = time.perf_counter() - start
+    reader.stdin.close()
+    reader.wait()
+    return blocked, worst, time.perf_counter() - start
+
+
+def run_queue(lines):
+    reader = slow_reader()
+    stderr = sys.stderr
+    sys.stderr = open(reader.stdin.fileno(), "w", closefd=False)
+    queued = QueueLogging("INFO", "json")
+    queued.start()
+    worst = 0.0
+    try:
+        start = time.perf_counter()
+        for i in range(lines):
+            call = time.perf_counter()
+            server.logger.info("User joined", extra={"user_id": str(i), "username": f"User {i}",
+                                                     "room_id": "bench", "participants": ROOM_SIZE})
+            worst = max(worst, time.perf_counter() - call)
+        blocked = time.perf_counter() - start
+        queued.stop()
+        sys.stderr.flush()
+    finally:
+        sys.stderr = stderr
+    reader.stdin.close()
+    reader.wait()
+    return blocked, worst, time.perf_counter() - start
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    logging.getLogger("engineio.server").setLevel(logging.WARNING)
+    logging.getLogger("socketio.server").setLevel(logging.WARNING)
+    server.sio._send_eio_packet = sink
+    loop = asyncio.new_event_loop()
+    sid = loop.run_until_complete(setup_room())
+    toggle = {"room_id": "bench", "user_id": "user-0", "is_enabled": True}
+
+    print(f"{iterations:,} iterations, ns per call")
+    print(f"{'':<24} {'bare':>8} {'timed':>8} {'overhead':>9}")
+    print(f"{'histogram observe':<24} {run_histogram(iterations):>8.0f}")
+    rows = (
+        ("no-op handler", noop, server.time_event("bench_noop", noop), ("sid", {})),
+        ("toggle_video", server.toggle_video, server.sio.handlers["/"]["toggle_video"], (sid, toggle)),
+    )
+    for name, bare, timed, args in rows:
+        bare_ns = loop.run_until_complete(run_async(bare, iterations, *args))
+        timed_ns = loop.run_until_complete(run_async(timed, iterations, *args))
+        print(f"{name:<24} {bare_ns:>8.0f} {timed_ns:>8.0f} {timed_ns - bare_ns:>9.0f}")
+
+    start = time.perf_counter()
+    text = server.metrics.render()
+    print(f"{'scrape':<24} {(time.perf_counter() - start) * 1000:>8.2f} ms for {len(text.splitlines())} lines")
+
+    lines = iterations // 10
+    print()
+    print(f"burst of {lines:,} join log lines into a pipe drained at ~1 MB/s")
+    print(f"{'':<24} {'caller ms':>10} {'worst call ms':>14} {'written ms':>11}")
+    for name, run in (("print", run_print), ("logger.info via queue", run_queue)):
+        blocked, worst, written = run(lines)
+        print(f"{name:<24} {blocked * 1000:>10.1f} {worst * 1000:>14.2f} {written * 1000:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
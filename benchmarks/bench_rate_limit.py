@@ -0,0 +1,169 @@
+"""
+Benchmark: signaling latency of well-behaved clients while other clients flood the server
+Starts the server in a subprocess. Well-behaved clients join meeting rooms in pairs, and one
+of each pair sends webrtc_offer to the other ten times a second with its send time inside; the
+receiver records how long the relay took. After a quiet phase, a second process adds abusive
+clients in a room of their own that send send_message, request_participants_list and
+toggle_video at a fixed rate far above the limits (a few listeners in that room receive the chat).
+The flood rate is fixed so both configurations face the same offered load.
+
+Both phases run twice: with rate limits off (MYCONFAPP_RATE_LIMITS=off) and with the defaults.
+Reported: offer relay latency of the well-behaved clients per phase, offers lost, and the
+server's loop lag, dropped events and turned-away joins from /api/health.
+
+Linux only, needs the python-socketio client (aiohttp). Run from the project root:
+    python benchmarks/bench_rate_limit.py [pairs] [abusers] [events/s per abuser] [seconds]
+"""
+
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import socketio  # noqa: E402
+
+PORT = 8391
+URL = f"http://127.0.0.1:{PORT}"
+OFFERS_PER_SECOND = 10
+LISTENERS = 5
+FLOOD_EVENTS = ("send_message", "request_participants_list", "toggle_video")
+
+
+async def client(name, room_id, handlers=None):
+    sio = socketio.AsyncClient(reconnection=False)
+    joined = asyncio.Event()
+    sio.on("room_joined", lambda data: joined.set())
+    for event, handler in (handlers or {}).items():
+        sio.on(event, handler)
+    await sio.connect(URL, transports=["websocket"])
+    await sio.emit("join_room", {"room_id": room_id, "username": name, "user_id": name})
+    await asyncio.wait_for(joined.wait(), 30)
+    return sio
+
+
+async def flood(abusers, rate, seconds):
+    """Abusive clients, each sending `rate` events a second in batches every 10 ms"""
+    logging.getLogger("engineio.client").setLevel(logging.ERROR)
+    listeners = [await client(f"listener-{i}", "abuse") for i in range(LISTENERS)]
+    clients = [await client(f"abuser-{i}", "abuse") for i in range(abusers)]
+    print("flooding", flush=True)
+    deadline = time.monotonic() + seconds
+
+    async def run(i, sio):
+        sent = 0
+        start = time.monotonic()
+        while time.monotonic() < deadline:
+            due = int((time.monotonic() - start) * rate)
+            if sent >= due:
+                await asyncio.sleep(0.01)
+                continue
+            event = FLOOD_EVENTS[sent % len(FLOOD_EVENTS)]
+            if event == "send_message":
+                data = {"room_id": "abuse", "user_id": f"abuser-{i}", "message": "spam " * 20}
+            elif event == "toggle_video":
+                data = {"room_id": "abuse", "user_id": f"abuser-{i}", "is_enabled": sent % 2 == 0}
+            else:
+                data = {"room_id": "abuse", "limit": 100}
+            await sio.emit(event, data)
+            sent += 1
+        return sent
+
+    sent = await asyncio.gather(*(run(i, sio) for i, sio in enumerate(clients)))
+    for sio in clients + listeners:
+        await sio.disconnect()
+    print(f"sent {sum(sent)}", flush=True)
+
+
+async def measure(pairs, seconds, tag):
+    latencies = []
+    received = {"count": 0}
+
+    def on_offer(data):
+        latencies.append(time.perf_counter() - data["offer"]["sent"])
+        received["count"] += 1
+
+    senders, receivers = [], []
+    for i in range(pairs):
+        room_id = f"{tag}-{i}"
+        senders.append(await client(f"{tag}-a{i}", room_id))
+        receivers.append(await client(f"{tag}-b{i}", room_id, {"webrtc_offer": on_offer}))
+    sent = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        tick = time.monotonic()
+        for i, sio in enumerate(senders):
+            await sio.emit("webrtc_offer", {"room_id": f"{tag}-{i}", "from_user": f"{tag}-a{i}",
+                                            "to_user": f"{tag}-b{i}",
+                                            "offer": {"type": "offer", "sdp": "v=0", "sent": time.perf_counter()}})
+            sent += 1
+        await asyncio.sleep(max(0.0, 1 / OFFERS_PER_SECOND - (time.monotonic() - tick)))
+    await asyncio.sleep(2)  # let late offers arrive
+    for sio in senders + receivers:
+        await sio.disconnect()
+    return sorted(latencies), sent - received["count"]
+
+
+def health():
+    with urllib.request.urlopen(f"{URL}/api/health") as response:
+        return json.load(response)
+
+
+def report(name, latencies, lost):
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else float("nan")
+    data = health()
+    print(f"{name:<24} {p(0.5):>8.1f} {p(0.95):>8.1f} {p(0.99):>8.1f} {lost:>6} {data['admission']['max_loop_lag_ms']:>9.0f} "
+          f"{sum(data['rate_limits']['refused'].values()):>9}")
+
+
+async def phases(pairs, abusers, rate, seconds, name):
+    latencies, lost = await measure(pairs, seconds, "quiet")
+    report(f"{name}: quiet", latencies, lost)
+    flooder = await asyncio.create_subprocess_exec(sys.executable, os.path.abspath(__file__), "--flood", str(abusers),
+                                                   str(rate), str(seconds + 5), stdout=subprocess.PIPE)
+    await flooder.stdout.readline()  # "flooding"
+    latencies, lost = await measure(pairs, seconds, "flood")
+    await flooder.wait()
+    report(f"{name}: flood", latencies, lost)
+    rejected = health()["admission"]["rejected"]
+    if rejected:
+        print(f"{'':<24} joins turned away: {rejected}")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--flood":
+        asyncio.run(flood(int(sys.argv[2]), float(sys.argv[3]), float(sys.argv[4])))
+        return
+    pairs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    abusers = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    rate = float(sys.argv[3]) if len(sys.argv) > 3 else 1500
+    seconds = float(sys.argv[4]) if len(sys.argv) > 4 else 15
+    print(f"{pairs} pairs sending {OFFERS_PER_SECOND} offers/s each, {abusers} abusive clients sending {rate:.0f} events/s each")
+    print(f"{'offer relay ms':<24} {'p50':>8} {'p95':>8} {'p99':>8} {'lost':>6} {'max lag':>9} {'dropped':>9}")
+    for name, limits in (("limits off", "off"), ("default limits", "")):
+        env = dict(os.environ, MYCONFAPP_STATE_DB="", MYCONFAPP_CHAT_DB="", MYCONFAPP_MEETINGS_DB="", MYCONFAPP_RATE_LIMITS=limits)
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:socket_app", "--port", str(PORT),
+                                   "--log-level", "warning"], env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                try:
+                    health()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            asyncio.run(phases(pairs, abusers, rate, seconds, name))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
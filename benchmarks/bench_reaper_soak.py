@@ -0,0 +1,159 @@
+"""
+Benchmark: 24 simulated hours of room and connection churn
+Drives the Socket.IO handlers in process (the Engine.IO layer is replaced by a sink, as in
+bench_reconnect.py) on a simulated clock: every minute meetings start and end, users join and
+chat, and users go away by leave_room, by a dropped connection (disconnect event, resume grace)
+or by a socket that vanishes without any event. Rooms created through POST /api/rooms are
+never joined. The reaper is advanced once per simulated second.
+
+Each configuration runs in its own process:
+    reaper          default TTLs (MYCONFAPP_ROOM_TTL=600, MYCONFAPP_SESSION_CHECK=300)
+    TTLs disabled   MYCONFAPP_ROOM_TTL=0 MYCONFAPP_SESSION_CHECK=0: only resume-grace users are
+                    dropped, as before the reaper
+
+Reported per simulated hour: live objects in the state store and per-room structures, and heap
+in use (tracemalloc, after gc). Then the cost of a reaper tick.
+
+Run from the project root:
+    python benchmarks/bench_reaper_soak.py [hours]
+"""
+
+import asyncio
+import collections
+import contextlib
+import gc
+import io
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+MEETINGS_PER_MINUTE = 10
+UNUSED_ROOMS_PER_MINUTE = 2
+JOINS_PER_MINUTE = 80
+MESSAGES_PER_MINUTE = 40
+MEETING_MINUTES = (20, 90)
+STAY_MINUTES = (5, 60)
+# How users go away: leave_room, dropped connection, socket gone without a disconnect event
+DEPARTURES = (("leave", 0.6), ("drop", 0.3), ("vanish", 0.1))
+REPORT_EVERY = 2  # hours
+
+
+async def sink(eio_sid, pkt):
+    pass
+
+
+def counts(server):
+    state = server.state
+    return {
+        "rooms": len(state.rooms),
+        "users": len(state.users),
+        "sessions": len(state.user_sessions),
+        "rosters": len(state.rosters),
+        "published": len(server.roster_publisher.published),
+        "chat bufs": len(server.chat_log.buffers),
+        "timers": len(server.reaper.wheel),
+    }
+
+
+async def soak(hours):
+    import main as server
+
+    logging.getLogger("engineio.server").setLevel(logging.WARNING)
+    logging.getLogger("socketio.server").setLevel(logging.WARNING)
+    server.sio._send_eio_packet = sink
+    rng = random.Random(1)
+    reaper = server.reaper
+    meetings = {}  # room_id -> end minute
+    present = {}   # sid -> (user_id, room_id, leave minute)
+    serial = 0
+    # Tick times in 10 us buckets: a list of every tick would itself grow the heap being measured
+    tick_buckets = collections.Counter()
+    tick_total = 0.0
+    tracemalloc.start()
+    header = None
+    for minute in range(hours * 60):
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(UNUSED_ROOMS_PER_MINUTE):
+                await server.create_room()
+            for _ in range(MEETINGS_PER_MINUTE):
+                serial += 1
+                meetings[f"meeting-{serial}"] = minute + rng.randint(*MEETING_MINUTES)
+            live = [room_id for room_id, end in meetings.items() if end > minute]
+            for _ in range(JOINS_PER_MINUTE):
+                serial += 1
+                room_id = rng.choice(live)
+                sid = await server.sio.manager.connect(f"sid-{serial}", "/")
+                user_id = f"user-{serial}"
+                await server.join_room(sid, {"room_id": room_id, "username": f"User {serial}", "user_id": user_id})
+                leave = min(meetings[room_id], minute + rng.randint(*STAY_MINUTES))
+                present[sid] = (user_id, room_id, leave)
+            talkers = rng.sample(list(present.items()), min(MESSAGES_PER_MINUTE, len(present)))
+            for sid, (user_id, room_id, _) in talkers:
+                await server.send_message(sid, {"room_id": room_id, "user_id": user_id, "message": "hello"})
+            for sid, (user_id, room_id, leave) in list(present.items()):
+                if leave > minute:
+                    continue
+                del present[sid]
+                way = rng.choices([name for name, _ in DEPARTURES], [weight for _, weight in DEPARTURES])[0]
+                if way == "leave":
+                    await server.leave_room(sid, {"room_id": room_id, "user_id": user_id})
+                if way != "vanish":
+                    await server.disconnect(sid)
+                await server.sio.manager.disconnect(sid, "/")
+            for room_id in [room_id for room_id, end in meetings.items() if end <= minute]:
+                del meetings[room_id]
+            for second in range(minute * 60 + 1, minute * 60 + 61):
+                start = time.perf_counter()
+                await reaper.advance(second)
+                elapsed = (time.perf_counter() - start) * 1e6
+                tick_buckets[int(elapsed // 10)] += 1
+                tick_total += elapsed
+            for _ in range(3):
+                await asyncio.sleep(0)  # let the roster_delta publisher run
+        if (minute + 1) % (REPORT_EVERY * 60) == 0:
+            gc.collect()
+            row = counts(server)
+            row["heap MiB"] = tracemalloc.get_traced_memory()[0] / 2 ** 20
+            if header is None:
+                header = list(row)
+                print(f"{'hour':>4} " + " ".join(f"{name:>9}" for name in header))
+            print(f"{(minute + 1) // 60:>4} " + " ".join(
+                f"{row[name]:>9.1f}" if isinstance(row[name], float) else f"{row[name]:>9,}" for name in header))
+    tracemalloc.stop()
+    snapshot = reaper.snapshot()
+    print(f"checked {snapshot['checked']}")
+    print(f"reclaimed {snapshot['reclaimed']}")
+    ticks = sum(tick_buckets.values())
+    seen = 0
+    for bucket in sorted(tick_buckets):
+        seen += tick_buckets[bucket]
+        if seen >= ticks * 0.99:
+            break
+    print(f"{ticks:,} ticks (under tracemalloc): mean {tick_total / ticks:.1f} us, "
+          f"p99 < {(bucket + 1) * 10} us, max < {(max(tick_buckets) + 1) / 100:.2f} ms")
+
+
+def main():
+    hours = int(sys.argv[1]) if len(sys.argv) > 1 else 24
+    if len(sys.argv) > 2 and sys.argv[2] == "--run":
+        asyncio.run(soak(hours))
+        return
+    base = dict(os.environ, MYCONFAPP_STATE_DB="", MYCONFAPP_CHAT_DB="", MYCONFAPP_MEETINGS_DB="")
+    for name, env in (("reaper", {}), ("TTLs disabled", {"MYCONFAPP_ROOM_TTL": "0", "MYCONFAPP_SESSION_CHECK": "0"})):
+        print(f"{name}: {hours} simulated hours, {JOINS_PER_MINUTE} joins and {MEETINGS_PER_MINUTE} meetings a minute")
+        sys.stdout.flush()
+        subprocess.run([sys.executable, os.path.abspath(__file__), str(hours), "--run"], env=dict(base, **env),
+                       check=True)
+        print()
+
+
+if __name__ == "__main__":
+    main()
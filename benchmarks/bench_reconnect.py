@@ -0,0 +1,101 @@
+"""
+Benchmark: a burst of reconnects in a large meeting
+A meeting room of 500 members on one server loses 20% of its connections at once (as after a
+Wi-Fi blip on one floor) and they all reconnect. The Engine.IO layer is replaced by a sink that
+counts the packets the server would write, per event (as in bench_webinar.py).
+
+    full rejoin   MYCONFAPP_RESUME_GRACE=0: disconnect removes the user (user_left to the room),
+                  the reconnect joins again (user_joined to the room)
+    resume        the reconnect presents the resume_token from room_joined within the grace
+                  period and is reattached to its user without telling the room
+
+"peer rebuilds" counts user_left and user_joined deliveries: in a mesh, each makes the
+receiving browser tear down or set up a peer connection to the reconnecting user.
+
+Run from the project root:
+    python benchmarks/bench_reconnect.py [members] [dropped percent]
+"""
+
+import asyncio
+import collections
+import contextlib
+import io
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.update(MYCONFAPP_STATE_DB="", MYCONFAPP_CHAT_DB="", MYCONFAPP_MEETINGS_DB="")
+
+import main as server  # noqa: E402
+
+sent = collections.Counter()
+
+
+async def sink(eio_sid, pkt):
+    pkt.encode()
+    # Shared frames are pre-encoded text such as 2["user_joined",{...}]
+    text = pkt.data if isinstance(pkt.data, str) else ""
+    start = text.find('["') + 2
+    sent[text[start:text.find('"', start)] if start > 1 else "other"] += 1
+
+
+async def settle():
+    for _ in range(3):
+        await asyncio.sleep(0)  # let the roster_delta publisher run
+
+
+async def run(name, members, dropped, resume):
+    server.RESUME_GRACE = 30 if resume else 0
+    room_id = f"reconnect-{name.replace(' ', '-')}"
+    joined = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(members):
+            sid = await server.sio.manager.connect(f"{room_id}-{i}", "/")
+            await server.join_room(sid, {"room_id": room_id, "username": f"User {i}", "user_id": f"{room_id}-u{i}"})
+            joined[i] = (sid, server.users[f"{room_id}-u{i}"].resume_token)
+        await settle()
+        sent.clear()
+        start = time.perf_counter()
+        for i in range(dropped):
+            sid = joined[i][0]
+            await server.disconnect(sid)
+            await server.sio.manager.disconnect(sid, "/")
+        await settle()
+        for i in range(dropped):
+            sid = await server.sio.manager.connect(f"{room_id}-{i}-again", "/")
+            data = {"room_id": room_id, "username": f"User {i}", "user_id": f"{room_id}-u{i}"}
+            if resume:
+                data["resume_token"] = joined[i][1]
+            await server.join_room(sid, data)
+        await settle()
+        elapsed = time.perf_counter() - start
+    assert server.state.participant_count(room_id) == members
+    rebuilds = sent["user_left"] + sent["user_joined"]
+    print(f"{name:<13} {elapsed * 1000:>9.1f} {sum(sent.values()):>9} {sent['user_left']:>9} {sent['user_joined']:>11} "
+          f"{sent['roster_delta']:>12} {rebuilds:>13}")
+
+
+async def report(members, percent):
+    logging.getLogger("engineio.server").setLevel(logging.WARNING)
+    logging.getLogger("socketio.server").setLevel(logging.WARNING)
+    server.sio._send_eio_packet = sink
+    dropped = members * percent // 100
+    print(f"{dropped} of {members} members drop and reconnect")
+    print(f"{'':<13} {'server ms':>9} {'packets':>9} {'user_left':>9} {'user_joined':>11} "
+          f"{'roster_delta':>12} {'peer rebuilds':>13}")
+    await run("full rejoin", members, dropped, resume=False)
+    await run("resume", members, dropped, resume=True)
+
+
+def main():
+    members = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    percent = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    asyncio.run(report(members, percent))
+
+
+if __name__ == "__main__":
+    main()
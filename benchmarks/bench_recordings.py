@@ -0,0 +1,125 @@
+"""
+Benchmark: ingesting a long recording chunk by chunk
+Starts the server in a subprocess with a temporary MYCONFAPP_RECORDINGS_DIR, joins a room and
+uploads a recording the way room.js does: one PUT per 1-second MediaRecorder chunk, in order,
+as fast as the server takes them (the default is one hour at 2.5 Mbit/s). Then it seeks to
+random times and reads 1 MiB from each position with a Range request.
+
+Reported: ingest speed as a multiple of real time, the server's resident memory before and at
+its peak (VmHWM from /proc), and the latency of a seek plus a ranged read. Before, the browser
+kept every chunk in memory until the recording stopped; that is the size of the recording.
+
+Linux only. Run from the project root:
+    python benchmarks/bench_recordings.py [minutes] [Mbit/s]
+"""
+
+import asyncio
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import aiohttp
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+PORT = 8379
+URL = f"http://127.0.0.1:{PORT}"
+MIB = 1024 * 1024
+SEEKS = 50
+
+
+def memory(pid):
+    """(VmRSS, VmHWM) in MiB"""
+    with open(f"/proc/{pid}/status") as status:
+        fields = dict(line.split(":", 1) for line in status)
+    return int(fields["VmRSS"].split()[0]) / 1024, int(fields["VmHWM"].split()[0]) / 1024
+
+
+def wait_for_server():
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"{URL}/api/health")
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def report(pid, seconds, chunk_size):
+    sio = socketio.AsyncClient()
+    joined = asyncio.Event()
+    me = {}
+
+    async def on_room_joined(data):
+        me.update(data)
+        joined.set()
+
+    sio.on("room_joined", on_room_joined)
+    # Chunk contents vary a little so nothing downstream can take shortcuts
+    chunks = [os.urandom(chunk_size) for _ in range(16)]
+    async with aiohttp.ClientSession() as http:
+        room_id = (await (await http.post(f"{URL}/api/rooms")).json())["room_id"]
+        await sio.connect(URL, transports=["websocket"])
+        await sio.emit("join_room", {"room_id": room_id, "username": "recorder"})
+        await joined.wait()
+        rss_before, _ = memory(pid)
+
+        recording = await (await http.post(f"{URL}/api/rooms/{room_id}/recordings", json={
+            "user_id": me["user_id"], "mime_type": "video/webm"})).json()
+        base = f"{URL}/api/rooms/{room_id}/recordings/{recording['recording_id']}"
+        start = time.perf_counter()
+        for seq in range(seconds):
+            response = await http.put(f"{base}/chunks/{seq}?t={seq * 1000}", data=chunks[seq % len(chunks)])
+            assert response.status == 200, await response.text()
+        ingest_time = time.perf_counter() - start
+        info = await (await http.post(f"{base}/stop")).json()
+        _, rss_peak = memory(pid)
+
+        latencies = []
+        for _ in range(SEEKS):
+            target = random.randrange(seconds) * 1000
+            start = time.perf_counter()
+            position = await (await http.get(f"{base}/seek?t={target}")).json()
+            async with http.get(base, headers={"Range": f"bytes={position['offset']}-{position['offset'] + MIB - 1}"}) as response:
+                assert response.status == 206
+                await response.read()
+            latencies.append(time.perf_counter() - start)
+        await sio.disconnect()
+
+    size = info["size"] / MIB
+    print(f"recording: {seconds / 60:.0f} min, {seconds} chunks of {chunk_size // 1024} KiB, {size:.0f} MiB")
+    print(f"ingest: {ingest_time:.1f} s, {seconds / ingest_time:.0f}x real time, {size / ingest_time:.0f} MiB/s")
+    print(f"server RSS: {rss_before:.0f} MiB before, peak {rss_peak:.0f} MiB")
+    print(f"seek + 1 MiB range read: median {statistics.median(latencies) * 1000:.1f} ms, "
+          f"max {max(latencies) * 1000:.1f} ms over {SEEKS} random positions")
+    print(f"browser memory: one chunk in flight ({chunk_size // 1024} KiB); before {size:.0f} MiB at the end")
+
+
+def main():
+    minutes = float(sys.argv[1]) if len(sys.argv) > 1 else 60
+    mbits = float(sys.argv[2]) if len(sys.argv) > 2 else 2.5
+    directory = tempfile.mkdtemp(prefix="myconfapp-recordings-")
+    env = dict(os.environ, MYCONFAPP_RECORDINGS_DIR=directory)
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:socket_app", "--port", str(PORT),
+                               "--log-level", "warning"], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_server()
+        asyncio.run(report(server.pid, int(minutes * 60), int(mbits * 1e6 / 8)))
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark: offer -> answer round trip between two participants of one room
+    backplane  participants on different workers, signaling relayed through the unix:// broker
+    affinity   both participants routed to the room's owner by router.py, no cross-process hop
+
+Run from the project root (starts its own workers on ports 8101-8104):
+    python benchmarks/bench_room_affinity.py [exchanges]
+"""
+
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROOM_ID = "bench-room"
+
+
+def start_worker(port, **env):
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:socket_app", "--port", str(port), "--log-level", "error"],
+        cwd=ROOT, env={**os.environ, **env},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def start_router(port, workers):
+    args = [sys.executable, "router.py", "--listen", f"127.0.0.1:{port}"]
+    for name, worker_port in workers:
+        args += ["--worker", f"{name}=127.0.0.1:{worker_port}"]
+    return subprocess.Popen(args, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def connect(url, username, user_id):
+    client = socketio.AsyncClient()
+    joined = asyncio.Event()
+    client.on("room_joined", lambda data: joined.set())
+    await client.connect(f"{url}?room_id={ROOM_ID}", transports=["websocket"])
+    await client.emit("join_room", {"room_id": ROOM_ID, "username": username, "user_id": user_id})
+    await asyncio.wait_for(joined.wait(), 5)
+    return client
+
+
+async def measure(url_a, url_b, exchanges):
+    caller = await connect(url_a, "caller", "caller")
+    callee = await connect(url_b, "callee", "callee")
+    await asyncio.sleep(0.5)  # let the registry settle on every worker
+    answered = asyncio.Queue()
+
+    async def on_offer(data):
+        await callee.emit("webrtc_answer", {"room_id": ROOM_ID, "from_user": "callee",
+                                            "to_user": "caller", "answer": data["offer"]})
+
+    callee.on("webrtc_offer", on_offer)
+    caller.on("webrtc_answer", lambda data: answered.put_nowait(time.perf_counter()))
+
+    offer = {"type": "offer", "sdp": "v=0\r\n" + "a=candidate:x\r\n" * 40}
+    samples = []
+    for _ in range(exchanges):
+        start = time.perf_counter()
+        await caller.emit("webrtc_offer", {"room_id": ROOM_ID, "from_user": "caller",
+                                           "to_user": "callee", "offer": offer})
+        samples.append((await asyncio.wait_for(answered.get(), 5) - start) * 1000)
+
+    await caller.disconnect()
+    await callee.disconnect()
+    return samples
+
+
+def report(label, samples):
+    samples.sort()
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    print(f"{label:<30} p50 {pick(0.50):6.2f} ms   p95 {pick(0.95):6.2f} ms   "
+          f"p99 {pick(0.99):6.2f} ms   mean {statistics.mean(samples):6.2f} ms")
+
+
+def main():
+    exchanges = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    broker = os.path.join(tempfile.mkdtemp(), "backplane.sock")
+
+    processes = [
+        start_worker(8101, MYCONFAPP_BACKPLANE=f"unix://{broker}"),
+        start_worker(8102, MYCONFAPP_BACKPLANE=f"unix://{broker}"),
+    ]
+    time.sleep(4)
+    try:
+        report("backplane (cross-worker)",
+               asyncio.run(measure("http://127.0.0.1:8101", "http://127.0.0.1:8102", exchanges)))
+    finally:
+        for process in processes:
+            process.terminate()
+
+    processes = [start_worker(8103), start_worker(8104)]
+    processes.append(start_router(8100, [("w1", 8103), ("w2", 8104)]))
+    time.sleep(4)
+    try:
+        report("affinity (via router)",
+               asyncio.run(measure("http://127.0.0.1:8100", "http://127.0.0.1:8100", exchanges)))
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark: the meeting scheduler as bookings grow
+For `meetings` booked over the next 30 days, measures:
+
+    book        Scheduler.add in memory: id index insert and heap push of its timers
+    cancel      Scheduler.cancel in memory, against filtering a list of meeting dicts as the
+                admin server's cancel_meeting did
+    next due    finding the earliest timer: the heap's top, against scanning the list for the
+                earliest start as a polling loop would
+    fire        popping and acting on one due timer (handlers do nothing)
+
+and, with SQLite, a refill of the one-hour window from the start time index, the meetings
+page's per-status counts and one page of meetings, with every meeting in the table.
+
+Run from the project root:
+    python benchmarks/bench_scheduler.py [meetings ...]
+"""
+
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import scheduler  # noqa: E402
+
+DAYS = 30
+REPEAT = 200
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_meetings(count, now, rng):
+    meetings = []
+    for number in range(count):
+        start = now + 60 + rng.random() * DAYS * 86400
+        duration = rng.choice((15, 30, 60))
+        meetings.append({"id": f"meeting-{number:08d}", "title": f"Meeting {number}", "organizer": "bench",
+                         "organizer_id": None, "room_id": f"meeting-{number:08d}", "date": "", "start_time": "",
+                         "duration": duration, "description": "", "participants": [], "recurring": False,
+                         "auto_record": False, "created_at": "", "status": scheduler.SCHEDULED, "fired": 0,
+                         "start_at": start, "end_at": start + duration * 60})
+    return meetings
+
+
+async def memory(meetings, now, rng):
+    store = scheduler.Scheduler(None, clock=Clock(now))
+    start = time.perf_counter()
+    for meeting in meetings:
+        await store.add(dict(meeting))
+    book = (time.perf_counter() - start) / len(meetings) * 1e6
+
+    victims = rng.sample(meetings, REPEAT)
+    start = time.perf_counter()
+    for meeting in victims:
+        await store.cancel(meeting["id"])
+    cancel = (time.perf_counter() - start) / REPEAT * 1e6
+
+    listed = list(meetings)
+    start = time.perf_counter()
+    for meeting in victims[:20]:
+        listed = [other for other in listed if other.get("id") != meeting["id"]]
+    list_cancel = (time.perf_counter() - start) / 20 * 1e6
+
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        store.heap[0]
+    heap_next = (time.perf_counter() - start) / REPEAT * 1e6
+    start = time.perf_counter()
+    for _ in range(20):
+        min(meeting["start_at"] for meeting in listed)
+    list_next = (time.perf_counter() - start) / 20 * 1e6
+
+    store.clock.now = now + 86400  # a day of timers comes due
+    due = sum(1 for entry in store.heap if entry[0] <= store.clock.now)
+    start = time.perf_counter()
+    await store.fire_due()
+    fire = (time.perf_counter() - start) / max(due, 1) * 1e6
+    return book, cancel, list_cancel, heap_next, list_next, fire
+
+
+async def database(meetings, now):
+    directory = tempfile.mkdtemp()
+    try:
+        store = scheduler.Scheduler(f"sqlite:///{directory}/meetings.db", clock=Clock(now))
+        with store.engine.begin() as connection:
+            connection.execute(scheduler.meetings_table.insert(), [scheduler._to_row(meeting) for meeting in meetings])
+        start = time.perf_counter()
+        await store.refill()
+        refill = (time.perf_counter() - start) * 1000
+        held = len(store.meetings)
+        start = time.perf_counter()
+        await store.counts()
+        counts = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        await store.page(since=now + 86400, limit=200)
+        page = (time.perf_counter() - start) * 1000
+        await store.stop()
+        return refill, held, counts, page
+    finally:
+        shutil.rmtree(directory)
+
+
+async def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 500000]
+    rng = random.Random(1)
+    now = time.time()
+    print("in memory, microseconds per operation")
+    print(f"{'meetings':>9} {'book':>7} {'cancel':>7} {'list cancel':>12} {'next due':>9} {'list scan':>10} {'fire':>7}")
+    for size in sizes:
+        meetings = make_meetings(size, now, rng)
+        book, cancel, list_cancel, heap_next, list_next, fire = await memory(meetings, now, rng)
+        print(f"{size:>9,} {book:>7.2f} {cancel:>7.2f} {list_cancel:>12.0f} {heap_next:>9.3f} {list_next:>10.0f} {fire:>7.2f}")
+    print()
+    print("SQLite, milliseconds")
+    print(f"{'meetings':>9} {'refill':>8} {'held':>6} {'counts':>8} {'page':>8}")
+    for size in sizes:
+        refill, held, counts, page = await database(make_meetings(size, now, rng), now)
+        print(f"{size:>9,} {refill:>8.2f} {held:>6} {counts:>8.2f} {page:>8.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,214 @@
+"""
+Benchmark: SFU forwarded throughput and server CPU per subscriber
+Starts the server with MYCONFAPP_MEDIA=sfu in a subprocess and drives it headlessly with
+aiortc clients over the normal Socket.IO signaling: one publisher sending a synthetic 640x480
+VP8 video track (a moving test pattern) and a silent Opus track, then a growing number of
+subscribers. Subscribers count what they receive without decoding it.
+
+For each subscriber count the server's CPU time (from /proc) and the bytes received by all
+subscribers are sampled over a fixed window. All clients share this process, so once its own
+CPU (harness CPU) nears 100% the subscribers, not the server, limit the frame rate. The publisher uploads its stream once whatever
+the room size; in a full mesh it would upload it once per subscriber.
+
+Needs aiortc and Linux. Run from the project root:
+    python benchmarks/bench_sfu.py [max subscribers]
+"""
+
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+try:
+    from aiortc import RTCPeerConnection, RTCSessionDescription
+    from aiortc.mediastreams import AudioStreamTrack, MediaStreamError, VideoStreamTrack
+    import av
+except ImportError:
+    sys.exit("The SFU benchmark needs aiortc (pip install aiortc)")
+
+from sfu import SFU_PEER, install_passthrough  # noqa: E402
+
+PORT = 8377
+URL = f"http://127.0.0.1:{PORT}"
+ROOM_ID = "sfu-bench"
+WARMUP = 3.0
+WINDOW = 5.0
+WIDTH, HEIGHT = 640, 480
+
+
+class TestPatternTrack(VideoStreamTrack):
+    """Diagonal bars that move every frame, so the encoder keeps producing real inter frames"""
+
+    def __init__(self):
+        super().__init__()
+        row = bytes((x * 4) & 0xff for x in range(WIDTH * 2))
+        self.luma = b"".join(row[y % WIDTH:y % WIDTH + WIDTH] for y in range(HEIGHT + WIDTH))
+        self.chroma = bytes([128]) * (WIDTH * HEIGHT // 4)
+        self.counter = 0
+
+    async def recv(self):
+        pts, time_base = await self.next_timestamp()
+        frame = av.VideoFrame(WIDTH, HEIGHT, "yuv420p")
+        offset = (self.counter * 4 % WIDTH) * WIDTH
+        frame.planes[0].update(self.luma[offset:offset + WIDTH * HEIGHT])
+        frame.planes[1].update(self.chroma)
+        frame.planes[2].update(self.chroma)
+        frame.pts, frame.time_base = pts, time_base
+        self.counter += 1
+        return frame
+
+
+class Client:
+    """A participant: a Socket.IO connection plus one RTCPeerConnection to the SFU"""
+
+    def __init__(self, name, publish):
+        self.name = name
+        self.publish = publish
+        self.user_id = None
+        self.sio = socketio.AsyncClient()
+        self.pc = RTCPeerConnection()
+        self.received = {"frames": 0, "bytes": 0}
+        self.joined = asyncio.Event()
+        # Browsers queue signaling operations per connection; aiortc needs it done for it
+        self.negotiation = asyncio.Lock()
+        self.tasks = set()
+        self.sio.on("room_joined", self.on_room_joined)
+        self.sio.on("webrtc_offer", self.on_offer)
+        self.sio.on("webrtc_answer", self.on_answer)
+        self.pc.on("track", self.on_track)
+
+    async def on_room_joined(self, data):
+        self.user_id = data["user_id"]
+        self.joined.set()
+
+    async def on_offer(self, data):
+        async with self.negotiation:
+            await self.pc.setRemoteDescription(RTCSessionDescription(**data["offer"]))
+            await self.pc.setLocalDescription(await self.pc.createAnswer())
+            await self.signal("webrtc_answer", "answer")
+
+    async def on_answer(self, data):
+        async with self.negotiation:
+            await self.pc.setRemoteDescription(RTCSessionDescription(**data["answer"]))
+
+    def on_track(self, track):
+        task = asyncio.ensure_future(self.consume(track))
+        self.tasks.add(task)
+
+    async def consume(self, track):
+        try:
+            while True:
+                packet = await track.recv()
+                self.received["frames"] += 1
+                self.received["bytes"] += packet.size
+        except MediaStreamError:
+            pass
+
+    async def signal(self, event, kind):
+        description = self.pc.localDescription
+        await self.sio.emit(event, {"room_id": ROOM_ID, "from_user": self.user_id, "to_user": SFU_PEER,
+                                    kind: {"type": description.type, "sdp": description.sdp}})
+
+    async def start(self):
+        await self.sio.connect(URL, transports=["websocket"])
+        await self.sio.emit("join_room", {"room_id": ROOM_ID, "username": self.name,
+                                          "capabilities": ["ice_batching"]})
+        await self.joined.wait()
+        if self.publish:
+            self.pc.addTrack(TestPatternTrack())
+            self.pc.addTrack(AudioStreamTrack())
+        else:
+            self.pc.addTransceiver("audio", direction="recvonly")
+            self.pc.addTransceiver("video", direction="recvonly")
+        # aiortc gathers every candidate before the description is set, so no trickling is needed
+        await self.pc.setLocalDescription(await self.pc.createOffer())
+        await self.signal("webrtc_offer", "offer")
+
+    async def stop(self):
+        await self.sio.disconnect()
+        await self.pc.close()
+
+
+def cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as stat:
+        fields = stat.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def health():
+    return json.loads(urllib.request.urlopen(f"{URL}/api/health").read())
+
+
+def wait_for_server():
+    for _ in range(100):
+        try:
+            health()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def measure(pid, subscribers):
+    await asyncio.sleep(WARMUP)
+    received = lambda: sum(s.received["bytes"] for s in subscribers)
+    frames = lambda: sum(s.received["frames"] for s in subscribers)
+    own, cpu, data, count = cpu_seconds(os.getpid()), cpu_seconds(pid), received(), frames()
+    dropped, start = health()["sfu"]["dropped_frames"], time.perf_counter()
+    await asyncio.sleep(WINDOW)
+    elapsed = time.perf_counter() - start
+    return ((cpu_seconds(pid) - cpu) / elapsed, (received() - data) * 8 / elapsed / 1e6,
+            (frames() - count) / elapsed, (cpu_seconds(os.getpid()) - own) / elapsed,
+            health()["sfu"]["dropped_frames"] - dropped)
+
+
+async def report(pid, max_subscribers):
+    publisher = Client("publisher", publish=True)
+    await publisher.start()
+    subscribers = []
+    steps = [n for n in (0, 1, 2, 4, 8, 16, 32) if n <= max_subscribers]
+    print(f"{'subscribers':>11} {'server CPU':>11} {'forwarded Mbit/s':>17} {'frames/s':>9} "
+          f"{'CPU ms per subscriber-s':>24} {'dropped':>8} {'harness CPU':>12}")
+    baseline = None
+    for count in steps:
+        while len(subscribers) < count:
+            subscriber = Client(f"subscriber {len(subscribers)}", publish=False)
+            await subscriber.start()
+            subscribers.append(subscriber)
+        cpu, mbits, fps, harness_cpu, dropped = await measure(pid, subscribers)
+        baseline = cpu if baseline is None else baseline
+        per_subscriber = f"{(cpu - baseline) / count * 1000:>24.1f}" if count else f"{'-':>24}"
+        print(f"{count:>11} {cpu:>10.1%} {mbits:>17.2f} {fps:>9.0f} {per_subscriber} {dropped:>8} "
+              f"{harness_cpu:>11.0%}")
+    for client in [publisher] + subscribers:
+        await client.stop()
+
+
+def main():
+    max_subscribers = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    logging.getLogger("aioice").setLevel(logging.WARNING)
+    install_passthrough()  # subscribers count encoded frames instead of decoding them
+    env = dict(os.environ, MYCONFAPP_MEDIA="sfu")
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:socket_app", "--port", str(PORT),
+                               "--log-level", "warning"], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_server()
+        asyncio.run(report(server.pid, max_subscribers))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
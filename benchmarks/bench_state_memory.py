@@ -0,0 +1,116 @@
+"""
+Benchmark: memory per connected user
+Two measurements with tracemalloc, at 100,000 users by default:
+
+    records       the user records alone: the Pydantic model the server used to keep (the
+                  same fields, defined here) against main.UserInfo. Room ids are fresh strings
+                  per user, as they arrive in join_room payloads.
+    connected     everything the server holds for a user that joined through join_room
+                  (rooms of 10): user record, session maps, room membership, roster entry and
+                  the Socket.IO manager's bookkeeping. The Engine.IO layer is a sink.
+
+Also reported: the cost of flipping a media flag on a record (toggle_video/toggle_audio).
+
+Run from the project root:
+    python benchmarks/bench_state_memory.py [users]
+"""
+
+import asyncio
+import contextlib
+import gc
+import io
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.update(MYCONFAPP_STATE_DB="", MYCONFAPP_CHAT_DB="", MYCONFAPP_MEETINGS_DB="")
+
+from pydantic import BaseModel  # noqa: E402
+
+import main as server  # noqa: E402
+
+ROOM_SIZE = 10
+TOGGLES = 1000000
+
+
+class PydanticUser(BaseModel):
+    """The user record as a Pydantic model"""
+    id: str
+    username: str
+    room_id: Optional[str]
+    joined_at: datetime
+    is_video_enabled: bool = True
+    is_audio_enabled: bool = True
+    ice_batching: bool = False
+    role: str = "participant"
+    resume_token: Optional[str] = None
+
+
+async def sink(eio_sid, pkt):
+    pass
+
+
+def measure(build):
+    """Bytes allocated by build() and still alive afterwards, and what it returned"""
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return used, kept
+
+
+def records(user_type, count):
+    now = datetime.now()
+    return [user_type(id=f"user-{i}", username=f"User {i}", room_id="room-" + str(i // ROOM_SIZE), joined_at=now,
+                      role=server.PARTICIPANT, resume_token=f"{i:022d}")
+            for i in range(count)]
+
+
+def toggle(user):
+    start = time.perf_counter()
+    for i in range(TOGGLES):
+        user.is_video_enabled = i & 1 == 0
+    return (time.perf_counter() - start) / TOGGLES * 1e9
+
+
+async def join(count):
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(count):
+            sid = await server.sio.manager.connect(f"sid-{i}", "/")
+            await server.join_room(sid, {"room_id": f"room-{i // ROOM_SIZE}", "username": f"User {i}",
+                                         "user_id": f"user-{i}"})
+            if i % ROOM_SIZE == ROOM_SIZE - 1:
+                for _ in range(3):
+                    await asyncio.sleep(0)  # let the roster_delta publisher run
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    logging.getLogger("engineio.server").setLevel(logging.WARNING)
+    logging.getLogger("socketio.server").setLevel(logging.WARNING)
+    server.sio._send_eio_packet = sink
+    print(f"{count:,} users, rooms of {ROOM_SIZE}")
+    print(f"{'records':<24} {'bytes/user':>10} {'flag set ns':>11}")
+    for name, user_type in (("Pydantic model", PydanticUser), ("main.UserInfo", server.UserInfo)):
+        used, kept = measure(lambda: records(user_type, count))
+        print(f"{name:<24} {used / count:>10.0f} {toggle(kept[0]):>11.0f}")
+        del kept
+
+    loop = asyncio.new_event_loop()
+    used, _ = measure(lambda: loop.run_until_complete(join(count)))
+    assert len(server.users) == count
+    print(f"{'connected, all state':<24} {used / count:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark: warm restart with persisted rooms
+Builds the state of a busy server through the state store (50,000 rooms of 4 users by default),
+lets StatePersistence write it behind, then starts the server in a subprocess on that database
+and measures the time from launch until GET /api/health answers, against a launch on an empty
+database. The server restores everything before it accepts connections.
+
+Also reported: how long the write-behind flush of the whole state took, and, in process, the
+bulk load against rebuilding the same store with one join per user (StateStore.restore).
+
+Linux only. Run from the project root:
+    python benchmarks/bench_state_restore.py [rooms] [users per room]
+"""
+
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.update(MYCONFAPP_STATE_DB="", MYCONFAPP_CHAT_DB="", MYCONFAPP_MEETINGS_DB="")
+
+from main import RoomInfo, UserInfo  # noqa: E402
+from state_persistence import StatePersistence  # noqa: E402
+from state_store import StateStore  # noqa: E402
+
+PORT = 8380
+URL = f"http://127.0.0.1:{PORT}"
+LAUNCHES = 3
+
+
+def memory(pid):
+    """VmRSS in MiB"""
+    with open(f"/proc/{pid}/status") as status:
+        fields = dict(line.split(":", 1) for line in status)
+    return int(fields["VmRSS"].split()[0]) / 1024
+
+
+async def build(url, room_count, per_room):
+    store = StateStore()
+    persistence = StatePersistence(url, store, RoomInfo, UserInfo)
+    now = datetime.now()
+    start = time.perf_counter()
+    for r in range(room_count):
+        room_id = f"room-{r}"
+        store.add_room(RoomInfo(id=room_id, name=f"Room {r}", created_at=now))
+        for u in range(per_room):
+            user_id = f"user-{r}-{u}"
+            store.add_user(UserInfo(id=user_id, username=f"user {u}", room_id=room_id, joined_at=now),
+                           f"sid-{r}-{u}")
+        if r % 1000 == 0:
+            await asyncio.sleep(0)  # let write-behind flushes run, as between Socket.IO events
+    mutations = time.perf_counter() - start
+    await persistence.close()
+    return store, mutations, time.perf_counter() - start
+
+
+def launch(url):
+    """Seconds from starting the server until it answers, and its resident memory"""
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:socket_app", "--port", str(PORT),
+                               "--log-level", "warning"], env=dict(os.environ, MYCONFAPP_STATE_DB=url),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                urllib.request.urlopen(f"{URL}/api/health")
+                break
+            except OSError:
+                time.sleep(0.02)
+        return time.perf_counter() - start, memory(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    room_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    per_room = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    directory = tempfile.mkdtemp(prefix="myconfapp-state-")
+    try:
+        url = f"sqlite:///{directory}/state.db"
+        store, mutations, persisted = asyncio.run(build(url, room_count, per_room))
+        size = os.path.getsize(f"{directory}/state.db") / 2 ** 20
+        print(f"{room_count:,} rooms, {room_count * per_room:,} users, database {size:.0f} MiB")
+        print(f"mutations {mutations:.1f} s, everything persisted {persisted - mutations:.2f} s after the last one")
+
+        start = time.perf_counter()
+        loaded = StateStore()
+        StatePersistence(url, loaded, RoomInfo, UserInfo).engine.dispose()
+        restore = time.perf_counter() - start
+        assert len(loaded.rooms) == room_count and len(loaded.users) == room_count * per_room
+        rooms, users = list(store.rooms.values()), list(store.users.values())
+        participants = {room_id: list(user_ids) for room_id, user_ids in store.room_participants.items()}
+        start = time.perf_counter()
+        StateStore().load(rooms, users, participants)
+        bulk = time.perf_counter() - start
+        snapshot = store.snapshot()
+        start = time.perf_counter()
+        StateStore().restore(snapshot)
+        replay = time.perf_counter() - start
+        print(f"in process: read, parse and load {restore:.2f} s, of which building the store "
+              f"{bulk:.2f} s (one join per user: {replay:.2f} s)")
+
+        empty = f"sqlite:///{directory}/empty.db"
+        print(f"{'launch until /api/health':<26} {'best s':>8} {'RSS MiB':>8}")
+        for name, database in (("empty database", empty), (f"{room_count:,} rooms", url)):
+            results = [launch(database) for _ in range(LAUNCHES)]
+            seconds, rss = min(results)
+            print(f"{name:<26} {seconds:>8.2f} {rss:>8.0f}")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Micro-benchmark: cost of one join + disconnect against the state store
+Compares the indexed StateStore with the linear scans previously done in main.py
+
+Run from the project root:
+    python benchmarks/bench_state_store.py
+"""
+
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from state_store import StateStore
+
+ROOM_SIZE = 10
+POPULATIONS = [100, 1_000, 10_000, 100_000]
+INDEXED_OPS = 20_000
+LEGACY_OPS = 200
+
+
+@dataclass
+class User:
+    id: str
+    username: str
+    room_id: Optional[str]
+    # Read by the room roster (roster.participant_entry)
+    role: str = "participant"
+    is_video_enabled: bool = True
+    is_audio_enabled: bool = True
+    joined_at: datetime = field(default_factory=datetime.now)
+
+
+def populate_indexed(n):
+    store = StateStore()
+    for i in range(n):
+        store.add_user(User(f"u{i}", f"name{i}", f"room{i // ROOM_SIZE}"), f"sid{i}")
+    return store
+
+
+def populate_legacy(n):
+    users, sessions, participants = {}, {}, {}
+    for i in range(n):
+        room_id = f"room{i // ROOM_SIZE}"
+        users[f"u{i}"] = User(f"u{i}", f"name{i}", room_id)
+        sessions[f"u{i}"] = f"sid{i}"
+        participants.setdefault(room_id, []).append(f"u{i}")
+    return users, sessions, participants
+
+
+def cycle_indexed(store, i):
+    room_id = f"room{i % 50}"
+    username = f"guest{i}"
+    existing = store.find_user(room_id, username)
+    store.add_user(User(existing or f"g{i}", username, room_id), f"gsid{i}")
+    user_id = store.user_for_session(f"gsid{i}")
+    store.remove_user(user_id)
+
+
+def cycle_legacy(users, sessions, participants, i):
+    room_id = f"room{i % 50}"
+    username = f"guest{i}"
+    user_id = f"g{i}"
+    for existing_id, existing in users.items():
+        if existing.username == username and existing.room_id == room_id:
+            user_id = existing_id
+            break
+    users[user_id] = User(user_id, username, room_id)
+    sessions[user_id] = f"gsid{i}"
+    participants.setdefault(room_id, []).append(user_id)
+    for uid, sid in sessions.items():
+        if sid == f"gsid{i}":
+            participants[room_id].remove(uid)
+            del users[uid]
+            del sessions[uid]
+            break
+
+
+def measure(fn, ops):
+    start = time.perf_counter()
+    for i in range(ops):
+        fn(i)
+    return (time.perf_counter() - start) / ops * 1e6
+
+
+def main():
+    print(f"{'connected users':>16} {'indexed us/op':>14} {'legacy us/op':>14}")
+    for n in POPULATIONS:
+        store = populate_indexed(n)
+        indexed = measure(lambda i: cycle_indexed(store, i), INDEXED_OPS)
+        legacy_state = populate_legacy(n)
+        legacy = measure(lambda i: cycle_legacy(*legacy_state, i), LEGACY_OPS)
+        print(f"{n:>16,} {indexed:>14.2f} {legacy:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark: filling a webinar room with 5,000 attendees versus a meeting room
+Every member joins through main.join_room on one server. The Engine.IO layer is replaced by a
+sink that counts the packets the server would write, so the numbers cover the server's own
+work per join: the roster, room_joined and the announcements to the rest of the room.
+
+    meeting   full mesh: room_joined carries the whole roster, everybody gets user_joined
+    webinar   2 presenters, then attendees: room_joined carries the presenters only and the
+              audience gets one participant_count per interval instead of user_joined
+
+Afterwards one page of /api/rooms/{room_id}/participants is read at the start and at the end
+of the webinar roster.
+
+Run from the project root:
+    python benchmarks/bench_webinar.py [attendees] [meeting members]
+"""
+
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import main as server  # noqa: E402
+
+PRESENTERS = 2
+PAGE_ROUNDS = 200
+
+sent = {"packets": 0}
+
+
+async def sink(eio_sid, pkt):
+    pkt.encode()
+    sent["packets"] += 1
+
+
+async def fill(room_id, members, presenter_token=None):
+    """Join `members` users one by one; per-join seconds, and packets including the events
+    published in the background because of the join"""
+    times, packets = [], []
+    for i in range(members):
+        sid = await server.sio.manager.connect(f"{room_id}-{i}", "/")
+        data = {"room_id": room_id, "username": f"User {i}", "user_id": f"{room_id}-u{i}"}
+        if presenter_token and i < PRESENTERS:
+            data["presenter_token"] = presenter_token
+        before = sent["packets"]
+        start = time.perf_counter()
+        await server.join_room(sid, data)
+        times.append(time.perf_counter() - start)
+        for _ in range(3):
+            await asyncio.sleep(0)  # let roster_delta / participant_count publishers run
+        packets.append(sent["packets"] - before)
+    return times, packets
+
+
+def summary(name, members, times, packets, extra=0):
+    times = sorted(times)
+    p = lambda q: times[min(len(times) - 1, int(q * len(times)))] * 1000
+    print(f"{name:<8} {members:>7} {sum(times):>9.2f} {p(0.5):>8.3f} {p(0.99):>8.3f} {times[-1] * 1000:>8.3f} "
+          f"{statistics.mean(packets[-100:]):>12.1f} {sum(packets) + extra:>10}")
+
+
+async def page_cost(room_id, cursor):
+    start = time.perf_counter()
+    for _ in range(PAGE_ROUNDS):
+        page = await server.list_room_participants(room_id, cursor=cursor, limit=server.PARTICIPANTS_PAGE_SIZE)
+    return (time.perf_counter() - start) / PAGE_ROUNDS, page
+
+
+async def report(attendees, meeting_members):
+    logging.getLogger("engineio.server").setLevel(logging.WARNING)
+    logging.getLogger("socketio.server").setLevel(logging.WARNING)
+    server.sio._send_eio_packet = sink
+    print(f"{'room':<8} {'members':>7} {'fill s':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+          f"{'pkts/join*':>12} {'total pkts':>10}")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        meeting = await server.create_room()
+        times, packets = await fill(meeting["room_id"], meeting_members)
+    summary("meeting", meeting_members, times, packets)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        webinar = await server.create_room(mode=server.WEBINAR)
+        before = sent["packets"]
+        times, packets = await fill(webinar["room_id"], PRESENTERS + attendees, webinar["presenter_token"])
+        # Let the last participant_count interval fire
+        await asyncio.sleep(server.WEBINAR_COUNT_INTERVAL_MS / 1000 + 0.1)
+        pending = sent["packets"] - before - sum(packets)
+    summary("webinar", PRESENTERS + attendees, times, packets, pending)
+    print("* mean over the last 100 joins")
+
+    room_id = webinar["room_id"]
+    first, page = await page_cost(room_id, None)
+    roster = server.state.get_roster(room_id)
+    last_cursor = f"{roster.epoch}:{roster.version - server.PARTICIPANTS_PAGE_SIZE - 1}"
+    last, _ = await page_cost(room_id, last_cursor)
+    print(f"participants page of {len(page['participants'])}: first {first * 1e6:.0f} us, "
+          f"last {last * 1e6:.0f} us (of {page['participant_count']})")
+
+
+def main():
+    attendees = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    meeting_members = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    asyncio.run(report(attendees, meeting_members))
+
+
+if __name__ == "__main__":
+    main()
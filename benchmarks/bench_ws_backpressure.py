@@ -0,0 +1,89 @@
+"""
+Benchmark: broadcast latency seen by fast WebSocket clients while some clients are slow
+    sequential  the previous ConnectionManager loop, awaiting send_text per recipient
+    queued      per-connection outbound queues with writer tasks
+
+Run from the project root:
+    python benchmarks/bench_ws_backpressure.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import main as server  # noqa: E402
+
+FAST_CLIENTS = 50
+SLOW_SEND_MS = 20
+MESSAGES = 200
+INTERVAL_MS = 5
+
+
+class FakeWebSocket:
+    def __init__(self, slow, latencies):
+        self.slow = slow
+        self.latencies = latencies
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        if self.slow:
+            await asyncio.sleep(SLOW_SEND_MS / 1000)
+        else:
+            self.latencies.append(time.perf_counter() - float(message))
+
+    async def close(self, code=1000):
+        pass
+
+
+class SequentialManager(server.ConnectionManager):
+    """Fan-out as it was before the outbound queues"""
+
+    async def broadcast_to_room(self, message, room_id, exclude_user=None, policy=None):
+        for user_id in self.room_connections[room_id]:
+            try:
+                await self.active_connections[user_id].send_text(message)
+            except Exception:
+                pass
+
+
+async def run(manager_class, slow_clients):
+    manager = manager_class()
+    latencies = []
+    for i in range(FAST_CLIENTS + slow_clients):
+        slow = i % 6 == 5 and i // 6 < slow_clients  # slow clients spread through the room
+        await manager.connect(FakeWebSocket(slow, latencies), f"u{i}", "room")
+
+    start = time.perf_counter()
+    for _ in range(MESSAGES):
+        await manager.broadcast_to_room(repr(time.perf_counter()), "room")
+        await asyncio.sleep(INTERVAL_MS / 1000)
+    elapsed = time.perf_counter() - start
+    while len(latencies) < FAST_CLIENTS * MESSAGES:
+        await asyncio.sleep(0.01)
+
+    for user_id in list(manager.active_connections):
+        manager.disconnect(user_id, "room")
+    latencies.sort()
+    pick = lambda q: latencies[int(q * (len(latencies) - 1))] * 1000
+    return pick(0.5), pick(0.99), MESSAGES / elapsed
+
+
+def main():
+    print(f"{FAST_CLIENTS} fast clients, slow clients take {SLOW_SEND_MS} ms per send, "
+          f"{MESSAGES} broadcasts every {INTERVAL_MS} ms")
+    print(f"{'fan-out':>10} {'slow':>5} {'fast p50 ms':>12} {'fast p99 ms':>12} {'broadcasts/s':>13}")
+    for manager_class, label in ((SequentialManager, "sequential"), (server.ConnectionManager, "queued")):
+        for slow_clients in (0, 10):
+            p50, p99, rate = asyncio.run(run(manager_class, slow_clients))
+            print(f"{label:>10} {slow_clients:>5} {p50:>12.3f} {p99:>12.3f} {rate:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
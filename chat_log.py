@@ -0,0 +1,500 @@
+"""
+Per-room chat history
+The newest messages of every room stay in a fixed-size ring buffer, so late joiners,
+reconnecting clients and the first history page are served from memory. With a database URL
+(SQLite by default), messages are also written behind in batches: send_message only appends to
+a list, and a background flush hands the batch to a single writer thread, so the event loop
+never waits for the disk. Older pages are read from the database after the pending batch is
+flushed.
+
+Message ids grow with time across all rooms and double as pagination cursors. Several workers
+can share one database: each leases its own writer slot there, and the slot is part of every id
+it hands out, so two workers never pick the same id. Behind a backplane (shared=True) a room's
+messages are sent through several workers, so history is always read from the database, once
+the other workers have had time to write what was sent before the read.
+
+On SQLite every batch also goes into an FTS5 full-text index in the same transaction. Room and
+user are indexed as one token each next to the words, so a search in one room intersects that
+room's posting list with the words' instead of filtering matches afterwards. Time filters are
+turned into a message id range first (ids grow with time).
+
+Persistence needs the optional sqlalchemy package; without it only the ring buffer is kept.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import logging
+import re
+import time
+import unicodedata
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, List, Optional, Tuple
+
+try:
+    import sqlalchemy
+    from sqlalchemy import Column, Float, Index, Integer, MetaData, String, Table, Text
+    from sqlalchemy.exc import IntegrityError
+except ImportError:  # optional dependency
+    sqlalchemy = None
+
+logger = logging.getLogger(__name__)
+
+# Messages kept in memory per room
+CHAT_BUFFER_SIZE = 200
+
+# Pending messages are written at least this often, or as soon as this many are waiting
+FLUSH_INTERVAL = 0.1
+FLUSH_BATCH_SIZE = 1000
+
+# A message id is (milliseconds since ID_EPOCH << 14) | (writer slot << 8) | sequence. Ids stay
+# below 2**53, so JavaScript clients read them exactly, until 2041.
+ID_EPOCH_MS = 1704067200000  # 2024-01-01 UTC
+SLOT_BITS = 6
+SEQUENCE_BITS = 8
+WRITER_SLOTS = 1 << SLOT_BITS
+
+# A worker's writer slot is leased for this long; the writer thread renews it every third of that
+WRITER_LEASE = 600.0
+
+# Shared logs: a history read waits this many flush intervals after the newest message it could
+# return, so other workers' write-behind batches with lower ids are in the database
+SETTLE_INTERVALS = 2
+
+if sqlalchemy is not None:
+    metadata = MetaData()
+    messages_table = Table(
+        "chat_messages", metadata,
+        Column("id", Integer, primary_key=True, autoincrement=False),
+        Column("room_id", String(64), nullable=False),
+        Column("user_id", String(64), nullable=False),
+        Column("username", String(255), nullable=False),
+        Column("message", Text, nullable=False),
+        Column("timestamp", String(32), nullable=False),
+        Column("type", String(16), nullable=False),
+        Index("ix_chat_messages_room_id_id", "room_id", "id"),
+        Index("ix_chat_messages_timestamp", "timestamp"),
+    )
+    writers_table = Table(
+        "chat_writers", metadata,
+        Column("slot", Integer, primary_key=True, autoincrement=False),
+        Column("owner", String(32), nullable=False),
+        Column("expires", Float, nullable=False),
+    )
+
+MESSAGE_FIELDS = ("id", "room_id", "user_id", "username", "message", "timestamp", "type")
+
+FTS_TABLE = "chat_messages_fts"
+# Contentless: the index only maps words to message ids, the text stays in chat_messages.
+# Prefix indexes make 2- and 3-character prefix queries as cheap as whole words.
+FTS_SCHEMA = (f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(message, room, user, content='', "
+              "prefix='2 3', tokenize='unicode61 remove_diacritics 2')")
+FTS_INSERT = (f"INSERT INTO {FTS_TABLE} (rowid, message, room, user) VALUES (:id, :message, :room, :user)")
+FTS_FILL = (f"INSERT INTO {FTS_TABLE} (rowid, message, room, user) SELECT id, message, "
+            "search_key('r', room_id), search_key('u', user_id) FROM chat_messages WHERE id BETWEEN :first AND :last")
+FTS_SEARCH = (f"SELECT {', '.join('m.' + name for name in MESSAGE_FIELDS)} FROM {FTS_TABLE} f "
+              f"JOIN chat_messages m ON m.id = f.rowid WHERE {FTS_TABLE} MATCH :match "
+              "AND f.rowid >= :low AND f.rowid < :high ORDER BY f.rowid DESC LIMIT :limit")
+
+WORD = re.compile(r"\w+")
+
+
+def search_key(kind: str, value: str) -> str:
+    """A single-token stand-in for a room or user id in the full-text index"""
+    return kind + hashlib.blake2b(value.encode(), digest_size=8).hexdigest()
+
+
+def fold(text: str) -> str:
+    """Lower case without accents, like the index's unicode61 tokenizer"""
+    return "".join(char for char in unicodedata.normalize("NFKD", text.lower()) if not unicodedata.combining(char))
+
+
+def parse_query(text: str) -> List[Tuple[str, bool]]:
+    """Words of a search as (word, is_prefix); a trailing * makes a word a prefix"""
+    terms = []
+    for part in text.split():
+        prefix = part.endswith("*")
+        terms.extend((word, prefix and index == len(words) - 1)
+                     for words in [WORD.findall(fold(part))] for index, word in enumerate(words))
+    return terms
+
+
+def fts_match(terms: List[Tuple[str, bool]], room_id: Optional[str], user_id: Optional[str]) -> str:
+    clauses = [f'"{word}"' + ("*" if prefix else "") for word, prefix in terms]
+    if room_id is not None:
+        clauses.append(f'room : "{search_key("r", room_id)}"')
+    if user_id is not None:
+        clauses.append(f'user : "{search_key("u", user_id)}"')
+    return " AND ".join(clauses)
+
+
+def id_time(message_id: int) -> float:
+    """When a message id was handed out (epoch seconds)"""
+    return ((message_id >> (SLOT_BITS + SEQUENCE_BITS)) + ID_EPOCH_MS) / 1000
+
+
+def available() -> bool:
+    return sqlalchemy is not None
+
+
+class ChatLog:
+    """Ring buffer per room plus optional write-behind persistence"""
+
+    def __init__(self, url: Optional[str], buffer_size: int = CHAT_BUFFER_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL, batch_size: int = FLUSH_BATCH_SIZE, shared: bool = False,
+                 read_only: bool = False):
+        self.buffer_size = buffer_size
+        # Only searches and reads a database the main server writes (the admin server): no schema,
+        # no full-text index and no writer slot of its own
+        self.read_only = read_only
+        # Other workers send to the same rooms: the buffers only hold this worker's messages
+        self.shared = shared
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.buffers: Dict[str, Deque[dict]] = {}
+        self.pending: List[dict] = []
+        self.written = 0
+        self.dropped = 0
+        self.engine = None
+        self.last_id = 0
+        self.slot = 0
+        self.owner = uuid.uuid4().hex
+        self._tick = 0
+        self._sequence = 0
+        self._lease_task: Optional[asyncio.Task] = None
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flushing: Optional[asyncio.Future] = None
+        self._full_text_index = False
+        if url and available():
+            # One writer thread: SQLite takes one writer at a time and batches stay in order
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-log")
+            self.engine = sqlalchemy.create_engine(url)
+            if self.engine.dialect.name == "sqlite":
+                sqlalchemy.event.listen(self.engine, "connect", _sqlite_pragmas)
+            if read_only:
+                return
+            metadata.create_all(self.engine)
+            for index in messages_table.indexes:
+                index.create(self.engine, checkfirst=True)
+            with self.engine.begin() as connection:
+                self.last_id = connection.execute(sqlalchemy.select(sqlalchemy.func.max(messages_table.c.id))).scalar() or 0
+                if self.full_text:
+                    self._create_full_text_index(connection)
+            # Start past every stored id, even if the clock went back
+            self._tick = (self.last_id >> (SLOT_BITS + SEQUENCE_BITS)) + 1
+            if not self._claim_slot():
+                raise RuntimeError(f"All {WRITER_SLOTS} chat writer slots are leased by other workers")
+        elif url:
+            logger.warning("Chat persistence needs sqlalchemy (pip install sqlalchemy), keeping chat in memory only")
+
+    @property
+    def persistent(self) -> bool:
+        return self.engine is not None
+
+    @property
+    def full_text(self) -> bool:
+        if self.engine is None or self.engine.dialect.name != "sqlite":
+            return False
+        # A reader uses the index once the main server has built it, and LIKE until then
+        return self._full_text_index if self.read_only else True
+
+    def _has_full_text_index(self, connection) -> bool:
+        if self.engine.dialect.name != "sqlite":
+            return False
+        return connection.execute(sqlalchemy.text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                                  {"name": FTS_TABLE}).first() is not None
+
+    def _create_full_text_index(self, connection):
+        if not self._has_full_text_index(connection):
+            connection.execute(sqlalchemy.text(FTS_SCHEMA))
+            if self.last_id:
+                logger.info("Indexing stored chat messages for search")
+                connection.execute(sqlalchemy.text(FTS_FILL), {"first": 0, "last": self.last_id})
+
+    def _claim_slot(self) -> bool:
+        """Lease a writer slot, preferring the one this log already holds; False if none is free"""
+        table = writers_table
+        now = time.time()
+        for slot in sorted(range(WRITER_SLOTS), key=lambda slot: slot != self.slot):
+            try:
+                with self.engine.begin() as connection:
+                    # Conditional update: of several workers racing for a free slot only one gets it
+                    claimed = connection.execute(table.update().where(
+                        table.c.slot == slot, sqlalchemy.or_(table.c.owner == self.owner, table.c.expires < now)
+                    ).values(owner=self.owner, expires=now + WRITER_LEASE)).rowcount
+                    if not claimed:
+                        if connection.execute(sqlalchemy.select(table.c.slot).where(table.c.slot == slot)).first():
+                            continue
+                        connection.execute(table.insert().values(slot=slot, owner=self.owner, expires=now + WRITER_LEASE))
+            except IntegrityError:
+                continue  # another worker inserted it first
+            self.slot = slot
+            return True
+        return False
+
+    def start(self):
+        """Keep the writer slot leased while the server runs"""
+        if self.engine is not None and not self.read_only and self._lease_task is None:
+            self._lease_task = asyncio.ensure_future(self._keep_lease())
+
+    async def _keep_lease(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(WRITER_LEASE / 3)
+            try:
+                # On the writer thread, like every other statement: the event loop never waits for it
+                await loop.run_in_executor(self.executor, self._renew_lease)
+            except Exception:
+                logger.exception("Renewing the chat writer lease failed, will retry")
+
+    def _renew_lease(self):
+        table = writers_table
+        with self.engine.begin() as connection:
+            renewed = connection.execute(table.update().where(table.c.slot == self.slot, table.c.owner == self.owner)
+                                         .values(expires=time.time() + WRITER_LEASE)).rowcount
+        # Only after the lease ran out unrenewed (an event loop stalled for minutes): take a new slot
+        if not renewed and not self._claim_slot():
+            logger.error("All %d chat writer slots are leased by other workers, keeping slot %d",
+                         WRITER_SLOTS, self.slot)
+
+    def _next_id(self) -> int:
+        tick = max(int(time.time() * 1000) - ID_EPOCH_MS, self._tick)
+        if tick == self._tick:
+            self._sequence += 1
+            if self._sequence >> SEQUENCE_BITS:
+                # More messages in this millisecond than the sequence holds: borrow the next one
+                tick += 1
+                self._sequence = 0
+        else:
+            self._sequence = 0
+        self._tick = tick
+        return (tick << (SLOT_BITS + SEQUENCE_BITS)) | (self.slot << SEQUENCE_BITS) | self._sequence
+
+    def append(self, room_id: str, user_id: str, username: str, message: str, timestamp: str,
+               type: str = "chat") -> dict:
+        if self.read_only:
+            raise RuntimeError("This chat log is read-only")
+        self.last_id = self._next_id()
+        entry = {"id": self.last_id, "room_id": room_id, "user_id": user_id, "username": username,
+                 "message": message, "timestamp": timestamp, "type": type}
+        buffer = self.buffers.get(room_id)
+        if buffer is None:
+            buffer = self.buffers[room_id] = deque(maxlen=self.buffer_size)
+        buffer.append(entry)
+        if self.engine is not None:
+            self.pending.append(entry)
+            if len(self.pending) >= self.batch_size:
+                self._start_flush()
+            elif self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(self.flush_interval, self._start_flush)
+        return entry
+
+    def _start_flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._flushing is None and self.pending:
+            self._flushing = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Write everything pending; waits for a flush already running"""
+        if self._flushing is not None and self._flushing is not asyncio.current_task():
+            await asyncio.shield(self._flushing)
+        loop = asyncio.get_running_loop()
+        try:
+            while self.pending:
+                batch, self.pending = self.pending, []
+                try:
+                    dropped = await loop.run_in_executor(self.executor, self._write, batch)
+                except Exception:
+                    logger.exception("Writing %d chat messages failed, will retry", len(batch))
+                    self.pending[:0] = batch
+                    if self._flush_handle is None:
+                        self._flush_handle = loop.call_later(self.flush_interval * 10, self._start_flush)
+                    return
+                self.written += len(batch) - dropped
+                self.dropped += dropped
+        finally:
+            if self._flushing is asyncio.current_task():
+                self._flushing = None
+
+    def _write(self, batch: List[dict]) -> int:
+        """Insert a batch in one transaction; returns how many messages had to be dropped"""
+        try:
+            self._insert(batch)
+            return 0
+        except IntegrityError:
+            pass
+        # A row the database rejects would fail the batch on every retry: write the others one
+        # by one and drop the rejected ones
+        dropped = 0
+        for entry in batch:
+            try:
+                self._insert([entry])
+            except IntegrityError as error:
+                logger.error("Dropping chat message %d of room %s: %s", entry["id"], entry["room_id"], error.orig)
+                dropped += 1
+        return dropped
+
+    def _insert(self, batch: List[dict]):
+        with self.engine.begin() as connection:
+            connection.execute(messages_table.insert(), batch)
+            if self.full_text:
+                connection.execute(sqlalchemy.text(FTS_INSERT), [
+                    {"id": entry["id"], "message": entry["message"], "room": search_key("r", entry["room_id"]),
+                     "user": search_key("u", entry["user_id"])} for entry in batch])
+
+    def _query(self, room_id: str, before: Optional[int], after: Optional[int], limit: int) -> List[dict]:
+        table = messages_table
+        query = sqlalchemy.select(*[table.c[name] for name in MESSAGE_FIELDS]).where(table.c.room_id == room_id)
+        if after is not None:
+            query = query.where(table.c.id > after).order_by(table.c.id).limit(limit)
+        else:
+            if before is not None:
+                query = query.where(table.c.id < before)
+            query = query.order_by(table.c.id.desc()).limit(limit)
+        with self.engine.connect() as connection:
+            rows = [dict(row._mapping) for row in connection.execute(query)]
+        return rows if after is not None else rows[::-1]
+
+    async def _read(self, room_id, before, after, limit) -> List[dict]:
+        await self.flush()
+        if self.shared:
+            # Another worker may still hold a message sent just before this read, with an id below
+            # ones it already wrote; wait until its write-behind batch is in
+            newest = id_time(before) if before is not None else time.time()
+            delay = newest + SETTLE_INTERVALS * self.flush_interval - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._query, room_id, before, after, limit)
+
+    async def page(self, room_id: str, before: Optional[int] = None, limit: int = 50) -> Tuple[List[dict], Optional[int]]:
+        """Up to `limit` messages older than `before` (the newest ones without it), oldest first,
+        and the cursor for the page before them (None at the start of the history)"""
+        buffer = list(self.buffers.get(room_id, ()))
+        end = len(buffer) if before is None else bisect.bisect_left([entry["id"] for entry in buffer], before)
+        if (end >= limit and not self.shared) or self.engine is None:
+            messages = buffer[max(0, end - limit):end]
+            more = end > limit or self.engine is not None  # older messages may be in the database
+        else:
+            messages = await self._read(room_id, before, None, limit + 1)
+            more = len(messages) > limit
+            messages = messages[-limit:]
+        return messages, (messages[0]["id"] if more and messages else None)
+
+    async def since(self, room_id: str, after: int, limit: int = 50) -> Tuple[List[dict], bool]:
+        """Up to `limit` messages newer than `after`, oldest first, and whether more follow"""
+        buffer = list(self.buffers.get(room_id, ()))
+        # The buffer holds everything newer than `after` if it still reaches back to it
+        if (buffer and buffer[0]["id"] <= after and not self.shared) or self.engine is None:
+            newer = buffer[bisect.bisect_right([entry["id"] for entry in buffer], after):]
+            return newer[:limit], len(newer) > limit
+        messages = await self._read(room_id, None, after, limit + 1)
+        return messages[:limit], len(messages) > limit
+
+    async def search(self, text: str, room_id: Optional[str] = None, user_id: Optional[str] = None,
+                     since: Optional[str] = None, until: Optional[str] = None, before: Optional[int] = None,
+                     limit: int = 20) -> Tuple[List[dict], Optional[int]]:
+        """Messages containing every word of `text` (`word*` matches a prefix), newest first, and
+        the cursor for the next page. since/until are ISO timestamps."""
+        terms = parse_query(text)
+        if not terms:
+            return [], None
+        if self.engine is None:
+            messages = self._search_buffers(terms, room_id, user_id, since, until, before, limit + 1)
+        else:
+            await self.flush()
+            messages = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self._search, terms, room_id, user_id, since, until, before, limit + 1)
+        more = len(messages) > limit
+        messages = messages[:limit]
+        return messages, (messages[-1]["id"] if more else None)
+
+    def _search(self, terms, room_id, user_id, since, until, before, limit) -> List[dict]:
+        table = messages_table
+        with self.engine.connect() as connection:
+            # A reader looks for what the main server creates until it finds the full-text index
+            if self.read_only and not self._full_text_index:
+                if not sqlalchemy.inspect(connection).has_table(table.name):
+                    return []
+                self._full_text_index = self._has_full_text_index(connection)
+            # No upper bound from last_id: a reader in another process (the admin server) does not see it grow
+            low, high = 0, before if before is not None else 2 ** 63 - 1
+            # Messages are appended in time order, so a time range is an id range
+            if since:
+                first = connection.execute(sqlalchemy.select(table.c.id).where(table.c.timestamp >= since)
+                                           .order_by(table.c.timestamp).limit(1)).scalar()
+                low = first if first is not None else high
+            if until:
+                last = connection.execute(sqlalchemy.select(table.c.id).where(table.c.timestamp <= until)
+                                          .order_by(table.c.timestamp.desc()).limit(1)).scalar()
+                high = min(high, last + 1) if last is not None else low
+            if low >= high:
+                return []
+            if self.full_text:
+                rows = connection.execute(sqlalchemy.text(FTS_SEARCH), {
+                    "match": fts_match(terms, room_id, user_id), "low": low, "high": high, "limit": limit})
+            else:
+                # Other databases: a scan with LIKE, bounded by the same filters
+                query = sqlalchemy.select(*[table.c[name] for name in MESSAGE_FIELDS]).where(
+                    table.c.id >= low, table.c.id < high,
+                    *[table.c.message.ilike(f"%{word}%") for word, _ in terms])
+                if room_id is not None:
+                    query = query.where(table.c.room_id == room_id)
+                if user_id is not None:
+                    query = query.where(table.c.user_id == user_id)
+                rows = connection.execute(query.order_by(table.c.id.desc()).limit(limit))
+            return [dict(row._mapping) for row in rows]
+
+    def _search_buffers(self, terms, room_id, user_id, since, until, before, limit) -> List[dict]:
+        buffers = [self.buffers.get(room_id, ())] if room_id is not None else list(self.buffers.values())
+        candidates = sorted((entry for buffer in buffers for entry in buffer), key=lambda entry: -entry["id"])
+        result = []
+        for entry in candidates:
+            if (before is not None and entry["id"] >= before) or (user_id is not None and entry["user_id"] != user_id) \
+                    or (since and entry["timestamp"] < since) or (until and entry["timestamp"] > until):
+                continue
+            words = WORD.findall(fold(entry["message"]))
+            if all(any(word.startswith(term) if prefix else word == term for word in words) for term, prefix in terms):
+                result.append(entry)
+                if len(result) == limit:
+                    break
+        return result
+
+    def drop_room(self, room_id: str):
+        """Forget a room's buffer; its persisted history stays"""
+        self.buffers.pop(room_id, None)
+
+    async def close(self):
+        if self._lease_task is not None:
+            self._lease_task.cancel()
+            self._lease_task = None
+        if self.engine is not None:
+            if not self.read_only:
+                await self.flush()
+                with self.engine.begin() as connection:
+                    connection.execute(writers_table.update().where(
+                        writers_table.c.slot == self.slot, writers_table.c.owner == self.owner).values(expires=0))
+            self.engine.dispose()
+            self.executor.shutdown()
+
+    def snapshot(self) -> dict:
+        return {
+            "rooms": len(self.buffers),
+            "buffered": sum(len(buffer) for buffer in self.buffers.values()),
+            "pending": len(self.pending),
+            "written": self.written,
+            "dropped": self.dropped,
+            "persistent": self.persistent,
+        }
+
+
+def _sqlite_pragmas(connection, record):
+    # WAL lets readers run while the writer thread commits; NORMAL syncs once per checkpoint
+    connection.create_function("search_key", 2, search_key, deterministic=True)
+    cursor = connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
@@ -0,0 +1,144 @@
+"""
+Compact binary signaling (MessagePack) negotiated per client
+A client opts in by connecting with ?codec=msgpack-v1 and a matching Socket.IO parser
+(static/js/compact-parser.js). Its packets travel as MessagePack with every key found in
+KEYS replaced by its index, so repeated names such as from_user, room_id and candidate
+cost one byte. Clients that do not ask for it keep the default JSON text protocol.
+
+Requires the optional msgpack package; without it the codec is not advertised.
+"""
+
+from typing import Set
+from urllib.parse import parse_qs
+
+import socketio
+from socketio import packet
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+CODEC = "msgpack-v1"
+
+# Dictionary for key compaction. Append only: an index must keep its meaning for the lifetime
+# of CODEC, since clients may hold an older copy of the table. Integer map keys are reserved.
+KEYS = (
+    # Socket.IO packet
+    "type", "data", "nsp", "id",
+    # WebRTC signaling
+    "room_id", "from_user", "to_user", "offer", "answer", "sdp",
+    "candidate", "candidates", "sdpMid", "sdpMLineIndex", "usernameFragment",
+    # Participants and presence
+    "user_id", "username", "participants", "joined_at", "is_video_enabled", "is_audio_enabled",
+    "is_enabled", "capabilities", "timestamp", "message", "status", "sid",
+)
+KEY_INDEX = {key: index for index, key in enumerate(KEYS)}
+KEY_NAMES = dict(enumerate(KEYS))
+_CONTAINERS = (dict, list, tuple)
+
+
+def available() -> bool:
+    return msgpack is not None
+
+
+def client_config() -> dict:
+    """Template context that lets room pages opt into the codec"""
+    return {"signaling_codec": CODEC if available() else None, "signaling_keys": list(KEYS)}
+
+
+def compact(obj):
+    """Replace dictionary keys found in KEYS with their index, recursively"""
+    if type(obj) is dict:
+        return {KEY_INDEX.get(key, key): compact(value) if type(value) in _CONTAINERS else value
+                for key, value in obj.items()}
+    return [compact(value) if type(value) in _CONTAINERS else value for value in obj]
+
+
+def _expand_pairs(pairs):
+    # object_pairs_hook: msgpack calls this for every map, so decoding needs no second pass
+    return {KEY_NAMES.get(key, key): value for key, value in pairs}
+
+
+class CompactPacket(packet.Packet):
+    """Socket.IO packet encoded as one key-compacted MessagePack message"""
+
+    uses_binary_events = False
+
+    def encode(self):
+        return msgpack.packb(compact(self._to_dict()), use_bin_type=True)
+
+    def decode(self, encoded_packet):
+        decoded = msgpack.unpackb(encoded_packet, raw=False, strict_map_key=False,
+                                  object_pairs_hook=_expand_pairs)
+        self.packet_type = decoded['type']
+        self.data = decoded.get('data')
+        self.id = decoded.get('id')
+        self.namespace = decoded.get('nsp') or '/'
+
+    @classmethod
+    def convert(cls, pkt: packet.Packet) -> "CompactPacket":
+        packet_type = {packet.BINARY_EVENT: packet.EVENT, packet.BINARY_ACK: packet.ACK}.get(
+            pkt.packet_type, pkt.packet_type)
+        return cls(packet_type, data=pkt.data, namespace=pkt.namespace, id=pkt.id)
+
+
+class CompactSignalingServer(socketio.AsyncServer):
+    """AsyncServer that speaks CompactPacket to the clients that negotiated CODEC and the
+    default JSON packets to everyone else"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.compact_sids: Set[str] = set()  # engine.io sids using CODEC
+        # Socket.IO traffic of this server; text frames are counted in characters
+        self.messages_in = 0
+        self.bytes_in = 0
+        self.messages_out = 0
+        self.bytes_out = 0
+
+    def packet_class_for(self, eio_sid: str):
+        return CompactPacket if eio_sid in self.compact_sids else self.packet_class
+
+    async def _handle_eio_connect(self, eio_sid, environ):
+        await super()._handle_eio_connect(eio_sid, environ)
+        query = parse_qs(environ.get('QUERY_STRING', ''))
+        if available() and query.get('codec', [None])[0] == CODEC:
+            self.compact_sids.add(eio_sid)
+
+    async def _handle_eio_disconnect(self, eio_sid):
+        await super()._handle_eio_disconnect(eio_sid)
+        self.compact_sids.discard(eio_sid)
+
+    async def _handle_eio_message(self, eio_sid, data):
+        self.messages_in += 1
+        self.bytes_in += len(data)
+        if eio_sid not in self.compact_sids or not isinstance(data, bytes):
+            return await super()._handle_eio_message(eio_sid, data)
+        pkt = CompactPacket(encoded_packet=data)
+        if pkt.packet_type == packet.CONNECT:
+            await self._handle_connect(eio_sid, pkt.namespace, pkt.data)
+        elif pkt.packet_type == packet.DISCONNECT:
+            await self._handle_disconnect(eio_sid, pkt.namespace)
+        elif pkt.packet_type == packet.EVENT:
+            await self._handle_event(eio_sid, pkt.namespace, pkt.id, pkt.data)
+        elif pkt.packet_type == packet.ACK:
+            await self._handle_ack(eio_sid, pkt.namespace, pkt.id, pkt.data)
+        else:
+            raise ValueError('Unexpected packet type for ' + CODEC)
+
+    async def _send_packet(self, eio_sid, pkt):
+        if eio_sid in self.compact_sids:
+            pkt = CompactPacket.convert(pkt)
+        encoded_packet = pkt.encode()
+        for part in encoded_packet if isinstance(encoded_packet, list) else [encoded_packet]:
+            self.messages_out += 1
+            self.bytes_out += len(part)
+            await self.eio.send(eio_sid, part)
+
+    async def _send_eio_packet(self, eio_sid, eio_pkt):
+        # Room emits arrive here as frames encoded once for all recipients (see fanout.py)
+        self.messages_out += 1
+        if isinstance(eio_pkt.data, (str, bytes)):
+            self.bytes_out += len(eio_pkt.data)
+        await super()._send_eio_packet(eio_sid, eio_pkt)
+
@@ -0,0 +1,117 @@
+"""
+Serialize-once fan-out for room broadcasts
+Every outbound event is encoded a single time into a shared Engine.IO frame and that frame
+is handed to each recipient. JSON goes through orjson when it is installed and through the
+standard library otherwise; both the Socket.IO server and the raw WebSocket path use it.
+"""
+
+import json
+import logging
+from typing import Callable, Optional
+
+import socketio
+from engineio import packet as eio_packet
+from socketio import packet
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+
+class FastJSON:
+    """json-module compatible shim, accepted by socketio.AsyncServer(json=...)"""
+
+    @staticmethod
+    def dumps(obj, **kwargs) -> str:
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+            except TypeError:
+                pass  # types orjson does not handle (e.g. ints over 64 bits) take the slow path
+        kwargs.setdefault("separators", (",", ":"))
+        return json.dumps(obj, **kwargs)
+
+    @staticmethod
+    def loads(data, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(data)
+        return json.loads(data, **kwargs)
+
+
+fast_json = FastJSON()
+
+
+class SharedFrameManager(socketio.AsyncManager):
+    """Client manager that encodes each room emit once and writes the same frame to every
+    recipient in one pass, instead of scheduling a task per recipient.
+
+    Servers that speak more than one wire format per client expose packet_class_for(eio_sid);
+    the frame is then encoded once per format in use.
+    """
+
+    # Optional callable(event, recipients) told the size of every room emit
+    on_fanout: Optional[Callable[[str, int], None]] = None
+
+    def encode_frame(self, packet_class, event, data, namespace):
+        """Encoded parts of an event: text parts as shared, pre-encoded Engine.IO packets,
+        binary parts as bytes. Engine.IO caches a single encoding per packet while polling
+        clients need binary as base64, so binary parts are wrapped per recipient."""
+        try:
+            # Skip python-socketio's recursive scan for bytes (O(payload) in Python): JSON cannot
+            # encode bytes, so a binary payload fails here and is re-encoded with the scan
+            encoded_packet = packet_class(packet.EVENT, namespace=namespace, data=[event] + data,
+                                          binary=False).encode()
+        except TypeError:
+            encoded_packet = packet_class(packet.EVENT, namespace=namespace, data=[event] + data).encode()
+        if not isinstance(encoded_packet, list):
+            encoded_packet = [encoded_packet]
+        frame = []
+        for p in encoded_packet:
+            if isinstance(p, str):
+                p = eio_packet.Packet(eio_packet.MESSAGE, p)
+                p.encode()
+            frame.append(p)
+        return frame
+
+    async def emit(self, event, data, namespace, room=None, skip_sid=None, callback=None, **kwargs):
+        if callback or namespace not in self.rooms:
+            # acks need a unique id per recipient, so they cannot share a frame
+            return await super().emit(event, data, namespace, room=room, skip_sid=skip_sid,
+                                      callback=callback, **kwargs)
+        if isinstance(data, tuple):
+            data = list(data)
+        elif data is not None:
+            data = [data]
+        else:
+            data = []
+        if not isinstance(skip_sid, list):
+            skip_sid = [skip_sid]
+
+        # Snapshot the recipients first so a join or leave during the sends cannot change the room
+        recipients = [eio_sid for sid, eio_sid in self.get_participants(namespace, room)
+                      if sid not in skip_sid]
+        if not recipients:
+            return
+        if self.on_fanout is not None:
+            self.on_fanout(event, len(recipients))
+        packet_class_for = getattr(self.server, 'packet_class_for', None)
+        default_class = self.server.packet_class
+        frames = {}
+        send = self.server._send_eio_packet
+        for eio_sid in recipients:
+            packet_class = packet_class_for(eio_sid) if packet_class_for else default_class
+            frame = frames.get(packet_class)
+            if frame is None:
+                frame = frames[packet_class] = self.encode_frame(packet_class, event, data, namespace)
+            for p in frame:
+                if not isinstance(p, eio_packet.Packet):
+                    p = eio_packet.Packet(eio_packet.MESSAGE, p)
+                try:
+                    await send(eio_sid, p)
+                except Exception:
+                    logger.exception("Failed to send %s to %s", event, eio_sid)
@@ -0,0 +1,280 @@
+"""
+Chunked, resumable file relay
+A shared file is uploaded once, in order, as raw binary chunks of at most CHUNK_SIZE bytes.
+Each chunk is streamed from the request body to disk while its SHA-256 is computed, so an
+upload holds one write buffer in memory whatever the file size. Progress is kept next to the
+data, and an interrupted upload (even across a restart) resumes at the first chunk the server
+has not acknowledged. Completed files are served from disk: through nginx X-Accel-Redirect
+when configured, with the ASGI zero-copy send extension when the server offers it, and
+otherwise streamed in blocks.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+from starlette.responses import FileResponse, Response
+
+# Bytes per chunk; every chunk but the last must be exactly this long
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# Data received for a chunk is written (and hashed, off the event loop) in blocks of this size
+WRITE_BLOCK_SIZE = 1024 * 1024
+
+META_SUFFIX = ".json"
+PART_SUFFIX = ".part"
+
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+class ChunkOutOfOrder(Exception):
+    """The chunk does not start where the upload stands; the client resumes from `next_chunk`
+    (`upload` is anything with next_chunk and status())"""
+
+    def __init__(self, upload):
+        super().__init__(f"expected chunk {upload.next_chunk}")
+        self.upload = upload
+
+
+class ChunkSizeError(Exception):
+    """The chunk body is longer or shorter than its position in the file allows"""
+
+
+class SharedFile:
+    """One upload: its metadata, how many bytes are on disk and the running hash of them"""
+
+    def __init__(self, file_id: str, room_id: str, user_id: str, name: str, size: int,
+                 content_type: str, chunk_size: int = CHUNK_SIZE, created_at: Optional[str] = None,
+                 received: int = 0, sha256: Optional[str] = None):
+        self.id = file_id
+        self.room_id = room_id
+        self.user_id = user_id
+        self.name = name
+        self.size = size
+        self.content_type = content_type
+        self.chunk_size = chunk_size
+        self.created_at = created_at or datetime.now().isoformat()
+        self.received = received
+        self.sha256 = sha256  # set once the last chunk is in
+        # Hash of the first `received` bytes; None after a restart until the part file is rehashed
+        self.digest = hashlib.sha256() if received == 0 else None
+        self.lock = asyncio.Lock()
+
+    @property
+    def complete(self) -> bool:
+        return self.sha256 is not None
+
+    @property
+    def next_chunk(self) -> int:
+        return self.received // self.chunk_size
+
+    @property
+    def chunk_count(self) -> int:
+        return max(1, -(-self.size // self.chunk_size))
+
+    def status(self) -> dict:
+        return {
+            "file_id": self.id,
+            "chunk_size": self.chunk_size,
+            "chunk_count": self.chunk_count,
+            "received": self.received,
+            "next_chunk": self.next_chunk,
+            "complete": self.complete,
+            "sha256": self.sha256,
+        }
+
+    def info(self) -> dict:
+        """Metadata broadcast with file_shared once the upload is complete"""
+        return {
+            "file_id": self.id,
+            "name": self.name,
+            "size": self.size,
+            "type": self.content_type,
+            "sha256": self.sha256,
+            "url": f"/api/rooms/{self.room_id}/files/{self.id}",
+        }
+
+    def to_meta(self) -> dict:
+        return {
+            "file_id": self.id, "room_id": self.room_id, "user_id": self.user_id, "name": self.name,
+            "size": self.size, "content_type": self.content_type, "chunk_size": self.chunk_size,
+            "created_at": self.created_at, "received": self.received, "sha256": self.sha256,
+        }
+
+
+def _write_block(file, digest, block: bytes):
+    # Runs in the default executor; hashlib releases the GIL for large buffers
+    file.write(block)
+    digest.update(block)
+
+
+def _hash_prefix(path: str, length: int):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while length > 0:
+            block = file.read(min(WRITE_BLOCK_SIZE, length))
+            if not block:
+                break
+            digest.update(block)
+            length -= len(block)
+    return digest
+
+
+class FileRelay:
+    """Uploads and completed files of every room, stored under `directory` by file id"""
+
+    def __init__(self, directory: str, max_size: int, chunk_size: int = CHUNK_SIZE,
+                 accel_redirect: Optional[str] = None):
+        self.directory = directory
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.accel_redirect = accel_redirect  # nginx internal location serving `directory`
+        self.files: Dict[str, SharedFile] = {}
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, file_id: str, suffix: str = "") -> str:
+        return os.path.join(self.directory, file_id + suffix)
+
+    def _load(self):
+        """Pick up the uploads of a previous run; partial data beyond the last saved chunk is dropped"""
+        for entry in os.listdir(self.directory):
+            if not entry.endswith(META_SUFFIX):
+                continue
+            try:
+                with open(os.path.join(self.directory, entry)) as meta_file:
+                    meta = json.load(meta_file)
+                shared = SharedFile(meta["file_id"], meta["room_id"], meta["user_id"], meta["name"],
+                                    meta["size"], meta["content_type"], meta["chunk_size"],
+                                    meta["created_at"], meta["received"], meta["sha256"])
+                data_path = self._data_path(shared)
+                shared.received = min(shared.received, os.path.getsize(data_path))
+            except (OSError, ValueError, KeyError):
+                continue
+            self.files[shared.id] = shared
+
+    def _data_path(self, shared: SharedFile) -> str:
+        return self._path(shared.id, "" if shared.complete else PART_SUFFIX)
+
+    def _save(self, shared: SharedFile):
+        path = self._path(shared.id, META_SUFFIX)
+        with open(path + ".tmp", "w") as meta_file:
+            json.dump(shared.to_meta(), meta_file)
+        os.replace(path + ".tmp", path)
+
+    def create(self, room_id: str, user_id: str, name: str, size: int, content_type: str) -> SharedFile:
+        if size < 0 or size > self.max_size:
+            raise ValueError(f"File size must be between 0 and {self.max_size} bytes")
+        shared = SharedFile(str(uuid.uuid4()), room_id, user_id, name, size, content_type, self.chunk_size)
+        open(self._path(shared.id, PART_SUFFIX), "wb").close()
+        self._save(shared)
+        self.files[shared.id] = shared
+        if size == 0:
+            self._finish(shared)
+        return shared
+
+    def get(self, room_id: str, file_id: str) -> Optional[SharedFile]:
+        shared = self.files.get(file_id)
+        return shared if shared is not None and shared.room_id == room_id else None
+
+    def room_files(self, room_id: str) -> List[SharedFile]:
+        return [shared for shared in self.files.values() if shared.room_id == room_id and shared.complete]
+
+    async def write_chunk(self, shared: SharedFile, index: int, body: AsyncIterator[bytes]) -> bool:
+        """Stream chunk `index` from `body` to disk. Returns True if it completed the file; a chunk
+        that is already stored is acknowledged again without being read."""
+        async with shared.lock:
+            offset = index * shared.chunk_size
+            if shared.complete or offset < shared.received:
+                return False
+            if offset > shared.received or offset >= shared.size:
+                raise ChunkOutOfOrder(shared)
+            expected = min(shared.chunk_size, shared.size - offset)
+            loop = asyncio.get_running_loop()
+            path = self._path(shared.id, PART_SUFFIX)
+            if shared.digest is None:
+                shared.digest = await loop.run_in_executor(None, _hash_prefix, path, shared.received)
+            # The chunk only counts once it is complete, so hash a copy and drop it on failure
+            digest = shared.digest.copy()
+            written = 0
+            with open(path, "r+b") as file:
+                file.truncate(offset)  # leftovers of an interrupted attempt
+                file.seek(offset)
+                block: List[bytes] = []
+                buffered = 0
+                async for data in body:
+                    written += len(data)
+                    if written > expected:
+                        raise ChunkSizeError(f"chunk {index} must be {expected} bytes")
+                    block.append(data)
+                    buffered += len(data)
+                    if buffered >= WRITE_BLOCK_SIZE:
+                        await loop.run_in_executor(None, _write_block, file, digest, b"".join(block))
+                        block, buffered = [], 0
+                if written != expected:
+                    raise ChunkSizeError(f"chunk {index} must be {expected} bytes, got {written}")
+                if block:
+                    await loop.run_in_executor(None, _write_block, file, digest, b"".join(block))
+            shared.digest = digest
+            shared.received += written
+            if shared.received == shared.size:
+                self._finish(shared)
+                return True
+            self._save(shared)
+            return False
+
+    def _finish(self, shared: SharedFile):
+        shared.sha256 = shared.digest.hexdigest()
+        shared.digest = None
+        os.replace(self._path(shared.id, PART_SUFFIX), self._path(shared.id))
+        self._save(shared)
+
+    def response(self, shared: SharedFile) -> Response:
+        path = self._path(shared.id)
+        headers = {"ETag": f'"{shared.sha256}"', "X-Content-SHA256": shared.sha256}
+        response = ZeroCopyFileResponse(path, media_type=shared.content_type or "application/octet-stream",
+                                        filename=shared.name, headers=headers)
+        if self.accel_redirect:
+            # nginx sends the file itself (sendfile) from its internal location; only headers go out here
+            headers["X-Accel-Redirect"] = self.accel_redirect.rstrip("/") + "/" + shared.id
+            headers["Content-Disposition"] = response.headers["content-disposition"]
+            return Response(headers=headers, media_type=response.media_type)
+        return response
+
+    def remove_room(self, room_id: str):
+        for shared in [shared for shared in self.files.values() if shared.room_id == room_id]:
+            del self.files[shared.id]
+            for suffix in ("", PART_SUFFIX, META_SUFFIX):
+                try:
+                    os.remove(self._path(shared.id, suffix))
+                except FileNotFoundError:
+                    pass
+
+    def snapshot(self) -> dict:
+        complete = [shared for shared in self.files.values() if shared.complete]
+        return {
+            "files": len(complete),
+            "bytes": sum(shared.size for shared in complete),
+            "uploads_in_progress": len(self.files) - len(complete),
+        }
+
+
+class ZeroCopyFileResponse(FileResponse):
+    """Hands the open file to the server when it supports the ASGI zero-copy send extension, so
+    the kernel copies it to the socket (sendfile); otherwise streams it like FileResponse"""
+
+    async def __call__(self, scope, receive, send):
+        if ZEROCOPY_EXTENSION not in scope.get("extensions", {}):
+            return await super().__call__(scope, receive, send)
+        with open(self.path, "rb") as file:
+            stat_result = os.fstat(file.fileno())
+            self.set_stat_headers(stat_result)
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            await send({"type": ZEROCOPY_EXTENSION, "file": file.fileno(), "offset": 0,
+                        "count": stat_result.st_size, "more_body": False})
+        if self.background is not None:
+            await self.background()
@@ -5,18 +5,41 @@ A real-time communication platform with WebSocket support and full WebRTC functi
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
+from starlette.requests import ClientDisconnect
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 import socketio
-import json
 import uuid
-from typing import Dict, List, Optional
+import secrets
+import time
+from typing import Deque, Dict, List, Optional, Set, Tuple
+from collections import deque
 from datetime import datetime, timedelta
 import asyncio
 import logging
+import os
+import sys
 from pydantic import BaseModel
 
+from admin_feed import FeedPublisher
+from backplane import create_client_manager
+from chat_log import ChatLog
+from compact_codec import CompactSignalingServer, client_config as signaling_config
+from fanout import SharedFrameManager, fast_json
+from file_relay import ChunkOutOfOrder, ChunkSizeError, FileRelay, SharedFile
+from metrics import FANOUT_BUCKETS, HTTPMetrics, Histogram, Registry
+from rate_limit import UNLIMITED_EVENTS, AdmissionController, LoopLagMonitor, RateLimiter, parse_limits
+from reaper import Reaper
+from recordings import Recording, RecordingStore
+from scheduler import END, PREWARM, REMIND, START, Scheduler, parse_meeting
+from sfu import SFU_PEER, SelectiveForwardingUnit, available as sfu_available
+from state_persistence import StatePersistence
+from state_store import StateStore
+from structured_logging import QueueLogging
+
+logger = logging.getLogger(__name__)
+
 # Create FastAPI app
 app = FastAPI(title="Teams Clone", description="A Microsoft Teams-like application with full WebRTC support")
 
@@ -29,12 +52,132 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Socket.IO server with CORS
-sio = socketio.AsyncServer(
+# Optional pub/sub backplane so several workers can serve the same rooms (see backplane.py)
+BACKPLANE_URL = os.environ.get("MYCONFAPP_BACKPLANE")
+client_manager = create_client_manager(BACKPLANE_URL)
+
+# ICE candidates for the same peer pair arriving within this window go out as one packet (0 disables)
+ICE_BATCH_WINDOW_MS = float(os.environ.get("MYCONFAPP_ICE_BATCH_MS", "25"))
+
+# Maximum messages waiting to be written to one raw WebSocket connection
+WS_QUEUE_SIZE = int(os.environ.get("MYCONFAPP_WS_QUEUE_SIZE", "256"))
+
+# Webinar rooms send head counts at most this often instead of one user_joined per attendee
+WEBINAR_COUNT_INTERVAL_MS = float(os.environ.get("MYCONFAPP_WEBINAR_COUNT_MS", "1000"))
+
+# Media topology: "mesh" (browsers connect to each other) or "sfu" (one connection per browser to
+# this server, which forwards the media; needs aiortc, see sfu.py)
+MESH = "mesh"
+SFU = "sfu"
+MEDIA_MODE = os.environ.get("MYCONFAPP_MEDIA", MESH)
+SFU_ICE_SERVERS = [url for url in os.environ.get("MYCONFAPP_SFU_ICE_SERVERS", "").split(",") if url]
+if MEDIA_MODE == SFU and not sfu_available():
+    logger.warning("MYCONFAPP_MEDIA=sfu needs aiortc (pip install aiortc), using mesh media")
+    MEDIA_MODE = MESH
+
+# Shared files are uploaded in chunks to this directory and downloaded from it (see file_relay.py)
+FILE_DIR = os.environ.get("MYCONFAPP_FILE_DIR", "uploads")
+FILE_MAX_BYTES = int(os.environ.get("MYCONFAPP_FILE_MAX_BYTES", str(16 * 1024 ** 3)))
+# nginx internal location serving FILE_DIR; when set, downloads are handed to nginx (X-Accel-Redirect)
+FILE_ACCEL_REDIRECT = os.environ.get("MYCONFAPP_FILE_ACCEL_REDIRECT")
+
+# Recordings are streamed here chunk by chunk as the browser records them (see recordings.py)
+RECORDINGS_DIR = os.environ.get("MYCONFAPP_RECORDINGS_DIR", "recordings")
+
+# Chat history: the newest messages of each room stay in memory and all of them are written behind
+# to this database (SQLAlchemy URL, empty for memory only; see chat_log.py)
+CHAT_DB_URL = os.environ.get("MYCONFAPP_CHAT_DB", "sqlite:///chat.db")
+# Most messages replayed on join_room with replay_since; more are read from /messages
+CHAT_REPLAY_LIMIT = 100
+MESSAGES_PAGE_SIZE = 50
+MESSAGES_PAGE_MAX = 200
+# Chat search results per page (/messages/search)
+SEARCH_PAGE_SIZE = 20
+SEARCH_PAGE_MAX = 100
+
+# Rooms and users are written behind to this database and restored at startup (SQLAlchemy URL,
+# empty for memory only; see state_persistence.py)
+STATE_DB_URL = os.environ.get("MYCONFAPP_STATE_DB", "sqlite:///state.db")
+# Restored users that have not reconnected after this many seconds are removed from their rooms
+RESTORE_GRACE = float(os.environ.get("MYCONFAPP_RESTORE_GRACE", "60"))
+
+# A dropped connection keeps the user's place for this many seconds; a reconnect presenting the
+# resume_token from room_joined takes it back without user_left/user_joined (0 disables)
+RESUME_GRACE = float(os.environ.get("MYCONFAPP_RESUME_GRACE", "30"))
+
+# Rooms left empty (or created and never joined) are closed after this many seconds (0 keeps them)
+ROOM_TTL = float(os.environ.get("MYCONFAPP_ROOM_TTL", "600"))
+# Every bound session is checked this often; one whose socket is gone without a disconnect event
+# releases its user as a disconnect would (0 disables the check)
+SESSION_CHECK_INTERVAL = float(os.environ.get("MYCONFAPP_SESSION_CHECK", "300"))
+
+# Meetings booked with schedule_meeting are stored in this database, shared with the admin server
+# (SQLAlchemy URL, empty for memory only; see scheduler.py)
+MEETINGS_DB_URL = os.environ.get("MYCONFAPP_MEETINGS_DB", "sqlite:///meetings.db")
+# A scheduled meeting's room is opened this many seconds before it starts
+MEETING_PREWARM = float(os.environ.get("MYCONFAPP_MEETING_PREWARM", "300"))
+# Its organizer, when connected, is reminded this many seconds before it starts
+MEETING_REMINDER = float(os.environ.get("MYCONFAPP_MEETING_REMINDER", "600"))
+
+# Per-client limits on Socket.IO events as (tokens per second, burst); "*" covers every other event.
+# MYCONFAPP_RATE_LIMITS="event=rate/burst,..." overrides entries, a rate of 0 lifts one limit and
+# "off" lifts all of them (see rate_limit.py)
+DEFAULT_RATE_LIMITS = {
+    "*": (20, 50),
+    "join_room": (2, 5),
+    "send_message": (5, 20),
+    "schedule_meeting": (0.2, 5),
+    "request_participants_list": (2, 10),
+    "toggle_video": (5, 10),
+    "toggle_audio": (5, 10),
+    "webrtc_offer": (50, 200),
+    "webrtc_answer": (50, 200),
+    "webrtc_ice_candidate": (300, 1500),
+}
+RATE_LIMITS = parse_limits(os.environ.get("MYCONFAPP_RATE_LIMITS", ""), DEFAULT_RATE_LIMITS)
+# Webinar presenters signal with every attendee, so signaling from them is not limited
+PRESENTER_EVENTS = frozenset({"webrtc_offer", "webrtc_answer", "webrtc_ice_candidate"})
+
+# New joins are turned away with join_rejected while the event loop lags more than this many ms
+# on average or the node has more than MAX_CONNECTIONS Socket.IO connections (0 disables a check)
+MAX_LOOP_LAG_MS = float(os.environ.get("MYCONFAPP_MAX_LOOP_LAG_MS", "250"))
+MAX_CONNECTIONS = int(os.environ.get("MYCONFAPP_MAX_CONNECTIONS", "0"))
+# Seconds a turned-away client is asked to wait before joining again
+ADMISSION_RETRY_AFTER = 5.0
+
+# Log records go through a queue to a writer thread (see structured_logging.py): level and
+# format, "text" or "json" (one object per line with the structured fields)
+LOG_LEVEL = os.environ.get("MYCONFAPP_LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("MYCONFAPP_LOG_FORMAT", "text")
+
+# Room changes and counters are streamed to the admin server over this Unix socket, batched per
+# interval (see admin_feed.py); empty disables the feed
+ADMIN_FEED_PATH = os.environ.get("MYCONFAPP_ADMIN_FEED", "admin_feed.sock")
+ADMIN_FEED_INTERVAL_MS = float(os.environ.get("MYCONFAPP_ADMIN_FEED_MS", "500"))
+
+# Page size limits for GET /api/rooms/{room_id}/participants
+PARTICIPANTS_PAGE_SIZE = 100
+PARTICIPANTS_PAGE_MAX = 500
+
+# Room modes and roles. In a webinar only presenters are announced for peer connections;
+# attendees connect to the presenters and are otherwise only counted.
+MEETING = "meeting"
+WEBINAR = "webinar"
+ROOM_MODES = (MEETING, WEBINAR)
+PARTICIPANT = "participant"  # every user of a meeting room
+PRESENTER = "presenter"
+ATTENDEE = "attendee"
+
+# Socket.IO server with CORS; room emits are encoded once and shared by every recipient (see fanout.py).
+# Clients may opt into compact MessagePack signaling per connection (see compact_codec.py).
+# Its loggers go through the log queue and only log per packet at MYCONFAPP_LOG_LEVEL=DEBUG.
+sio = CompactSignalingServer(
     async_mode='asgi', 
+    client_manager=client_manager or SharedFrameManager(),
+    json=fast_json,
     cors_allowed_origins='*',
-    logger=True,
-    engineio_logger=True
+    logger=logging.getLogger("socketio.server"),
+    engineio_logger=logging.getLogger("engineio.server")
 )
 socket_app = socketio.ASGIApp(sio, app)
 
@@ -45,20 +188,110 @@ templates = Jinja2Templates(directory="templates")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Data models
-class RoomInfo(BaseModel):
-    id: str
+# Rooms and users live in the state store for as long as they are connected and are mutated by
+# hot handlers, so they are slotted records rather than Pydantic models: no per-instance dict,
+# no validation on assignment, room ids and roles interned, media flags packed into one int.
+# Pydantic is used for request bodies only.
+
+# Bits of UserInfo.flags
+VIDEO_ENABLED = 1
+AUDIO_ENABLED = 2
+ICE_BATCHING = 4
+
+def _flag(bit: int) -> property:
+    """A bool attribute stored as one bit of `flags`"""
+    def get(self) -> bool:
+        return bool(self.flags & bit)
+
+    def set(self, value: bool):
+        self.flags = self.flags | bit if value else self.flags & ~bit
+
+    return property(get, set)
+
+class RoomInfo:
+    __slots__ = ("id", "name", "created_at", "is_active", "mode", "presenter_token")
+
+    def __init__(self, id: str, name: str, created_at: datetime, is_active: bool = True, mode: str = MEETING,
+                 presenter_token: Optional[str] = None):
+        self.id = sys.intern(id)
+        self.name = name
+        self.created_at = created_at
+        self.is_active = is_active
+        self.mode = sys.intern(mode)
+        self.presenter_token = presenter_token  # webinar: joining with this token makes a presenter
+
+    def __reduce__(self):
+        # Rebuilt through __init__, so copies replayed by the backplane are interned too
+        return (RoomInfo, (self.id, self.name, self.created_at, self.is_active, self.mode, self.presenter_token))
+
+    def to_json(self) -> str:
+        return fast_json.dumps({
+            "id": self.id,
+            "name": self.name,
+            "created_at": self.created_at.isoformat(),
+            "is_active": self.is_active,
+            "mode": self.mode,
+            "presenter_token": self.presenter_token
+        })
+
+    @classmethod
+    def from_json(cls, data: str) -> "RoomInfo":
+        fields = fast_json.loads(data)
+        return cls(fields["id"], fields["name"], datetime.fromisoformat(fields["created_at"]),
+                   fields.get("is_active", True), fields.get("mode", MEETING), fields.get("presenter_token"))
+
+class UserInfo:
+    __slots__ = ("id", "username", "room_id", "joined_at", "flags", "role", "resume_token")
+
+    def __init__(self, id: str, username: str, room_id: Optional[str], joined_at: datetime,
+                 is_video_enabled: bool = True, is_audio_enabled: bool = True, ice_batching: bool = False,
+                 role: str = PARTICIPANT, resume_token: Optional[str] = None):
+        self.id = id
+        self.username = username
+        self.room_id = sys.intern(room_id) if room_id else None
+        self.joined_at = joined_at
+        self.flags = ((VIDEO_ENABLED if is_video_enabled else 0) | (AUDIO_ENABLED if is_audio_enabled else 0)
+                      | (ICE_BATCHING if ice_batching else 0))
+        self.role = sys.intern(role)
+        self.resume_token = resume_token  # reattaches a new connection to this user (see join_room)
+
+    is_video_enabled = _flag(VIDEO_ENABLED)
+    is_audio_enabled = _flag(AUDIO_ENABLED)
+    ice_batching = _flag(ICE_BATCHING)  # client understands webrtc_ice_candidates
+
+    def __reduce__(self):
+        return (UserInfo, (self.id, self.username, self.room_id, self.joined_at, self.is_video_enabled,
+                           self.is_audio_enabled, self.ice_batching, self.role, self.resume_token))
+
+    def to_json(self) -> str:
+        return fast_json.dumps({
+            "id": self.id,
+            "username": self.username,
+            "room_id": self.room_id,
+            "joined_at": self.joined_at.isoformat(),
+            "is_video_enabled": self.is_video_enabled,
+            "is_audio_enabled": self.is_audio_enabled,
+            "ice_batching": self.ice_batching,
+            "role": self.role,
+            "resume_token": self.resume_token
+        })
+
+    @classmethod
+    def from_json(cls, data: str) -> "UserInfo":
+        fields = fast_json.loads(data)
+        return cls(fields["id"], fields["username"], fields.get("room_id"), datetime.fromisoformat(fields["joined_at"]),
+                   fields.get("is_video_enabled", True), fields.get("is_audio_enabled", True),
+                   fields.get("ice_batching", False), fields.get("role", PARTICIPANT), fields.get("resume_token"))
+
+class FileUpload(BaseModel):
+    user_id: str
     name: str
-    created_at: datetime
-    participants: List[str]
-    is_active: bool
-
-class UserInfo(BaseModel):
-    id: str
-    username: str
-    room_id: Optional[str]
-    joined_at: datetime
-    is_video_enabled: bool = True
-    is_audio_enabled: bool = True
+    size: int
+    type: str = ""
+
+class RecordingStart(BaseModel):
+    user_id: str
+    mime_type: str = "video/webm"
 
 class CallSignal(BaseModel):
     type: str
@@ -68,21 +301,195 @@ class CallSignal(BaseModel):
     room_id: str
 
 # In-memory storage (replace with database in production)
-rooms: Dict[str, RoomInfo] = {}
-users: Dict[str, UserInfo] = {}
-user_sessions: Dict[str, str] = {}  # session_id -> user_id
-room_participants: Dict[str, List[str]] = {}  # room_id -> [user_ids]
+# All mutations go through the indexed state store; the module-level names are read-only views
+state = StateStore()
+rooms: Dict[str, RoomInfo] = state.rooms
+users: Dict[str, UserInfo] = state.users
+user_sessions: Dict[str, str] = state.user_sessions  # user_id -> session_id
+room_participants: Dict[str, Dict[str, None]] = state.room_participants  # room_id -> ordered set of user_ids
+state_persistence = StatePersistence(STATE_DB_URL, state, RoomInfo, UserInfo)
+
+admin_feed = None
+if ADMIN_FEED_PATH:
+    admin_feed = FeedPublisher(ADMIN_FEED_PATH, state,
+                               lambda: {"connections": len(sio.eio.sockets), "users": len(users)},
+                               ADMIN_FEED_INTERVAL_MS / 1000)
+    state.add_listener(admin_feed.on_change)
+    state.add_roster_listener(admin_feed.mark)
+
+def count_activity(kind: str):
+    """Count a chat message, screen share, recording or shared file for the admin analytics"""
+    if admin_feed is not None:
+        admin_feed.count(kind)
+
+file_relay = FileRelay(FILE_DIR, FILE_MAX_BYTES, accel_redirect=FILE_ACCEL_REDIRECT)
+recording_store = RecordingStore(RECORDINGS_DIR)
+# Behind a backplane a room's chat goes through several workers, so history is read from the database
+chat_log = ChatLog(CHAT_DB_URL, shared=client_manager is not None)
+scheduler = Scheduler(MEETINGS_DB_URL, prewarm=MEETING_PREWARM, remind=MEETING_REMINDER)
+rate_limiter = RateLimiter(RATE_LIMITS)
+loop_lag = LoopLagMonitor()
+admission = AdmissionController(loop_lag, MAX_LOOP_LAG_MS, MAX_CONNECTIONS, ADMISSION_RETRY_AFTER)
+queue_logging = QueueLogging(LOG_LEVEL, LOG_FORMAT)
+metrics = Registry()
+
+# Replicate registry changes to the other workers when a backplane is configured
+if client_manager is not None:
+    client_manager.attach_store(state)
+
+@app.on_event("startup")
+async def start_logging():
+    queue_logging.start()
+
+@app.on_event("startup")
+async def start_backplane():
+    # Subscribe at startup rather than on the first connection so this worker never misses registry updates
+    if client_manager is not None and not sio.manager_initialized:
+        sio.manager_initialized = True
+        client_manager.initialize()
+
+@app.on_event("startup")
+async def start_reaper():
+    # Restored users get RESTORE_GRACE to reconnect; restored rooms nobody comes back to are closed
+    for user_id in state_persistence.restored:
+        reaper.schedule("user", user_id, RESTORE_GRACE)
+    state_persistence.restored = []
+    if ROOM_TTL > 0:
+        for room_id in rooms:
+            if not state.participant_count(room_id):
+                reaper.schedule("room", room_id, ROOM_TTL)
+    reaper.start()
+
+@app.on_event("shutdown")
+async def stop_reaper():
+    await reaper.stop()
+
+@app.on_event("startup")
+async def start_scheduler():
+    scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    await scheduler.stop()
+
+@app.on_event("startup")
+async def start_admin_feed():
+    if admin_feed is not None:
+        admin_feed.start()
+
+@app.on_event("shutdown")
+async def stop_admin_feed():
+    if admin_feed is not None:
+        await admin_feed.stop()
+
+@app.on_event("startup")
+async def start_lag_monitor():
+    loop_lag.start()
+
+@app.on_event("shutdown")
+async def stop_lag_monitor():
+    await loop_lag.stop()
+
+@app.on_event("startup")
+async def start_chat_log():
+    chat_log.start()
+
+@app.on_event("shutdown")
+async def flush_chat_log():
+    await chat_log.close()
+
+@app.on_event("shutdown")
+async def flush_state():
+    await state_persistence.close()
+
+@app.on_event("shutdown")
+async def stop_logging():
+    queue_logging.stop()
+
+# Overflow policies for outbound WebSocket queues
+DROP_OLDEST = "drop_oldest"          # presence events: a newer update supersedes an older one
+DISCONNECT_SLOW = "disconnect_slow"  # chat: never drop silently, disconnect the slow consumer instead
+
+class OutboundQueue:
+    """Bounded send queue drained by a dedicated writer task, one per WebSocket"""
+
+    def __init__(self, websocket: WebSocket, maxsize: int, stats: Dict[str, int]):
+        self.websocket = websocket
+        self.maxsize = maxsize
+        self.stats = stats  # counters shared by every queue of the manager
+        self.items: Deque[Tuple[str, str]] = deque()  # (message, overflow policy)
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.writer = asyncio.create_task(self._drain())
+
+    def put(self, message: str, policy: str) -> bool:
+        if self.closed:
+            return False
+        if len(self.items) >= self.maxsize:
+            if policy == DISCONNECT_SLOW:
+                self.stats["slow_consumer_disconnects"] += 1
+                self.close(code=1013)  # Try Again Later
+                return False
+            self.stats["dropped"] += 1
+            if not self._drop_oldest(policy):
+                return False
+        self.items.append((message, policy))
+        self.ready.set()
+        return True
+
+    def _drop_oldest(self, policy: str) -> bool:
+        """Drop the oldest queued message with the same policy; False if there is none"""
+        for index, (_, queued_policy) in enumerate(self.items):
+            if queued_policy == policy:
+                del self.items[index]
+                return True
+        return False
+
+    async def _drain(self):
+        try:
+            while True:
+                while not self.items:
+                    self.ready.clear()
+                    await self.ready.wait()
+                message, _ = self.items.popleft()
+                await self.websocket.send_text(message)
+                self.stats["sent"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            self.stats["send_errors"] += 1
+            logger.warning("WebSocket send failed, closing connection: %s", exc)
+            self.close(code=1011)
+
+    def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.closed = True
+        self.items.clear()
+        if self.writer is not asyncio.current_task():
+            self.writer.cancel()
+        asyncio.ensure_future(self._close_websocket(code))
+
+    async def _close_websocket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass  # already closed by the peer
 
 # Enhanced Connection Manager with WebRTC support
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, queue_size: int = WS_QUEUE_SIZE):
         self.active_connections: Dict[str, WebSocket] = {}  # user_id -> websocket
         self.room_connections: Dict[str, List[str]] = {}    # room_id -> [user_ids]
         self.webrtc_signals: Dict[str, List[dict]] = {}     # room_id -> [signals]
+        self.queues: Dict[str, OutboundQueue] = {}          # user_id -> outbound queue
+        self.queue_size = queue_size
+        self.stats: Dict[str, int] = {"sent": 0, "dropped": 0, "slow_consumer_disconnects": 0, "send_errors": 0}
 
     async def connect(self, websocket: WebSocket, user_id: str, room_id: str = None):
         await websocket.accept()
         self.active_connections[user_id] = websocket
+        self.queues[user_id] = OutboundQueue(websocket, self.queue_size, self.stats)
         
         if room_id:
             if room_id not in self.room_connections:
@@ -93,39 +500,48 @@ class ConnectionManager:
     def disconnect(self, user_id: str, room_id: str = None):
         if user_id in self.active_connections:
             del self.active_connections[user_id]
+        queue = self.queues.pop(user_id, None)
+        if queue:
+            queue.close()
         
         if room_id and room_id in self.room_connections:
             if user_id in self.room_connections[room_id]:
                 self.room_connections[room_id].remove(user_id)
+            if not self.room_connections[room_id]:
+                del self.room_connections[room_id]
 
-    async def send_personal_message(self, message: str, user_id: str):
-        if user_id in self.active_connections:
-            try:
-                await self.active_connections[user_id].send_text(message)
-            except:
-                pass
-
-    async def broadcast_to_room(self, message: str, room_id: str, exclude_user: str = None):
-        if room_id in self.room_connections:
-            for user_id in self.room_connections[room_id]:
-                if exclude_user and user_id == exclude_user:
-                    continue
-                if user_id in self.active_connections:
-                    try:
-                        await self.active_connections[user_id].send_text(message)
-                    except:
-                        pass
-
-    async def broadcast(self, message: str):
-        for user_id, connection in self.active_connections.items():
-            try:
-                await connection.send_text(message)
-            except:
-                pass
+    async def send_personal_message(self, message: str, user_id: str, policy: str = DISCONNECT_SLOW):
+        queue = self.queues.get(user_id)
+        if queue:
+            queue.put(message, policy)
+
+    async def broadcast_to_room(self, message: str, room_id: str, exclude_user: str = None,
+                                policy: str = DISCONNECT_SLOW):
+        # Enqueue only; each connection's writer task does the actual send
+        queues = self.queues
+        for user_id in self.room_connections.get(room_id, ()):
+            if exclude_user and user_id == exclude_user:
+                continue
+            queue = queues.get(user_id)
+            if queue:
+                queue.put(message, policy)
+
+    async def broadcast(self, message: str, policy: str = DISCONNECT_SLOW):
+        for queue in self.queues.values():
+            queue.put(message, policy)
 
     def get_room_participants(self, room_id: str) -> List[str]:
         return self.room_connections.get(room_id, [])
 
+    def queue_stats(self) -> dict:
+        depths = [len(queue.items) for queue in self.queues.values()]
+        return {
+            "connections": len(depths),
+            "queued": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            **self.stats
+        }
+
 manager = ConnectionManager()
 
 @app.get("/", response_class=HTMLResponse)
@@ -134,15 +550,16 @@ async def get_home(request: Request):
 
 @app.get("/room/{room_id}", response_class=HTMLResponse)
 async def get_room(request: Request, room_id: str):
-    return templates.TemplateResponse("room.html", {"request": request, "room_id": room_id})
+    return templates.TemplateResponse("room.html", {"request": request, "room_id": room_id, **signaling_config()})
 
 @app.websocket("/ws/{room_id}")
 async def websocket_endpoint(websocket: WebSocket, room_id: str):
-    await manager.connect(websocket, room_id)
+    connection_id = websocket.query_params.get("user_id") or str(uuid.uuid4())
+    await manager.connect(websocket, connection_id, room_id)
     try:
         while True:
             data = await websocket.receive_text()
-            message_data = json.loads(data)
+            message_data = fast_json.loads(data)
             
             # Handle different message types
             if message_data["type"] == "message":
@@ -154,7 +571,7 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str):
                     "timestamp": datetime.now().isoformat(),
                     "room_id": room_id
                 }
-                await manager.broadcast_to_room(json.dumps(broadcast_message), room_id)
+                await manager.broadcast_to_room(fast_json.dumps(broadcast_message), room_id)
             
             elif message_data["type"] == "user_joined":
                 # Notify room about new user
@@ -164,122 +581,246 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str):
                     "timestamp": datetime.now().isoformat(),
                     "room_id": room_id
                 }
-                await manager.broadcast_to_room(json.dumps(join_message), room_id)
+                await manager.broadcast_to_room(fast_json.dumps(join_message), room_id, policy=DROP_OLDEST)
                 
     except WebSocketDisconnect:
-        manager.disconnect(websocket, room_id)
+        manager.disconnect(connection_id, room_id)
 
 # Enhanced Socket.IO events for full Teams functionality
 @sio.event
 async def connect(sid, environ):
-    print(f"Client {sid} connected")
+    logger.debug("Client connected", extra={"sid": sid})
     await sio.emit('connected', {'status': 'connected'}, room=sid)
 
 @sio.event
 async def disconnect(sid):
-    print(f"Client {sid} disconnected")
-    # Clean up user session
-    for user_id, session_id in user_sessions.items():
-        if session_id == sid:
-            # Remove from room participants
-            user = users.get(user_id)
-            if user and user.room_id:
-                if user.room_id in room_participants:
-                    if user_id in room_participants[user.room_id]:
-                        room_participants[user.room_id].remove(user_id)
-                    
-                    # Notify others in room
-                    await sio.emit('user_left', {
-                        'user_id': user_id,
-                        'username': user.username,
-                        'timestamp': datetime.now().isoformat()
-                    }, room=user.room_id)
-            
-            # Clean up
-            if user_id in users:
-                del users[user_id]
-            del user_sessions[user_id]
-            break
+    logger.info("Client disconnected", extra={"sid": sid})
+    rate_limiter.forget(sid)
+    await release_session(sid)
+
+async def release_session(sid: str) -> bool:
+    """Detach a session's user after its connection ended; False if the sid had no user"""
+    user_id = state.user_for_session(sid)
+    if not user_id:
+        return False
+    user = users.get(user_id)
+    if RESUME_GRACE > 0 and user is not None and user.resume_token:
+        # Keep the user in the room for a while: a quick reconnect resumes without a broadcast,
+        # otherwise the reaper drops it
+        state.unbind_session(user_id)
+        reaper.schedule("user", user_id, RESUME_GRACE)
+        return True
+    await drop_user(user_id)
+    return True
+
+def resumable_user(room_id: str, data: dict) -> Optional[UserInfo]:
+    """The user a join_room carrying a valid resume_token takes back"""
+    token = data.get('resume_token')
+    user = users.get(data.get('user_id') or '')
+    if not token or user is None or not user.resume_token or user.id not in room_participants.get(room_id, ()):
+        return None
+    return user if secrets.compare_digest(str(token), user.resume_token) else None
+
+async def drop_user(user_id: str):
+    """Take a user out of its room, tell the others and forget it"""
+    user = users.get(user_id)
+    if user and user.room_id and user.room_id in room_participants:
+        # Remove from room participants
+        state.remove_participant(user.room_id, user_id)
+
+        # Notify others in room
+        await sio.emit('user_left', {
+            'user_id': user_id,
+            'username': user.username,
+            'timestamp': datetime.now().isoformat()
+        }, room=audience_room(user.room_id, user.role))
+
+    # Clean up
+    if sfu is not None:
+        await sfu.remove_peer(user_id)
+    state.remove_user(user_id)
+
+# Idle rooms, users without a connection and dead sessions are put on the reaper's timer wheel
+# when they may become garbage; each handler re-checks when its timer fires (see reaper.py)
+reaper = Reaper()
+
+async def reap_room(room_id: str) -> bool:
+    if room_id not in rooms or state.participant_count(room_id):
+        return False  # gone already, or somebody joined since
+    await close_room(room_id)
+    return True
+
+async def reap_user(user_id: str) -> bool:
+    if user_id not in users or state.session_for_user(user_id) is not None:
+        return False  # left, or reconnected
+    await drop_user(user_id)
+    return True
+
+async def reap_session(sid: str) -> bool:
+    if state.user_for_session(sid) is None:
+        return False
+    if sio.manager.is_connected(sid, '/'):
+        reaper.schedule("session", sid, SESSION_CHECK_INTERVAL)
+        return False
+    return await release_session(sid)
+
+reaper.register("room", reap_room)
+reaper.register("user", reap_user)
+reaper.register("session", reap_session)
+
+def schedule_reaping(op: str, args: tuple):
+    """State store listener: start the timers of new rooms and sessions"""
+    if op == "add_room" and ROOM_TTL > 0:
+        reaper.schedule("room", args[0].id, ROOM_TTL)
+    elif SESSION_CHECK_INTERVAL > 0 and (op == "bind_session" or (op == "add_user" and len(args) > 1 and args[1])):
+        reaper.schedule("session", args[1], SESSION_CHECK_INTERVAL)
+
+def schedule_empty_room(room_id: str):
+    """Roster listener: a room whose last participant left starts its TTL"""
+    if ROOM_TTL > 0 and state.get_roster(room_id) is not None and not state.participant_count(room_id):
+        reaper.schedule("room", room_id, ROOM_TTL)
+
+state.add_listener(schedule_reaping)
+state.add_roster_listener(schedule_empty_room)
+
+def presenters_room(room_id: str) -> str:
+    """Socket.IO room holding only the presenters of a webinar"""
+    return f"{room_id}:presenters"
+
+def audience_room(room_id: str, role: str) -> str:
+    """Where events about a user go: attendees of a webinar are only visible to its presenters"""
+    return presenters_room(room_id) if role == ATTENDEE else room_id
+
+def webinar_role(room: RoomInfo, data: dict, created: bool, existing_user: Optional[UserInfo]) -> str:
+    """The creator of a webinar, holders of its presenter token and returning presenters present"""
+    token = data.get('presenter_token')
+    if created or (existing_user is not None and existing_user.role == PRESENTER):
+        return PRESENTER
+    if token and room.presenter_token and secrets.compare_digest(str(token), room.presenter_token):
+        return PRESENTER
+    return ATTENDEE
 
 @sio.event
 async def join_room(sid, data):
     room_id = data['room_id']
     username = data['username']
     user_id = data.get('user_id', str(uuid.uuid4()))
+    previous_user_id = state.user_for_session(sid)
+    
+    logger.debug("Join attempt", extra={"sid": sid, "user_id": user_id, "username": username, "room_id": room_id})
     
-    print(f"User {username} ({user_id}) attempting to join room {room_id}")
+    # A busy node still takes back its own users, but asks newcomers to come back later
+    user = resumable_user(room_id, data)
+    if user is None:
+        reason = admission.check(len(sio.eio.sockets))
+        if reason:
+            logger.info("Join rejected", extra={"sid": sid, "room_id": room_id, "reason": reason})
+            await sio.emit('join_rejected', {
+                'room_id': room_id,
+                'reason': reason,
+                'retry_after': admission.retry_after
+            }, to=sid)
+            return
     
     # Create or get room
-    if room_id not in rooms:
-        rooms[room_id] = RoomInfo(
+    created = room_id not in rooms
+    if created:
+        mode = data.get('mode') if data.get('mode') in ROOM_MODES else MEETING
+        state.add_room(RoomInfo(
             id=room_id,
             name=f"Room {room_id[:8]}",
             created_at=datetime.now(),
-            participants=[],
-            is_active=True
-        )
-        print(f"Created new room: {room_id}")
-    
-    # Check if user is already in the room (reconnection case)
-    existing_user = None
-    for existing_user_id, existing_user in users.items():
-        if existing_user.username == username and existing_user.room_id == room_id:
-            existing_user = existing_user
-            user_id = existing_user_id  # Use existing user ID
-            break
-    
-    # Create or update user
-    user = UserInfo(
-        id=user_id,
-        username=username,
-        room_id=room_id,
-        joined_at=datetime.now() if not existing_user else existing_user.joined_at
-    )
-    
-    users[user_id] = user
-    user_sessions[user_id] = sid
+            is_active=True,
+            mode=mode,
+            presenter_token=secrets.token_urlsafe(16) if mode == WEBINAR else None
+        ))
+        logger.info("Room created", extra={"room_id": room_id, "mode": mode})
+    room = rooms[room_id]
     
-    # Add to room participants
-    if room_id not in room_participants:
-        room_participants[room_id] = []
-    if user_id not in room_participants[room_id]:
-        room_participants[room_id].append(user_id)
+    # A reconnect presenting its resume token takes its user back as it was: same roster entry,
+    # no user_joined, and peers keep their connections to it
+    resumed = user is not None
+    if resumed:
+        user_id = user.id
+        role = user.role
+        reaper.cancel("user", user_id)
+        state.bind_session(user_id, sid)
+    else:
+        # Check if user is already in the room (reconnection case)
+        existing_user = None
+        existing_user_id = state.find_user(room_id, username)
+        if existing_user_id:
+            existing_user = users.get(existing_user_id)
+            user_id = existing_user_id  # Use existing user ID
+            reaper.cancel("user", user_id)
+        
+        role = webinar_role(room, data, created, existing_user) if room.mode == WEBINAR else PARTICIPANT
+        
+        ice_batching = 'ice_batching' in data.get('capabilities', [])
+        if existing_user is not None:
+            # A reconnect updates its record in place, so it keeps its roster entry and join order;
+            # the new client starts with its media on, as a new user would
+            user = state.update_user(user_id, {
+                'role': role,
+                'ice_batching': ice_batching,
+                'resume_token': secrets.token_urlsafe(16),
+                'is_video_enabled': True,
+                'is_audio_enabled': True
+            })
+            state.bind_session(user_id, sid)
+        else:
+            # Register user, bind the session and add to room participants
+            user = UserInfo(
+                id=user_id,
+                username=username,
+                room_id=room_id,
+                joined_at=datetime.now(),
+                ice_batching=ice_batching,
+                role=role,
+                resume_token=secrets.token_urlsafe(16)
+            )
+            state.add_user(user, sid)
+    if previous_user_id and previous_user_id != user_id:
+        # This connection now belongs to another user; the one it leaves behind has no session
+        reaper.schedule("user", previous_user_id, 0)
     
     # Join socket room
     await sio.enter_room(sid, room_id)
+    if role == PRESENTER:
+        await sio.enter_room(sid, presenters_room(room_id))
     
-    # Get current participants (excluding the current user for proper peer connections)
-    participants = []
-    other_participants = []
-    
-    for participant_id in room_participants[room_id]:
-        participant = users.get(participant_id)
-        if participant:
-            participant_data = {
-                'user_id': participant_id,
-                'username': participant.username,
-                'is_video_enabled': participant.is_video_enabled,
-                'is_audio_enabled': participant.is_audio_enabled,
-                'joined_at': participant.joined_at.isoformat()
-            }
-            participants.append(participant_data)
-            
-            # Collect other participants for WebRTC connections
-            if participant_id != user_id:
-                other_participants.append(participant_data)
+    # A reconnecting client passes the last message id it has and gets what it missed
+    if isinstance(data.get('replay_since'), int):
+        messages, has_more = await chat_log.since(room_id, data['replay_since'], CHAT_REPLAY_LIMIT)
+        await sio.emit('chat_history', {'room_id': room_id, 'messages': messages, 'has_more': has_more}, to=sid)
+    
+    roster = state.get_roster(room_id)
+    if room.mode == WEBINAR:
+        await join_webinar(sid, room, user, roster, resumed)
+        return
     
-    print(f"Room {room_id} now has {len(participants)} participants: {[p['username'] for p in participants]}")
+    # Current participants come from the room's cached roster (excluding the current user for peer connections)
+    participants = roster.snapshot()
+    other_participants = [participant for participant in participants if participant['user_id'] != user_id]
     
-    # Send room join confirmation to the new user with all current participants
+    
+    # Send room join confirmation to the new user with all current participants;
+    # later changes arrive as roster_delta events on top of this roster version
     await sio.emit('room_joined', {
         'user_id': user_id,
         'room_id': room_id,
+        'mode': room.mode,
+        'role': role,
+        'media': MEDIA_MODE,
         'participants': participants,  # All participants including self
-        'other_participants': other_participants  # Other participants for WebRTC
+        'other_participants': other_participants,  # Other participants for WebRTC
+        'resume_token': user.resume_token,
+        'resumed': resumed,
+        **roster.state()
     }, to=sid)
     
     # Notify existing participants about the new user (excluding the new user)
-    if len(other_participants) > 0:
+    if len(other_participants) > 0 and not resumed:
         await sio.emit('user_joined', {
             'user_id': user_id,
             'username': username,
@@ -287,26 +828,59 @@ async def join_room(sid, data):
             'room_id': room_id
         }, room=room_id, skip_sid=sid)
     
-    print(f"User {username} successfully joined room {room_id}")
+    logger.info("User joined", extra={"user_id": user_id, "username": username, "room_id": room_id,
+                                      "participants": len(participants), "resumed": resumed})
+
+async def join_webinar(sid: str, room: RoomInfo, user: UserInfo, roster, resumed: bool = False):
+    """Webinar join: the cost depends on the number of presenters, not on the audience size.
+
+    The joiner only learns about the presenters (and the head count); attendees connect to the
+    presenters themselves and are otherwise announced through periodic participant_count events.
+    """
+    presenters = roster.by_role(PRESENTER)
+    participants = presenters if user.role == PRESENTER else presenters + [roster.entries[user.id]]
+    joined = {
+        'user_id': user.id,
+        'room_id': room.id,
+        'mode': room.mode,
+        'role': user.role,
+        'media': MEDIA_MODE,
+        'participants': participants,  # Presenters, plus self for an attendee
+        'other_participants': [p for p in presenters if p['user_id'] != user.id],  # Peers to connect to
+        'participant_count': len(roster),
+        'attendee_count': roster.count(ATTENDEE),
+        'resume_token': user.resume_token,
+        'resumed': resumed
+    }
+    if user.role == PRESENTER:
+        joined['presenter_token'] = room.presenter_token  # lets the presenter invite co-presenters
+    await sio.emit('room_joined', joined, to=sid)
     
-    # Update room's participant list in the rooms dictionary
-    rooms[room_id].participants = participants
+    # Everybody connects to a new presenter; a new attendee is only counted
+    if user.role == PRESENTER and not resumed:
+        await sio.emit('user_joined', {
+            'user_id': user.id,
+            'username': user.username,
+            'role': PRESENTER,
+            'timestamp': datetime.now().isoformat(),
+            'room_id': room.id
+        }, room=room.id, skip_sid=sid)
 
 @sio.event
 async def leave_room(sid, data):
     room_id = data.get('room_id') or data.get('room')  # Handle both formats
-    user_id = data.get('user_id')
+    user_id = data.get('user_id') or state.user_for_session(sid)
     username = data.get('username', 'Unknown')
     
     await sio.leave_room(sid, room_id)
+    await sio.leave_room(sid, presenters_room(room_id))
     
     # Remove from participants
-    if room_id in room_participants and user_id in room_participants[room_id]:
-        room_participants[room_id].remove(user_id)
+    state.remove_participant(room_id, user_id)
     
     # Get user info for notification
+    user = users.get(user_id)
     if not username or username == 'Unknown':
-        user = users.get(user_id)
         username = user.username if user else "Unknown"
     
     # Notify others
@@ -314,11 +888,12 @@ async def leave_room(sid, data):
         'user_id': user_id,
         'username': username,
         'timestamp': datetime.now().isoformat()
-    }, room=room_id)
+    }, room=audience_room(room_id, user.role if user else PARTICIPANT))
     
     # Clean up
-    if user_id in users:
-        del users[user_id]
+    if sfu is not None:
+        await sfu.remove_peer(user_id)
+    state.remove_user(user_id)
 
 @sio.event
 async def start_recording(sid, data):
@@ -349,22 +924,31 @@ async def stop_recording(sid, data):
 @sio.event
 async def request_participants_list(sid, data):
     room_id = data['room_id']
+    roster = state.get_roster(room_id)
+    if roster is None:
+        await sio.emit('participants_list', {'participants': []}, to=sid)
+        return
+    
+    # Webinar audiences are read page by page from /api/rooms/{room_id}/participants
+    if rooms[room_id].mode == WEBINAR:
+        await sio.emit('participants_list', {
+            'participants': roster.by_role(PRESENTER),
+            'participant_count': len(roster),
+            'attendee_count': roster.count(ATTENDEE)
+        }, to=sid)
+        return
     
-    participants = []
-    if room_id in room_participants:
-        for participant_id in room_participants[room_id]:
-            participant = users.get(participant_id)
-            if participant:
-                participants.append({
-                    'user_id': participant_id,
-                    'username': participant.username,
-                    'is_video_enabled': participant.is_video_enabled,
-                    'is_audio_enabled': participant.is_audio_enabled,
-                    'joined_at': participant.joined_at.isoformat()
-                })
+    # A client that still holds a recent roster version only needs the changes it missed
+    known_version = data.get('roster_version')
+    if data.get('roster_epoch') == roster.epoch and isinstance(known_version, int):
+        changes = roster.changes_since(known_version)
+        if changes is not None:
+            await sio.emit('roster_delta', {'room_id': room_id, 'changes': changes, **roster.state()}, to=sid)
+            return
     
     await sio.emit('participants_list', {
-        'participants': participants
+        'participants': roster.snapshot(),
+        **roster.state()
     }, to=sid)
 
 @sio.event
@@ -390,8 +974,7 @@ async def update_settings(sid, data):
         'user_id': user_id,
         'settings': settings
     }, to=sid)
-    if user_id in user_sessions:
-        del user_sessions[user_id]
+    state.unbind_session(user_id)
 
 @sio.event
 async def send_message(sid, data):
@@ -403,16 +986,15 @@ async def send_message(sid, data):
     if not user:
         return
     
-    message_data = {
-        'user_id': user_id,
-        'username': user.username,
-        'message': message,
-        'timestamp': datetime.now().isoformat(),
-        'type': 'chat'
-    }
+    message_data = chat_log.append(room_id, user_id, user.username, message, datetime.now().isoformat())
+    count_activity("messages")
     
     await sio.emit('receive_message', message_data, room=room_id)
 
+def is_attendee(user_id: str) -> bool:
+    user = users.get(user_id)
+    return user is not None and user.role == ATTENDEE
+
 # WebRTC Signaling Events
 @sio.event
 async def webrtc_offer(sid, data):
@@ -422,8 +1004,19 @@ async def webrtc_offer(sid, data):
     to_user = data['to_user']
     offer = data['offer']
     
+    # In SFU mode every client negotiates a single connection with the server
+    if to_user == SFU_PEER:
+        if sfu is not None:
+            # Webinar attendees receive the presenters but publish nothing
+            await sfu.handle_offer(room_id, from_user, offer, publish=not is_attendee(from_user))
+        return
+    
+    # Webinar attendees only connect to presenters
+    if is_attendee(from_user) and is_attendee(to_user):
+        return
+    
     # Forward offer to specific user
-    target_session = user_sessions.get(to_user)
+    target_session = state.session_for_user(to_user)
     if target_session:
         await sio.emit('webrtc_offer', {
             'from_user': from_user,
@@ -439,8 +1032,13 @@ async def webrtc_answer(sid, data):
     to_user = data['to_user']
     answer = data['answer']
     
+    if to_user == SFU_PEER:
+        if sfu is not None:
+            await sfu.handle_answer(from_user, answer)
+        return
+    
     # Forward answer to specific user
-    target_session = user_sessions.get(to_user)
+    target_session = state.session_for_user(to_user)
     if target_session:
         await sio.emit('webrtc_answer', {
             'from_user': from_user,
@@ -450,21 +1048,179 @@ async def webrtc_answer(sid, data):
 
 @sio.event
 async def webrtc_ice_candidate(sid, data):
-    """Handle ICE candidate"""
+    """Handle ICE candidates, sent one per packet or as a 'candidates' array"""
     room_id = data['room_id']
     from_user = data['from_user']
     to_user = data['to_user']
-    candidate = data['candidate']
+    candidates = data['candidates'] if 'candidates' in data else [data['candidate']]
+    
+    if to_user == SFU_PEER:
+        if sfu is not None:
+            await sfu.add_candidates(from_user, candidates)
+        return
     
-    # Forward ICE candidate to specific user
-    target_session = user_sessions.get(to_user)
+    # Batching clients get candidates coalesced into webrtc_ice_candidates
+    target = users.get(to_user)
+    if target and target.ice_batching:
+        if ICE_BATCH_WINDOW_MS > 0:
+            ice_batcher.add(room_id, from_user, to_user, candidates)
+        else:
+            await send_ice_candidates(room_id, from_user, to_user, candidates)
+        return
+    
+    # Forward ICE candidates to specific user one at a time
+    target_session = state.session_for_user(to_user)
+    if target_session:
+        for candidate in candidates:
+            await sio.emit('webrtc_ice_candidate', {
+                'from_user': from_user,
+                'candidate': candidate,
+                'room_id': room_id
+            }, room=target_session)
+
+async def send_ice_candidates(room_id: str, from_user: str, to_user: str, candidates: list):
+    """Forward a batch of ICE candidates as a single webrtc_ice_candidates packet"""
+    target_session = state.session_for_user(to_user)
     if target_session:
-        await sio.emit('webrtc_ice_candidate', {
+        await sio.emit('webrtc_ice_candidates', {
             'from_user': from_user,
-            'candidate': candidate,
+            'candidates': candidates,
             'room_id': room_id
         }, room=target_session)
 
+class IceCandidateBatcher:
+    """Coalesces ICE candidates bound for the same (from_user, to_user) pair within a short window"""
+
+    def __init__(self, window_ms: float):
+        self.window = window_ms / 1000
+        self.pending: Dict[Tuple[str, str], dict] = {}  # (from_user, to_user) -> {room_id, candidates}
+        self.tasks: Set[asyncio.Task] = set()
+
+    def add(self, room_id: str, from_user: str, to_user: str, candidates: list):
+        key = (from_user, to_user)
+        batch = self.pending.get(key)
+        if batch is not None:
+            batch['candidates'].extend(candidates)
+            return
+        self.pending[key] = {'room_id': room_id, 'candidates': list(candidates)}
+        asyncio.get_running_loop().call_later(self.window, self._flush, key)
+
+    def _flush(self, key: Tuple[str, str]):
+        batch = self.pending.pop(key, None)
+        if batch is None:
+            return
+        task = asyncio.ensure_future(send_ice_candidates(batch['room_id'], key[0], key[1], batch['candidates']))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+ice_batcher = IceCandidateBatcher(ICE_BATCH_WINDOW_MS)
+
+async def send_sfu_signal(user_id: str, event: str, data: dict):
+    """Deliver an answer or offer from the SFU to a participant"""
+    target_session = state.session_for_user(user_id)
+    if target_session:
+        await sio.emit(event, data, room=target_session)
+
+sfu = SelectiveForwardingUnit(send_sfu_signal, SFU_ICE_SERVERS) if MEDIA_MODE == SFU else None
+
+class RosterPublisher:
+    """Sends the roster changes of each room as one roster_delta event per event-loop turn.
+
+    Every worker publishes to its own clients only (ignore_queue): rosters also change when a
+    backplane replays another worker's mutations, and versions are local to each worker.
+    """
+
+    def __init__(self, store: StateStore):
+        self.store = store
+        self.published: Dict[str, Tuple[str, int]] = {}  # room_id -> (epoch, last version sent)
+        self.dirty: Set[str] = set()
+        self.scheduled = False
+        self.tasks: Set[asyncio.Task] = set()
+
+    def mark(self, room_id: str):
+        room = self.store.rooms.get(room_id)
+        if room is not None and room.mode == WEBINAR:
+            return  # webinar audiences get head counts instead (ParticipantCountPublisher)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no clients to notify outside the server loop
+        self.dirty.add(room_id)
+        if not self.scheduled:
+            self.scheduled = True
+            loop.call_soon(self._flush)
+
+    def _flush(self):
+        self.scheduled = False
+        room_ids, self.dirty = self.dirty, set()
+        task = asyncio.ensure_future(self.publish(room_ids))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def publish(self, room_ids: Set[str]):
+        for room_id in room_ids:
+            roster = self.store.get_roster(room_id)
+            if roster is None:
+                self.published.pop(room_id, None)
+                continue
+            epoch, version = self.published.get(room_id, (roster.epoch, 0))
+            changes = roster.changes_since(version) if epoch == roster.epoch else None
+            self.published[room_id] = (roster.epoch, roster.version)
+            # An empty change list with a newer version tells clients to request a fresh roster
+            await sio.emit('roster_delta', {
+                'room_id': room_id,
+                'changes': changes or [],
+                **roster.state()
+            }, room=room_id, ignore_queue=True)
+
+roster_publisher = RosterPublisher(state)
+state.add_roster_listener(roster_publisher.mark)
+
+class ParticipantCountPublisher:
+    """Sends the head count of each webinar room at most once per interval.
+
+    Attendee joins and leaves are not announced one by one: a burst of any size within one
+    interval costs a single participant_count event per room. Like roster_delta, counts are
+    published by every worker to its own clients.
+    """
+
+    def __init__(self, store: StateStore, interval_ms: float):
+        self.store = store
+        self.interval = interval_ms / 1000
+        self.pending: Set[str] = set()  # rooms with a count scheduled
+        self.tasks: Set[asyncio.Task] = set()
+
+    def mark(self, room_id: str):
+        room = self.store.rooms.get(room_id)
+        if room is None or room.mode != WEBINAR or room_id in self.pending:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no clients to notify outside the server loop
+        self.pending.add(room_id)
+        loop.call_later(self.interval, self._flush, room_id)
+
+    def _flush(self, room_id: str):
+        self.pending.discard(room_id)
+        task = asyncio.ensure_future(self.publish(room_id))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def publish(self, room_id: str):
+        roster = self.store.get_roster(room_id)
+        if roster is None:
+            return
+        await sio.emit('participant_count', {
+            'room_id': room_id,
+            'participant_count': len(roster),
+            'presenter_count': roster.count(PRESENTER),
+            'attendee_count': roster.count(ATTENDEE)
+        }, room=room_id, ignore_queue=True)
+
+participant_count_publisher = ParticipantCountPublisher(state, WEBINAR_COUNT_INTERVAL_MS)
+state.add_roster_listener(participant_count_publisher.mark)
+
 @sio.event
 async def toggle_video(sid, data):
     """Handle video toggle"""
@@ -473,14 +1229,13 @@ async def toggle_video(sid, data):
     is_enabled = data['is_enabled']
     
     # Update user state
-    if user_id in users:
-        users[user_id].is_video_enabled = is_enabled
+    user = state.update_user(user_id, {'is_video_enabled': is_enabled})
     
     # Notify room
     await sio.emit('user_video_toggle', {
         'user_id': user_id,
         'is_enabled': is_enabled
-    }, room=room_id, skip_sid=sid)
+    }, room=audience_room(room_id, user.role if user else PARTICIPANT), skip_sid=sid)
 
 @sio.event
 async def toggle_audio(sid, data):
@@ -490,14 +1245,13 @@ async def toggle_audio(sid, data):
     is_enabled = data['is_enabled']
     
     # Update user state
-    if user_id in users:
-        users[user_id].is_audio_enabled = is_enabled
+    user = state.update_user(user_id, {'is_audio_enabled': is_enabled})
     
     # Notify room
     await sio.emit('user_audio_toggle', {
         'user_id': user_id,
         'is_enabled': is_enabled
-    }, room=room_id, skip_sid=sid)
+    }, room=audience_room(room_id, user.role if user else PARTICIPANT), skip_sid=sid)
 
 @sio.event
 async def screen_share_start(sid, data):
@@ -505,6 +1259,11 @@ async def screen_share_start(sid, data):
     room_id = data['room_id']
     user_id = data['user_id']
     
+    # Only presenters share their screen in a webinar
+    if is_attendee(user_id):
+        return
+    count_activity("screen_shares")
+    
     await sio.emit('screen_share_started', {
         'user_id': user_id,
         'username': users[user_id].username if user_id in users else 'Unknown'
@@ -523,7 +1282,7 @@ async def screen_share_stop(sid, data):
 # File sharing events
 @sio.event
 async def file_share(sid, data):
-    """Handle file sharing"""
+    """Relay file metadata from clients that send the file over data channels themselves"""
     room_id = data['room_id']
     user_id = data['user_id']
     file_info = data['file_info']
@@ -531,6 +1290,7 @@ async def file_share(sid, data):
     user = users.get(user_id)
     if not user:
         return
+    count_activity("files")
     
     await sio.emit('file_shared', {
         'user_id': user_id,
@@ -546,80 +1306,311 @@ async def get_home(request: Request):
 
 @app.get("/room/{room_id}", response_class=HTMLResponse)
 async def get_room(request: Request, room_id: str):
-    return templates.TemplateResponse("room.html", {"request": request, "room_id": room_id})
+    return templates.TemplateResponse("room.html", {"request": request, "room_id": room_id, **signaling_config()})
 
 @app.post("/api/rooms")
-async def create_room():
+async def create_room(mode: str = MEETING):
+    if mode not in ROOM_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown room mode: {mode}")
     room_id = str(uuid.uuid4())
     room = RoomInfo(
         id=room_id,
         name=f"Room {room_id[:8]}",
         created_at=datetime.now(),
-        participants=[],
-        is_active=True
+        is_active=True,
+        mode=mode,
+        presenter_token=secrets.token_urlsafe(16) if mode == WEBINAR else None
     )
-    rooms[room_id] = room
-    room_participants[room_id] = []
+    state.add_room(room)
     
-    return {"room_id": room_id, "room_name": room.name}
+    response = {"room_id": room_id, "room_name": room.name, "mode": mode}
+    if room.presenter_token:
+        response["presenter_token"] = room.presenter_token
+    return response
 
 @app.get("/api/rooms/{room_id}")
 async def get_room_info(room_id: str):
     if room_id in rooms:
         room = rooms[room_id]
-        participants = []
-        
-        # Get participant details
-        for user_id in room_participants.get(room_id, []):
-            user = users.get(user_id)
-            if user:
-                participants.append({
-                    "user_id": user_id,
-                    "username": user.username,
-                    "joined_at": user.joined_at.isoformat(),
-                    "is_video_enabled": user.is_video_enabled,
-                    "is_audio_enabled": user.is_audio_enabled
-                })
+        roster = state.get_roster(room_id)
+        # A webinar lists its presenters here; the audience is paged through /participants
+        participants = roster.by_role(PRESENTER) if room.mode == WEBINAR else roster.snapshot()
         
         return {
             "room_id": room.id,
             "name": room.name,
             "created_at": room.created_at.isoformat(),
             "participants": participants,
-            "participant_count": len(participants),
-            "is_active": room.is_active
+            "participant_count": len(roster),
+            "is_active": room.is_active,
+            "mode": room.mode,
+            **roster.state()
         }
     
     raise HTTPException(status_code=404, detail="Room not found")
 
+@app.get("/api/rooms/{room_id}/participants")
+async def list_room_participants(room_id: str, cursor: Optional[str] = None,
+                                 limit: int = PARTICIPANTS_PAGE_SIZE, role: Optional[str] = None):
+    """One page of a room's participants in join order; pass next_cursor back for the next page"""
+    roster = state.get_roster(room_id) if room_id in rooms else None
+    if roster is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    
+    # Cursors are "<roster epoch>:<join sequence>" and only valid for the roster that issued them
+    after = 0
+    if cursor:
+        epoch, _, seq = cursor.partition(':')
+        if not seq.isdigit():
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if epoch != roster.epoch:
+            raise HTTPException(status_code=409, detail="Roster was reset, start again without a cursor")
+        after = int(seq)
+    
+    limit = max(1, min(limit, PARTICIPANTS_PAGE_MAX))
+    page, next_seq = roster.page(after, limit, role)
+    return {
+        "room_id": room_id,
+        "participants": page,
+        "next_cursor": f"{roster.epoch}:{next_seq}" if next_seq is not None else None,
+        "participant_count": len(roster),
+        **roster.state()
+    }
+
+@app.get("/api/rooms/{room_id}/messages")
+async def list_room_messages(room_id: str, cursor: Optional[int] = None, after: Optional[int] = None,
+                             limit: int = MESSAGES_PAGE_SIZE):
+    """Chat history, oldest first. Without arguments the newest page; pass next_cursor back for the
+    page before it, or `after` (a message id) for the messages that followed it"""
+    limit = max(1, min(limit, MESSAGES_PAGE_MAX))
+    if after is not None:
+        messages, has_more = await chat_log.since(room_id, after, limit)
+        return {"room_id": room_id, "messages": messages, "has_more": has_more}
+    messages, next_cursor = await chat_log.page(room_id, cursor, limit)
+    return {"room_id": room_id, "messages": messages, "next_cursor": next_cursor}
+
+
+@app.get("/api/rooms/{room_id}/messages/search")
+async def search_room_messages(room_id: str, q: str, user_id: Optional[str] = None, since: Optional[str] = None,
+                               until: Optional[str] = None, cursor: Optional[int] = None,
+                               limit: int = SEARCH_PAGE_SIZE):
+    """Messages of the room containing every word of `q` (`word*` for a prefix), newest first.
+    Optional filters: sender (`user_id`) and ISO timestamps (`since`, `until`); pass the returned
+    `next_cursor` as `cursor` for the next page"""
+    limit = max(1, min(limit, SEARCH_PAGE_MAX))
+    messages, next_cursor = await chat_log.search(q, room_id, user_id, since, until, cursor, limit)
+    return {"room_id": room_id, "query": q, "messages": messages, "next_cursor": next_cursor}
+
+async def announce_file(shared: SharedFile):
+    """Tell the room about a file once all of it is on the server"""
+    user = users.get(shared.user_id)
+    count_activity("files")
+    await sio.emit('file_shared', {
+        'user_id': shared.user_id,
+        'username': user.username if user else 'Unknown',
+        'file_info': shared.info(),
+        'timestamp': datetime.now().isoformat()
+    }, room=shared.room_id)
+
+def get_shared_file(room_id: str, file_id: str) -> SharedFile:
+    shared = file_relay.get(room_id, file_id)
+    if shared is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return shared
+
+@app.post("/api/rooms/{room_id}/files")
+async def start_file_upload(room_id: str, upload: FileUpload):
+    """Start a chunked upload; the chunks are then PUT in order to .../chunks/{index}"""
+    if room_id not in rooms:
+        raise HTTPException(status_code=404, detail="Room not found")
+    user = users.get(upload.user_id)
+    if user is None or user.room_id != room_id:
+        raise HTTPException(status_code=403, detail="Only participants of the room can share files")
+    try:
+        shared = file_relay.create(room_id, user.id, upload.name, upload.size, upload.type)
+    except ValueError as error:
+        raise HTTPException(status_code=413, detail=str(error))
+    if shared.complete:
+        await announce_file(shared)
+    return shared.status()
+
+@app.get("/api/rooms/{room_id}/files")
+async def list_room_files(room_id: str):
+    return {"room_id": room_id, "files": [shared.info() for shared in file_relay.room_files(room_id)]}
+
+@app.get("/api/rooms/{room_id}/files/{file_id}/status")
+async def get_file_upload_status(room_id: str, file_id: str):
+    """Where an interrupted upload resumes: next_chunk is the first chunk not yet stored"""
+    return get_shared_file(room_id, file_id).status()
+
+@app.put("/api/rooms/{room_id}/files/{file_id}/chunks/{index}")
+async def upload_file_chunk(request: Request, room_id: str, file_id: str, index: int):
+    """Store one chunk, streamed straight from the request body to disk"""
+    shared = get_shared_file(room_id, file_id)
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > shared.chunk_size:
+        raise HTTPException(status_code=413, detail=f"Chunks are at most {shared.chunk_size} bytes")
+    try:
+        completed = await file_relay.write_chunk(shared, index, request.stream())
+    except ChunkOutOfOrder as error:
+        raise HTTPException(status_code=409, detail=error.upload.status())
+    except ChunkSizeError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    except ClientDisconnect:
+        raise HTTPException(status_code=400, detail="Upload interrupted")
+    if completed:
+        await announce_file(shared)
+    return shared.status()
+
+@app.get("/api/rooms/{room_id}/files/{file_id}")
+async def download_file(room_id: str, file_id: str):
+    shared = get_shared_file(room_id, file_id)
+    if not shared.complete:
+        raise HTTPException(status_code=409, detail="Upload not complete")
+    return file_relay.response(shared)
+
+def get_recording(room_id: str, recording_id: str) -> Recording:
+    recording = recording_store.get(room_id, recording_id)
+    if recording is None:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    return recording
+
+@app.post("/api/rooms/{room_id}/recordings")
+async def start_room_recording(room_id: str, start: RecordingStart):
+    """Register a recording; its chunks are then PUT to .../chunks/{seq} as they are recorded"""
+    if room_id not in rooms:
+        raise HTTPException(status_code=404, detail="Room not found")
+    user = users.get(start.user_id)
+    if user is None or user.room_id != room_id:
+        raise HTTPException(status_code=403, detail="Only participants of the room can record it")
+    count_activity("recordings")
+    return recording_store.create(room_id, user.id, user.username, start.mime_type).info()
+
+@app.get("/api/rooms/{room_id}/recordings")
+async def list_room_recordings(room_id: str):
+    return {"room_id": room_id, "recordings": [recording.info() for recording in recording_store.room_recordings(room_id)]}
+
+@app.put("/api/rooms/{room_id}/recordings/{recording_id}/chunks/{seq}")
+async def append_recording_chunk(request: Request, room_id: str, recording_id: str, seq: int, t: Optional[int] = None):
+    """Append one MediaRecorder chunk; `t` is its start in milliseconds since the recording began"""
+    recording = get_recording(room_id, recording_id)
+    try:
+        await recording_store.append_chunk(recording, seq, t, request.stream())
+    except ChunkOutOfOrder as error:
+        raise HTTPException(status_code=409, detail=error.upload.status())
+    except ChunkSizeError as error:
+        raise HTTPException(status_code=413, detail=str(error))
+    except ClientDisconnect:
+        raise HTTPException(status_code=400, detail="Upload interrupted")
+    return recording.status()
+
+@app.post("/api/rooms/{room_id}/recordings/{recording_id}/stop")
+async def stop_room_recording(room_id: str, recording_id: str):
+    recording = await recording_store.stop(get_recording(room_id, recording_id))
+    return recording.info()
+
+@app.get("/api/rooms/{room_id}/recordings/{recording_id}/seek")
+async def seek_recording(room_id: str, recording_id: str, t: int = 0):
+    """Byte offset of the chunk playing `t` milliseconds into the recording"""
+    return await recording_store.seek(get_recording(room_id, recording_id), t)
+
+@app.get("/api/rooms/{room_id}/recordings/{recording_id}")
+async def download_recording(request: Request, room_id: str, recording_id: str):
+    """The recording as one file; supports Range requests, also while it is still being recorded"""
+    return recording_store.response(get_recording(room_id, recording_id), request.headers.get("range"))
+
 @app.get("/api/rooms")
 async def list_rooms():
     active_rooms = []
     for room_id, room in rooms.items():
         if room.is_active:
-            participant_count = len(room_participants.get(room_id, []))
+            participant_count = state.participant_count(room_id)
             active_rooms.append({
                 "room_id": room.id,
                 "name": room.name,
                 "created_at": room.created_at.isoformat(),
-                "participant_count": participant_count
+                "participant_count": participant_count,
+                "mode": room.mode
             })
     
     return {"rooms": active_rooms}
 
+async def close_room(room_id: str):
+    # Notify all participants
+    await sio.emit('room_closed', {'room_id': room_id}, room=room_id)
+    
+    # Clean up
+    state.remove_room(room_id)
+    file_relay.remove_room(room_id)
+    chat_log.drop_room(room_id)
+
+# The admin dashboard closes rooms through its feed connection, and has meetings it changed
+# reloaded the same way
+if admin_feed is not None:
+    admin_feed.on_close_room = close_room
+    admin_feed.on_reload_meetings = scheduler.reload
+
+@sio.event
+async def schedule_meeting(sid, data):
+    """Book a meeting from the room page's schedule form; its room opens shortly before the start"""
+    user = users.get(state.user_for_session(sid) or '')
+    if user is None:
+        return
+    try:
+        meeting = await scheduler.add(parse_meeting(data.get('meeting_data') or {}, user.username, user.id))
+    except ValueError as error:
+        await sio.emit('schedule_rejected', {'reason': str(error)}, to=sid)
+        return
+    logger.info("Meeting scheduled", extra={"meeting_id": meeting["id"], "user_id": user.id})
+    await sio.emit('meeting_scheduled', {
+        'meeting_id': meeting['id'],
+        'room_id': meeting['room_id'],
+        'start_at': datetime.fromtimestamp(meeting['start_at']).isoformat()
+    }, to=sid)
+
+async def open_meeting_room(meeting: dict):
+    """Scheduler timer: open a meeting's room before anybody comes, and keep it until the meeting is over"""
+    room_id = meeting['room_id']
+    if room_id not in rooms:
+        state.add_room(RoomInfo(
+            id=room_id,
+            name=meeting['title'],
+            created_at=datetime.now(),
+            is_active=True,
+            mode=MEETING
+        ))
+        logger.info("Meeting room opened", extra={"room_id": room_id, "meeting_id": meeting['id']})
+    if ROOM_TTL > 0 and not state.participant_count(room_id):
+        reaper.schedule("room", room_id, max(ROOM_TTL, meeting['end_at'] - time.time()))
+
+async def remind_organizer(meeting: dict):
+    """Scheduler timer: tell the organizer, if connected, that the meeting is coming up"""
+    sid = state.session_for_user(meeting['organizer_id'] or '')
+    if sid is not None:
+        await sio.emit('meeting_reminder', {
+            'meeting_id': meeting['id'],
+            'title': meeting['title'],
+            'room_id': meeting['room_id'],
+            'start_at': datetime.fromtimestamp(meeting['start_at']).isoformat(),
+            'starts_in': max(0, round(meeting['start_at'] - time.time()))
+        }, to=sid)
+
+async def end_meeting(meeting: dict):
+    """Scheduler timer: the meeting's time is up"""
+    if meeting['room_id'] in rooms:
+        await close_room(meeting['room_id'])
+
+scheduler.register(PREWARM, open_meeting_room)
+scheduler.register(REMIND, remind_organizer)
+scheduler.register(START, open_meeting_room)
+scheduler.register(END, end_meeting)
+
 @app.delete("/api/rooms/{room_id}")
 async def delete_room(room_id: str):
     if room_id not in rooms:
         raise HTTPException(status_code=404, detail="Room not found")
     
-    # Notify all participants
-    await sio.emit('room_closed', {'room_id': room_id}, room=room_id)
-    
-    # Clean up
-    if room_id in rooms:
-        del rooms[room_id]
-    if room_id in room_participants:
-        del room_participants[room_id]
+    await close_room(room_id)
     
     return {"message": "Room deleted successfully"}
 
@@ -635,7 +1626,8 @@ async def get_user_info(user_id: str):
         "room_id": user.room_id,
         "joined_at": user.joined_at.isoformat(),
         "is_video_enabled": user.is_video_enabled,
-        "is_audio_enabled": user.is_audio_enabled
+        "is_audio_enabled": user.is_audio_enabled,
+        "role": user.role
     }
 
 # Health check endpoint
@@ -645,9 +1637,108 @@ async def health_check():
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "active_rooms": len(rooms),
-        "active_users": len(users)
+        "active_users": len(users),
+        "websocket_queues": manager.queue_stats(),
+        "media": MEDIA_MODE,
+        "sfu": sfu.snapshot() if sfu is not None else None,
+        "files": file_relay.snapshot(),
+        "recordings": recording_store.snapshot(),
+        "chat": chat_log.snapshot(),
+        "state": state_persistence.snapshot(),
+        "reaper": reaper.snapshot(),
+        "scheduler": scheduler.snapshot(),
+        "admin_feed": admin_feed.snapshot() if admin_feed is not None else None,
+        "rate_limits": rate_limiter.snapshot(),
+        "admission": admission.snapshot()
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of this worker's metrics"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Instrumentation: Socket.IO handler and HTTP request latency, event-loop lag, fan-out sizes,
+# traffic and queue depths. Series are created here once; gauges are read at scrape time.
+app.add_middleware(HTTPMetrics, registry=metrics)
+
+loop_lag.observe = metrics.histogram("event_loop_lag_seconds", "Event-loop lag samples").observe
+metrics.gauge("event_loop_lag_smoothed_seconds", "Smoothed event-loop lag used for admission",
+              lambda: loop_lag.lag_ms / 1000)
+
+fanout_sizes: Dict[str, Histogram] = {}
+
+def observe_fanout(event: str, recipients: int):
+    histogram = fanout_sizes.get(event)
+    if histogram is None:
+        histogram = fanout_sizes[event] = metrics.histogram(
+            "socketio_fanout_recipients", "Recipients per room emit", FANOUT_BUCKETS, event=event)
+    histogram.observe(recipients)
+
+sio.manager.on_fanout = observe_fanout
+
+metrics.gauge("socketio_messages_received_total", "Socket.IO messages received", lambda: sio.messages_in, "counter")
+metrics.gauge("socketio_received_bytes_total", "Socket.IO payload received (text in characters)",
+              lambda: sio.bytes_in, "counter")
+metrics.gauge("socketio_messages_sent_total", "Socket.IO messages sent", lambda: sio.messages_out, "counter")
+metrics.gauge("socketio_sent_bytes_total", "Socket.IO payload sent (text in characters)",
+              lambda: sio.bytes_out, "counter")
+metrics.gauge("socketio_connections", "Engine.IO connections", lambda: len(sio.eio.sockets))
+metrics.gauge("rooms", "Rooms", lambda: len(rooms))
+metrics.gauge("users", "Users", lambda: len(users))
+metrics.gauge("websocket_queued_messages", "Messages waiting in raw WebSocket queues",
+              lambda: manager.queue_stats()["queued"])
+metrics.gauge("websocket_max_queue_depth", "Deepest raw WebSocket queue",
+              lambda: manager.queue_stats()["max_queue_depth"])
+metrics.gauge("chat_pending_writes", "Chat messages not yet written to the database", lambda: len(chat_log.pending))
+metrics.gauge("state_pending_writes", "Rooms and users not yet written to the database",
+              lambda: state_persistence.snapshot()["pending"])
+metrics.gauge("reaper_scheduled", "Rooms, users and sessions on the reaper's timer wheel", lambda: len(reaper.wheel))
+metrics.gauge("scheduled_meeting_timers", "Timers on the meeting scheduler's heap", lambda: len(scheduler.heap))
+metrics.gauge("ice_batches_pending", "ICE candidate batches waiting for their window", lambda: len(ice_batcher.pending))
+metrics.gauge("roster_rooms_pending", "Rooms with a roster_delta not yet published", lambda: len(roster_publisher.dirty))
+metrics.gauge("rate_limited_events_total", "Socket.IO events dropped by rate limits",
+              lambda: (({"event": event}, count) for event, count in rate_limiter.refused.items()), "counter")
+metrics.gauge("joins_rejected_total", "Joins turned away by admission control",
+              lambda: (({"reason": reason}, count) for reason, count in admission.rejected.items()), "counter")
+
+def time_event(event: str, handler):
+    """Wrap a Socket.IO handler with a latency histogram and an error counter"""
+    latency = metrics.histogram("socketio_event_seconds", "Socket.IO handler latency", event=event)
+    errors = metrics.counter("socketio_event_errors_total", "Socket.IO handlers that raised", event=event)
+    async def timed(sid, *args):
+        start = time.perf_counter()
+        try:
+            return await handler(sid, *args)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - start)
+    return timed
+
+def limit_event(event: str, handler):
+    """Wrap a Socket.IO handler so that events over the client's rate limit are dropped"""
+    async def limited(sid, *args):
+        retry_after = rate_limiter.check(sid, event)
+        if retry_after and not (event in PRESENTER_EVENTS and is_presenter_session(sid)):
+            if rate_limiter.first_refusal(sid, event):
+                await sio.emit('rate_limited', {'event': event, 'retry_after': round(retry_after, 3)}, to=sid)
+            return None
+        return await handler(sid, *args)
+    return limited
+
+def is_presenter_session(sid: str) -> bool:
+    user = users.get(state.user_for_session(sid) or '')
+    return user is not None and user.role == PRESENTER
+
+# Every Socket.IO handler registered above is timed and goes through its rate limit; refused
+# events are counted by the rate limiter and do not show up as handler latency
+for event, handler in list(sio.handlers['/'].items()):
+    handler = time_event(event, handler)
+    if rate_limiter.enabled and event not in UNLIMITED_EVENTS:
+        handler = limit_event(event, handler)
+    sio.handlers['/'][event] = handler
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(socket_app, host="0.0.0.0", port=8000)
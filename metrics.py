@@ -0,0 +1,167 @@
+"""
+Low-overhead metrics exposed in the Prometheus text format
+Series are created once with fixed labels and kept by the code that updates them, so the hot
+path never formats a name or looks one up: a counter adds to a float and a histogram finds its
+bucket with one bisect. Gauges are callbacks evaluated only when /metrics is scraped.
+"""
+
+import bisect
+import math
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+# Seconds: handler and request latency, event-loop lag
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Recipients of one emit
+FANOUT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 10000)
+
+Labels = Tuple[Tuple[str, str], ...]
+# A gauge callback returns one value, or (labels, value) pairs for several series
+GaugeValue = Union[float, Iterable[Tuple[Dict[str, str], float]]]
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Family:
+    """All series of one metric name"""
+
+    def __init__(self, kind: str, help: str):
+        self.kind = kind
+        self.help = help
+        self.series: Dict[Labels, Union[Counter, Histogram]] = {}
+        self.read: Optional[Callable[[], GaugeValue]] = None
+
+
+class Registry:
+    def __init__(self, prefix: str = "myconfapp_"):
+        self.prefix = prefix
+        self.families: Dict[str, Family] = {}
+
+    def _family(self, name: str, kind: str, help: str) -> Family:
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = Family(kind, help)
+        elif family.kind != kind:
+            raise ValueError(f"Metric {name} is a {family.kind}, not a {kind}")
+        return family
+
+    def counter(self, name: str, help: str, **labels: str) -> Counter:
+        family = self._family(name, "counter", help)
+        key = tuple(sorted(labels.items()))
+        series = family.series.get(key)
+        if series is None:
+            series = family.series[key] = Counter()
+        return series
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+                  **labels: str) -> Histogram:
+        family = self._family(name, "histogram", help)
+        key = tuple(sorted(labels.items()))
+        series = family.series.get(key)
+        if series is None:
+            series = family.series[key] = Histogram(buckets)
+        return series
+
+    def gauge(self, name: str, help: str, read: Callable[[], GaugeValue], kind: str = "gauge"):
+        """A value read at scrape time; kind="counter" for totals kept elsewhere"""
+        self._family(name, kind, help).read = read
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for name, family in self.families.items():
+            name = self.prefix + name
+            lines.append(f"# HELP {name} {family.help}")
+            lines.append(f"# TYPE {name} {family.kind}")
+            if family.read is not None:
+                value = family.read()
+                if isinstance(value, (int, float)):
+                    lines.append(f"{name} {_number(value)}")
+                else:
+                    for labels, number in value:
+                        lines.append(f"{name}{_labels(tuple(sorted(labels.items())))} {_number(number)}")
+            for labels, series in family.series.items():
+                if isinstance(series, Counter):
+                    lines.append(f"{name}{_labels(labels)} {_number(series.value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(series.bounds + (math.inf,), series.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else _number(bound)
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(series.sum)}")
+                lines.append(f"{name}_count{_labels(labels)} {series.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (f'{key}="{_escape(value)}"' for key, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class HTTPMetrics:
+    """ASGI middleware timing each HTTP request until its response is complete, labelled by
+    method, route template (not the raw path, which would make a series per room) and status"""
+
+    def __init__(self, app, registry: Registry):
+        self.app = app
+        self.registry = registry
+        self.series: Dict[Tuple[str, str, int], Histogram] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            # Mounted apps (static files) have no route; their mount path is the root path
+            route = getattr(scope.get("route"), "path", None) or scope.get("root_path") or "unmatched"
+            key = (scope["method"], route, status)
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = self.registry.histogram(
+                    "http_request_seconds", "HTTP request latency until the response is complete",
+                    method=key[0], route=key[1], status=str(status))
+            series.observe(time.perf_counter() - start)
@@ -0,0 +1,176 @@
+"""
+Per-client rate limiting and join admission control for Socket.IO events
+Every client (sid) gets a token bucket per event type, created on its first event of that type:
+`rate` tokens per second refill up to `burst`, and an event that finds the bucket empty is
+dropped before its handler runs. A flooding tab therefore costs the server little more than
+decoding its packets, and the rooms it is not in never notice.
+
+Admission control protects the clients already connected when the whole node is busy: new
+joins are turned away with a retry hint while the event loop lags behind or the node holds
+too many connections. Lag is measured by a task that sleeps for a fixed interval and records
+how late it wakes up.
+"""
+
+import asyncio
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional, Tuple
+
+# Events never limited: the connection lifecycle itself
+UNLIMITED_EVENTS = frozenset({"connect", "disconnect"})
+
+# Wildcard entry in a limits table: applies to every event without its own entry
+ANY_EVENT = "*"
+
+# How often the lag monitor wakes up, and the weight of a new sample in the smoothed lag
+LAG_INTERVAL = 0.1
+LAG_SMOOTHING = 0.3
+
+Limit = Tuple[float, float]  # (tokens per second, burst)
+
+
+def parse_limits(spec: str, defaults: Dict[str, Limit]) -> Dict[str, Limit]:
+    """Limits from "event=rate/burst,..." on top of `defaults`; "off" disables every limit and
+    a rate of 0 disables one"""
+    spec = spec.strip()
+    if spec == "off":
+        return {}
+    limits = dict(defaults)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        event, _, value = item.partition("=")
+        rate, _, burst = value.partition("/")
+        try:
+            limits[event.strip()] = (float(rate), float(burst or rate))
+        except ValueError:
+            raise ValueError(f"Bad rate limit {item!r}, expected event=rate/burst") from None
+    return {event: limit for event, limit in limits.items() if limit[0] > 0}
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated", "limited")
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+        self.limited = False  # refused since the last event it let through
+
+
+class RateLimiter:
+    """Token buckets per (sid, event)"""
+
+    def __init__(self, limits: Dict[str, Limit], clock: Callable[[], float] = time.monotonic):
+        self.limits = limits
+        self.default = limits.get(ANY_EVENT)
+        self.clock = clock
+        self.buckets: Dict[str, Dict[str, TokenBucket]] = {}  # sid -> event -> bucket
+        self.refused: Counter = Counter()  # event -> events dropped
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.limits)
+
+    def check(self, sid: str, event: str) -> float:
+        """Take a token: 0.0 if the event may run, else seconds until the next token"""
+        limit = self.limits.get(event, self.default)
+        if limit is None or event in UNLIMITED_EVENTS:
+            return 0.0
+        rate, burst = limit
+        now = self.clock()
+        buckets = self.buckets.get(sid)
+        if buckets is None:
+            buckets = self.buckets[sid] = {}
+        bucket = buckets.get(event)
+        if bucket is None:
+            bucket = buckets[event] = TokenBucket(burst, now)
+        else:
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            bucket.limited = False
+            return 0.0
+        self.refused[event] += 1
+        return (1 - bucket.tokens) / rate
+
+    def first_refusal(self, sid: str, event: str) -> bool:
+        """True once per run of refused events, so a client is told once rather than per drop"""
+        bucket = self.buckets[sid][event]
+        if bucket.limited:
+            return False
+        bucket.limited = True
+        return True
+
+    def forget(self, sid: str):
+        self.buckets.pop(sid, None)
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "clients": len(self.buckets),
+            "refused": dict(self.refused),
+        }
+
+
+class LoopLagMonitor:
+    """Smoothed event-loop lag in milliseconds"""
+
+    def __init__(self, interval: float = LAG_INTERVAL, smoothing: float = LAG_SMOOTHING):
+        self.interval = interval
+        self.smoothing = smoothing
+        self.lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.observe: Optional[Callable[[float], None]] = None  # called with every sample, in seconds
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            sample = max(0.0, loop.time() - start - self.interval) * 1000
+            self.lag_ms += self.smoothing * (sample - self.lag_ms)
+            self.max_lag_ms = max(self.max_lag_ms, sample)
+            if self.observe is not None:
+                self.observe(sample / 1000)
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+class AdmissionController:
+    """Decides whether a node takes another join"""
+
+    def __init__(self, monitor: LoopLagMonitor, max_lag_ms: float, max_connections: int, retry_after: float):
+        self.monitor = monitor
+        self.max_lag_ms = max_lag_ms
+        self.max_connections = max_connections
+        self.retry_after = retry_after
+        self.rejected: Counter = Counter()  # reason -> joins turned away
+
+    def check(self, connections: int) -> Optional[str]:
+        """The reason to turn a join away, or None to admit it"""
+        if self.max_lag_ms > 0 and self.monitor.lag_ms > self.max_lag_ms:
+            reason = "overloaded"
+        elif self.max_connections > 0 and connections > self.max_connections:
+            reason = "full"
+        else:
+            return None
+        self.rejected[reason] += 1
+        return reason
+
+    def snapshot(self) -> dict:
+        return {
+            "loop_lag_ms": round(self.monitor.lag_ms, 2),
+            "max_loop_lag_ms": round(self.monitor.max_lag_ms, 2),
+            "rejected": dict(self.rejected),
+        }
@@ -0,0 +1,169 @@
+"""
+Background reaper for idle rooms, stale users and orphaned sessions
+Everything that should go away unless something happens first (an empty room nobody rejoins,
+a user whose connection dropped, a session whose socket died without a disconnect) is put on a
+hierarchical timer wheel under a (kind, key) pair. Scheduling and cancelling are O(1); a tick
+touches only the slot that is due, plus the occasional cascade of a higher level into a lower
+one, so the work per tick follows what expires, not how much is being watched.
+
+A handler per kind decides when the timer fires whether the object is really stale (the room
+may have filled up again) and reclaims it; reclaimed objects are counted per kind.
+"""
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds per wheel tick: the resolution of every TTL
+TICK = 1.0
+
+# 64 slots on each of 4 levels: 64 s, ~68 min, ~73 h and ~194 days at one tick per second
+SLOT_BITS = 6
+LEVELS = 4
+
+Key = Tuple[str, str]  # (kind, key)
+
+
+class TimerWheel:
+    """Hierarchical timing wheel counting in ticks.
+
+    Timers are stored as (deadline, key) in the slot of the lowest level whose span covers
+    them and move down a level when a higher slot comes due (cascading). Cancelling or
+    rescheduling only updates `deadlines`; outdated slot entries are skipped when reached.
+    """
+
+    def __init__(self, slot_bits: int = SLOT_BITS, levels: int = LEVELS):
+        self.bits = slot_bits
+        self.mask = (1 << slot_bits) - 1
+        self.levels = levels
+        self.slots: List[List[List[Tuple[int, Key]]]] = [[[] for _ in range(1 << slot_bits)] for _ in range(levels)]
+        self.deadlines: Dict[Key, int] = {}
+        self.current = 0
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def __contains__(self, key: Key):
+        return key in self.deadlines
+
+    def schedule(self, key: Key, ticks: int):
+        """Fire `key` after `ticks` ticks (at least one), replacing an earlier schedule"""
+        deadline = self.current + max(1, ticks)
+        self.deadlines[key] = deadline
+        self._insert(deadline, key)
+
+    def cancel(self, key: Key):
+        self.deadlines.pop(key, None)
+
+    def _insert(self, deadline: int, key: Key):
+        delta = deadline - self.current
+        position = deadline
+        for level in range(self.levels):
+            if delta < 1 << (self.bits * (level + 1)):
+                break
+        else:
+            # Beyond the wheel: park it in the farthest top-level slot and re-sort it from there
+            position = self.current + (1 << (self.bits * self.levels)) - 1
+        self.slots[level][(position >> (self.bits * level)) & self.mask].append((deadline, key))
+
+    def advance(self, ticks: int = 1) -> List[Key]:
+        """Move `ticks` ticks forward and return the keys that expired, in deadline order"""
+        expired = []
+        deadlines = self.deadlines
+        for _ in range(ticks):
+            self.current += 1
+            now = self.current
+            for level in range(1, self.levels):
+                if now & ((1 << (self.bits * level)) - 1):
+                    break
+                index = (now >> (self.bits * level)) & self.mask
+                entries, self.slots[level][index] = self.slots[level][index], []
+                for deadline, key in entries:
+                    if deadlines.get(key) == deadline:
+                        self._insert(deadline, key)
+            index = now & self.mask
+            entries, self.slots[0][index] = self.slots[0][index], []
+            for deadline, key in entries:
+                if deadlines.get(key) == deadline:
+                    del deadlines[key]
+                    expired.append(key)
+        return expired
+
+
+# handler(key) -> True if the object was reclaimed
+Handler = Callable[[str], Awaitable[bool]]
+
+
+class Reaper:
+    """Runs the timer wheel on the event loop and hands expired keys to their kind's handler"""
+
+    def __init__(self, tick: float = TICK, clock: Callable[[], float] = time.monotonic):
+        self.tick = tick
+        self.clock = clock
+        self.wheel = TimerWheel()
+        self.handlers: Dict[str, Handler] = {}
+        self.reclaimed: Counter = Counter()
+        self.checked: Counter = Counter()
+        self.started_at: Optional[float] = None
+        self.last_tick_ms = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+    def register(self, kind: str, handler: Handler):
+        self.handlers[kind] = handler
+        self.reclaimed[kind] += 0
+
+    def schedule(self, kind: str, key: str, seconds: float):
+        self.wheel.schedule((kind, key), -int(-seconds // self.tick))
+
+    def cancel(self, kind: str, key: str):
+        self.wheel.cancel((kind, key))
+
+    def scheduled(self, kind: str, key: str) -> bool:
+        return (kind, key) in self.wheel
+
+    async def advance(self, now: float):
+        """Expire everything due up to `now` (seconds on the reaper's clock)"""
+        if self.started_at is None:
+            self.started_at = now
+        ticks = int((now - self.started_at) / self.tick) - self.wheel.current
+        if ticks <= 0:
+            return
+        start = time.perf_counter()
+        for kind, key in self.wheel.advance(ticks):
+            self.checked[kind] += 1
+            try:
+                if await self.handlers[kind](key):
+                    self.reclaimed[kind] += 1
+            except Exception:
+                logger.exception("Reaping %s %s failed", kind, key)
+        self.last_tick_ms = (time.perf_counter() - start) * 1000
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            await self.advance(self.clock())
+            await asyncio.sleep(self.tick)
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def snapshot(self) -> dict:
+        return {
+            "scheduled": len(self.wheel),
+            "checked": dict(self.checked),
+            "reclaimed": dict(self.reclaimed),
+            "last_tick_ms": round(self.last_tick_ms, 3),
+        }
@@ -0,0 +1,303 @@
+"""
+Streaming recording ingest
+A browser recording arrives as the 1-second chunks MediaRecorder produces, each uploaded as
+soon as it is recorded and appended to the recording's current segment file while it streams
+in. Neither the browser nor the server holds more than a chunk, however long the recording.
+
+Every recording is a directory under the recordings directory:
+
+    recording.json   metadata: room, who recorded, mime type, start and stop, segment sizes
+    index            one fixed-size record per chunk: milliseconds since the start, byte
+                     offset in the recording and length, so a time maps to an offset with a
+                     binary search over the file
+    000000.seg ...   the media, a new segment once one reaches the segment size
+
+Downloads serve the segments as one file and honour HTTP range requests, so players can seek
+without fetching the whole recording. The admin dashboard lists recordings from the same
+directory (list_recordings).
+"""
+
+import asyncio
+import json
+import os
+import struct
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import aiofiles
+from starlette.responses import Response, StreamingResponse
+
+from file_relay import ChunkOutOfOrder, ChunkSizeError
+
+# A recording starts a new segment file once the current one reaches this size
+SEGMENT_SIZE = 256 * 1024 * 1024
+
+# Upper bound for one chunk; MediaRecorder's 1-second chunks are far smaller
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Bytes read per step when serving a download
+READ_BLOCK_SIZE = 256 * 1024
+
+META_FILE = "recording.json"
+INDEX_FILE = "index"
+INDEX_RECORD = struct.Struct("<QQI")  # time_ms, offset, length
+
+RECORDING = "recording"
+COMPLETE = "complete"
+
+
+class Recording:
+    """One recording: metadata plus where the next chunk goes"""
+
+    def __init__(self, recording_id: str, room_id: str, user_id: str, username: str, mime_type: str,
+                 started_at: Optional[str] = None, stopped_at: Optional[str] = None,
+                 segments: Optional[List[int]] = None, chunks: int = 0, duration_ms: int = 0):
+        self.id = recording_id
+        self.room_id = room_id
+        self.user_id = user_id
+        self.username = username
+        self.mime_type = mime_type
+        self.started_at = started_at or datetime.now().isoformat()
+        self.stopped_at = stopped_at
+        self.segments = segments if segments is not None else [0]  # byte size of every segment
+        self.chunks = chunks
+        self.duration_ms = duration_ms
+        self.lock = asyncio.Lock()
+
+    @property
+    def size(self) -> int:
+        return sum(self.segments)
+
+    @property
+    def next_chunk(self) -> int:
+        return self.chunks
+
+    def info(self) -> dict:
+        return {
+            "recording_id": self.id,
+            "room_id": self.room_id,
+            "user_id": self.user_id,
+            "username": self.username,
+            "mime_type": self.mime_type,
+            "started_at": self.started_at,
+            "stopped_at": self.stopped_at,
+            "status": COMPLETE if self.stopped_at else RECORDING,
+            "size": self.size,
+            "duration_ms": self.duration_ms,
+            "chunks": self.chunks,
+            "url": f"/api/rooms/{self.room_id}/recordings/{self.id}",
+        }
+
+    def status(self) -> dict:
+        return {"recording_id": self.id, "next_chunk": self.next_chunk, "size": self.size,
+                "status": COMPLETE if self.stopped_at else RECORDING}
+
+    def to_meta(self) -> dict:
+        return {
+            "recording_id": self.id, "room_id": self.room_id, "user_id": self.user_id,
+            "username": self.username, "mime_type": self.mime_type, "started_at": self.started_at,
+            "stopped_at": self.stopped_at, "segments": self.segments, "duration_ms": self.duration_ms,
+        }
+
+
+def segment_name(number: int) -> str:
+    return f"{number:06d}.seg"
+
+
+def _read_meta(path: str) -> dict:
+    with open(os.path.join(path, META_FILE)) as meta_file:
+        return json.load(meta_file)
+
+
+def list_recordings(directory: str) -> List[dict]:
+    """Metadata of every recording under `directory`, newest first (used by the admin dashboard)"""
+    result = []
+    try:
+        entries = os.listdir(directory)
+    except FileNotFoundError:
+        return result
+    for entry in entries:
+        try:
+            meta = _read_meta(os.path.join(directory, entry))
+        except (OSError, ValueError):
+            continue
+        meta["status"] = COMPLETE if meta.get("stopped_at") else RECORDING
+        meta["size"] = sum(meta.get("segments", ()))
+        result.append(meta)
+    result.sort(key=lambda meta: meta.get("started_at", ""), reverse=True)
+    return result
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """(first, last) byte of a single "bytes=" range, None for the whole file; ValueError if it
+    cannot be satisfied"""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    if not first:
+        if not last.isdigit() or int(last) == 0:
+            raise ValueError(header)
+        return max(0, size - int(last)), size - 1
+    if not first.isdigit() or (last and not last.isdigit()):
+        return None
+    first, last = int(first), min(int(last) if last else size - 1, size - 1)
+    if first > last:
+        raise ValueError(header)
+    return first, last
+
+
+class RecordingStore:
+    """Recordings of every room, one directory each under `directory`"""
+
+    def __init__(self, directory: str, segment_size: int = SEGMENT_SIZE):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.recordings: Dict[str, Recording] = {}
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, recording_id: str, name: str = "") -> str:
+        return os.path.join(self.directory, recording_id, name)
+
+    def _load(self):
+        """Pick up recordings of a previous run; the index says which bytes made it to disk"""
+        for entry in os.listdir(self.directory):
+            try:
+                meta = _read_meta(self._path(entry))
+                recording = Recording(meta["recording_id"], meta["room_id"], meta["user_id"], meta["username"],
+                                      meta["mime_type"], meta["started_at"], meta["stopped_at"],
+                                      meta["segments"], duration_ms=meta["duration_ms"])
+                index_size = os.path.getsize(self._path(entry, INDEX_FILE))
+            except (OSError, ValueError, KeyError):
+                continue
+            recording.chunks = index_size // INDEX_RECORD.size
+            if recording.chunks:
+                with open(self._path(entry, INDEX_FILE), "rb") as index:
+                    index.seek((recording.chunks - 1) * INDEX_RECORD.size)
+                    time_ms, offset, length = INDEX_RECORD.unpack(index.read(INDEX_RECORD.size))
+                end = offset + length
+                recording.duration_ms = max(recording.duration_ms, time_ms)
+            else:
+                end = 0
+            # Earlier segments were saved when they filled up; the last one ends where the index
+            # does, which drops the bytes of an unfinished chunk
+            full = recording.segments[:-1]
+            recording.segments = full + [max(0, end - sum(full))]
+            self.recordings[recording.id] = recording
+
+    def _save(self, recording: Recording):
+        path = self._path(recording.id, META_FILE)
+        with open(path + ".tmp", "w") as meta_file:
+            json.dump(recording.to_meta(), meta_file)
+        os.replace(path + ".tmp", path)
+
+    def create(self, room_id: str, user_id: str, username: str, mime_type: str) -> Recording:
+        recording = Recording(str(uuid.uuid4()), room_id, user_id, username, mime_type)
+        os.makedirs(self._path(recording.id))
+        open(self._path(recording.id, INDEX_FILE), "wb").close()
+        open(self._path(recording.id, segment_name(0)), "wb").close()
+        self._save(recording)
+        self.recordings[recording.id] = recording
+        return recording
+
+    def get(self, room_id: str, recording_id: str) -> Optional[Recording]:
+        recording = self.recordings.get(recording_id)
+        return recording if recording is not None and recording.room_id == room_id else None
+
+    def room_recordings(self, room_id: str) -> List[Recording]:
+        return [recording for recording in self.recordings.values() if recording.room_id == room_id]
+
+    async def append_chunk(self, recording: Recording, seq: int, time_ms: Optional[int],
+                           body: AsyncIterator[bytes]) -> bool:
+        """Append chunk `seq` from `body`; False if it was already stored (a retry)"""
+        async with recording.lock:
+            if seq < recording.chunks:
+                return False
+            if seq > recording.chunks or recording.stopped_at:
+                raise ChunkOutOfOrder(recording)
+            if recording.segments[-1] >= self.segment_size:
+                recording.segments.append(0)
+                self._save(recording)
+            segment = len(recording.segments) - 1
+            offset = recording.size
+            length = 0
+            async with aiofiles.open(self._path(recording.id, segment_name(segment)), "ab") as media:
+                await media.truncate(recording.segments[segment])  # leftovers of an interrupted attempt
+                async for data in body:
+                    length += len(data)
+                    if length > MAX_CHUNK_SIZE:
+                        raise ChunkSizeError(f"chunks are at most {MAX_CHUNK_SIZE} bytes")
+                    await media.write(data)
+            if time_ms is None:
+                time_ms = int((datetime.now() - datetime.fromisoformat(recording.started_at)).total_seconds() * 1000)
+            async with aiofiles.open(self._path(recording.id, INDEX_FILE), "r+b") as index:
+                await index.seek(seq * INDEX_RECORD.size)
+                await index.write(INDEX_RECORD.pack(time_ms, offset, length))
+            recording.segments[segment] += length
+            recording.chunks += 1
+            recording.duration_ms = max(recording.duration_ms, time_ms)
+            return True
+
+    async def stop(self, recording: Recording) -> Recording:
+        async with recording.lock:
+            if not recording.stopped_at:
+                stopped = datetime.now()
+                elapsed = stopped - datetime.fromisoformat(recording.started_at)
+                recording.stopped_at = stopped.isoformat()
+                recording.duration_ms = max(recording.duration_ms, int(elapsed.total_seconds() * 1000))
+                self._save(recording)
+        return recording
+
+    async def seek(self, recording: Recording, time_ms: int) -> dict:
+        """The chunk playing at `time_ms`: binary search over the on-disk index"""
+        low, high = 0, recording.chunks - 1
+        found = (0, 0, 0)
+        async with aiofiles.open(self._path(recording.id, INDEX_FILE), "rb") as index:
+            while low <= high:
+                middle = (low + high) // 2
+                await index.seek(middle * INDEX_RECORD.size)
+                record = INDEX_RECORD.unpack(await index.read(INDEX_RECORD.size))
+                if record[0] <= time_ms:
+                    found, low = record, middle + 1
+                else:
+                    high = middle - 1
+        chunk_time, offset, length = found
+        return {"recording_id": recording.id, "time_ms": chunk_time, "offset": offset, "length": length}
+
+    def response(self, recording: Recording, range_header: Optional[str]) -> Response:
+        size = recording.size
+        headers = {"Accept-Ranges": "bytes"}
+        try:
+            requested = parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        first, last = requested or (0, size - 1)
+        if requested is not None:
+            headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+        headers["Content-Length"] = str(max(0, last - first + 1))
+        return StreamingResponse(self._read(recording, first, last), status_code=206 if requested else 200,
+                                 media_type=recording.mime_type, headers=headers)
+
+    async def _read(self, recording: Recording, first: int, last: int):
+        start = 0
+        for number, size in enumerate(list(recording.segments)):
+            end = start + size  # this segment holds bytes start .. end - 1
+            if end > first and start <= last:
+                async with aiofiles.open(self._path(recording.id, segment_name(number)), "rb") as media:
+                    position = max(first, start)
+                    await media.seek(position - start)
+                    while position <= min(last, end - 1):
+                        data = await media.read(min(READ_BLOCK_SIZE, min(last, end - 1) - position + 1))
+                        if not data:
+                            return
+                        position += len(data)
+                        yield data
+            start = end
+
+    def snapshot(self) -> dict:
+        return {
+            "recordings": len(self.recordings),
+            "recording_now": sum(1 for recording in self.recordings.values() if not recording.stopped_at),
+            "bytes": sum(recording.size for recording in self.recordings.values()),
+        }
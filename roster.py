@@ -0,0 +1,182 @@
+"""
+Versioned per-room participant roster
+Each room keeps its participant entries in join order together with a version that every
+join, leave and media toggle bumps, and a bounded log of the changes. Clients take one full
+snapshot and then apply roster_delta changes in version order; a client that still knows a
+recent (epoch, version) pair can catch up from the log instead of taking a new snapshot.
+Large rooms are read page by page (Roster.page) and per role (Roster.by_role) instead.
+"""
+
+import bisect
+import uuid
+from collections import deque
+from itertools import islice
+from typing import Deque, Dict, List, Optional, Tuple
+
+ROSTER_LOG_SIZE = 256
+
+# User attributes that are part of a roster entry and can change while the user is in the room
+ROSTER_FIELDS = ("username", "role", "is_video_enabled", "is_audio_enabled")
+
+
+def participant_entry(user) -> dict:
+    return {
+        "user_id": user.id,
+        "username": user.username,
+        "role": user.role,
+        "is_video_enabled": user.is_video_enabled,
+        "is_audio_enabled": user.is_audio_enabled,
+        "joined_at": user.joined_at.isoformat(),
+    }
+
+
+class Roster:
+    """Participants of one room with a monotonically increasing version.
+
+    Entries are never mutated in place, and snapshot() returns a cached list that is rebuilt
+    only after a change, so both can be handed out without copying.
+    """
+
+    def __init__(self, log_size: int = ROSTER_LOG_SIZE):
+        # Versions are only comparable within one epoch (one roster instance in one process)
+        self.epoch = uuid.uuid4().hex[:12]
+        self.version = 0
+        self.entries: Dict[str, dict] = {}  # user_id -> entry, in join order
+        self.log: Deque[dict] = deque(maxlen=log_size)
+        self.roles: Dict[str, Dict[str, dict]] = {}  # role -> user_id -> entry, in join order
+        self._snapshot: Optional[List[dict]] = None
+        # Pagination: every join gets a sequence number (the version it created). _order keeps
+        # them sorted for bisect; departed sequences are skipped and compacted away lazily.
+        # _role_order does the same per role, so a filtered page never walks the other roles.
+        self.seqs: Dict[str, int] = {}      # user_id -> join sequence
+        self._by_seq: Dict[int, str] = {}   # join sequence -> user_id
+        self._order: List[int] = []
+        self._role_order: Dict[Optional[str], List[int]] = {}
+
+    @classmethod
+    def from_entries(cls, entries: List[dict], log_size: int = ROSTER_LOG_SIZE) -> "Roster":
+        """A roster holding `entries` in this order, built in one pass instead of one join each"""
+        roster = cls(log_size)
+        for seq, entry in enumerate(entries, 1):
+            user_id = entry["user_id"]
+            roster.entries[user_id] = entry
+            roster.roles.setdefault(entry.get("role"), {})[user_id] = entry
+            roster.seqs[user_id] = seq
+            roster._by_seq[seq] = user_id
+            roster._role_order.setdefault(entry.get("role"), []).append(seq)
+        roster._order = list(range(1, len(roster.entries) + 1))
+        roster.version = len(roster.entries)
+        return roster
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, user_id):
+        return user_id in self.entries
+
+    def _record(self, change: dict) -> dict:
+        self.version += 1
+        change["version"] = self.version
+        self.log.append(change)
+        self._snapshot = None
+        return change
+
+    def join(self, entry: dict) -> dict:
+        user_id = entry["user_id"]
+        if user_id in self.entries:
+            self._unlink(user_id)
+        change = self._record({"op": "join", "user_id": user_id, "participant": entry})
+        seq = change["version"]
+        self.entries[user_id] = entry
+        self.roles.setdefault(entry.get("role"), {})[user_id] = entry
+        self.seqs[user_id] = seq
+        self._by_seq[seq] = user_id
+        self._order.append(seq)
+        self._role_order.setdefault(entry.get("role"), []).append(seq)
+        return change
+
+    def leave(self, user_id: str) -> Optional[dict]:
+        if user_id not in self.entries:
+            return None
+        self._unlink(user_id)
+        return self._record({"op": "leave", "user_id": user_id})
+
+    def _unlink(self, user_id: str):
+        entry = self.entries.pop(user_id)
+        self.roles.get(entry.get("role"), {}).pop(user_id, None)
+        del self._by_seq[self.seqs.pop(user_id)]
+        if len(self._order) > 2 * len(self.entries) + 64:
+            self._order = [seq for seq in self._order if seq in self._by_seq]
+        self._compact_role(entry.get("role"))
+
+    def _compact_role(self, role: Optional[str]):
+        # Drops the sequences of users who left or changed role once they outnumber the live ones
+        order = self._role_order.get(role)
+        if order is not None and len(order) > 2 * self.count(role) + 64:
+            members = self.roles.get(role, {})
+            self._role_order[role] = [seq for seq in order if self._by_seq.get(seq) in members]
+
+    def update(self, user_id: str, fields: dict) -> Optional[dict]:
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        changed = {name: value for name, value in fields.items() if entry.get(name) != value}
+        if not changed:
+            return None
+        updated = self.entries[user_id] = {**entry, **changed}
+        if updated.get("role") != entry.get("role"):
+            self.roles.get(entry.get("role"), {}).pop(user_id, None)
+            # The user keeps its join sequence, so it goes into the new role's order by bisect
+            order = self._role_order.setdefault(updated.get("role"), [])
+            seq = self.seqs[user_id]
+            index = bisect.bisect_left(order, seq)
+            if index == len(order) or order[index] != seq:
+                order.insert(index, seq)
+            self._compact_role(entry.get("role"))
+        self.roles.setdefault(updated.get("role"), {})[user_id] = updated
+        return self._record({"op": "update", "user_id": user_id, "fields": changed})
+
+    def snapshot(self) -> List[dict]:
+        if self._snapshot is None:
+            self._snapshot = list(self.entries.values())
+        return self._snapshot
+
+    def by_role(self, role: str) -> List[dict]:
+        return list(self.roles.get(role, {}).values())
+
+    def count(self, role: str) -> int:
+        return len(self.roles.get(role, ()))
+
+    def page(self, after: int = 0, limit: int = 100, role: Optional[str] = None) -> Tuple[List[dict], Optional[int]]:
+        """Entries that joined after sequence `after`, in join order, and the cursor for the next
+        page (None once the end is reached). Cost depends on the page size, not the room size,
+        with or without a role filter."""
+        order = self._order if role is None else self._role_order.get(role, [])
+        by_seq, entries = self._by_seq, self.entries
+        index = bisect.bisect_right(order, after)
+        result: List[dict] = []
+        last = after
+        while index < len(order) and len(result) < limit:
+            last = order[index]
+            index += 1
+            user_id = by_seq.get(last)
+            if user_id is None:
+                continue
+            entry = entries[user_id]
+            if role is None or entry.get("role") == role:
+                result.append(entry)
+        return result, (last if index < len(order) else None)
+
+    def changes_since(self, version: int) -> Optional[List[dict]]:
+        """Changes after `version`, or None if the log no longer covers it"""
+        if version == self.version:
+            return []
+        if version > self.version or not self.log:
+            return None
+        start = version + 1 - self.log[0]["version"]
+        if start < 0:
+            return None
+        return list(islice(self.log, start, None))
+
+    def state(self) -> dict:
+        return {"roster_epoch": self.epoch, "roster_version": self.version}
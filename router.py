@@ -0,0 +1,348 @@
+"""
+Room-affinity front router
+Pins every room to one worker by consistent hashing so that all of its signaling stays
+in that worker's memory. /room/{room_id}, /api/rooms/{room_id} and /socket.io requests
+carrying ?room_id= are routed to the owner; anything else goes to any live worker.
+
+Run with workers started separately:
+    python router.py --listen 0.0.0.0:8000 --worker w1=127.0.0.1:8001 --worker w2=127.0.0.1:8002
+or let the router start them:
+    python router.py --listen 0.0.0.0:8000 --spawn 4
+
+Workers are added or drained at runtime from the local machine:
+    curl -X POST "http://localhost:8000/_router/workers?name=w3&addr=127.0.0.1:8003"
+    curl -X DELETE http://localhost:8000/_router/workers/w1
+    curl http://localhost:8000/_router/status
+"""
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import itertools
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+MAX_HEAD_SIZE = 64 * 1024
+ROOM_PATH = re.compile(r"^/(?:room|api/rooms)/([^/?#]+)")
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes"""
+
+    def __init__(self, replicas: int = 128):
+        self.replicas = replicas
+        self._keys: List[int] = []
+        self._owners: List[str] = []
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+    def add(self, node: str):
+        for i in range(self.replicas):
+            key = self._hash(f"{node}#{i}")
+            index = bisect.bisect(self._keys, key)
+            self._keys.insert(index, key)
+            self._owners.insert(index, node)
+
+    def remove(self, node: str):
+        kept = [(key, owner) for key, owner in zip(self._keys, self._owners) if owner != node]
+        self._keys = [key for key, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def get(self, key: str) -> Optional[str]:
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._owners[index]
+
+    @property
+    def nodes(self) -> Set[str]:
+        return set(self._owners)
+
+
+class AffinityRouter:
+    def __init__(self, replicas: int = 128):
+        self.ring = HashRing(replicas)
+        self.workers: Dict[str, Tuple[str, int]] = {}   # name -> (host, port)
+        self.draining: Set[str] = set()
+        self.connections: Dict[str, Set[asyncio.StreamWriter]] = {}  # room_id -> client writers
+        self.room_owner: Dict[str, str] = {}            # room_id -> worker, for rooms with open connections
+        self._round_robin = itertools.count()
+
+    # Membership
+    def add_worker(self, name: str, host: str, port: int):
+        """Add a worker and move the active rooms whose ring owner changed"""
+        self.workers[name] = (host, port)
+        self.draining.discard(name)
+        self.ring.add(name)
+        return self.rebalance()
+
+    def drain_worker(self, name: str):
+        """Stop routing to a worker and move its active rooms to their new owners"""
+        if name not in self.workers:
+            return 0
+        self.draining.add(name)
+        self.ring.remove(name)
+        moved = self.rebalance()
+        if not any(owner == name for owner in self.room_owner.values()):
+            self._forget(name)
+        return moved
+
+    def _forget(self, name: str):
+        self.workers.pop(name, None)
+        self.draining.discard(name)
+
+    def rebalance(self) -> int:
+        """Disconnect the clients of every room that is now owned by another worker.
+        Clients reconnect through the router and land on the new owner."""
+        moved = 0
+        for room_id, owner in list(self.room_owner.items()):
+            if self.ring.get(room_id) != owner:
+                for writer in list(self.connections.get(room_id, ())):
+                    writer.close()
+                moved += 1
+        return moved
+
+    def pick(self, room_id: Optional[str]) -> Optional[str]:
+        if room_id:
+            return self.ring.get(room_id)
+        live = sorted(self.ring.nodes)
+        if not live:
+            return None
+        return live[next(self._round_robin) % len(live)]
+
+    def status(self) -> dict:
+        rooms_per_worker: Dict[str, int] = {}
+        for owner in self.room_owner.values():
+            rooms_per_worker[owner] = rooms_per_worker.get(owner, 0) + 1
+        return {
+            "workers": {
+                name: {
+                    "addr": f"{host}:{port}",
+                    "draining": name in self.draining,
+                    "active_rooms": rooms_per_worker.get(name, 0),
+                }
+                for name, (host, port) in self.workers.items()
+            },
+            "active_rooms": len(self.room_owner),
+        }
+
+    # Connection tracking
+    def _track(self, room_id: str, worker: str, writer: asyncio.StreamWriter):
+        self.connections.setdefault(room_id, set()).add(writer)
+        self.room_owner[room_id] = worker
+
+    def _untrack(self, room_id: str, writer: asyncio.StreamWriter):
+        writers = self.connections.get(room_id)
+        if writers is None:
+            return
+        writers.discard(writer)
+        if not writers:
+            del self.connections[room_id]
+            owner = self.room_owner.pop(room_id, None)
+            if owner in self.draining and owner not in self.room_owner.values():
+                self._forget(owner)
+                logger.info("Worker %s drained", owner)
+
+    # Proxy
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+
+        request_line, _, header_block = head.partition(b"\r\n")
+        try:
+            method, target, _version = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            writer.close()
+            return
+
+        if target.startswith("/_router/"):
+            await self._handle_control(method, target, writer)
+            return
+
+        room_id = route_key(target)
+        worker = self.pick(room_id)
+        if worker is None:
+            await _respond(writer, 503, {"detail": "No workers available"})
+            return
+
+        headers = header_block.decode("latin-1")
+        upgrade = "upgrade" in _header(headers, "connection").lower()
+        if not upgrade:
+            # One request per upstream connection, so every request is routed on its own
+            head = _with_connection_close(request_line, headers)
+
+        host, port = self.workers[worker]
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(host, port)
+        except OSError:
+            await _respond(writer, 502, {"detail": f"Worker {worker} unavailable"})
+            return
+
+        if room_id:
+            self._track(room_id, worker, writer)
+        upstream_writer.write(head)
+        to_upstream = asyncio.ensure_future(_pipe(reader, upstream_writer))
+        try:
+            # The exchange is over once the worker side finishes (response sent or WebSocket closed)
+            await _pipe(upstream_reader, writer)
+        finally:
+            to_upstream.cancel()
+            if room_id:
+                self._untrack(room_id, writer)
+            upstream_writer.close()
+            writer.close()
+
+    async def _handle_control(self, method: str, target: str, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info("peername")
+        if peer and peer[0] not in ("127.0.0.1", "::1"):
+            await _respond(writer, 403, {"detail": "Router control is only available locally"})
+            return
+
+        url = urlsplit(target)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if method == "GET" and url.path == "/_router/status":
+            await _respond(writer, 200, self.status())
+        elif method == "POST" and url.path == "/_router/workers" and "name" in query and "addr" in query:
+            host, port = parse_addr(query["addr"])
+            moved = self.add_worker(query["name"], host, port)
+            await _respond(writer, 200, {"added": query["name"], "moved_rooms": moved})
+        elif method == "DELETE" and url.path.startswith("/_router/workers/"):
+            name = url.path.rsplit("/", 1)[1]
+            if name not in self.workers:
+                await _respond(writer, 404, {"detail": "Worker not found"})
+                return
+            moved = self.drain_worker(name)
+            await _respond(writer, 200, {"draining": name, "moved_rooms": moved})
+        else:
+            await _respond(writer, 404, {"detail": "Not found"})
+
+
+def route_key(target: str) -> Optional[str]:
+    """Room id a request belongs to, or None if any worker can serve it"""
+    url = urlsplit(target)
+    match = ROOM_PATH.match(url.path)
+    if match:
+        return match.group(1)
+    if url.path.startswith("/socket.io"):
+        return parse_qs(url.query).get("room_id", [None])[0]
+    return None
+
+
+def parse_addr(addr: str) -> Tuple[str, int]:
+    host, _, port = addr.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def _header(headers: str, name: str) -> str:
+    prefix = name.lower() + ":"
+    for line in headers.split("\r\n"):
+        if line.lower().startswith(prefix):
+            return line.split(":", 1)[1].strip()
+    return ""
+
+
+def _with_connection_close(request_line: bytes, headers: str) -> bytes:
+    lines = [line for line in headers.split("\r\n")
+             if line and not line.lower().startswith(("connection:", "keep-alive:"))]
+    lines.append("Connection: close")
+    return request_line + b"\r\n" + "\r\n".join(lines).encode("latin-1") + b"\r\n\r\n"
+
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, OSError):
+        pass
+    finally:
+        if writer.can_write_eof():
+            try:
+                writer.write_eof()
+            except (ConnectionError, OSError):
+                pass
+
+
+async def _respond(writer: asyncio.StreamWriter, status: int, body: dict):
+    payload = json.dumps(body).encode()
+    reason = {200: "OK", 403: "Forbidden", 404: "Not Found", 502: "Bad Gateway", 503: "Service Unavailable"}[status]
+    writer.write(
+        f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload
+    )
+    try:
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+def spawn_workers(count: int, base_port: int) -> List[Tuple[str, str, int, subprocess.Popen]]:
+    """Start `count` single-process workers on consecutive ports (no backplane needed)"""
+    env = {key: value for key, value in os.environ.items() if key != "MYCONFAPP_BACKPLANE"}
+    workers = []
+    for i in range(count):
+        port = base_port + i
+        # Each worker saves and restores the rooms it owns in its own state database
+        worker_env = dict(env) if "MYCONFAPP_STATE_DB" in env else {**env, "MYCONFAPP_STATE_DB": f"sqlite:///state-w{i + 1}.db"}
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:socket_app", "--host", "127.0.0.1", "--port", str(port)],
+            env=worker_env,
+        )
+        workers.append((f"w{i + 1}", "127.0.0.1", port, process))
+    return workers
+
+
+async def serve(router: AffinityRouter, host: str, port: int):
+    server = await asyncio.start_server(router.handle_client, host, port, limit=MAX_HEAD_SIZE)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Room-affinity router for Teams Clone workers")
+    parser.add_argument("--listen", default="0.0.0.0:8000")
+    parser.add_argument("--worker", action="append", default=[], help="name=host:port, repeatable")
+    parser.add_argument("--spawn", type=int, default=0, help="start N local workers")
+    parser.add_argument("--spawn-base-port", type=int, default=8001)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    router = AffinityRouter()
+    processes = []
+    for name, host, port, process in spawn_workers(args.spawn, args.spawn_base_port):
+        router.add_worker(name, host, port)
+        processes.append(process)
+    for spec in args.worker:
+        name, _, addr = spec.partition("=")
+        router.add_worker(name, *parse_addr(addr))
+
+    host, port = parse_addr(args.listen)
+    print(f"🧭 Room-affinity router on http://{host}:{port} -> {', '.join(router.workers)}")
+    try:
+        asyncio.run(serve(router, host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,539 @@
+"""
+Meeting scheduler
+Meetings booked ahead (schedule_meeting from the room page, or the admin server's meetings
+page) are stored in a table indexed by id and by status and start time. Each worker keeps the
+meetings whose first timer falls within HORIZON in memory, with their timers on one min-heap,
+and a single task sleeping until the earliest is due:
+
+    prewarm     the meeting's room is opened `prewarm` seconds before the start
+    remind      the organizer is reminded `remind` seconds before the start
+    start       the meeting becomes active
+    end         the meeting is over: completed, and its room closed
+
+Booking a meeting is a heap push and cancelling it only drops it from the id index (its
+heap entries are skipped when they reach the top, and the heap is rebuilt once they
+outnumber the live ones), so both are O(log n) and the task wakes only when something is due,
+however many meetings are booked. Later meetings stay in the database only; the window is
+read again from the start time index every REFILL_INTERVAL, and at once when the admin server
+asks (after it created, changed, started or ended a meeting).
+
+Several workers may load the same meetings: a timer is claimed with a conditional update of
+the meeting's `fired` bits before it is acted on, so exactly one worker opens, reminds and
+closes. A missed timer (the server was down) fires when the meeting is loaded, unless it is
+pointless by then: no reminder after the start, no room for a meeting that is already over.
+
+Dates and times are read in the server's local time zone, as the forms send them without one.
+Persistence needs the optional sqlalchemy package; without it meetings are kept in memory only.
+"""
+
+import asyncio
+import heapq
+import json
+import logging
+import re
+import secrets
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import sqlalchemy
+    from sqlalchemy import Column, Float, Index, Integer, MetaData, String, Table, Text
+except ImportError:  # optional dependency
+    sqlalchemy = None
+
+logger = logging.getLogger(__name__)
+
+SCHEDULED = "scheduled"
+ACTIVE = "active"
+COMPLETED = "completed"
+CANCELLED = "cancelled"
+STATUSES = (SCHEDULED, ACTIVE, COMPLETED, CANCELLED)
+PENDING = (SCHEDULED, ACTIVE)
+
+# Timers of a meeting, as bits of its `fired` column, in the order they fire at the same time
+PREWARM = 1
+REMIND = 2
+START = 4
+END = 8
+TIMERS = {PREWARM: "prewarm", REMIND: "remind", START: "start", END: "end"}
+
+# Meetings whose first timer is due within this many seconds are kept in memory
+HORIZON = 3600.0
+
+# Seconds between reloads of that window from the database
+REFILL_INTERVAL = 60.0
+
+# Seconds to wait after the database failed a claim or a refill
+RETRY_INTERVAL = 5.0
+
+# The heap is rebuilt from the live meetings when it holds this many entries per timer they have left
+COMPACT_RATIO = 2
+COMPACT_MIN = 1024
+
+# Meetings read from the database per query of an export
+EXPORT_BATCH = 1000
+
+DEFAULT_DURATION = 60
+MAX_DURATION = 24 * 60
+MAX_TITLE = 200
+MAX_DESCRIPTION = 2000
+MAX_PARTICIPANTS = 500
+MEETING_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Stored in the `data` column; the indexed fields have columns of their own
+DATA_FIELDS = ("title", "organizer", "organizer_id", "room_id", "date", "start_time", "duration", "description",
+               "participants", "recurring", "auto_record", "created_at")
+
+if sqlalchemy is not None:
+    metadata = MetaData()
+    meetings_table = Table(
+        "scheduled_meetings", metadata,
+        Column("id", String(64), primary_key=True),
+        Column("start_at", Float, nullable=False),
+        Column("end_at", Float, nullable=False),
+        Column("status", String(16), nullable=False),
+        Column("fired", Integer, nullable=False, default=0),
+        Column("data", Text, nullable=False),
+        Index("ix_scheduled_meetings_start_at", "start_at"),
+        Index("ix_scheduled_meetings_status_start_at", "status", "start_at"),
+    )
+
+
+def available() -> bool:
+    return sqlalchemy is not None
+
+
+def _text(value, limit: int) -> str:
+    return str(value or "").strip()[:limit]
+
+
+def parse_meeting(data: dict, organizer: Optional[str] = None, organizer_id: Optional[str] = None) -> dict:
+    """A new meeting from the fields of a schedule form (the room page's or the admin page's);
+    ValueError if they do not describe one"""
+    title = _text(data.get("title"), MAX_TITLE)
+    if not title:
+        raise ValueError("A meeting needs a title")
+    meeting_id = str(data.get("id") or "meeting-" + secrets.token_hex(6))
+    if not MEETING_ID.match(meeting_id):
+        raise ValueError("Invalid meeting id")
+    participants = data.get("participants", data.get("attendees")) or []
+    if isinstance(participants, str):
+        participants = participants.split(",")
+    meeting = {
+        "id": meeting_id,
+        "title": title,
+        "organizer": _text(organizer if organizer is not None else data.get("organizer"), MAX_TITLE),
+        "organizer_id": organizer_id,
+        "room_id": meeting_id,  # a meeting's link is /room/{id}
+        "description": _text(data.get("description"), MAX_DESCRIPTION),
+        "participants": [name for name in (_text(name, MAX_TITLE) for name in participants[:MAX_PARTICIPANTS]) if name],
+        "recurring": bool(data.get("recurring")),
+        "auto_record": bool(data.get("recordingEnabled", data.get("autoRecord"))),
+        "created_at": datetime.now().isoformat(),
+        "status": SCHEDULED,
+        "fired": 0,
+    }
+    meeting.update(schedule_fields(data))
+    return meeting
+
+
+def schedule_fields(data: dict) -> dict:
+    """date, start_time and duration of a form, and the start and end they mean; ValueError if unusable"""
+    date = _text(data.get("date"), 10)
+    start_time = _text(data.get("start_time", data.get("startTime")), 5)
+    try:
+        start = datetime.strptime(f"{date} {start_time}", "%Y-%m-%d %H:%M")
+        duration = int(data.get("duration") or DEFAULT_DURATION)
+    except (TypeError, ValueError):
+        raise ValueError("A meeting needs a date (YYYY-MM-DD), a start time (HH:MM) and a duration in minutes")
+    if not 1 <= duration <= MAX_DURATION:
+        raise ValueError(f"Duration must be between 1 and {MAX_DURATION} minutes")
+    start_at = start.timestamp()
+    return {"date": date, "start_time": start_time, "duration": duration,
+            "start_at": start_at, "end_at": start_at + duration * 60}
+
+
+def schedule_at(start_at: float, duration: int) -> dict:
+    """The schedule fields of a meeting moved to `start_at`, with the form's date and start_time
+    (server local time) following it"""
+    start = datetime.fromtimestamp(start_at)
+    return {"date": start.strftime("%Y-%m-%d"), "start_time": start.strftime("%H:%M"),
+            "start_at": start_at, "end_at": start_at + duration * 60}
+
+
+# handler(meeting) for one kind of timer
+Handler = Callable[[dict], Awaitable[None]]
+
+Entry = Tuple[float, int, str]  # (due, timer bit, meeting id)
+
+
+class Scheduler:
+    """Meeting store plus the timer heap of the meetings due soon"""
+
+    def __init__(self, url: Optional[str], prewarm: float = 300.0, remind: float = 600.0,
+                 horizon: float = HORIZON, refill_interval: float = REFILL_INTERVAL,
+                 clock: Callable[[], float] = time.time, timers: bool = True):
+        self.prewarm = prewarm
+        self.remind = remind
+        self.horizon = horizon
+        self.refill_interval = refill_interval
+        self.clock = clock
+        # The admin server only stores meetings (timers=False); the workers run their timers
+        self.timers = timers
+        self.meetings: Dict[str, dict] = {}  # id -> meeting, those within the window
+        self.heap: List[Entry] = []
+        self.handlers: Dict[int, Handler] = {}
+        self.fired: Counter = Counter()
+        self.lost: Counter = Counter()  # timers claimed by another worker, or of meetings cancelled meanwhile
+        self.next_refill = 0.0
+        self.engine = None
+        self.task: Optional[asyncio.Task] = None
+        self._sleep: Optional[asyncio.Future] = None  # what the timer task waits on until the next due time
+        if url and available():
+            # One thread for the database: claims and writes stay in order
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scheduler")
+            self.engine = sqlalchemy.create_engine(url)
+            if self.engine.dialect.name == "sqlite":
+                sqlalchemy.event.listen(self.engine, "connect", _sqlite_pragmas)
+            metadata.create_all(self.engine)
+        elif url:
+            logger.warning("Meeting persistence needs sqlalchemy (pip install sqlalchemy), keeping meetings in memory only")
+
+    @property
+    def persistent(self) -> bool:
+        return self.engine is not None
+
+    def register(self, timer: int, handler: Handler):
+        self.handlers[timer] = handler
+
+    def due(self, meeting: dict, timer: int) -> float:
+        if timer == PREWARM:
+            return meeting["start_at"] - self.prewarm
+        if timer == REMIND:
+            return meeting["start_at"] - self.remind
+        return meeting["start_at"] if timer == START else meeting["end_at"]
+
+    def _timers(self, meeting: dict, now: float) -> Iterator[Entry]:
+        for timer in TIMERS:
+            if meeting["fired"] & timer:
+                continue
+            if (timer == REMIND and now >= meeting["start_at"]) or (timer in (PREWARM, START) and now >= meeting["end_at"]):
+                continue  # too late to be of use
+            yield self.due(meeting, timer), timer, meeting["id"]
+
+    def _in_window(self, meeting: dict, now: float) -> bool:
+        return meeting["status"] in PENDING and \
+            meeting["start_at"] - max(self.prewarm, self.remind, 0) <= now + self.horizon
+
+    def _hold(self, meeting: dict):
+        """Keep a meeting in memory and put its timers on the heap (replacing an older copy)"""
+        now = self.clock()
+        self.meetings[meeting["id"]] = meeting
+        earliest = self.heap[0][0] if self.heap else None
+        for entry in self._timers(meeting, now):
+            heapq.heappush(self.heap, entry)
+        if len(self.heap) > COMPACT_MIN and len(self.heap) > COMPACT_RATIO * len(TIMERS) * len(self.meetings):
+            self._compact(now)
+        if self.heap and (earliest is None or self.heap[0][0] < earliest):
+            self._wake()
+
+    def _compact(self, now: float):
+        self.heap = [entry for meeting in self.meetings.values() for entry in self._timers(meeting, now)]
+        heapq.heapify(self.heap)
+
+    def _holds_timers(self) -> bool:
+        return self.timers or self.engine is None
+
+    async def _run_db(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def add(self, meeting: dict) -> dict:
+        """Store a new meeting; ValueError if its id is taken or it is over already"""
+        if meeting["end_at"] <= self.clock():
+            raise ValueError("The meeting is over already")
+        if self.engine is not None:
+            await self._run_db(self._insert, meeting)
+        elif meeting["id"] in self.meetings:
+            raise ValueError("A meeting with this id exists")
+        if self._holds_timers() and (self.engine is None or self._in_window(meeting, self.clock())):
+            self._hold(dict(meeting))
+        return meeting
+
+    async def update(self, meeting_id: str, reschedule: bool = False, **fields) -> Optional[dict]:
+        """Change a pending meeting (None if there is none by that id); a new start or end
+        reschedules its timers. With `reschedule`, a new start also clears the timers that fired
+        for the old one. Which timers fired is decided here, never taken from the caller."""
+        if self.engine is not None:
+            meeting = await self._run_db(self._update, meeting_id, fields, reschedule)
+        else:
+            meeting = self.meetings.get(meeting_id)
+            if meeting is None or meeting["status"] not in PENDING:
+                return None
+            restart = reschedule and fields.get("start_at", meeting["start_at"]) != meeting["start_at"]
+            meeting = {**meeting, **fields}
+            if restart:
+                meeting["fired"] = 0
+        if meeting is None:
+            return None
+        if self._holds_timers():
+            if meeting["status"] in PENDING and (self.engine is None or self._in_window(meeting, self.clock())):
+                self._hold(meeting)
+            else:
+                self.meetings.pop(meeting_id, None)
+        return meeting
+
+    async def cancel(self, meeting_id: str) -> Optional[dict]:
+        """Cancel a pending meeting; its timers are dropped when they come up. None if there is none"""
+        return await self.update(meeting_id, status=CANCELLED)
+
+    async def get(self, meeting_id: str) -> Optional[dict]:
+        if self.engine is not None:
+            return await self._run_db(self._get, meeting_id)
+        meeting = self.meetings.get(meeting_id)
+        return dict(meeting) if meeting is not None else None
+
+    async def page(self, since: Optional[float] = None, status: Optional[str] = None, limit: int = 100) -> List[dict]:
+        """Up to `limit` meetings starting at `since` or later, optionally of one status, by start time"""
+        if self.engine is not None:
+            return await self._run_db(self._page, since, status, limit)
+        meetings = [meeting for meeting in self.meetings.values()
+                    if (since is None or meeting["start_at"] >= since) and (status is None or meeting["status"] == status)]
+        return [dict(meeting) for meeting in sorted(meetings, key=lambda meeting: meeting["start_at"])[:limit]]
+
+    async def counts(self, since: Optional[float] = None) -> Dict[str, int]:
+        """Meetings per status, of those starting at `since` or later"""
+        if self.engine is not None:
+            counts = await self._run_db(self._counts, since)
+        else:
+            counts = Counter(meeting["status"] for meeting in self.meetings.values()
+                             if since is None or meeting["start_at"] >= since)
+        return {status: counts.get(status, 0) for status in STATUSES}
+
+    def export(self) -> Iterator[dict]:
+        """Every meeting by start time, read in batches (a plain generator, for a threadpool)"""
+        if self.engine is None:
+            yield from (dict(meeting) for meeting in sorted(self.meetings.values(), key=lambda meeting: meeting["start_at"]))
+            return
+        table = meetings_table
+        after: Optional[Tuple[float, str]] = None
+        while True:
+            query = sqlalchemy.select(table).order_by(table.c.start_at, table.c.id).limit(EXPORT_BATCH)
+            if after is not None:
+                query = query.where(sqlalchemy.tuple_(table.c.start_at, table.c.id) > after)
+            with self.engine.connect() as connection:
+                batch = [_from_row(row) for row in connection.execute(query)]
+            yield from batch
+            if len(batch) < EXPORT_BATCH:
+                return
+            after = (batch[-1]["start_at"], batch[-1]["id"])
+
+    async def refill(self):
+        """Load the meetings due within the window from the database, taking changes made elsewhere"""
+        now = self.clock()
+        self.next_refill = now + self.refill_interval
+        if self.engine is None:
+            return
+        rows = await self._run_db(self._window, now + self.horizon + max(self.prewarm, self.remind, 0))
+        pending = set()
+        for meeting in rows:
+            pending.add(meeting["id"])
+            held = self.meetings.get(meeting["id"])
+            if held is None or (held["start_at"], held["end_at"], held["status"]) != \
+                    (meeting["start_at"], meeting["end_at"], meeting["status"]):
+                self._hold(meeting)
+            else:
+                held["fired"] |= meeting["fired"]
+        # Cancelled or ended elsewhere: their heap entries become stale
+        for meeting_id in self.meetings.keys() - pending:
+            del self.meetings[meeting_id]
+
+    async def _claim(self, meeting: dict, timer: int) -> Tuple[bool, Optional[str]]:
+        """Take a timer so no other worker acts on it: (claimed, the meeting's status)"""
+        status = ACTIVE if timer == START else COMPLETED if timer == END else None
+        if self.engine is not None:
+            return await self._run_db(self._claim_row, meeting["id"], timer, status)
+        if meeting["status"] not in PENDING or meeting["fired"] & timer:
+            return False, meeting["status"]
+        meeting["fired"] |= timer
+        if status is not None:
+            meeting["status"] = status
+        return True, meeting["status"]
+
+    async def fire_due(self):
+        """Act on every timer due by now"""
+        now = self.clock()
+        while self.heap and self.heap[0][0] <= now:
+            due, timer, meeting_id = heapq.heappop(self.heap)
+            meeting = self.meetings.get(meeting_id)
+            if meeting is None or meeting["fired"] & timer or self.due(meeting, timer) != due:
+                continue  # cancelled, rescheduled or done already
+            try:
+                claimed, status = await self._claim(meeting, timer)
+            except Exception:
+                heapq.heappush(self.heap, (due, timer, meeting_id))
+                raise
+            if claimed:
+                meeting["fired"] |= timer
+                if status is not None:
+                    meeting["status"] = status
+                self.fired[TIMERS[timer]] += 1
+                handler = self.handlers.get(timer)
+                if handler is not None:
+                    try:
+                        await handler(meeting)
+                    except Exception:
+                        logger.exception("Meeting %s timer %s failed", meeting_id, TIMERS[timer])
+            else:
+                meeting["fired"] |= timer
+                self.lost[TIMERS[timer]] += 1
+            if (timer == END or status not in PENDING) and self.meetings.get(meeting_id) is meeting:
+                del self.meetings[meeting_id]
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                if self.clock() >= self.next_refill:
+                    await self.refill()
+                await self.fire_due()
+            except Exception:
+                logger.exception("Meeting scheduler failed, retrying")
+                await asyncio.sleep(RETRY_INTERVAL)
+            delay = min(self.next_refill, self.heap[0][0] if self.heap else self.next_refill) - self.clock()
+            if delay > 0:
+                loop = asyncio.get_running_loop()
+                self._sleep = loop.create_future()
+                timer = loop.call_later(delay, self._wake)
+                try:
+                    await self._sleep
+                finally:
+                    timer.cancel()
+                    self._sleep = None
+
+    def _wake(self):
+        if self._sleep is not None and not self._sleep.done():
+            self._sleep.set_result(None)
+
+    def reload(self):
+        """Refill the window at once (the admin server changed meetings)"""
+        self.next_refill = 0.0
+        self._wake()
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        if self.engine is not None:
+            self.engine.dispose()
+            self.executor.shutdown()
+
+    def snapshot(self) -> dict:
+        return {
+            "meetings": len(self.meetings),
+            "timers": len(self.heap),
+            "next_due": round(self.heap[0][0] - self.clock(), 3) if self.heap else None,
+            "fired": dict(self.fired),
+            "lost": dict(self.lost),
+            "persistent": self.persistent,
+        }
+
+    # Database access, on the executor thread
+
+    def _insert(self, meeting: dict):
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(meetings_table.insert(), _to_row(meeting))
+        except sqlalchemy.exc.IntegrityError:
+            raise ValueError("A meeting with this id exists")
+
+    def _get(self, meeting_id: str, connection=None) -> Optional[dict]:
+        query = sqlalchemy.select(meetings_table).where(meetings_table.c.id == meeting_id)
+        if connection is not None:
+            row = connection.execute(query).first()
+        else:
+            with self.engine.connect() as connection:
+                row = connection.execute(query).first()
+        return _from_row(row) if row is not None else None
+
+    def _update(self, meeting_id: str, fields: dict, reschedule: bool) -> Optional[dict]:
+        table = meetings_table
+        with self.engine.begin() as connection:
+            meeting = self._get(meeting_id, connection)
+            if meeting is None or meeting["status"] not in PENDING:
+                return None
+            restart = reschedule and fields.get("start_at", meeting["start_at"]) != meeting["start_at"]
+            meeting.update(fields)
+            # Only the columns that changed: `fired` bits claimed by a worker meanwhile stay set
+            values = {name: meeting[name] for name in ("start_at", "end_at", "status") if name in fields}
+            values["data"] = _to_row(meeting)["data"]
+            if restart:
+                meeting["fired"] = values["fired"] = 0
+            connection.execute(table.update().where(table.c.id == meeting_id, table.c.status.in_(PENDING)), values)
+        return meeting
+
+    def _page(self, since, status, limit) -> List[dict]:
+        table = meetings_table
+        query = sqlalchemy.select(table)
+        if since is not None:
+            query = query.where(table.c.start_at >= since)
+        if status is not None:
+            query = query.where(table.c.status == status)
+        with self.engine.connect() as connection:
+            return [_from_row(row) for row in connection.execute(query.order_by(table.c.start_at).limit(limit))]
+
+    def _counts(self, since) -> Dict[str, int]:
+        table = meetings_table
+        query = sqlalchemy.select(table.c.status, sqlalchemy.func.count()).group_by(table.c.status)
+        if since is not None:
+            query = query.where(table.c.start_at >= since)
+        with self.engine.connect() as connection:
+            return {status: count for status, count in connection.execute(query)}
+
+    def _window(self, until: float) -> List[dict]:
+        table = meetings_table
+        query = sqlalchemy.select(table).where(table.c.status.in_(PENDING), table.c.start_at <= until)
+        with self.engine.connect() as connection:
+            return [_from_row(row) for row in connection.execute(query)]
+
+    def _claim_row(self, meeting_id: str, timer: int, status: Optional[str]) -> Tuple[bool, Optional[str]]:
+        table = meetings_table
+        values = {"fired": table.c.fired.op("|")(timer)}
+        if status is not None:
+            values["status"] = status
+        with self.engine.begin() as connection:
+            claimed = connection.execute(table.update().where(
+                table.c.id == meeting_id, table.c.status.in_(PENDING), table.c.fired.op("&")(timer) == 0,
+            ).values(**values)).rowcount == 1
+            current = connection.execute(sqlalchemy.select(table.c.status).where(table.c.id == meeting_id)).scalar()
+        return claimed, current
+
+
+def _to_row(meeting: dict) -> dict:
+    return {"id": meeting["id"], "start_at": meeting["start_at"], "end_at": meeting["end_at"],
+            "status": meeting["status"], "fired": meeting["fired"],
+            "data": json.dumps({name: meeting.get(name) for name in DATA_FIELDS})}
+
+
+def _from_row(row) -> dict:
+    meeting = json.loads(row.data)
+    meeting.update(id=row.id, start_at=row.start_at, end_at=row.end_at, status=row.status, fired=row.fired)
+    return meeting
+
+
+def _sqlite_pragmas(connection, record):
+    # WAL lets the admin server read while a worker writes; a busy timeout covers two writers
+    cursor = connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
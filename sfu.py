@@ -0,0 +1,363 @@
+"""
+Selective forwarding unit (SFU) for room media
+With MYCONFAPP_MEDIA=sfu every participant keeps one RTCPeerConnection with the server instead
+of one per other participant. Each published track is received once and its encoded frames
+are forwarded to every subscriber in the room. Frames are re-packetized for each subscriber's
+RTP session but never decoded or re-encoded, so a subscriber costs a copy, not a codec, and no
+GPU is needed.
+
+Signaling reuses webrtc_offer, webrtc_answer and webrtc_ice_candidate with SFU_PEER as the
+peer id. The client sends the first offer; afterwards the server offers whenever the tracks
+forwarded to that client change.
+
+Requires the optional aiortc package; without it rooms stay full mesh.
+"""
+
+import asyncio
+import fractions
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+try:
+    import av
+    from aiortc import RTCConfiguration, RTCIceServer, RTCPeerConnection, RTCSessionDescription
+    from aiortc import rtcrtpreceiver
+    from aiortc.mediastreams import MediaStreamError, MediaStreamTrack
+    from aiortc.rtcrtpsender import RTCRtpSender
+    from aiortc.sdp import candidate_from_sdp
+except ImportError:  # optional dependency
+    rtcrtpreceiver = None
+    MediaStreamTrack = object
+
+logger = logging.getLogger(__name__)
+
+SFU_PEER = "sfu"
+
+# Nothing is transcoded, so publishers and subscribers are held to the same codec per kind
+FORWARDED_CODECS = {"audio": "audio/opus", "video": "video/vp8"}
+
+# Encoded frames buffered per subscriber track; a subscriber that falls further behind skips
+# ahead to the next keyframe
+SUBSCRIBER_QUEUE_SIZE = 64
+
+# Minimum seconds between keyframe requests (PLI) sent to one publisher
+KEYFRAME_REQUEST_INTERVAL = 0.5
+
+Signal = Callable[[str, str, dict], Awaitable[None]]  # (user_id, event, data)
+
+
+def available() -> bool:
+    return rtcrtpreceiver is not None
+
+
+class PassthroughDecoder:
+    """Stands in for aiortc's decoders: a reassembled encoded frame is handed on as an av.Packet,
+    which RTCRtpSender re-packetizes (Encoder.pack) instead of encoding"""
+
+    def __init__(self, codec):
+        self.time_base = fractions.Fraction(1, codec.clockRate)
+
+    def decode(self, encoded_frame) -> list:
+        packet = av.Packet(encoded_frame.data)
+        packet.pts = encoded_frame.timestamp
+        packet.time_base = self.time_base
+        return [packet]
+
+
+def install_passthrough():
+    # aiortc looks the decoder factory up in rtcrtpreceiver whenever a stream starts, so this
+    # switches every RTCPeerConnection in the process to forwarding encoded frames
+    rtcrtpreceiver.get_decoder = PassthroughDecoder
+
+
+def prefer_forwarded_codec(transceiver):
+    codecs = RTCRtpSender.getCapabilities(transceiver.kind).codecs
+    mime_type = FORWARDED_CODECS[transceiver.kind]
+    transceiver.setCodecPreferences([codec for codec in codecs if codec.mimeType.lower() == mime_type]
+                                    + [codec for codec in codecs if codec.mimeType.lower().endswith("/rtx")])
+
+
+class Publication:
+    """A track published by one participant and the subscribers it is forwarded to"""
+
+    def __init__(self, user_id: str, track, receiver, stats: Dict[str, int]):
+        self.user_id = user_id
+        self.kind = track.kind
+        self.track = track
+        self.receiver = receiver
+        self.stats = stats  # counters shared by every publication of the SFU
+        self.subscribers: Dict[str, "ForwardedTrack"] = {}  # subscriber user_id -> its copy
+        self.last_keyframe_request = 0.0
+        self.tasks: Set[asyncio.Task] = set()
+        self.pump = asyncio.ensure_future(self._pump())
+
+    async def _pump(self):
+        try:
+            while True:
+                packet = await self.track.recv()
+                self.stats["received_frames"] += 1
+                for forwarded in self.subscribers.values():
+                    forwarded.push(packet)
+        except MediaStreamError:
+            pass  # the publisher's connection closed
+        finally:
+            for forwarded in self.subscribers.values():
+                forwarded.end()
+
+    def request_keyframe(self):
+        """Ask the publisher for a keyframe (RTCP PLI), at most every KEYFRAME_REQUEST_INTERVAL"""
+        now = time.monotonic()
+        if self.kind != "video" or now - self.last_keyframe_request < KEYFRAME_REQUEST_INTERVAL:
+            return
+        self.last_keyframe_request = now
+        for source in self.receiver.getSynchronizationSources():
+            task = asyncio.ensure_future(self.receiver._send_rtcp_pli(source.source))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    def close(self):
+        self.pump.cancel()
+
+
+class ForwardedTrack(MediaStreamTrack):
+    """One subscriber's copy of a publication, fed with the publisher's encoded frames"""
+
+    def __init__(self, publication: Publication):
+        super().__init__()
+        self.kind = publication.kind
+        self.publication = publication
+        self.stats = publication.stats
+        self.queue: asyncio.Queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self.started = False
+
+    def push(self, packet):
+        if not self.started:
+            return  # frames from before the subscriber connected could not be decoded anyway
+        if self.queue.full():
+            # A stream with holes cannot be decoded: skip ahead to the next keyframe instead
+            self.stats["dropped_frames"] += self.queue.qsize()
+            self._clear()
+            self.publication.request_keyframe()
+        self.queue.put_nowait(packet)
+        self.stats["forwarded_frames"] += 1
+        self.stats["forwarded_bytes"] += packet.size
+
+    def end(self):
+        self._clear()
+        self.queue.put_nowait(None)
+
+    def _clear(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    async def recv(self):
+        if not self.started:
+            # The subscriber's sender only starts reading once the connection is up; it needs
+            # a keyframe to start decoding
+            self.started = True
+            self.publication.request_keyframe()
+        packet = await self.queue.get()
+        if packet is None:
+            self.stop()
+            raise MediaStreamError
+        return packet
+
+
+class SfuPeer:
+    """A participant's connection to the SFU"""
+
+    def __init__(self, room_id: str, user_id: str, pc, publish: bool):
+        self.room_id = room_id
+        self.user_id = user_id
+        self.pc = pc
+        self.publish = publish
+        self.publications: List[Publication] = []
+        self.forwarded: Dict[Publication, object] = {}  # publication -> sending transceiver
+        self.pending_candidates: list = []  # candidates that arrived before the offer was applied
+        self.lock = asyncio.Lock()  # one offer/answer exchange at a time
+        self.offer_scheduled = False
+        self.renegotiate = False  # forwarded tracks changed while an exchange was in progress
+        self.closed = False
+
+
+class SelectiveForwardingUnit:
+    """Per-process SFU. Rooms are not shared between workers, so a multi-worker deployment
+    needs room-affinity routing (router.py) to keep everyone in a room on the same worker."""
+
+    def __init__(self, signal: Signal, ice_servers: Optional[List[str]] = None):
+        self.signal = signal
+        self.configuration = RTCConfiguration(iceServers=[RTCIceServer(urls=url) for url in ice_servers or []])
+        self.peers: Dict[str, SfuPeer] = {}
+        self.rooms: Dict[str, Dict[str, SfuPeer]] = {}  # room_id -> user_id -> peer
+        self.stats: Dict[str, int] = {"received_frames": 0, "forwarded_frames": 0,
+                                      "forwarded_bytes": 0, "dropped_frames": 0}
+        self.tasks: Set[asyncio.Task] = set()
+        install_passthrough()
+
+    # Signaling
+    async def handle_offer(self, room_id: str, user_id: str, offer: dict, publish: bool = True):
+        """Answer a participant's offer; `publish` False receives but never forwards its media"""
+        peer = self.peers.get(user_id)
+        if peer is not None and peer.room_id != room_id:
+            await self.remove_peer(user_id)
+            peer = None
+        created = peer is None
+        if created:
+            peer = self._create_peer(room_id, user_id, publish, offer['sdp'])
+
+        async with peer.lock:
+            if peer.pc.signalingState != "stable":
+                # Both sides offered at once. The browser rolls its offer back when it applies
+                # the server's, so the server keeps its own.
+                logger.info("Ignoring offer from %s during a server offer", user_id)
+                return
+            await peer.pc.setRemoteDescription(RTCSessionDescription(sdp=offer['sdp'], type=offer['type']))
+            await peer.pc.setLocalDescription(await peer.pc.createAnswer())
+            candidates, peer.pending_candidates = peer.pending_candidates, []
+            answer = self._description(peer.pc.localDescription)
+        await self.signal(user_id, 'webrtc_answer', {'from_user': SFU_PEER, 'answer': answer, 'room_id': room_id})
+        await self.add_candidates(user_id, candidates)
+
+        if created:
+            for other in self.rooms[room_id].values():
+                for publication in other.publications:
+                    if other is not peer:
+                        self._subscribe(peer, publication)
+        if peer.renegotiate:
+            self._schedule_offer(peer)
+
+    async def handle_answer(self, user_id: str, answer: dict):
+        peer = self.peers.get(user_id)
+        if peer is None:
+            return
+        async with peer.lock:
+            if peer.pc.signalingState != "have-local-offer":
+                return
+            await peer.pc.setRemoteDescription(RTCSessionDescription(sdp=answer['sdp'], type=answer['type']))
+        if peer.renegotiate:
+            self._schedule_offer(peer)
+
+    async def add_candidates(self, user_id: str, candidates: list):
+        peer = self.peers.get(user_id)
+        if peer is None:
+            return
+        if peer.pc.remoteDescription is None:
+            peer.pending_candidates.extend(candidates)
+            return
+        for candidate in candidates:
+            if not candidate or not candidate.get('candidate'):
+                continue  # end of candidates
+            ice = candidate_from_sdp(candidate['candidate'].split(':', 1)[1])
+            ice.sdpMid = candidate.get('sdpMid')
+            ice.sdpMLineIndex = candidate.get('sdpMLineIndex')
+            await peer.pc.addIceCandidate(ice)
+
+    async def remove_peer(self, user_id: str):
+        peer = self.peers.pop(user_id, None)
+        if peer is None:
+            return
+        peer.closed = True
+        room = self.rooms.get(peer.room_id, {})
+        room.pop(user_id, None)
+        if not room:
+            self.rooms.pop(peer.room_id, None)
+        for publication in peer.publications:
+            for subscriber_id in list(publication.subscribers):
+                subscriber = self.peers.get(subscriber_id)
+                if subscriber is not None:
+                    self._unsubscribe(subscriber, publication)
+            publication.close()
+        for publication in peer.forwarded:
+            publication.subscribers.pop(user_id, None)
+        await peer.pc.close()
+
+    # Forwarding
+    def _create_peer(self, room_id: str, user_id: str, publish: bool, offer_sdp: str) -> SfuPeer:
+        pc = RTCPeerConnection(self.configuration)
+        peer = self.peers[user_id] = SfuPeer(room_id, user_id, pc, publish)
+        self.rooms.setdefault(room_id, {})[user_id] = peer
+
+        # Receive at most one audio and one video track, in the forwarded codecs. Transceivers
+        # created before the offer is applied take its first m-line of the same kind.
+        for kind in FORWARDED_CODECS:
+            if f"m={kind} " in offer_sdp:
+                prefer_forwarded_codec(pc.addTransceiver(kind, direction="recvonly" if publish else "inactive"))
+
+        @pc.on("track")
+        def on_track(track):
+            if peer.closed or not peer.publish:
+                return
+            receiver = next(t.receiver for t in pc.getTransceivers() if t.receiver.track is track)
+            publication = Publication(user_id, track, receiver, self.stats)
+            peer.publications.append(publication)
+            for other in self.rooms.get(room_id, {}).values():
+                if other is not peer:
+                    self._subscribe(other, publication)
+
+        @pc.on("connectionstatechange")
+        async def on_connection_state_change():
+            if pc.connectionState in ("failed", "closed") and self.peers.get(user_id) is peer:
+                await self.remove_peer(user_id)
+
+        return peer
+
+    def _subscribe(self, peer: SfuPeer, publication: Publication):
+        if publication in peer.forwarded:
+            return
+        forwarded = ForwardedTrack(publication)
+        transceiver = peer.pc.addTransceiver(forwarded, direction="sendonly")
+        prefer_forwarded_codec(transceiver)
+        # Browsers group received tracks by stream id (msid), so the publisher's user id tells
+        # the subscriber whose media a track is
+        transceiver.sender._stream_id = publication.user_id
+        # A subscriber's picture loss can only be repaired by the publisher
+        transceiver.sender._send_keyframe = publication.request_keyframe
+        publication.subscribers[peer.user_id] = forwarded
+        peer.forwarded[publication] = transceiver
+        self._schedule_offer(peer)
+
+    def _unsubscribe(self, peer: SfuPeer, publication: Publication):
+        forwarded = publication.subscribers.pop(peer.user_id, None)
+        if forwarded is not None:
+            forwarded.end()
+        transceiver = peer.forwarded.pop(publication, None)
+        if transceiver is not None:
+            transceiver.sender.replaceTrack(None)
+            transceiver.direction = "inactive"
+            self._schedule_offer(peer)
+
+    def _schedule_offer(self, peer: SfuPeer):
+        # Subscriptions made in the same event-loop turn share one offer
+        peer.renegotiate = True
+        if peer.offer_scheduled or peer.closed:
+            return
+        peer.offer_scheduled = True
+        task = asyncio.ensure_future(self._offer(peer))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _offer(self, peer: SfuPeer):
+        async with peer.lock:
+            peer.offer_scheduled = False
+            if peer.closed or peer.pc.signalingState != "stable" or peer.pc.remoteDescription is None:
+                return  # sent once the current exchange completes
+            peer.renegotiate = False
+            await peer.pc.setLocalDescription(await peer.pc.createOffer())
+            offer = self._description(peer.pc.localDescription)
+        await self.signal(peer.user_id, 'webrtc_offer', {'from_user': SFU_PEER, 'offer': offer,
+                                                         'room_id': peer.room_id})
+
+    @staticmethod
+    def _description(description) -> dict:
+        return {'type': description.type, 'sdp': description.sdp}
+
+    def snapshot(self) -> dict:
+        """Counters for /api/health"""
+        return {
+            "peers": len(self.peers),
+            "rooms": len(self.rooms),
+            "publications": sum(len(peer.publications) for peer in self.peers.values()),
+            "subscriptions": sum(len(peer.forwarded) for peer in self.peers.values()),
+            **self.stats,
+        }
@@ -0,0 +1,266 @@
+"""
+Write-behind persistence of the state store
+Rooms and users (with their room membership in join order) are copied to a database so a
+restarted server comes back with its meetings. The store's change feed only marks what changed;
+a background flush serializes the changed records on the event loop and hands one batch to a
+single writer thread, so Socket.IO handlers never wait for the disk.
+
+At startup the saved state is loaded into the empty store in one pass (StateStore.load): rooms,
+user records and rosters exist before the first client reconnects, and a reconnecting client
+is matched to its user record by room and username as after any reconnect. Sessions are not
+saved because Socket.IO sids do not outlive the process.
+
+Users are kept when they disconnect, marked with the time, and dropped from the database later.
+A graceful shutdown disconnects everybody first, so users that disconnected within
+SHUTDOWN_WINDOW seconds of the last write are restored along with the connected ones.
+
+Persistence needs the optional sqlalchemy package; without it state stays in memory only.
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+
+try:
+    import sqlalchemy
+    from sqlalchemy import Column, Float, Index, Integer, MetaData, String, Table, Text
+except ImportError:  # optional dependency
+    sqlalchemy = None
+
+logger = logging.getLogger(__name__)
+
+# Changes are written at least this often
+FLUSH_INTERVAL = 0.5
+
+# Users that disconnected this close to the last write were most likely disconnected by the
+# shutdown itself and are restored
+SHUTDOWN_WINDOW = 10.0
+
+# Rows per statement when writing a batch
+WRITE_CHUNK = 500
+
+if sqlalchemy is not None:
+    metadata = MetaData()
+    rooms_table = Table(
+        "state_rooms", metadata,
+        Column("id", String(64), primary_key=True),
+        Column("data", Text, nullable=False),
+    )
+    users_table = Table(
+        "state_users", metadata,
+        Column("id", String(64), primary_key=True),
+        Column("room_id", String(64)),
+        Column("position", Integer),  # join order in the room, NULL after leaving it
+        Column("data", Text, nullable=False),
+        Column("detached_at", Float),  # when the user disconnected, NULL while connected
+        Index("ix_state_users_detached_at", "detached_at"),
+    )
+    meta_table = Table(
+        "state_meta", metadata,
+        Column("key", String(32), primary_key=True),
+        Column("value", Float, nullable=False),
+    )
+
+
+def available() -> bool:
+    return sqlalchemy is not None
+
+
+class StatePersistence:
+    """Keeps a database copy of a StateStore; room_type and user_type are the classes of its
+    records (to_json() and from_json())"""
+
+    def __init__(self, url: Optional[str], store, room_type, user_type, flush_interval: float = FLUSH_INTERVAL):
+        self.store = store
+        self.room_type = room_type
+        self.user_type = user_type
+        self.flush_interval = flush_interval
+        self.engine = None
+        self.dirty_rooms: Set[str] = set()
+        self.dirty_users: Set[str] = set()
+        self.positions: Dict[str, int] = {}  # user_id -> join order, for users in a room
+        self.sequence = itertools.count(1)
+        self.restored: List[str] = []  # user ids loaded at startup, waiting to reconnect
+        self.load_time = 0.0
+        self.written = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flushing: Optional[asyncio.Future] = None
+        if url and available():
+            # One writer thread: SQLite takes one writer at a time and batches stay in order
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-store")
+            self.engine = sqlalchemy.create_engine(url)
+            if self.engine.dialect.name == "sqlite":
+                sqlalchemy.event.listen(self.engine, "connect", _sqlite_pragmas)
+            metadata.create_all(self.engine)
+            self._load()
+            store.add_listener(self._changed)
+        elif url:
+            logger.warning("State persistence needs sqlalchemy (pip install sqlalchemy), keeping state in memory only")
+
+    @property
+    def persistent(self) -> bool:
+        return self.engine is not None
+
+    def _load(self):
+        start = time.perf_counter()
+        with self.engine.connect() as connection:
+            saved_at = connection.execute(sqlalchemy.select(meta_table.c.value)
+                                          .where(meta_table.c.key == "saved_at")).scalar()
+            room_rows = connection.execute(sqlalchemy.select(rooms_table.c.data)).all()
+            users = users_table.c
+            query = sqlalchemy.select(users.id, users.position, users.data, users.detached_at)
+            if saved_at is not None:
+                query = query.where(sqlalchemy.or_(users.detached_at.is_(None),
+                                                   users.detached_at >= saved_at - SHUTDOWN_WINDOW))
+            user_rows = connection.execute(query.order_by(users.position)).all()
+        if not room_rows and not user_rows:
+            return
+        room_type, user_type = self.room_type, self.user_type
+        rooms = [room_type.from_json(data) for data, in room_rows]
+        users, participants, late = [], {}, []
+        for user_id, position, data, detached_at in user_rows:
+            user = user_type.from_json(data)
+            users.append(user)
+            if not user.room_id:
+                continue
+            if position is not None:
+                participants.setdefault(user.room_id, []).append(user_id)
+                self.positions[user_id] = position
+            elif detached_at is not None:
+                late.append(user)  # left the room while disconnecting, after the last write
+        sequence = max(self.positions.values(), default=0)
+        for user in late:
+            sequence += 1
+            participants.setdefault(user.room_id, []).append(user.id)
+            self.positions[user.id] = sequence
+        self.store.load(rooms, users, participants)
+        self.sequence = itertools.count(sequence + 1)
+        self.restored = [user.id for user in users]
+        self.load_time = time.perf_counter() - start
+        logger.info("Restored %d rooms and %d users in %.2f s", len(rooms), len(users), self.load_time)
+
+    def _changed(self, op: str, args: tuple):
+        """State store listener: remember what to write"""
+        if op in ("add_room", "remove_room"):
+            self.dirty_rooms.add(args[0].id if op == "add_room" else args[0])
+        elif op == "add_user":
+            user = args[0]
+            if user.room_id:
+                self.positions[user.id] = next(self.sequence)  # a re-added user goes to the end
+            self.dirty_users.add(user.id)
+        elif op == "add_participant":
+            self.positions[args[1]] = next(self.sequence)
+            self.dirty_users.add(args[1])
+        elif op in ("remove_participant", "remove_user"):
+            user_id = args[1] if op == "remove_participant" else args[0]
+            self.positions.pop(user_id, None)
+            self.dirty_users.add(user_id)
+        elif op == "update_user":
+            self.dirty_users.add(args[0])
+        else:
+            return  # sessions are not saved
+        if self._flush_handle is None and self._flushing is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.flush_interval, self._start_flush)
+
+    def _start_flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._flushing is None and (self.dirty_rooms or self.dirty_users):
+            self._flushing = asyncio.ensure_future(self.flush())
+
+    def _collect(self) -> dict:
+        """Serialize the changed records as they are now"""
+        store = self.store
+        batch = {"rooms": [], "removed_rooms": [], "users": [], "detached": []}
+        for room_id in self.dirty_rooms:
+            room = store.rooms.get(room_id)
+            if room is None:
+                batch["removed_rooms"].append(room_id)
+            else:
+                batch["rooms"].append({"id": room_id, "data": room.to_json()})
+        for user_id in self.dirty_users:
+            user = store.users.get(user_id)
+            if user is None:
+                batch["detached"].append(user_id)
+                continue
+            in_room = user.room_id is not None and user_id in store.room_participants.get(user.room_id, ())
+            batch["users"].append({"id": user_id, "room_id": user.room_id, "data": user.to_json(),
+                                   "position": self.positions.get(user_id) if in_room else None,
+                                   "detached_at": None})
+        self.dirty_rooms, self.dirty_users = set(), set()
+        return batch
+
+    async def flush(self):
+        """Write every change made so far; waits for a flush already running"""
+        if self.engine is None:
+            return
+        if self._flushing is not None and self._flushing is not asyncio.current_task():
+            await asyncio.shield(self._flushing)
+        loop = asyncio.get_running_loop()
+        try:
+            while self.dirty_rooms or self.dirty_users:
+                rooms, users = self.dirty_rooms, self.dirty_users
+                batch = self._collect()
+                try:
+                    await loop.run_in_executor(self.executor, self._write, batch)
+                except Exception:
+                    logger.exception("Writing %d state changes failed, will retry", len(rooms) + len(users))
+                    self.dirty_rooms |= rooms
+                    self.dirty_users |= users
+                    if self._flush_handle is None:
+                        self._flush_handle = loop.call_later(self.flush_interval * 10, self._start_flush)
+                    return
+                self.written += len(rooms) + len(users)
+        finally:
+            if self._flushing is asyncio.current_task():
+                self._flushing = None
+
+    def _write(self, batch: dict):
+        now = time.time()
+        with self.engine.begin() as connection:
+            for table, rows, removed in ((rooms_table, batch["rooms"], batch["removed_rooms"]),
+                                         (users_table, batch["users"], ())):
+                # Replace changed rows: a delete and an insert work on every database
+                ids = [row["id"] for row in rows] + list(removed)
+                for start in range(0, len(ids), WRITE_CHUNK):
+                    connection.execute(table.delete().where(table.c.id.in_(ids[start:start + WRITE_CHUNK])))
+                if rows:
+                    connection.execute(table.insert(), rows)
+            detached = batch["detached"]
+            for start in range(0, len(detached), WRITE_CHUNK):
+                connection.execute(users_table.update().where(users_table.c.id.in_(detached[start:start + WRITE_CHUNK]))
+                                   .values(detached_at=now))
+            connection.execute(users_table.delete().where(users_table.c.detached_at < now - SHUTDOWN_WINDOW))
+            connection.execute(meta_table.delete().where(meta_table.c.key == "saved_at"))
+            connection.execute(meta_table.insert(), {"key": "saved_at", "value": now})
+
+    async def close(self):
+        if self.engine is None:
+            return
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        await self.flush()
+        self.executor.shutdown(wait=True)
+        self.engine.dispose()
+
+    def snapshot(self) -> dict:
+        return {
+            "persistent": self.persistent,
+            "pending": len(self.dirty_rooms) + len(self.dirty_users),
+            "written": self.written,
+            "restored_users": len(self.restored),
+            "load_seconds": round(self.load_time, 3),
+        }
+
+
+def _sqlite_pragmas(connection, record):
+    # WAL lets the startup read and the writer thread work without blocking each other
+    cursor = connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
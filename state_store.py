@@ -0,0 +1,252 @@
+"""
+Indexed in-memory state store for rooms, users and Socket.IO sessions
+Every lookup used by the Socket.IO handlers is a single dict access
+"""
+
+import functools
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from roster import ROSTER_FIELDS, Roster, participant_entry
+
+# listener(op, args) is called once per top-level mutation, e.g. ("add_user", (user, sid))
+StateListener = Callable[[str, tuple], None]
+
+# roster listener(room_id) is called whenever a room's roster version changes, including
+# mutations replayed with apply() or restore()
+RosterListener = Callable[[str], None]
+
+
+def _mutation(method):
+    """Notify listeners after a public mutation; nested mutations are folded into the outer one"""
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        self._depth += 1
+        try:
+            result = method(self, *args)
+        finally:
+            self._depth -= 1
+        if self._depth == 0:
+            for listener in self.listeners:
+                listener(method.__name__, args)
+        return result
+    return wrapper
+
+
+class StateStore:
+    """Owns rooms, users, sessions and room participants and keeps their indexes consistent"""
+
+    MUTATIONS = frozenset({
+        "add_room", "remove_room", "add_participant", "remove_participant",
+        "add_user", "update_user", "remove_user", "bind_session", "unbind_session",
+    })
+
+    def __init__(self):
+        self.listeners: List[StateListener] = []
+        self._depth = 0
+        self.rooms: Dict[str, Any] = {}                         # room_id -> RoomInfo
+        self.users: Dict[str, Any] = {}                         # user_id -> UserInfo
+        self.user_sessions: Dict[str, str] = {}                 # user_id -> sid
+        self.session_users: Dict[str, str] = {}                 # sid -> user_id
+        self.room_participants: Dict[str, Dict[str, None]] = {} # room_id -> ordered set of user_ids
+        self.room_usernames: Dict[Tuple[str, str], str] = {}    # (room_id, username) -> user_id
+        self.rosters: Dict[str, Roster] = {}                    # room_id -> versioned participant roster
+        self.roster_listeners: List[RosterListener] = []
+
+    # Change feed
+    def add_listener(self, listener: StateListener):
+        self.listeners.append(listener)
+
+    def add_roster_listener(self, listener: RosterListener):
+        self.roster_listeners.append(listener)
+
+    def _roster_changed(self, room_id: str, change: Optional[dict]):
+        if change is not None:
+            for listener in self.roster_listeners:
+                listener(room_id)
+
+    def apply(self, op: str, args: tuple):
+        """Replay a mutation received from another process without notifying local listeners"""
+        if op not in self.MUTATIONS:
+            raise ValueError(f"Unknown state mutation: {op}")
+        listeners, self.listeners = self.listeners, []
+        try:
+            return getattr(self, op)(*args)
+        finally:
+            self.listeners = listeners
+
+    def snapshot(self) -> dict:
+        return {
+            "rooms": list(self.rooms.values()),
+            "users": [(user, self.user_sessions.get(user.id)) for user in self.users.values()],
+            "room_participants": {room_id: list(ids) for room_id, ids in self.room_participants.items()},
+        }
+
+    def restore(self, snapshot: dict):
+        """Merge a snapshot into the store without notifying listeners"""
+        listeners, self.listeners = self.listeners, []
+        try:
+            for room in snapshot["rooms"]:
+                self.add_room(room)
+            for user, sid in snapshot["users"]:
+                self.add_user(user, sid)
+            for room_id, user_ids in snapshot["room_participants"].items():
+                for user_id in user_ids:
+                    self.add_participant(room_id, user_id)
+        finally:
+            self.listeners = listeners
+
+    def load(self, rooms: List[Any], users: List[Any], room_participants: Dict[str, List[str]]):
+        """Fill an empty store in one pass (warm restart): indexes and rosters are built directly
+        instead of replaying a join per participant, and nobody is notified. Users are loaded
+        without sessions."""
+        for room in rooms:
+            self.rooms[room.id] = room
+            self.room_participants[room.id] = {}
+        for user in users:
+            self.users[user.id] = user
+            if user.room_id:
+                self.room_usernames[(user.room_id, user.username)] = user.id
+        for room_id, user_ids in room_participants.items():
+            self.room_participants[room_id] = dict.fromkeys(user_ids)
+        for room_id, participants in self.room_participants.items():
+            self.rosters[room_id] = Roster.from_entries(
+                [participant_entry(user) for user in self.iter_participants(room_id)])
+
+    # Rooms
+    @_mutation
+    def add_room(self, room):
+        self.rooms[room.id] = room
+        self.room_participants.setdefault(room.id, {})
+        self.rosters.setdefault(room.id, Roster())
+        return room
+
+    def get_room(self, room_id: str):
+        return self.rooms.get(room_id)
+
+    @_mutation
+    def remove_room(self, room_id: str):
+        """Drop a room and its participant set; users keep their records until they disconnect"""
+        self.room_participants.pop(room_id, None)
+        if self.rosters.pop(room_id, None) is not None:
+            for listener in self.roster_listeners:
+                listener(room_id)
+        return self.rooms.pop(room_id, None)
+
+    def participant_ids(self, room_id: str) -> List[str]:
+        return list(self.room_participants.get(room_id, ()))
+
+    def iter_participants(self, room_id: str) -> Iterator[Any]:
+        """Yield the user records of a room in join order"""
+        users = self.users
+        for user_id in self.room_participants.get(room_id, ()):
+            user = users.get(user_id)
+            if user:
+                yield user
+
+    def participant_count(self, room_id: str) -> int:
+        return len(self.room_participants.get(room_id, ()))
+
+    def get_roster(self, room_id: str) -> Optional[Roster]:
+        return self.rosters.get(room_id)
+
+    @_mutation
+    def add_participant(self, room_id: str, user_id: str):
+        participants = self.room_participants.setdefault(room_id, {})
+        if user_id in participants:
+            return
+        participants[user_id] = None
+        user = self.users.get(user_id)
+        if user is not None:
+            roster = self.rosters.setdefault(room_id, Roster())
+            self._roster_changed(room_id, roster.join(participant_entry(user)))
+
+    @_mutation
+    def remove_participant(self, room_id: str, user_id: str) -> bool:
+        participants = self.room_participants.get(room_id)
+        if participants is None or user_id not in participants:
+            return False
+        del participants[user_id]
+        roster = self.rosters.get(room_id)
+        if roster is not None:
+            self._roster_changed(room_id, roster.leave(user_id))
+        return True
+
+    # Users
+    def find_user(self, room_id: str, username: str) -> Optional[str]:
+        """Return the user_id already registered under this username in the room (reconnect case)"""
+        return self.room_usernames.get((room_id, username))
+
+    @_mutation
+    def add_user(self, user, sid: Optional[str] = None):
+        """Register or replace a user, index it by (room, username) and add it to its room"""
+        previous = self.users.get(user.id)
+        if previous is not None:
+            self._unindex_user(previous)
+
+        self.users[user.id] = user
+        if user.room_id:
+            self.room_usernames[(user.room_id, user.username)] = user.id
+            self.add_participant(user.room_id, user.id)
+        if sid is not None:
+            self.bind_session(user.id, sid)
+        return user
+
+    @_mutation
+    def update_user(self, user_id: str, fields: dict):
+        """Set plain attributes (e.g. media flags) on a user record"""
+        user = self.users.get(user_id)
+        if user is None:
+            return None
+        for name, value in fields.items():
+            setattr(user, name, value)
+        roster = self.rosters.get(user.room_id) if user.room_id else None
+        if roster is not None and user_id in roster:
+            roster_fields = {name: value for name, value in fields.items() if name in ROSTER_FIELDS}
+            if roster_fields:
+                self._roster_changed(user.room_id, roster.update(user_id, roster_fields))
+        return user
+
+    @_mutation
+    def remove_user(self, user_id: str):
+        """Forget a user entirely: record, room membership, username index and session"""
+        user = self.users.pop(user_id, None)
+        if user is not None:
+            self._unindex_user(user)
+        self.unbind_session(user_id)
+        return user
+
+    def _unindex_user(self, user):
+        if not user.room_id:
+            return
+        key = (user.room_id, user.username)
+        if self.room_usernames.get(key) == user.id:
+            del self.room_usernames[key]
+        self.remove_participant(user.room_id, user.id)
+
+    # Sessions
+    @_mutation
+    def bind_session(self, user_id: str, sid: str):
+        """Attach a sid to a user, releasing whatever either side was bound to before"""
+        old_sid = self.user_sessions.get(user_id)
+        if old_sid is not None and old_sid != sid:
+            self.session_users.pop(old_sid, None)
+
+        old_user_id = self.session_users.get(sid)
+        if old_user_id is not None and old_user_id != user_id:
+            self.user_sessions.pop(old_user_id, None)
+
+        self.user_sessions[user_id] = sid
+        self.session_users[sid] = user_id
+
+    @_mutation
+    def unbind_session(self, user_id: str) -> Optional[str]:
+        sid = self.user_sessions.pop(user_id, None)
+        if sid is not None and self.session_users.get(sid) == user_id:
+            del self.session_users[sid]
+        return sid
+
+    def session_for_user(self, user_id: str) -> Optional[str]:
+        return self.user_sessions.get(user_id)
+
+    def user_for_session(self, sid: str) -> Optional[str]:
+        return self.session_users.get(sid)
@@ -63,10 +63,10 @@ function validateUsername() {
     return true;
 }
 
-function createRoom() {
+function createRoom(mode = 'meeting') {
     if (!validateUsername()) return;
     
-    fetch('/api/rooms', {
+    fetch(`/api/rooms?mode=${mode}`, {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
@@ -75,7 +75,9 @@ function createRoom() {
     .then(response => response.json())
     .then(data => {
         if (data.room_id) {
-            window.location.href = `/room/${data.room_id}`;
+            // The creator of a webinar joins as its presenter
+            const query = data.presenter_token ? `?presenter=${encodeURIComponent(data.presenter_token)}` : '';
+            window.location.href = `/room/${data.room_id}${query}`;
         }
     })
     .catch(error => {
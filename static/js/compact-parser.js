@@ -0,0 +1,222 @@
+// Socket.IO parser for the compact MessagePack signaling codec (compact_codec.py on the server).
+// Every packet is one MessagePack map; keys found in the server's key table travel as their index.
+
+function createCompactParser(keys) {
+    const keyIndex = new Map(keys.map((key, index) => [key, index]));
+    const textEncoder = new TextEncoder();
+    const textDecoder = new TextDecoder();
+
+    // Encoding
+    function pushUint(out, value, size) {
+        for (let shift = (size - 1) * 8; shift >= 0; shift -= 8) {
+            out.push(Math.floor(value / 2 ** shift) & 0xff);
+        }
+    }
+
+    function writeHeader(out, length, fix, fixLimit, codes) {
+        if (length < fixLimit) {
+            out.push(fix | length);
+        } else if (codes[0] && length < 0x100) {
+            out.push(codes[0], length);
+        } else if (length < 0x10000) {
+            out.push(codes[1]);
+            pushUint(out, length, 2);
+        } else {
+            out.push(codes[2]);
+            pushUint(out, length, 4);
+        }
+    }
+
+    function writeBytes(out, bytes) {
+        for (let i = 0; i < bytes.length; i++) {
+            out.push(bytes[i]);
+        }
+    }
+
+    function writeNumber(out, value) {
+        if (Number.isInteger(value) && value >= 0 && value < 0x100000000) {
+            if (value < 0x80) out.push(value);
+            else if (value < 0x100) out.push(0xcc, value);
+            else if (value < 0x10000) { out.push(0xcd); pushUint(out, value, 2); }
+            else { out.push(0xce); pushUint(out, value, 4); }
+        } else if (Number.isInteger(value) && value < 0 && value >= -0x80000000) {
+            if (value >= -32) out.push(value & 0xff);
+            else if (value >= -0x80) out.push(0xd0, value & 0xff);
+            else if (value >= -0x8000) { out.push(0xd1); pushUint(out, value & 0xffff, 2); }
+            else { out.push(0xd2); pushUint(out, value >>> 0, 4); }
+        } else {
+            const view = new DataView(new ArrayBuffer(8));
+            view.setFloat64(0, value);
+            out.push(0xcb);
+            writeBytes(out, new Uint8Array(view.buffer));
+        }
+    }
+
+    function write(out, value) {
+        if (value === null || value === undefined) {
+            out.push(0xc0);
+        } else if (typeof value === 'boolean') {
+            out.push(value ? 0xc3 : 0xc2);
+        } else if (typeof value === 'number') {
+            writeNumber(out, value);
+        } else if (typeof value === 'string') {
+            const bytes = textEncoder.encode(value);
+            writeHeader(out, bytes.length, 0xa0, 32, [0xd9, 0xda, 0xdb]);
+            writeBytes(out, bytes);
+        } else if (value instanceof ArrayBuffer || ArrayBuffer.isView(value)) {
+            const bytes = value instanceof ArrayBuffer
+                ? new Uint8Array(value) : new Uint8Array(value.buffer, value.byteOffset, value.byteLength);
+            writeHeader(out, bytes.length, 0, 0, [0xc4, 0xc5, 0xc6]);
+            writeBytes(out, bytes);
+        } else if (Array.isArray(value)) {
+            writeHeader(out, value.length, 0x90, 16, [null, 0xdc, 0xdd]);
+            value.forEach(item => write(out, item));
+        } else if (typeof value.toJSON === 'function') {
+            write(out, value.toJSON());
+        } else {
+            const entries = Object.entries(value).filter(([, item]) => item !== undefined);
+            writeHeader(out, entries.length, 0x80, 16, [null, 0xde, 0xdf]);
+            entries.forEach(([key, item]) => {
+                write(out, keyIndex.has(key) ? keyIndex.get(key) : key);
+                write(out, item);
+            });
+        }
+    }
+
+    function encode(value) {
+        const out = [];
+        write(out, value);
+        return new Uint8Array(out);
+    }
+
+    // Decoding
+    function decode(bytes) {
+        const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+        let pos = 0;
+
+        function take(length) {
+            const slice = bytes.subarray(pos, pos + length);
+            pos += length;
+            return slice;
+        }
+
+        function uint(size) {
+            let value = 0;
+            for (let i = 0; i < size; i++) {
+                value = value * 256 + bytes[pos++];
+            }
+            return value;
+        }
+
+        function array(length) {
+            const result = [];
+            for (let i = 0; i < length; i++) {
+                result.push(read());
+            }
+            return result;
+        }
+
+        function map(length) {
+            const result = {};
+            for (let i = 0; i < length; i++) {
+                const key = read();
+                result[typeof key === 'number' && key < keys.length ? keys[key] : key] = read();
+            }
+            return result;
+        }
+
+        function read() {
+            const code = bytes[pos++];
+            if (code < 0x80) return code;
+            if (code < 0x90) return map(code & 0x0f);
+            if (code < 0xa0) return array(code & 0x0f);
+            if (code < 0xc0) return textDecoder.decode(take(code & 0x1f));
+            if (code >= 0xe0) return code - 0x100;
+            let value;
+            switch (code) {
+                case 0xc0: return null;
+                case 0xc2: return false;
+                case 0xc3: return true;
+                case 0xc4: return take(uint(1)).slice();
+                case 0xc5: return take(uint(2)).slice();
+                case 0xc6: return take(uint(4)).slice();
+                case 0xca: value = view.getFloat32(pos); pos += 4; return value;
+                case 0xcb: value = view.getFloat64(pos); pos += 8; return value;
+                case 0xcc: return uint(1);
+                case 0xcd: return uint(2);
+                case 0xce: return uint(4);
+                case 0xcf: return uint(8);
+                case 0xd0: value = view.getInt8(pos); pos += 1; return value;
+                case 0xd1: value = view.getInt16(pos); pos += 2; return value;
+                case 0xd2: value = view.getInt32(pos); pos += 4; return value;
+                case 0xd3: value = Number(view.getBigInt64(pos)); pos += 8; return value;
+                case 0xd9: return textDecoder.decode(take(uint(1)));
+                case 0xda: return textDecoder.decode(take(uint(2)));
+                case 0xdb: return textDecoder.decode(take(uint(4)));
+                case 0xdc: return array(uint(2));
+                case 0xdd: return array(uint(4));
+                case 0xde: return map(uint(2));
+                case 0xdf: return map(uint(4));
+                default: throw new Error(`Unsupported MessagePack type 0x${code.toString(16)}`);
+            }
+        }
+
+        return read();
+    }
+
+    // Socket.IO parser interface
+    class Encoder {
+        encode(packet) {
+            const message = { type: packet.type, data: packet.data, nsp: packet.nsp };
+            if (packet.id !== undefined) {
+                message.id = packet.id;
+            }
+            return [encode(message)];
+        }
+    }
+
+    class Decoder {
+        constructor() {
+            this.listeners = {};
+        }
+
+        on(event, listener) {
+            (this.listeners[event] = this.listeners[event] || []).push(listener);
+            return this;
+        }
+
+        off(event, listener) {
+            if (!event) {
+                this.listeners = {};
+            } else if (!listener) {
+                delete this.listeners[event];
+            } else {
+                this.listeners[event] = (this.listeners[event] || []).filter(fn => fn !== listener);
+            }
+            return this;
+        }
+
+        emit(event, value) {
+            (this.listeners[event] || []).slice().forEach(listener => listener(value));
+        }
+
+        add(chunk) {
+            if (typeof chunk === 'string') {
+                throw new Error('Compact signaling received a text frame');
+            }
+            const bytes = chunk instanceof ArrayBuffer
+                ? new Uint8Array(chunk) : new Uint8Array(chunk.buffer, chunk.byteOffset, chunk.byteLength);
+            const packet = decode(bytes);
+            if (packet.nsp === undefined || packet.nsp === null) {
+                packet.nsp = '/';
+            }
+            this.emit('decoded', packet);
+        }
+
+        destroy() {
+            this.listeners = {};
+        }
+    }
+
+    return { protocol: 5, Encoder, Decoder, encode, decode };
+}
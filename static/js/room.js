@@ -8,6 +8,8 @@ let isVideoEnabled = true;
 let isAudioEnabled = true;
 let isScreenSharing = false;
 let screenStream = null;
+let hasJoinedRoom = false;
+let resumeToken = null;  // from room_joined; a reconnect presenting it keeps this user's place
 
 // WebRTC Configuration
 const rtcConfiguration = {
@@ -23,6 +25,39 @@ let peerConnections = {};
 let participants = {};
 let dataChannels = {};
 
+// Local ICE candidates are sent to each peer in small batches instead of one packet each
+const ICE_BATCH_DELAY_MS = 20;
+let pendingIceCandidates = {};
+
+// Versioned room roster: one snapshot on join, then roster_delta changes applied in version order
+let roster = {};
+let rosterEpoch = null;
+let rosterVersion = null;
+
+// Room mode and own role. Webinar attendees only connect to presenters, and the full audience
+// is paged in from /api/rooms/{room_id}/participants while the participants modal is open.
+const roomParams = new URLSearchParams(window.location.search);
+let roomMode = roomParams.get('mode') || 'meeting';
+let userRole = 'participant';
+const PARTICIPANTS_PAGE_SIZE = 100;
+
+// Media topology chosen by the server: 'mesh' (one connection per participant) or 'sfu' (a single
+// connection to the server, which forwards everybody's media; remote streams carry the user id)
+const SFU_PEER = 'sfu';
+let mediaMode = 'mesh';
+let participantsCursor = null;
+let participantsPageLoading = false;
+
+// Consecutive failed attempts at one file chunk before an upload gives up
+const FILE_UPLOAD_RETRIES = 5;
+
+// Chat history: the newest message id shown is sent as replay_since when rejoining; older pages
+// are loaded from /messages when the chat is scrolled to the top
+let lastMessageId = null;
+let oldestMessageId = null;
+let chatHistoryCursor = null;
+let chatHistoryLoading = false;
+
 // Initialize room
 document.addEventListener('DOMContentLoaded', function() {
     initializeRoom();
@@ -73,10 +108,23 @@ async function startRoom() {
 }
 
 function setupSocketConnection() {
-    socket = io();
+    // Prefer WebSocket so multi-worker deployments work without sticky sessions; fall back to polling.
+    // room_id lets the affinity router send this connection to the worker that owns the room.
+    const options = { transports: ['websocket', 'polling'], query: { room_id: ROOM_ID } };
+    // Use compact binary signaling when the server offers it; ?codec=json keeps the JSON protocol
+    if (SIGNALING_CODEC && new URLSearchParams(window.location.search).get('codec') !== 'json') {
+        options.query.codec = SIGNALING_CODEC;
+        options.parser = createCompactParser(SIGNALING_KEYS);
+    }
+    socket = io(options);
     
     socket.on('connect', function() {
         console.log('Connected to server');
+        if (hasJoinedRoom) {
+            // Reconnected (e.g. the room moved to another worker): join again on the new session
+            joinSocketRoom();
+            return;
+        }
         addSystemMessage('🔗 Connected to server');
         addSystemMessage('💡 Tip: Use Ctrl+M (mute), Ctrl+E (video), Ctrl+D (screen share) | Right-click camera/mic buttons for device options');
     });
@@ -89,6 +137,18 @@ function setupSocketConnection() {
     socket.on('room_joined', function(data) {
         console.log('Room joined:', data);
         userId = data.user_id;
+        roomMode = data.mode || 'meeting';
+        userRole = data.role || 'participant';
+        mediaMode = data.media || 'mesh';
+        resumeToken = data.resume_token || null;
+        if (lastMessageId === null) {
+            loadChatHistory(true);
+        }
+        
+        if (data.resumed) {
+            resumeRoom(data);
+            return;
+        }
         
         // Clear existing participants
         participants = {};
@@ -100,14 +160,27 @@ function setupSocketConnection() {
             data.other_participants.forEach(participant => {
                 console.log(`Adding participant: ${participant.username} (${participant.user_id})`);
                 participants[participant.user_id] = participant;
+                if (mediaMode === 'sfu') return;
                 createPeerConnection(participant.user_id);
+                // Presenters are not told about attendees, so an attendee calls each presenter
+                if (userRole === 'attendee') {
+                    setTimeout(() => initiateCall(participant.user_id), 1000);
+                }
             });
         }
         
-        // Update UI with all participants (including self)
+        // With an SFU this one connection carries all media, sent and received
+        if (mediaMode === 'sfu') {
+            createPeerConnection(SFU_PEER).then(() => initiateCall(SFU_PEER));
+        }
+        
+        applyRosterSnapshot(data);
+        
+        // Update UI with all participants (including self); a webinar sends presenters and a head count
+        const participantCount = data.participant_count || data.participants.length;
         updateParticipantsList(data.participants);
-        updateParticipantsCount(data.participants.length);
-        addSystemMessage(`Joined room ${ROOM_ID} with ${data.participants.length} participant(s)`);
+        updateParticipantsCount(participantCount);
+        addSystemMessage(`Joined ${roomMode === 'webinar' ? `webinar as ${userRole}` : 'room'} ${ROOM_ID} with ${participantCount} participant(s)`);
         
         console.log(`Room joined successfully. Total participants: ${data.participants.length}, WebRTC connections to establish: ${data.other_participants ? data.other_participants.length : 0}`);
     });
@@ -124,15 +197,18 @@ function setupSocketConnection() {
                 joined_at: data.timestamp
             };
             
-            // Create peer connection for new user
-            createPeerConnection(data.user_id);
-            
-            // Update UI
+            // Update UI (webinar head counts arrive as participant_count events)
             updateParticipantsList();
-            updateParticipantsCount(Object.keys(participants).length + 1); // +1 for self
+            if (roomMode !== 'webinar') {
+                updateParticipantsCount(Object.keys(participants).length + 1); // +1 for self
+            }
             addSystemMessage(`${data.username} joined the room`);
             
+            // The SFU starts forwarding the new user's media on its own
+            if (mediaMode === 'sfu') return;
+            
             // As an existing participant, initiate call to the new user
+            createPeerConnection(data.user_id);
             console.log(`Initiating call to new participant: ${data.username}`);
             setTimeout(() => {
                 initiateCall(data.user_id);
@@ -153,6 +229,20 @@ function setupSocketConnection() {
     socket.on('receive_message', function(data) {
         if (data.type === 'chat') {
             addChatMessage(data.username, data.message, data.timestamp);
+            trackMessageId(data.id);
+        }
+    });
+    
+    socket.on('chat_history', function(data) {
+        // Messages missed while disconnected, oldest first
+        data.messages.forEach(message => {
+            if (message.id > lastMessageId) {
+                addChatMessage(message.username, message.message, message.timestamp);
+                trackMessageId(message.id);
+            }
+        });
+        if (data.has_more) {
+            loadMissedMessages();
         }
     });
     
@@ -172,6 +262,13 @@ function setupSocketConnection() {
         await handleIceCandidate(data.from_user, data.candidate);
     });
     
+    socket.on('webrtc_ice_candidates', async function(data) {
+        console.log(`Received ${data.candidates.length} ICE candidates from:`, data.from_user);
+        for (const candidate of data.candidates) {
+            await handleIceCandidate(data.from_user, candidate);
+        }
+    });
+    
     socket.on('user_video_toggle', function(data) {
         if (participants[data.user_id]) {
             participants[data.user_id].is_video_enabled = data.is_enabled;
@@ -186,6 +283,17 @@ function setupSocketConnection() {
         }
     });
     
+    socket.on('participant_count', function(data) {
+        updateParticipantsCount(data.participant_count);
+    });
+    
+    socket.on('roster_delta', function(data) {
+        applyRosterDelta(data);
+        if (rosterVersion !== null) {
+            updateParticipantsList(Object.values(roster));
+        }
+    });
+    
     socket.on('screen_share_started', function(data) {
         showScreenShareNotification(`${data.username} started sharing screen`);
     });
@@ -202,6 +310,26 @@ function setupSocketConnection() {
         alert('Room has been closed by the host');
         window.location.href = '/';
     });
+
+    socket.on('join_rejected', function(data) {
+        // The server is busy: join again later, spread out so that retries do not arrive together
+        const delay = data.retry_after * (1 + Math.random()) * 1000;
+        addSystemMessage(`⏳ Server busy, joining again in ${Math.round(delay / 1000)} s`);
+        setTimeout(joinSocketRoom, delay);
+    });
+
+    socket.on('rate_limited', function(data) {
+        console.warn(`Server is dropping ${data.event} events for ${data.retry_after} s`);
+    });
+
+    socket.on('schedule_rejected', function(data) {
+        showToast(`Meeting not scheduled: ${data.reason}`, 'error');
+    });
+
+    socket.on('meeting_reminder', function(data) {
+        const minutes = Math.round(data.starts_in / 60);
+        showToast(`"${data.title}" starts ${minutes > 0 ? `in ${minutes} min` : 'now'}: ${window.location.origin}/room/${data.room_id}`, 'info');
+    });
 }
 
 function setupEventListeners() {
@@ -218,6 +346,16 @@ function setupEventListeners() {
         });
     }
     
+    // Older chat history loads when the chat is scrolled to the top
+    const chatMessages = document.getElementById('chat-messages');
+    if (chatMessages) {
+        chatMessages.addEventListener('scroll', () => {
+            if (chatMessages.scrollTop < 50) {
+                loadChatHistory();
+            }
+        });
+    }
+    
     // Video controls with enhanced features
     const toggleVideoBtn = document.getElementById('toggle-video');
     const toggleAudioBtn = document.getElementById('toggle-audio');
@@ -706,13 +844,111 @@ function monitorVideoQuality() {
 }
 
 function joinSocketRoom() {
+    hasJoinedRoom = true;
     socket.emit('join_room', {
         room_id: ROOM_ID,
         username: username,
-        user_id: userId
+        user_id: userId,
+        capabilities: ['ice_batching'],
+        mode: roomMode,  // only used when this join creates the room
+        presenter_token: roomParams.get('presenter'),
+        replay_since: lastMessageId,
+        resume_token: resumeToken
     });
 }
 
+function resumeRoom(data) {
+    // Same user and roster entry as before the drop: keep the peer connections that are
+    // still up and only repair what changed while the socket was away
+    const present = {};
+    (data.other_participants || []).forEach(participant => {
+        present[participant.user_id] = true;
+        participants[participant.user_id] = participant;
+        const pc = peerConnections[participant.user_id];
+        if (mediaMode === 'sfu' || (pc && pc.connectionState !== 'failed' && pc.connectionState !== 'closed')) return;
+        createPeerConnection(participant.user_id);
+        setTimeout(() => initiateCall(participant.user_id), 1000);
+    });
+    // Webinars only list presenters, so other connections there are not stale
+    if (roomMode !== 'webinar') {
+        Object.keys(peerConnections).forEach(remoteUserId => {
+            if (remoteUserId !== SFU_PEER && !present[remoteUserId]) {
+                closePeerConnection(remoteUserId);
+                delete participants[remoteUserId];
+            }
+        });
+    }
+    const sfuConnection = peerConnections[SFU_PEER];
+    if (mediaMode === 'sfu' && (!sfuConnection || sfuConnection.connectionState === 'failed' || sfuConnection.connectionState === 'closed')) {
+        createPeerConnection(SFU_PEER).then(() => initiateCall(SFU_PEER));
+    }
+    
+    applyRosterSnapshot(data);
+    updateParticipantsList(data.participants);
+    updateParticipantsCount(data.participant_count || data.participants.length);
+    addSystemMessage('🔗 Reconnected');
+}
+
+function trackMessageId(id) {
+    if (id === undefined) return;
+    lastMessageId = lastMessageId === null ? id : Math.max(lastMessageId, id);
+    oldestMessageId = oldestMessageId === null ? id : Math.min(oldestMessageId, id);
+}
+
+function loadChatHistory(reset = false) {
+    // The newest page (reset) or the page before chatHistoryCursor, inserted above what is shown
+    if (chatHistoryLoading || (!reset && !chatHistoryCursor)) return;
+    chatHistoryLoading = true;
+    const params = new URLSearchParams();
+    if (!reset) {
+        params.set('cursor', chatHistoryCursor);
+    }
+    fetch(`/api/rooms/${ROOM_ID}/messages?${params}`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(data => {
+            chatHistoryLoading = false;
+            chatHistoryCursor = data.next_cursor;
+            const container = document.getElementById('chat-messages');
+            const firstShown = container.firstChild;
+            const height = container.scrollHeight;
+            data.messages.forEach(message => {
+                // Messages that also arrived live are already shown
+                if (oldestMessageId !== null && message.id >= oldestMessageId) return;
+                container.insertBefore(createChatMessageElement(message.username, message.message, message.timestamp), firstShown);
+            });
+            if (data.messages.length) {
+                const ids = data.messages.map(message => message.id);
+                oldestMessageId = oldestMessageId === null ? Math.min(...ids) : Math.min(oldestMessageId, ...ids);
+                if (lastMessageId === null) lastMessageId = Math.max(...ids);
+            }
+            container.scrollTop = reset ? container.scrollHeight : container.scrollHeight - height;
+        })
+        .catch(error => {
+            chatHistoryLoading = false;
+            console.error('Error loading chat history:', error);
+        });
+}
+
+async function loadMissedMessages() {
+    // Follow-up to chat_history when more was missed than one replay carries
+    let hasMore = true;
+    while (hasMore) {
+        const response = await fetch(`/api/rooms/${ROOM_ID}/messages?after=${lastMessageId}&limit=200`);
+        if (!response.ok) return;
+        const data = await response.json();
+        data.messages.forEach(message => {
+            addChatMessage(message.username, message.message, message.timestamp);
+            trackMessageId(message.id);
+        });
+        hasMore = data.has_more && data.messages.length > 0;
+    }
+}
+
 function sendMessage() {
     const input = document.getElementById('message-input');
     const message = input.value.trim();
@@ -731,6 +967,11 @@ function sendMessage() {
 
 function addChatMessage(author, message, timestamp) {
     const messagesContainer = document.getElementById('chat-messages');
+    messagesContainer.appendChild(createChatMessageElement(author, message, timestamp));
+    messagesContainer.scrollTop = messagesContainer.scrollHeight;
+}
+
+function createChatMessageElement(author, message, timestamp) {
     const messageElement = document.createElement('div');
     messageElement.className = 'message';
     
@@ -744,8 +985,7 @@ function addChatMessage(author, message, timestamp) {
         <div class="message-content">${escapeHtml(message)}</div>
     `;
     
-    messagesContainer.appendChild(messageElement);
-    messagesContainer.scrollTop = messagesContainer.scrollHeight;
+    return messageElement;
 }
 
 function addFileMessage(author, fileInfo, timestamp) {
@@ -763,7 +1003,9 @@ function addFileMessage(author, fileInfo, timestamp) {
         <div class="message-content">
             <div class="file-info">
                 <i class="bi bi-file-earmark"></i>
-                <span class="file-name">${escapeHtml(fileInfo.name)}</span>
+                ${fileInfo.url
+                    ? `<a class="file-name" href="${escapeHtml(fileInfo.url)}" download="${escapeHtml(fileInfo.name)}">${escapeHtml(fileInfo.name)}</a>`
+                    : `<span class="file-name">${escapeHtml(fileInfo.name)}</span>`}
                 <span class="file-size">(${formatFileSize(fileInfo.size)})</span>
             </div>
         </div>
@@ -1050,18 +1292,19 @@ async function createPeerConnection(remoteUserId) {
         });
     }
     
-    // Handle remote stream
+    // Handle remote stream (tracks forwarded by the SFU name their publisher as the stream id)
     pc.ontrack = (event) => {
-        console.log(`Received remote ${event.track.kind} track from:`, remoteUserId);
-        const participant = participants[remoteUserId];
+        const ownerId = remoteUserId === SFU_PEER ? event.streams[0].id : remoteUserId;
+        console.log(`Received remote ${event.track.kind} track from:`, ownerId);
+        const participant = participants[ownerId];
         const participantName = participant ? participant.username : 'Unknown';
         
-        let remoteVideo = document.getElementById(`remote-video-${remoteUserId}`);
+        let remoteVideo = document.getElementById(`remote-video-${ownerId}`);
         if (remoteVideo) {
             remoteVideo.srcObject = event.streams[0];
             console.log(`Updated existing video element for ${participantName}`);
         } else {
-            createRemoteVideoElement(remoteUserId, event.streams[0], participantName);
+            createRemoteVideoElement(ownerId, event.streams[0], participantName);
             console.log(`Created new video element for ${participantName}`);
         }
     };
@@ -1069,15 +1312,10 @@ async function createPeerConnection(remoteUserId) {
     // Handle ICE candidates
     pc.onicecandidate = (event) => {
         if (event.candidate) {
-            console.log(`Sending ICE candidate to ${remoteUserId}`);
-            socket.emit('webrtc_ice_candidate', {
-                room_id: ROOM_ID,
-                from_user: userId,
-                to_user: remoteUserId,
-                candidate: event.candidate
-            });
+            queueIceCandidate(remoteUserId, event.candidate);
         } else {
             console.log(`ICE gathering complete for ${remoteUserId}`);
+            flushIceCandidates(remoteUserId);
         }
     };
     
@@ -1112,6 +1350,11 @@ async function createPeerConnection(remoteUserId) {
         console.log(`ICE connection state for ${remoteUserId}: ${pc.iceConnectionState}`);
     };
     
+    // File sharing data channels are peer to peer and do not go through the SFU
+    if (remoteUserId === SFU_PEER) {
+        return pc;
+    }
+    
     // Create data channel for file sharing and messaging
     const dataChannel = pc.createDataChannel('fileTransfer', {
         ordered: true
@@ -1150,6 +1393,33 @@ async function createPeerConnection(remoteUserId) {
     return pc;
 }
 
+function queueIceCandidate(remoteUserId, candidate) {
+    let pending = pendingIceCandidates[remoteUserId];
+    if (!pending) {
+        pending = pendingIceCandidates[remoteUserId] = {
+            candidates: [],
+            timer: setTimeout(() => flushIceCandidates(remoteUserId), ICE_BATCH_DELAY_MS)
+        };
+    }
+    pending.candidates.push(candidate);
+}
+
+function flushIceCandidates(remoteUserId) {
+    const pending = pendingIceCandidates[remoteUserId];
+    if (!pending) return;
+    
+    clearTimeout(pending.timer);
+    delete pendingIceCandidates[remoteUserId];
+    
+    console.log(`Sending ${pending.candidates.length} ICE candidate(s) to ${remoteUserId}`);
+    socket.emit('webrtc_ice_candidate', {
+        room_id: ROOM_ID,
+        from_user: userId,
+        to_user: remoteUserId,
+        candidates: pending.candidates
+    });
+}
+
 async function initiateCall(remoteUserId) {
     console.log('Initiating call to:', remoteUserId);
     
@@ -1239,6 +1509,11 @@ function closePeerConnection(remoteUserId) {
         delete dataChannels[remoteUserId];
     }
     
+    if (pendingIceCandidates[remoteUserId]) {
+        clearTimeout(pendingIceCandidates[remoteUserId].timer);
+        delete pendingIceCandidates[remoteUserId];
+    }
+    
     // Remove remote video element
     const remoteVideo = document.getElementById(`remote-video-${remoteUserId}`);
     if (remoteVideo) {
@@ -1550,39 +1825,65 @@ function setupDataChannels() {
     };
 }
 
-function shareFile(file) {
-    if (file.size > 10 * 1024 * 1024) {
-        alert('File too large. Maximum size is 10MB.');
+async function shareFile(file) {
+    // Files go to the server in raw chunks and are announced to the room (file_shared) once
+    // complete. An interrupted upload is resumed from the server's next_chunk.
+    let upload;
+    try {
+        const response = await fetch(`/api/rooms/${ROOM_ID}/files`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ user_id: userId, name: file.name, size: file.size, type: file.type })
+        });
+        if (!response.ok) {
+            const error = await response.json().catch(() => ({}));
+            throw new Error(error.detail || `HTTP ${response.status}`);
+        }
+        upload = await response.json();
+    } catch (error) {
+        addSystemMessage(`Could not share "${file.name}": ${error.message}`);
         return;
     }
     
-    const reader = new FileReader();
-    reader.onload = () => {
-        const fileData = {
-            name: file.name,
-            size: file.size,
-            type: file.type,
-            data: reader.result
-        };
-        
-        socket.emit('file_share', {
-            room_id: ROOM_ID,
-            user_id: userId,
-            file_info: {
-                name: file.name,
-                size: file.size,
-                type: file.type
+    const url = `/api/rooms/${ROOM_ID}/files/${upload.file_id}`;
+    let next = upload.next_chunk;
+    let failures = 0;
+    let lastReport = 0;
+    while (!upload.complete) {
+        const start = next * upload.chunk_size;
+        try {
+            const response = await fetch(`${url}/chunks/${next}`, {
+                method: 'PUT',
+                headers: { 'Content-Type': 'application/octet-stream' },
+                body: file.slice(start, start + upload.chunk_size)
+            });
+            if (response.status === 409) {
+                // Out of step with the server: continue where it stands
+                upload = (await response.json()).detail;
+            } else if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            } else {
+                upload = await response.json();
+                failures = 0;
             }
-        });
-        
-        Object.values(dataChannels).forEach(channel => {
-            if (channel.readyState === 'open') {
-                channel.send(JSON.stringify(fileData));
+        } catch (error) {
+            if (++failures > FILE_UPLOAD_RETRIES) {
+                addSystemMessage(`Upload of "${file.name}" failed: ${error.message}`);
+                return;
             }
-        });
-    };
-    
-    reader.readAsDataURL(file);
+            await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** (failures - 1)));
+            const status = await fetch(`${url}/status`).catch(() => null);
+            if (status && status.ok) {
+                upload = await status.json();
+            }
+        }
+        next = upload.next_chunk;
+        const percent = Math.floor(100 * upload.received / Math.max(file.size, 1));
+        if (!upload.complete && percent >= lastReport + 25) {
+            lastReport = percent - percent % 25;
+            addSystemMessage(`Uploading "${file.name}": ${lastReport}%`);
+        }
+    }
 }
 
 function handleDataChannelMessage(fromUserId, data) {
@@ -1631,8 +1932,12 @@ function dataURLtoBlob(dataURL) {
 
 // ===== RECORDING FUNCTIONALITY =====
 let mediaRecorder = null;
-let recordedChunks = [];
 let isRecording = false;
+// Chunks are uploaded one after another as MediaRecorder produces them (see recordings.py)
+let recordingId = null;
+let recordingUploads = Promise.resolve();
+let recordingChunkIndex = 0;
+let recordingChunkStart = 0;
 let recordingStartTime = null;
 let recordingTimer = null;
 
@@ -1682,10 +1987,25 @@ async function startRecording() {
             mimeType: 'video/webm;codecs=vp9,opus'
         });
 
-        recordedChunks = [];
+        const response = await fetch(`/api/rooms/${ROOM_ID}/recordings`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ user_id: userId, mime_type: mediaRecorder.mimeType })
+        });
+        if (!response.ok) {
+            displayStream.getTracks().forEach(track => track.stop());
+            throw new Error(`HTTP ${response.status}`);
+        }
+        const id = (await response.json()).recording_id;
+        recordingId = id;
+        recordingChunkIndex = 0;
+        recordingChunkStart = 0;
         mediaRecorder.ondataavailable = (event) => {
             if (event.data.size > 0) {
-                recordedChunks.push(event.data);
+                const seq = recordingChunkIndex++;
+                const start = recordingChunkStart;
+                recordingChunkStart = Date.now() - recordingStartTime;
+                recordingUploads = recordingUploads.then(() => uploadRecordingChunk(id, seq, start, event.data));
             }
         };
 
@@ -1737,23 +2057,43 @@ function stopRecording() {
     }
 }
 
+async function uploadRecordingChunk(id, seq, start, blob) {
+    const url = `/api/rooms/${ROOM_ID}/recordings/${id}/chunks/${seq}?t=${start}`;
+    for (let attempt = 0; attempt <= FILE_UPLOAD_RETRIES; attempt++) {
+        try {
+            const response = await fetch(url, {
+                method: 'PUT',
+                headers: { 'Content-Type': 'application/octet-stream' },
+                body: blob
+            });
+            // 409: the server already has this chunk, or the recording is over
+            if (response.ok || response.status === 409) return;
+        } catch (error) {
+            console.warn('Recording chunk upload failed:', error);
+        }
+        await new Promise(resolve => setTimeout(resolve, 500 * 2 ** attempt));
+    }
+    console.error(`Recording chunk ${seq} could not be uploaded`);
+}
+
 function handleRecordingStop() {
-    const blob = new Blob(recordedChunks, { type: 'video/webm' });
-    const url = URL.createObjectURL(blob);
-    
-    // Create download link
-    const a = document.createElement('a');
-    a.href = url;
-    a.download = `meeting-recording-${new Date().toISOString().slice(0, 19)}.webm`;
-    document.body.appendChild(a);
-    a.click();
-    document.body.removeChild(a);
-    
-    // Cleanup
-    URL.revokeObjectURL(url);
-    recordedChunks = [];
-    
-    showToast('Recording saved successfully!', 'success');
+    const id = recordingId;
+    recordingId = null;
+    // Stop once every chunk recorded so far is on the server
+    recordingUploads = recordingUploads
+        .then(() => fetch(`/api/rooms/${ROOM_ID}/recordings/${id}/stop`, { method: 'POST' }))
+        .then(response => {
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            return response.json();
+        })
+        .then(recording => {
+            showToast('Recording saved successfully!', 'success');
+            addSystemMessage(`Recording saved (${formatFileSize(recording.size)}): ${recording.url}`);
+        })
+        .catch(error => {
+            console.error('Error saving recording:', error);
+            showToast('Failed to save recording.', 'error');
+        });
 }
 
 function updateRecordingUI(recording) {
@@ -1803,6 +2143,16 @@ function initializeParticipants() {
         participantsModal.addEventListener('show.bs.modal', requestParticipantsList);
     }
 
+    // Webinar rosters load the next page when the list is scrolled to the bottom
+    const participantsList = document.getElementById('participants-list');
+    if (participantsList) {
+        participantsList.addEventListener('scroll', () => {
+            if (participantsList.scrollTop + participantsList.clientHeight >= participantsList.scrollHeight - 50) {
+                loadParticipantsPage();
+            }
+        });
+    }
+
     // Search functionality
     const searchInput = document.getElementById('participants-search');
     if (searchInput) {
@@ -1816,11 +2166,93 @@ function showParticipantsModal() {
 }
 
 function requestParticipantsList() {
+    if (roomMode === 'webinar') {
+        loadParticipantsPage(true);
+        return;
+    }
+    // With a known roster version the server answers with just the missed roster_delta changes
     socket.emit('request_participants_list', {
-        room_id: ROOM_ID
+        room_id: ROOM_ID,
+        roster_epoch: rosterEpoch,
+        roster_version: rosterVersion
     });
 }
 
+function loadParticipantsPage(reset = false) {
+    // Fetches the first page (reset) or the page after participantsCursor and appends it
+    if (participantsPageLoading || (!reset && !participantsCursor)) return;
+    participantsPageLoading = true;
+    const params = new URLSearchParams({ limit: PARTICIPANTS_PAGE_SIZE });
+    if (!reset) {
+        params.set('cursor', participantsCursor);
+    }
+    fetch(`/api/rooms/${ROOM_ID}/participants?${params}`)
+        .then(response => {
+            if (response.status === 409) {
+                // The roster was rebuilt (e.g. the room moved to another worker): start over
+                participantsPageLoading = false;
+                loadParticipantsPage(true);
+                return null;
+            }
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(data => {
+            if (!data) return;
+            participantsPageLoading = false;
+            participantsCursor = data.next_cursor;
+            if (reset) {
+                updateParticipantsList(data.participants);
+            } else {
+                const container = document.getElementById('participants-list');
+                data.participants.forEach(participant => {
+                    container.appendChild(createParticipantElement(participant));
+                });
+            }
+            document.getElementById('total-participants').textContent = `${data.participant_count} Participants`;
+        })
+        .catch(error => {
+            participantsPageLoading = false;
+            console.error('Error loading participants:', error);
+        });
+}
+
+function applyRosterSnapshot(data) {
+    if (data.roster_version === undefined) return;
+    roster = {};
+    data.participants.forEach(participant => {
+        roster[participant.user_id] = participant;
+    });
+    rosterEpoch = data.roster_epoch;
+    rosterVersion = data.roster_version;
+}
+
+function applyRosterDelta(data) {
+    // Changes at or below the local version are already applied; a gap triggers a resync
+    if (rosterVersion === null || data.roster_version <= rosterVersion) return;
+    if (data.roster_epoch !== rosterEpoch) {
+        requestParticipantsList();
+        return;
+    }
+    for (const change of data.changes) {
+        if (change.version <= rosterVersion) continue;
+        if (change.version !== rosterVersion + 1) break;
+        if (change.op === 'join') {
+            roster[change.user_id] = change.participant;
+        } else if (change.op === 'leave') {
+            delete roster[change.user_id];
+        } else if (change.op === 'update' && roster[change.user_id]) {
+            roster[change.user_id] = { ...roster[change.user_id], ...change.fields };
+        }
+        rosterVersion = change.version;
+    }
+    if (rosterVersion < data.roster_version) {
+        requestParticipantsList();
+    }
+}
+
 function updateParticipantsList(participantsList) {
     const container = document.getElementById('participants-list');
     const totalParticipants = document.getElementById('total-participants');
@@ -2071,6 +2503,7 @@ function setupEnhancedSocketEvents() {
 
     // Participants events
     socket.on('participants_list', (data) => {
+        applyRosterSnapshot(data);
         updateParticipantsList(data.participants);
     });
 
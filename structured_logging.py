@@ -0,0 +1,93 @@
+"""
+Structured, asynchronous logging
+Loggers only put records on a queue; a listener thread formats them and writes them to stderr,
+so a burst of log lines never blocks the event loop on console or pipe I/O. Fields passed with
+`extra=` are kept as fields: one JSON object per line with format "json", or key=value pairs
+after the message with format "text".
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from datetime import datetime, timezone
+from typing import Optional
+
+# Attributes every LogRecord has; anything else on a record came in through extra=
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+# Chatty third-party loggers, quiet unless the level is DEBUG (engineio logs every packet)
+NOISY_LOGGERS = ("engineio.server", "socketio.server")
+
+
+def extra_fields(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **extra_fields(record),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = extra_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues the record as it is; the listener runs in the same process, so the message,
+    arguments and traceback need not be flattened to strings on the caller's thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class QueueLogging:
+    """Routes every log record through a queue to a stderr writer thread while started"""
+
+    def __init__(self, level: str = "INFO", format: str = "text"):
+        self.level = level.upper()
+        self.format = format
+        self.handler: Optional[LocalQueueHandler] = None
+        self.listener: Optional[logging.handlers.QueueListener] = None
+
+    def start(self):
+        if self.listener is not None:
+            return
+        output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(JSONFormatter() if self.format == "json" else TextFormatter())
+        records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        self.handler = LocalQueueHandler(records)
+        self.listener = logging.handlers.QueueListener(records, output)
+        root = logging.getLogger()
+        root.addHandler(self.handler)
+        root.setLevel(self.level)
+        noisy_level = logging.NOTSET if root.level <= logging.DEBUG else logging.WARNING
+        for name in NOISY_LOGGERS:
+            logging.getLogger(name).setLevel(noisy_level)
+        self.listener.start()
+
+    def stop(self):
+        """Detach from the root logger and write out what is still queued"""
+        if self.listener is None:
+            return
+        logging.getLogger().removeHandler(self.handler)
+        self.listener.stop()
+        self.handler = self.listener = None
@@ -0,0 +1,133 @@
+"""
+Two workers sharing an in-process backplane: a participant on each completes signaling.
+
+Each worker is its own instance of main.py (its own CompactSignalingServer, StateStore and
+handlers) served by uvicorn in this process, with MYCONFAPP_BACKPLANE=memory:// joining them.
+"""
+
+import asyncio
+import importlib.util
+import os
+import socket
+import sys
+import uuid
+
+import pytest
+
+socketio = pytest.importorskip("socketio")
+uvicorn = pytest.importorskip("uvicorn")
+pytest.importorskip("aiohttp")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TIMEOUT = 5
+
+
+def load_worker(name: str):
+    """A fresh copy of main.py, so each worker has its own server and registry"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    # Registered like an imported module, so records the backplane pickles can be loaded again
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def workers(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    monkeypatch.syspath_prepend(ROOT)
+    monkeypatch.setenv("MYCONFAPP_BACKPLANE", f"memory://test-{uuid.uuid4().hex}")
+    for name in ("MYCONFAPP_STATE_DB", "MYCONFAPP_CHAT_DB", "MYCONFAPP_MEETINGS_DB", "MYCONFAPP_ADMIN_FEED"):
+        monkeypatch.setenv(name, "")
+    modules = [load_worker(f"backplane_worker_{index}") for index in range(2)]
+    yield modules
+    for module in modules:
+        sys.modules.pop(module.__name__, None)
+
+
+class Participant:
+    """A Socket.IO client that records every event it receives"""
+
+    def __init__(self, username: str):
+        self.username = username
+        self.client = socketio.AsyncClient()
+        self.events = asyncio.Queue()
+        self.client.on("*", self._record)
+
+    async def _record(self, event, data):
+        await self.events.put((event, data))
+
+    async def expect(self, name: str) -> dict:
+        while True:
+            event, data = await asyncio.wait_for(self.events.get(), TIMEOUT)
+            if event == name:
+                return data
+
+
+async def serve(module, port: int):
+    config = uvicorn.Config(module.socket_app, host="127.0.0.1", port=port, log_level="error", lifespan="on")
+    server = uvicorn.Server(config)
+    task = asyncio.ensure_future(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server, task
+
+
+async def signal_across_workers(workers):
+    servers = []
+    alice, bob = Participant("alice"), Participant("bob")
+    try:
+        for module in workers:
+            servers.append(await serve(module, free_port()))
+        ports = [server.config.port for server, _ in servers]
+        room_id = "room-" + uuid.uuid4().hex[:8]
+
+        await alice.client.connect(f"http://127.0.0.1:{ports[0]}", transports=["websocket"])
+        await alice.client.emit("join_room", {"room_id": room_id, "username": "alice"})
+        alice_id = (await alice.expect("room_joined"))["user_id"]
+
+        # Bob's worker learns about the room and alice from the replicated registry
+        await bob.client.connect(f"http://127.0.0.1:{ports[1]}", transports=["websocket"])
+        await bob.client.emit("join_room", {"room_id": room_id, "username": "bob"})
+        joined = await bob.expect("room_joined")
+        bob_id = joined["user_id"]
+        assert [participant["user_id"] for participant in joined["other_participants"]] == [alice_id]
+        assert (await alice.expect("user_joined"))["user_id"] == bob_id
+
+        offer = {"type": "offer", "sdp": "v=0 bob"}
+        await bob.client.emit("webrtc_offer", {"room_id": room_id, "from_user": bob_id, "to_user": alice_id,
+                                               "offer": offer})
+        received = await alice.expect("webrtc_offer")
+        assert (received["from_user"], received["offer"]) == (bob_id, offer)
+
+        answer = {"type": "answer", "sdp": "v=0 alice"}
+        await alice.client.emit("webrtc_answer", {"room_id": room_id, "from_user": alice_id, "to_user": bob_id,
+                                                  "answer": answer})
+        received = await bob.expect("webrtc_answer")
+        assert (received["from_user"], received["answer"]) == (alice_id, answer)
+
+        for sender, sender_id, receiver, receiver_id in ((alice, alice_id, bob, bob_id),
+                                                         (bob, bob_id, alice, alice_id)):
+            candidate = {"candidate": f"candidate:1 1 udp 1 10.0.0.1 9 typ host {sender.username}",
+                         "sdpMid": "0", "sdpMLineIndex": 0}
+            await sender.client.emit("webrtc_ice_candidate", {"room_id": room_id, "from_user": sender_id,
+                                                              "to_user": receiver_id, "candidate": candidate})
+            received = await receiver.expect("webrtc_ice_candidate")
+            assert (received["from_user"], received["candidate"]) == (sender_id, candidate)
+    finally:
+        for participant in (alice, bob):
+            if participant.client.connected:
+                await participant.client.disconnect()
+        for server, task in servers:
+            server.should_exit = True
+            await task
+
+
+def test_signaling_between_workers(workers):
+    asyncio.run(signal_across_workers(workers))